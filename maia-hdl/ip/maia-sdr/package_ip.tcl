@@ -72,11 +72,13 @@ set_property bus_type_vlnv xilinx.com:signal:reset:1.0 \
 ipx::add_bus_parameter POLARITY [ipx::get_bus_interfaces s_axi_lite_rst -of_objects [ipx::current_core]]
 set_property value ACTIVE_HIGH [ipx::get_bus_parameters POLARITY -of_objects [ipx::get_bus_interfaces s_axi_lite_rst -of_objects [ipx::current_core]]]
 
-# associate s_axi_lite, m_axi_recorder to s_axi_lite_clk
+# associate s_axi_lite, m_axi_recorder, m_axi_ddc_coeff to s_axi_lite_clk
 ipx::associate_bus_interfaces -busif s_axi_lite -clock clk -remove [ipx::current_core]
 ipx::associate_bus_interfaces -busif s_axi_lite -clock s_axi_lite_clk [ipx::current_core]
 ipx::associate_bus_interfaces -busif m_axi_recorder -clock clk -remove [ipx::current_core]
 ipx::associate_bus_interfaces -busif m_axi_recorder -clock s_axi_lite_clk [ipx::current_core]
+ipx::associate_bus_interfaces -busif m_axi_ddc_coeff -clock clk -remove [ipx::current_core]
+ipx::associate_bus_interfaces -busif m_axi_ddc_coeff -clock s_axi_lite_clk [ipx::current_core]
 
 # interrupt
 ipx::add_bus_interface interrupt [ipx::current_core]
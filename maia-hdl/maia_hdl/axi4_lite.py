@@ -7,6 +7,7 @@
 #
 
 from amaranth import *
+from amaranth.lib.fifo import SyncFIFO
 import amaranth.cli
 import amaranth.back.verilog
 
@@ -22,6 +23,14 @@ class Axi4LiteRegisterBridge(Elaboratable):
     internally for register access. See register.py for the definition of the
     custom bus.
 
+    The bridge can have several transactions in progress. A new transaction
+    is initiated on the register bus whenever the ``ready`` input was
+    asserted in the previous cycle and fewer than ``max_outstanding``
+    transactions have not received an AXI response yet. The register bus must
+    give the responses in the same order as the transactions. With
+    ``max_outstanding = 1``, each transaction only starts after the previous
+    one has finished, so the register bus does not need to be pipelined.
+
     Parameters
     ----------
     address_width : int
@@ -30,6 +39,8 @@ class Axi4LiteRegisterBridge(Elaboratable):
         is ``address_width + 2``.
     name : Optional[str]
         Used to set the pin names of the AXI4-Lite interface.
+    max_outstanding : int
+        Maximum number of transactions in progress.
 
     Attributes
     ----------
@@ -47,9 +58,16 @@ class Axi4LiteRegisterBridge(Elaboratable):
         Read data of the register bus.
     wdata : Signal(32), out
         Write data of the register bus.
+    ready : Signal(), in
+        Indicates that the register bus can accept a new transaction in the
+        next cycle.
     """
-    def __init__(self, address_width: int, name: Optional[str] = None):
+    def __init__(self, address_width: int, name: Optional[str] = None,
+                 max_outstanding: int = 1):
+        if max_outstanding < 1:
+            raise ValueError('max_outstanding must be at least 1')
         self.aw = address_width
+        self.max_outstanding = max_outstanding
 
         self.axi = axi.AxiInterface(
             axi.AxiDevice.SUBORDINATE,
@@ -64,7 +82,8 @@ class Axi4LiteRegisterBridge(Elaboratable):
         self.wdone = Signal()
         self.address = Signal(self.aw, reset_less=True)
         self.rdata = Signal(32)
-        self.wdata = Signal(32)
+        self.wdata = Signal(32, reset_less=True)
+        self.ready = Signal(init=1)
 
     def ports(self):
         return self.axi.ports() + [
@@ -75,63 +94,65 @@ class Axi4LiteRegisterBridge(Elaboratable):
             self.address,
             self.rdata,
             self.wdata,
+            self.ready,
         ]
 
     def elaborate(self, platform):
         m = Module()
-        busy = Signal()
-        write_transaction = Signal()
+        # Number of transactions that have been initiated and whose AXI
+        # response has not been accepted yet
+        outstanding = Signal(range(self.max_outstanding + 1))
         write_preference = Signal()
         start_write = Signal()
-        start_write_q = Signal()
         start_read = Signal()
-        start_read_q = Signal()
+        can_start = self.ready & (outstanding != self.max_outstanding)
         m.d.comb += [
-            self.axi.awready.eq(start_write_q),
-            self.axi.wready.eq(start_write_q),
-            self.axi.arready.eq(start_read_q),
-            self.ren.eq(start_read_q),
-            self.wdata.eq(self.axi.wdata),
             start_write.eq(
-                ~busy & self.axi.awvalid & self.axi.wvalid &
+                can_start & self.axi.awvalid & self.axi.wvalid &
                 (write_preference | ~self.axi.arvalid)),
-            start_read.eq(
-                ~busy & self.axi.arvalid &
-                (~write_preference | ~self.axi.awvalid | ~self.axi.wvalid)),
+            start_read.eq(can_start & self.axi.arvalid & ~start_write),
+            self.axi.awready.eq(start_write),
+            self.axi.wready.eq(start_write),
+            self.axi.arready.eq(start_read),
         ]
         m.d.sync += [
-            start_write_q.eq(start_write),
-            start_read_q.eq(start_read),
+            self.ren.eq(start_read),
             self.wstrobe.eq(Mux(start_write,
                                 self.axi.wstrb,
                                 0)),
             self.address.eq(Mux(start_write,
                                 self.axi.awaddr >> 2,
                                 self.axi.araddr >> 2)),
+            outstanding.eq(outstanding + (start_write | start_read)
+                           - self.axi.b_handshake()
+                           - self.axi.r_handshake()),
         ]
-
-        with m.If(self.axi.b_handshake() | self.axi.r_handshake()):
-            m.d.sync += busy.eq(0)
+        with m.If(start_write):
+            m.d.sync += self.wdata.eq(self.axi.wdata)
         with m.If(start_write | start_read):
-            m.d.sync += [
-                busy.eq(1),
-                write_preference.eq(~write_preference),
-            ]
-
-        with m.If(self.wdone):
-            m.d.sync += self.axi.bvalid.eq(1)
-        with m.If(self.axi.b_handshake()):
-            m.d.sync += self.axi.bvalid.eq(0)
-        m.d.comb += self.axi.bresp.eq(axi.AxiResp.OKAY)
-
-        with m.If(self.rdone):
-            m.d.sync += [
-                self.axi.rdata.eq(self.rdata),
-                self.axi.rvalid.eq(1),
-            ]
-        with m.If(self.axi.r_handshake()):
-            m.d.sync += self.axi.rvalid.eq(0)
-        m.d.comb += self.axi.rresp.eq(axi.AxiResp.OKAY)
+            m.d.sync += write_preference.eq(~write_preference)
+
+        # The write responses are not buffered, since they contain no data.
+        pending_writes = Signal(range(self.max_outstanding + 1))
+        m.d.sync += pending_writes.eq(
+            pending_writes + self.wdone - self.axi.b_handshake())
+        m.d.comb += [
+            self.axi.bvalid.eq(pending_writes != 0),
+            self.axi.bresp.eq(axi.AxiResp.OKAY),
+        ]
+
+        # The number of outstanding transactions guarantees that the read
+        # data FIFO never overflows.
+        m.submodules.rdata_fifo = rdata_fifo = SyncFIFO(
+            width=32, depth=self.max_outstanding)
+        m.d.comb += [
+            rdata_fifo.w_en.eq(self.rdone),
+            rdata_fifo.w_data.eq(self.rdata),
+            rdata_fifo.r_en.eq(self.axi.rready),
+            self.axi.rvalid.eq(rdata_fifo.r_rdy),
+            self.axi.rdata.eq(rdata_fifo.r_data),
+            self.axi.rresp.eq(axi.AxiResp.OKAY),
+        ]
 
         return m
 
@@ -148,6 +148,80 @@ class RegisterCDC(Elaboratable):
         return m
 
 
+class BusSynchronizer(Elaboratable):
+    """Clock domain crossing for a multi-bit value
+
+    This transfers a multi-bit value between two clock domains using a
+    request/acknowledge handshake. When the input changes, it is latched in
+    the input domain and a request is sent to the output domain, which copies
+    the latched value to the output and sends back an acknowledge. Since the
+    latched value does not change while the request is in flight, all the
+    bits of the output are updated at once. If the input changes again
+    before the acknowledge is received, the new value is transferred after
+    the acknowledge. Changes that last less than a handshake round-trip may
+    not be seen in the output.
+
+    Parameters
+    ----------
+    i_domain : str
+        Input clock domain.
+    o_domain : str
+        Output clock domain.
+    width : int
+        Width of the value.
+    stages : int
+        Number of flip-flop synchronization stages used in the CDC.
+
+    Attributes
+    ----------
+    i : Signal(width), in
+        Input value.
+    o : Signal(width), out
+        Output value.
+    """
+    def __init__(self, i_domain: str, o_domain: str, width: int,
+                 stages: int = 2):
+        self._i_domain = i_domain
+        self._o_domain = o_domain
+        self.w = width
+        self._stages = stages
+
+        self.i = Signal(width)
+        # This is reset-less, so that it always holds the last value that
+        # was transferred, regardless of the resets of each domain.
+        self.o = Signal(width, reset_less=True)
+
+    def ports(self):
+        return [self.i, self.o]
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.request_sync = request_sync = PulseSynchronizer(
+            self._i_domain, self._o_domain, stages=self._stages)
+        m.submodules.ack_sync = ack_sync = PulseSynchronizer(
+            self._o_domain, self._i_domain, stages=self._stages)
+        # The output domain samples this register only after the request has
+        # gone through the synchronizer, so it can be used without
+        # synchronization.
+        data = Signal(self.w, reset_less=True)
+        busy = Signal()
+
+        m.d.comb += request_sync.i.eq(~busy & (self.i != data))
+        with m.If(request_sync.i):
+            m.d[self._i_domain] += [
+                data.eq(self.i),
+                busy.eq(1),
+            ]
+        with m.If(ack_sync.o):
+            m.d[self._i_domain] += busy.eq(0)
+
+        m.d.comb += ack_sync.i.eq(request_sync.o)
+        with m.If(request_sync.o):
+            m.d[self._o_domain] += self.o.eq(data)
+
+        return m
+
+
 class RxIQCDC(Elaboratable):
     """CDC for RX IQ data based around the Xilinx FIFO18_36 primitive.
 
@@ -0,0 +1,192 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import amaranth.cli
+from amaranth.lib.cdc import PulseSynchronizer
+
+from .dma import DmaStreamRead
+from .fifo import AsyncFifoBRAM
+
+
+class CoeffLoader(Elaboratable):
+    """FIR coefficient loader
+
+    This module reads a table of FIR coefficients from memory using a DMA
+    and writes them to a coefficient write bus such as the one of the
+    ``DDC``. The table is an array of little-endian 32-bit words, each
+    containing a coefficient in its ``coeff_width`` LSBs. The coefficients
+    are written to consecutive addresses, starting at ``waddr_start``.
+
+    The DMA runs in the ``domain_dma`` clock domain, and the coefficients are
+    written in the ``domain_out`` clock domain, at a rate of one coefficient
+    per cycle. The coefficients are transferred between both domains using
+    a FIFO.
+
+    Parameters
+    ----------
+    coeff_width : int
+        Width of the coefficients.
+    coeff_awidth : int
+        Width of the coefficient write address.
+    dma_name : Optional[str]
+        Name of the AXI3 Manager interface of the DMA.
+    axi_awidth : int
+        Address width of the AXI3 port.
+    domain_dma : str
+        Clock domain of the DMA.
+    domain_out : str
+        Clock domain of the coefficient write bus.
+    fifo_depth_log2 : int
+        log2 of the depth of the FIFO between ``domain_dma`` and
+        ``domain_out``.
+
+    Attributes
+    ----------
+    start : Signal(), in
+        Pulsed to start loading the coefficients. It is undefined behaviour
+        to pulse this signal while ``busy`` is asserted. This is in the
+        ``domain_dma`` domain.
+    address : Signal(axi_awidth), in
+        Address of the coefficient table. It must be aligned to 128 bytes.
+        This is in the ``domain_dma`` domain.
+    num_coeffs : Signal(range(2**coeff_awidth + 1)), in
+        Number of coefficients in the table. This is in the ``domain_dma``
+        domain.
+    waddr_start : Signal(coeff_awidth), in
+        Coefficient write address of the first coefficient in the table. This
+        is in the ``domain_dma`` domain.
+    busy : Signal(), out
+        Asserted while the coefficients are being loaded. This is in the
+        ``domain_dma`` domain.
+    done : Signal(), out
+        Pulsed for one cycle when all the coefficients have been written. This
+        is in the ``domain_dma`` domain.
+    error : Signal(), out
+        Indicates that there has been an AXI read error while loading the
+        coefficients. It is cleared when loading starts. This is in the
+        ``domain_dma`` domain.
+    coeff_waddr : Signal(coeff_awidth), out
+        Coefficient write address. This is in the ``domain_out`` domain.
+    coeff_wren : Signal(), out
+        Coefficient write enable. This is in the ``domain_out`` domain.
+    coeff_wdata : Signal(coeff_width), out
+        Coefficient write data. This is in the ``domain_out`` domain.
+    """
+    def __init__(self, coeff_width=18, coeff_awidth=10, dma_name=None,
+                 axi_awidth=32, domain_dma='sync', domain_out='sync',
+                 fifo_depth_log2=5):
+        self.coeff_width = coeff_width
+        self.coeff_awidth = coeff_awidth
+        self.domain_dma = domain_dma
+        self.domain_out = domain_out
+        self.fifo_depth_log2 = fifo_depth_log2
+
+        # domain_dma
+        self.start = Signal()
+        self.address = Signal(axi_awidth)
+        self.num_coeffs = Signal(range(2**coeff_awidth + 1))
+        self.waddr_start = Signal(coeff_awidth)
+        self.busy = Signal()
+        self.done = Signal()
+        self.error = Signal()
+
+        # domain_out
+        self.coeff_waddr = Signal(coeff_awidth)
+        self.coeff_wren = Signal()
+        self.coeff_wdata = Signal(coeff_width)
+
+        # Each 64-bit word contains two coefficients
+        self.dma = DomainRenamer({'sync': domain_dma})(
+            DmaStreamRead(width=64, axi_awidth=axi_awidth, name=dma_name,
+                          max_length_log2=coeff_awidth - 1))
+
+    def ports(self):
+        return self.dma.axi.ports() + [
+            self.start, self.address, self.num_coeffs, self.waddr_start,
+            self.busy, self.done, self.error, self.coeff_waddr,
+            self.coeff_wren, self.coeff_wdata,
+        ]
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.dma = dma = self.dma
+        # The FIFO contains the coefficient write address and data, plus a
+        # flag that marks the last coefficient.
+        m.submodules.fifo = fifo = AsyncFifoBRAM(
+            1 + self.coeff_awidth + self.coeff_width, self.fifo_depth_log2,
+            r_domain=self.domain_out, w_domain=self.domain_dma)
+
+        # domain_dma: unpack the 64-bit words into coefficients
+        waddr = Signal(self.coeff_awidth)
+        remaining = Signal.like(self.num_coeffs)
+        upper = Signal()
+        last = Signal()
+        m.d.comb += [
+            dma.start.eq(self.start),
+            dma.address.eq(self.address),
+            dma.length.eq((self.num_coeffs + 1) >> 1),
+            last.eq(remaining == 1),
+            fifo.wren.eq(dma.stream_valid & ~fifo.full),
+            fifo.data_in.eq(Cat(
+                Mux(upper, dma.stream_data[32:], dma.stream_data[:32])
+                [:self.coeff_width],
+                waddr, last)),
+            # The word is consumed after writing its upper coefficient, or
+            # after writing its lower coefficient if it is the last one.
+            dma.stream_ready.eq(~fifo.full & (upper | last)),
+            self.error.eq(dma.error),
+        ]
+        with m.If(fifo.wren):
+            m.d[self.domain_dma] += [
+                waddr.eq(waddr + 1),
+                remaining.eq(remaining - 1),
+                upper.eq(~upper),
+            ]
+        with m.If(self.start):
+            m.d[self.domain_dma] += [
+                waddr.eq(self.waddr_start),
+                remaining.eq(self.num_coeffs),
+                upper.eq(0),
+            ]
+
+        # domain_out: write the coefficients
+        fifo_valid = Signal()
+        m.d[self.domain_out] += fifo_valid.eq(fifo.rden)
+        m.d.comb += [
+            fifo.rden.eq(~fifo.empty),
+            self.coeff_wdata.eq(fifo.data_out[:self.coeff_width]),
+            self.coeff_waddr.eq(
+                fifo.data_out[self.coeff_width:][:self.coeff_awidth]),
+            self.coeff_wren.eq(fifo_valid),
+        ]
+        coeff_done = fifo_valid & fifo.data_out[-1]
+
+        # domain_out -> domain_dma
+        if self.domain_out == self.domain_dma:
+            done = coeff_done
+        else:
+            m.submodules.sync_done = sync_done = PulseSynchronizer(
+                i_domain=self.domain_out, o_domain=self.domain_dma)
+            m.d.comb += sync_done.i.eq(coeff_done)
+            done = sync_done.o
+
+        m.d.comb += self.done.eq(
+            done | (dma.finished & (self.num_coeffs == 0)))
+        with m.If(self.start & (self.num_coeffs != 0)):
+            m.d[self.domain_dma] += self.busy.eq(1)
+        with m.If(done):
+            m.d[self.domain_dma] += self.busy.eq(0)
+
+        return m
+
+
+if __name__ == '__main__':
+    loader = CoeffLoader(domain_dma='dma', domain_out='sync')
+    amaranth.cli.main(
+        loader, ports=loader.ports())
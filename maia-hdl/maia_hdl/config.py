@@ -16,17 +16,96 @@ class MaiaSDRConfig:
 
         # general
         self.platform = 0
+        # frequency of the AXI4-Lite clock in Hz, which is used to time the
+        # interrupt moderation interval in microseconds
+        self.s_axi_lite_frequency = 100_000_000
 
         # spectrometer
         self.spectrometer_address = 0x1a00_0000
+        # size of the DDR memory reserved for the spectrometer, starting at
+        # spectrometer_address
+        self.spectrometer_reserved_size = 0x0020_0000
         self.spectrometer_buffers = 8
+        # maximum number of buffers for the runtime DMA settings, so that
+        # the ring can be made deeper when the host falls behind. The
+        # memory reserved for the spectrometer must fit this many buffers.
+        self.spectrometer_max_buffers = 32
+        # maximum and minimum FFT sizes (log2) for the runtime FFT size
+        self.spectrometer_fft_order_log2 = 12
+        self.spectrometer_fft_min_order_log2 = 8
+        # maximum FFT frames overlap (log2) for the runtime overlap
+        self.spectrometer_fft_max_overlap_log2 = 2
+        # maximum bin decimation (log2) and zoom window support for the
+        # spectrometer output
+        self.spectrometer_max_bin_decimation_log2 = 4
+        self.spectrometer_zoom = True
+        # header with a timestamp and a sequence number for each spectrum,
+        # written after the buffers
+        self.spectrometer_header = True
 
         # IQ recorder
         self.recorder_address_range = (0x0100_0000, 0x1a00_0000)
+        # DMA burst length (log2) and maximum number of bursts issued ahead
+        # of their data and of outstanding write responses (log2)
+        self.recorder_dma_burst_len_log2 = 4
+        self.recorder_dma_max_outstanding_bursts = 4
+        self.recorder_dma_max_outstanding_b_log2 = 3
+        # depth (log2) of the CDC FIFO in front of the recorder DMA, in
+        # 32-bit words
+        self.recorder_fifo_depth_log2 = 11
 
     def validate(self):
         assert self.platform >= 0 and self.platform < 256
+        assert self.s_axi_lite_frequency % 1_000_000 == 0
         assert self.spectrometer_buffers > 0
         assert self.spectrometer_buffers.bit_count() == 1
+        assert self.spectrometer_max_buffers >= self.spectrometer_buffers
+        assert self.spectrometer_max_buffers.bit_count() == 1
+        assert self.spectrometer_fft_order_log2 % 2 == 0
+        assert (self.spectrometer_fft_min_order_log2
+                <= self.spectrometer_fft_order_log2)
+        assert (self.spectrometer_fft_order_log2
+                - self.spectrometer_fft_min_order_log2) % 2 == 0
+        # the DMA transfers at least one burst
+        assert self.spectrometer_fft_min_order_log2 > 4
+        assert (0 <= self.spectrometer_fft_max_overlap_log2
+                <= self.spectrometer_fft_min_order_log2)
+        assert (0 <= self.spectrometer_max_bin_decimation_log2
+                < self.spectrometer_fft_min_order_log2)
         assert self.recorder_address_range[0] < self.recorder_address_range[1]
-        # TODO: check that spectrometer and recorder buffers do not overlap
+        assert 0 <= self.recorder_dma_burst_len_log2 <= 4
+        assert self.recorder_dma_max_outstanding_bursts >= 1
+        assert self.recorder_dma_max_outstanding_b_log2 >= 0
+        # the FIFO must hold at least the bursts issued ahead of their data
+        assert (2**self.recorder_fifo_depth_log2
+                >= 2**self.recorder_dma_burst_len_log2
+                * self.recorder_dma_max_outstanding_bursts)
+        # the spectrometer base address register holds bits 31:16
+        assert self.spectrometer_address % 2**16 == 0
+        spectrometer_range = self.spectrometer_address_range()
+        assert self.spectrometer_address % (
+            self.spectrometer_max_buffers
+            * self._spectrometer_buffer_size()) == 0
+        reserved_end = (self.spectrometer_address
+                        + self.spectrometer_reserved_size)
+        assert spectrometer_range[1] <= reserved_end
+        assert (reserved_end <= self.recorder_address_range[0]
+                or self.recorder_address_range[1] <= spectrometer_range[0])
+
+    def spectrometer_address_range(self):
+        """Address range used by the spectrometer buffers
+
+        The range is given as (start, end), with the end excluded. It is
+        computed for the maximum number of buffers, and it includes the
+        spectrum headers if they are enabled.
+        """
+        # each spectrum header uses four 64-bit words
+        header_size = 32 if self.spectrometer_header else 0
+        return (self.spectrometer_address,
+                self.spectrometer_address
+                + self.spectrometer_max_buffers
+                * (self._spectrometer_buffer_size() + header_size))
+
+    def _spectrometer_buffer_size(self):
+        # each spectrum bin uses a 64-bit word
+        return 8 * 2**self.spectrometer_fft_order_log2
@@ -0,0 +1,79 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+from amaranth.lib.cdc import FFSynchronizer
+
+
+class EventCounter(Elaboratable):
+    """Event counter
+
+    This module counts the number of clock cycles in which its input is
+    asserted. It is used to implement performance counters. The counter wraps
+    around when it overflows, so the number of events in an interval can be
+    obtained by subtracting two readings modulo ``2**width``.
+
+    The counter can optionally be read from a different clock domain. In this
+    case, the counter is kept in Gray code and synchronized with flip-flops
+    to the output domain, where it is converted back to binary. Since the
+    counter increments by at most one in each cycle, the synchronized value
+    is always a value that the counter has had.
+
+    Parameters
+    ----------
+    width : int
+        Width of the counter.
+    domain : str
+        Clock domain of the event input.
+    o_domain : Optional[str]
+        Clock domain of the count output. By default, the same as ``domain``.
+    stages : int
+        Number of flip-flop synchronization stages used in the CDC.
+
+    Attributes
+    ----------
+    event : Signal(), in
+        Event input. The counter increments in each cycle in which it is
+        asserted.
+    count : Signal(width), out
+        Counter value, in the ``o_domain`` domain.
+    """
+    def __init__(self, width=32, domain='sync', o_domain=None, stages=2):
+        self.w = width
+        self._domain = domain
+        self._o_domain = domain if o_domain is None else o_domain
+        self._stages = stages
+
+        self.event = Signal()
+        self.count = Signal(width)
+
+    def ports(self):
+        return [self.event, self.count]
+
+    def elaborate(self, platform):
+        m = Module()
+        counter = Signal(self.w)
+        with m.If(self.event):
+            m.d[self._domain] += counter.eq(counter + 1)
+
+        if self._o_domain == self._domain:
+            m.d.comb += self.count.eq(counter)
+            return m
+
+        gray = Signal(self.w)
+        gray_sync = Signal(self.w)
+        m.d[self._domain] += gray.eq(counter ^ (counter >> 1))
+        m.submodules.sync_gray = FFSynchronizer(
+            gray, gray_sync, o_domain=self._o_domain, stages=self._stages)
+        binary = Signal(self.w)
+        m.d.comb += binary[-1].eq(gray_sync[-1])
+        for j in reversed(range(self.w - 1)):
+            m.d.comb += binary[j].eq(binary[j + 1] ^ gray_sync[j])
+        m.d[self._o_domain] += self.count.eq(binary)
+
+        return m
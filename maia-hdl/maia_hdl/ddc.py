@@ -39,6 +39,10 @@ class DDC(Elaboratable):
         Width of ``operations_minus_one`` input for each stage.
     macc_trunc : List[int]
         Truncation length for the output of each stage.
+    shadow : bool
+        Add a shadow copy of the mixing frequency and of the configuration and
+        coefficients of the FIR decimator, which is committed atomically by
+        ``apply``.
 
     Attributes
     ----------
@@ -83,6 +87,22 @@ class DDC(Elaboratable):
     odd_operations3 : Signal(), in
         Disable the MACC1 in the last operation of stage 1 in order to achieve
         an odd number of multiplies. See ``FIR4DSP``.
+    shadow_mode : Signal(), in
+        Enables the shadow configuration (only present if ``shadow ==
+        True``). When this is asserted, changes to ``frequency``, to the FIR
+        decimator configuration and coefficient writes only take effect when
+        ``apply`` is pulsed. See ``FIRDecimator3Stage``.
+    apply : Signal(), in
+        Commit the shadow configuration (only present if ``shadow ==
+        True``). The new frequency is used starting with the next input
+        sample, without a discontinuity in the NCO phase. Each FIR stage
+        commits its configuration at the boundary between two of its output
+        samples.
+    apply_pending : Signal(), out
+        Indicates that ``apply`` has been pulsed but the commit has not
+        happened yet in the mixer or in some of the FIR stages (only present
+        if ``shadow == True``). The commit only happens while the DDC is
+        processing input samples.
     re_in : Signal(signed(in_width)), in
         Input real part.
     im_in : Signal(signed(in_width)), in
@@ -108,7 +128,8 @@ class DDC(Elaboratable):
                  coeff_width: int = 18,
                  decim_width: list[int] = [7, 6, 7],
                  oper_width: list[int] = [7, 6, 7],
-                 macc_trunc: list[int] = [17, 18, 18]):
+                 macc_trunc: list[int] = [17, 18, 18],
+                 shadow: bool = False):
         self._3x = domain_3x
         self.iw = in_width
         self.ow = out_width
@@ -117,6 +138,7 @@ class DDC(Elaboratable):
         self.decim_width = decim_width
         self.oper_width = oper_width
         self.macc_trunc = macc_trunc
+        self.shadow = shadow
 
         self.common_edge = Signal()
         self.enable_input = Signal()
@@ -136,6 +158,10 @@ class DDC(Elaboratable):
         self.operations_minus_one3 = Signal(oper_width[2])
         self.odd_operations1 = Signal()
         self.odd_operations3 = Signal()
+        if shadow:
+            self.shadow_mode = Signal()
+            self.apply = Signal()
+            self.apply_pending = Signal()
 
         self.re_in = Signal(signed(self.iw))
         self.im_in = Signal(signed(self.iw))
@@ -145,32 +171,112 @@ class DDC(Elaboratable):
         self.im_out = Signal(signed(self.ow[-1]), reset_less=True)
         self.strobe_out = Signal()
 
+        self.mixer = Mixer(self._3x, self.iw, nco_width=self.nco_width)
+        self.decimator = FIRDecimator3Stage(
+            in_width=self.iw, out_width=self.ow,
+            coeff_width=self.coeff_width, decim_width=self.decim_width,
+            oper_width=self.oper_width, macc_trunc=self.macc_trunc,
+            shadow=shadow)
+
+    def model(self, frequency, taps, decimation, chunks, *, phase=0,
+              **kwargs):
+        """Streaming model.
+
+        This is a generator that takes an iterable of ``(re_in, im_in)``
+        chunks and yields an ``(re_out, im_out)`` chunk for each input chunk
+        (some output chunks can be empty). The NCO phase and the state of the
+        FIR stages are kept across chunks, so arbitrarily long inputs can be
+        processed with constant memory.
+
+        The model assumes that the first output of each FIR stage is computed
+        at the first input sample of that stage. After a reset, the hardware
+        delays the mixer output by ``mixer.delay`` samples and each FIR
+        stage computes its outputs one input sample later than the model, so
+        the hardware output matches the model when the input is preceded by
+        the corresponding number of zeros.
+
+        Parameters
+        ----------
+        frequency : int
+            Mixing frequency (see the ``frequency`` attribute).
+        taps : List[numpy.ndarray]
+            FIR taps of each stage.
+        decimation : List[int]
+            Decimation factor of each stage.
+        chunks : Iterable[Tuple[numpy.ndarray, numpy.ndarray]]
+            Input IQ chunks.
+        phase : int
+            NCO phase for the first input sample.
+        **kwargs
+            Other settings of the FIR stages (``bypass2``, ``bypass3``,
+            ``operations_minus_one`` and ``odd_operations``). See
+            ``FIRDecimator3Stage.model``.
+        """
+        def mix(phase):
+            for re_in, im_in in chunks:
+                yield self.mixer.model(frequency, re_in, im_in, phase=phase)
+                phase = (phase + len(re_in) * frequency) % 2**self.nco_width
+
+        return self.decimator.model(
+            taps, decimation, mix(phase), **kwargs)
+
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.mixer = mixer = Mixer(
-            self._3x, self.iw, nco_width=self.nco_width)
+        m.submodules.mixer = mixer = self.mixer
+
+        if self.shadow:
+            frequency = Signal.like(self.frequency)
+            frequency_active = Signal.like(self.frequency)
+            frequency_pending = Signal()
+            # The NCO phase is updated with the frequency in each cycle in
+            # which clken is asserted, so the commit happens at one of these
+            # cycles.
+            commit_frequency = frequency_pending & mixer.clken
+            with m.If(self.shadow_mode):
+                with m.If(commit_frequency):
+                    m.d.sync += [
+                        frequency_pending.eq(0),
+                        frequency_active.eq(self.frequency),
+                    ]
+                with m.If(self.apply):
+                    m.d.sync += frequency_pending.eq(1)
+            with m.Else():
+                m.d.sync += [
+                    frequency_pending.eq(0),
+                    frequency_active.eq(self.frequency),
+                ]
+            m.d.comb += frequency.eq(
+                Mux(self.shadow_mode & ~commit_frequency,
+                    frequency_active, self.frequency))
+        else:
+            frequency = self.frequency
 
         m.d.comb += [
             mixer.common_edge.eq(self.common_edge),
             mixer.clken.eq(self.enable_input & self.strobe_in),
-            mixer.frequency.eq(self.frequency),
+            mixer.frequency.eq(frequency),
             mixer.re_in.eq(self.re_in),
             mixer.im_in.eq(self.im_in),
         ]
 
         clk3x_renamer = DomainRenamer({'sync': self._3x})
-        m.submodules.decimator = decimator = clk3x_renamer(
-            FIRDecimator3Stage(
-                in_width=self.iw, out_width=self.ow,
-                coeff_width=self.coeff_width, decim_width=self.decim_width,
-                oper_width=self.oper_width, macc_trunc=self.macc_trunc))
+        m.submodules.decimator = decimator = clk3x_renamer(self.decimator)
         for port in ['coeff_waddr', 'coeff_wren', 'coeff_wdata', 'decimation1',
                      'decimation2', 'decimation3', 'bypass2', 'bypass3',
                      'operations_minus_one1', 'operations_minus_one2',
                      'operations_minus_one3', 'odd_operations1',
                      'odd_operations3']:
             m.d.comb += getattr(decimator, port).eq(getattr(self, port))
+        if self.shadow:
+            m.d.comb += [
+                decimator.shadow_mode.eq(self.shadow_mode),
+                # apply is a pulse in the 1x domain. Convert it to a single
+                # cycle pulse in the 3x domain.
+                decimator.apply.eq(self.apply & self.common_edge),
+                self.apply_pending.eq(
+                    frequency_pending | decimator.apply_pending),
+            ]
 
         # input CDC: sync -> 3x
         m.submodules.inbuff = inbuff = clk3x_renamer(SkidBuffer(2 * self.iw))
@@ -15,10 +15,14 @@ from . import axi
 
 
 class DmaBRAMWrite(Elaboratable):
+    # 16-word bursts
+    _burst_len_log2 = 4
+
     def __init__(self, base_address, num_buffers_log2,
                  bram_awidth, bram_latency=2,
                  axi_width=64, axi_awidth=32,
-                 name=None):
+                 name=None, min_length_log2=None, narrow_width=None,
+                 max_buffers_log2=None, header_words=0):
         """Cyclic DMA BRAM -> AXI3
 
         This module contains an AXI3 Manager that reads data from a BRAM and
@@ -45,11 +49,64 @@ class DmaBRAMWrite(Elaboratable):
             Address width of the AXI3 port.
         name : Optional[str]
             Name for the AXI3 Manager interface.
+        min_length_log2 : Optional[int]
+            log2 of the minimum transfer length (in words) that can be
+            selected at runtime. By default, the whole BRAM is always
+            transferred.
+        narrow_width : Optional[int]
+            If this is given, transfers can optionally write only the
+            ``narrow_width`` LSBs of each BRAM word. The width must be a power
+            of two bytes and smaller than ``axi_width``. Several narrow words
+            are packed in each full-width AXI beat, so the number of beats and
+            bursts is divided by ``axi_width // narrow_width``. The words are
+            packed contiguously at the beginning of the buffer.
+        header_words : int
+            Number of ``axi_width`` words of a header that is written after
+            each transfer, as a single burst. It must be a power of two
+            between 1 and 16, or zero to disable the header. The headers are
+            written to a header ring placed immediately after the
+            ring-buffer, which has an entry of ``header_words`` words for
+            each buffer.
 
         Attributes
         ----------
         axi : AXI3 Manager interface
             The AXI3 port used for writing.
+        length_log2 : Signal(range(bram_awidth + 1)), in
+            log2 of the number of words to transfer. This is only present if
+            ``min_length_log2`` is smaller than ``bram_awidth``. It is
+            latched when the transfer starts, and values outside the
+            supported range select the whole BRAM. The first ``2**length_log2``
+            BRAM addresses are transferred to the beginning of the buffer. The
+            buffer size in the ring-buffer does not depend on the transfer
+            length. When a runtime transfer length is used, AXI write
+            addresses are only issued while a transfer is in progress.
+        narrow : Signal(), in
+            Write only ``narrow_width`` bits of each BRAM word, packing them
+            in full-width beats. This is only present if ``narrow_width`` is
+            given. It is latched when the transfer starts. AXI write addresses
+            are only issued while a transfer is in progress.
+        base_address_in : Signal(axi_awidth), in
+            Base address of the ring-buffer. This is only present if
+            ``max_buffers_log2`` is given. It is latched when the transfer
+            starts, together with ``num_buffers_log2_in``. The base address
+            must be aligned to the ring-buffer size. Otherwise, the new
+            settings are ignored and the previous ones are kept. When the
+            settings change, the next transfer is written to the first
+            buffer.
+        num_buffers_log2_in : Signal(range(max_buffers_log2 + 1)), in
+            log2 of the number of buffers in the ring-buffer. This is only
+            present if ``max_buffers_log2`` is given.
+        address_error : Signal(), out
+            Indicates that ``base_address_in`` and ``num_buffers_log2_in``
+            are not valid. This is only present if ``max_buffers_log2`` is
+            given.
+        header : Signal(header_words * axi_width), in
+            Header of the transfer. This is only present if ``header_words``
+            is not zero. It is latched when the transfer starts, and the
+            first word is given by the LSBs. The header is written after
+            the transfer data, with full-width writes even if ``narrow`` is
+            used.
         start : Signal(), in
             This signal should be pulsed for a clock cycle to start a
             DMA transfer from the BRAM to the AXI3 port. It is undefined
@@ -58,7 +115,7 @@ class DmaBRAMWrite(Elaboratable):
             This signal is asserted while the DMA transfer is in progress.
         last_buffer : Signal(num_buffers_log2), out
             Contains the buffer index of the buffer that was transferred
-            previously.
+            previously. Its width is ``max_buffers_log2`` if this is given.
         raddr : Signal(), out
             BRAM read address.
         rdata : Signal(), in
@@ -74,43 +131,183 @@ class DmaBRAMWrite(Elaboratable):
             raise ValueError('address is not aligned correctly')
         self.base_address = base_address
         self.num_buffers_log2 = num_buffers_log2
+        self.max_buffers_log2 = max_buffers_log2
+        if (max_buffers_log2 is not None
+                and not 0 <= num_buffers_log2 <= max_buffers_log2):
+            raise ValueError(f'invalid max_buffers_log2 {max_buffers_log2}')
+        self.min_length_log2 = (
+            bram_awidth if min_length_log2 is None else min_length_log2)
+        if not self._burst_len_log2 < self.min_length_log2 <= bram_awidth:
+            raise ValueError(f'invalid min_length_log2 {min_length_log2}')
+        self.narrow_width = narrow_width
+        if narrow_width is not None:
+            self.narrow_bytes_log2 = int(log2(narrow_width // 8))
+            if (narrow_width != 8 * 2**self.narrow_bytes_log2
+                    or narrow_width >= axi_width):
+                raise ValueError(f'invalid narrow_width {narrow_width}')
+            # log2 of the number of narrow words in each beat
+            self.pack_log2 = self.bytes_per_word_log2 - self.narrow_bytes_log2
+            # A packed transfer contains at least one burst
+            if self.min_length_log2 - self.pack_log2 < self._burst_len_log2:
+                raise ValueError(
+                    f'min_length_log2 {min_length_log2} is too small for '
+                    f'narrow_width {narrow_width}')
+        self.header_words = header_words
+        if header_words and (header_words.bit_count() != 1
+                             or header_words > 2**self._burst_len_log2):
+            raise ValueError(f'invalid header_words {header_words}')
         self.axi_awidth = axi_awidth
         self.axi = axi.AxiInterface(
             axi.AxiDevice.MANAGER,
             [axi.AxiChannel(axi.AxiDirection.WRITE, axi_awidth, axi_width)],
             axi.AxiVersion.AXI3, name=name)
+        if self.min_length_log2 < bram_awidth:
+            self.length_log2 = Signal(range(bram_awidth + 1),
+                                      init=bram_awidth)
+        if narrow_width is not None:
+            self.narrow = Signal()
+        if max_buffers_log2 is not None:
+            self.base_address_in = Signal(axi_awidth, init=base_address)
+            self.num_buffers_log2_in = Signal(
+                range(max_buffers_log2 + 1), init=num_buffers_log2)
+            self.address_error = Signal()
+        if header_words:
+            self.header = Signal(header_words * axi_width)
         self.start = Signal()
         self.busy = Signal()
-        self.last_buffer = Signal(num_buffers_log2, init=-1)
+        self.last_buffer = Signal(
+            num_buffers_log2 if max_buffers_log2 is None
+            else max_buffers_log2,
+            init=2**num_buffers_log2 - 1)
         # BRAM ports
         self.bram_latency = bram_latency
         self.raddr = Signal(bram_awidth)
         self.rdata = Signal(axi_width)
         self.ren = Signal()
 
+    @property
+    def runtime_length(self):
+        return self.min_length_log2 < len(self.raddr)
+
+    @property
+    def runtime_address(self):
+        return self.max_buffers_log2 is not None
+
+    @property
+    def runtime_start(self):
+        # Write addresses can only be issued once the transfer has started
+        # if they depend on runtime settings.
+        return (self.runtime_length or self.narrow_width is not None
+                or self.runtime_address)
+
     def ports(self):
         return self.axi.ports() + [
             self.start, self.busy, self.last_buffer,
-            self.raddr, self.rdata, self.ren]
+            self.raddr, self.rdata, self.ren] + (
+                [self.length_log2] if self.runtime_length else []) + (
+                [self.narrow] if self.narrow_width is not None else []) + (
+                [self.base_address_in, self.num_buffers_log2_in,
+                 self.address_error] if self.runtime_address else []) + (
+                [self.header] if self.header_words else [])
 
     def elaborate(self, platform):
         m = Module()
 
-        # 16-word burst
-        burst_len_log2 = 4
+        burst_len_log2 = self._burst_len_log2
+        assert len(self.raddr) > burst_len_log2
+
+        # Mask of the BRAM address bits used in the transfer. The transfer
+        # finishes when these bits are all ones.
+        if self.runtime_length:
+            length_log2 = Signal.like(self.length_log2)
+            with m.If(self.start):
+                m.d.sync += length_log2.eq(self.length_log2)
+            raddr_mask = Signal(len(self.raddr))
+            with m.Switch(length_log2):
+                for n in range(self.min_length_log2, len(self.raddr)):
+                    with m.Case(n):
+                        m.d.comb += raddr_mask.eq(2**n - 1)
+                with m.Default():
+                    m.d.comb += raddr_mask.eq(-1)
+        else:
+            raddr_mask = Const(2**len(self.raddr) - 1, len(self.raddr))
+        burst_mask = Signal(len(self.raddr) - burst_len_log2)
+        m.d.comb += burst_mask.eq(raddr_mask[burst_len_log2:])
+        if self.narrow_width is not None:
+            narrow = Signal()
+            with m.If(self.start):
+                m.d.sync += narrow.eq(self.narrow)
+            with m.If(narrow):
+                # Each beat contains 2**pack_log2 BRAM words
+                m.d.comb += burst_mask.eq(
+                    raddr_mask[burst_len_log2 + self.pack_log2:])
+
+        # Ring-buffer base address and mask of the buffer index bits
+        axi_buffer_counter = Signal(len(self.last_buffer))
+        buffer_shift = len(self.raddr) + self.bytes_per_word_log2
+        if self.runtime_address:
+            buffers_mask_in = Signal(len(axi_buffer_counter))
+            ring_mask_in = Signal(self.axi_awidth)
+            with m.Switch(self.num_buffers_log2_in):
+                for n in range(self.max_buffers_log2 + 1):
+                    with m.Case(n):
+                        m.d.comb += [
+                            buffers_mask_in.eq(2**n - 1),
+                            ring_mask_in.eq(2**(n + buffer_shift) - 1),
+                        ]
+                with m.Default():
+                    m.d.comb += ring_mask_in.eq(-1)
+            m.d.comb += self.address_error.eq(
+                (self.base_address_in & ring_mask_in) != 0)
+            base_address = Signal(self.axi_awidth, init=self.base_address)
+            buffers_mask = Signal(len(axi_buffer_counter),
+                                  init=2**self.num_buffers_log2 - 1)
+            with m.If(self.start & ~self.address_error):
+                m.d.sync += [
+                    base_address.eq(self.base_address_in),
+                    buffers_mask.eq(buffers_mask_in),
+                ]
+                with m.If((self.base_address_in != base_address)
+                          | (buffers_mask_in != buffers_mask)):
+                    # Start again from the first buffer of the new
+                    # ring-buffer.
+                    m.d.sync += [
+                        axi_buffer_counter.eq(0),
+                        self.last_buffer.eq(buffers_mask_in),
+                    ]
+        else:
+            base_address = Const(self.base_address, self.axi_awidth)
+            buffers_mask = Const(2**self.num_buffers_log2 - 1,
+                                 len(axi_buffer_counter))
 
         # Addresses are generated independently of writes, since we know all
         # the addresses we will use beforehand.
-        assert len(self.raddr) > burst_len_log2
-        axi_addr_counter = Signal(
-            self.num_buffers_log2 + len(self.raddr) - burst_len_log2)
+        axi_burst_counter = Signal(len(self.raddr) - burst_len_log2)
+        last_axi_burst = (axi_burst_counter | ~burst_mask).all()
         m.d.comb += self.axi.awaddr.eq(
-            Cat(axi_addr_counter
-                << (burst_len_log2 + self.bytes_per_word_log2),
-                Const(self.base_address >> self.address_shift,
-                      self.axi_awidth - self.address_shift)))
+            base_address
+            | Cat(Const(0, burst_len_log2 + self.bytes_per_word_log2),
+                  axi_burst_counter,
+                  axi_buffer_counter))
+        # Indicates that the next address is the header burst
+        axi_header = Signal()
+        next_buffer = [
+            axi_burst_counter.eq(0),
+            axi_buffer_counter.eq((axi_buffer_counter + 1) & buffers_mask),
+        ]
         with m.If(self.axi.aw_handshake()):
-            m.d.sync += axi_addr_counter.eq(axi_addr_counter + 1)
+            m.d.sync += axi_burst_counter.eq(axi_burst_counter + 1)
+            with m.If(last_axi_burst):
+                if self.header_words:
+                    m.d.sync += [
+                        axi_burst_counter.eq(0),
+                        axi_header.eq(1),
+                    ]
+                else:
+                    m.d.sync += next_buffer
+            with m.If(axi_header):
+                m.d.sync += [axi_header.eq(0)] + next_buffer
+        last_axi_address = axi_header if self.header_words else last_axi_burst
 
         # Beat counter to determine the end of bursts
         beat_counter = Signal(burst_len_log2)
@@ -119,7 +316,7 @@ class DmaBRAMWrite(Elaboratable):
         m.d.comb += beat_counter_next.eq(beat_counter + 1)
 
         raddr_next = Signal(len(self.raddr) + 1)
-        last_bram_addr = raddr_next[-1]
+        last_bram_addr = (self.raddr | ~raddr_mask).all()
         m.d.comb += raddr_next.eq(self.raddr + 1)
 
         with m.If(self.ren):
@@ -127,57 +324,147 @@ class DmaBRAMWrite(Elaboratable):
         with m.If(self.start):
             m.d.sync += self.raddr.eq(0)
 
+        # Indicates that rdata contains a BRAM word of the transfer
+        data_valid = Signal()
+        # Indicates that a full beat of data is available
+        beat_valid = Signal()
         m.d.comb += [
+            beat_valid.eq(data_valid),
+            self.axi.awsize.eq(self.bytes_per_word_log2),
             self.axi.wdata.eq(self.rdata),
+            self.axi.wstrb.eq(-1),
+        ]
+        if self.narrow_width is not None:
+            # The first words of each beat are stored in a shift register,
+            # and the beat is written together with its last word. The first
+            # word goes in the LSBs.
+            pack_words = 2**self.pack_log2
+            word_phase = Signal(self.pack_log2)
+            packed = Signal(self.narrow_width * (pack_words - 1))
+            with m.If(narrow):
+                m.d.comb += [
+                    beat_valid.eq(data_valid & (word_phase == pack_words - 1)),
+                    self.axi.wdata.eq(
+                        Cat(packed, self.rdata[:self.narrow_width])),
+                ]
+
+        m.d.comb += [
             self.axi.awlen.eq(2**burst_len_log2 - 1),
             self.axi.awburst.eq(axi.AxiBurst.INCR),
             # Normal non-cacheable buffereable memory
             self.axi.awcache.eq(0b0011),
             self.axi.awprot.eq(0b0000),
             self.axi.awlock.eq(0),
-            self.axi.awsize.eq(self.bytes_per_word_log2),
-            self.axi.wstrb.eq(-1),
             self.axi.wlast.eq(last_beat),
         ]
 
-        m.d.sync += [
-            self.axi.bready.eq(1),
-            self.axi.awvalid.eq(1),
-        ]
+        # Header write
+        w_header = Signal()
+        if self.header_words:
+            header_bytes_log2 = (self.header_words.bit_length() - 1
+                                 + self.bytes_per_word_log2)
+            header = Signal.like(self.header)
+            with m.If(self.start):
+                m.d.sync += header.eq(self.header)
+            header_beat = Signal(range(self.header_words))
+            last_header_beat = header_beat == self.header_words - 1
+            # The header ring starts at the end of the ring-buffer.
+            header_address = Signal(self.axi_awidth)
+            m.d.comb += header_address.eq(
+                base_address
+                + Cat(Const(0, buffer_shift), buffers_mask + 1)
+                + Cat(Const(0, header_bytes_log2), axi_buffer_counter))
+            with m.If(axi_header):
+                m.d.comb += [
+                    self.axi.awaddr.eq(header_address),
+                    self.axi.awlen.eq(self.header_words - 1),
+                    self.axi.awsize.eq(self.bytes_per_word_log2),
+                ]
+            with m.If(w_header):
+                m.d.comb += [
+                    self.axi.wdata.eq(
+                        header.word_select(header_beat, len(self.rdata))),
+                    self.axi.wstrb.eq(-1),
+                    self.axi.wlast.eq(last_header_beat),
+                ]
+            with m.If(w_header & self.axi.w_handshake()):
+                m.d.sync += header_beat.eq(header_beat + 1)
+                with m.If(last_header_beat):
+                    m.d.sync += [
+                        header_beat.eq(0),
+                        w_header.eq(0),
+                    ]
+
+        m.d.sync += self.axi.bready.eq(1)
+        if self.runtime_start:
+            # The addresses of a transfer depend on its runtime settings, so
+            # they cannot be issued before the transfer starts.
+            with m.If(self.start):
+                m.d.sync += self.axi.awvalid.eq(1)
+            with m.If(self.axi.aw_handshake() & last_axi_address):
+                m.d.sync += self.axi.awvalid.eq(0)
+        else:
+            m.d.sync += self.axi.awvalid.eq(1)
 
         start_del = Signal(self.bram_latency)
         last_bram_addr_del = Signal(self.bram_latency)
         m.d.sync += start_del.eq(Cat(self.start, start_del[:-1]))
-        m.d.comb += self.ren.eq(start_del.any() | self.axi.w_handshake())
+        data_handshake = self.axi.w_handshake() & ~w_header
+        # A BRAM word is consumed when it is written, or when it is stored
+        # to be packed with the next words.
+        consume = Signal()
+        m.d.comb += [
+            self.axi.wvalid.eq(beat_valid | w_header),
+            consume.eq(data_valid & (~beat_valid | data_handshake)),
+            self.ren.eq(start_del.any() | consume),
+        ]
+        if self.narrow_width is not None:
+            with m.If(narrow & consume):
+                m.d.sync += [
+                    word_phase.eq(word_phase + 1),
+                    packed.eq(Cat(packed[self.narrow_width:],
+                                  self.rdata[:self.narrow_width])),
+                ]
 
         with m.If(start_del[-1]):
-            m.d.sync += self.axi.wvalid.eq(1)
-        with m.If(last_bram_addr_del[-1] & self.axi.w_handshake()):
-            m.d.sync += self.axi.wvalid.eq(0)
+            m.d.sync += data_valid.eq(1)
+        with m.If(last_bram_addr_del[-1] & consume):
+            m.d.sync += data_valid.eq(0)
+            if self.header_words:
+                m.d.sync += w_header.eq(1)
 
         bvalid_counter = Signal(len(self.raddr) - burst_len_log2)
-        bvalid_counter_next = Signal(len(bvalid_counter) + 1)
-        last_bvalid = bvalid_counter_next[-1]
-        m.d.comb += bvalid_counter_next.eq(bvalid_counter + 1)
+        last_bvalid = (bvalid_counter | ~burst_mask).all()
+        # Indicates that the next write response is for the header
+        b_header = Signal()
         # We use bvalid instead of b_handshake() here and below because bready
         # is always asserted except when in reset.
-        with m.If(self.axi.bvalid):
-            m.d.sync += bvalid_counter.eq(bvalid_counter_next)
+        with m.If(self.axi.bvalid & ~b_header):
+            m.d.sync += bvalid_counter.eq(bvalid_counter + 1)
+            with m.If(last_bvalid):
+                m.d.sync += bvalid_counter.eq(0)
+
+        transfer_done = Signal()
+        if self.header_words:
+            with m.If(self.axi.bvalid):
+                m.d.sync += b_header.eq(~b_header & last_bvalid)
+            m.d.comb += transfer_done.eq(b_header & self.axi.bvalid)
+        else:
+            m.d.comb += transfer_done.eq(last_bvalid & self.axi.bvalid)
 
         with m.If(self.start):
             m.d.sync += self.busy.eq(1)
-        with m.If(last_bvalid & self.axi.bvalid):
+        with m.If(transfer_done):
             m.d.sync += [
                 self.busy.eq(0),
-                self.last_buffer.eq(self.last_buffer + 1),
+                self.last_buffer.eq((self.last_buffer + 1) & buffers_mask),
             ]
 
-        with m.If(self.axi.w_handshake()):
-            m.d.sync += [
-                beat_counter.eq(beat_counter_next),
-                last_bram_addr_del.eq(
-                    Cat(last_bram_addr, last_bram_addr_del[:-1]))
-            ]
+        with m.If(data_handshake):
+            m.d.sync += beat_counter.eq(beat_counter_next)
+        with m.If(consume):
+            m.d.sync += last_bram_addr_del.eq(
+                Cat(last_bram_addr, last_bram_addr_del[:-1]))
 
         return m
 
@@ -192,6 +479,16 @@ class DmaStreamWrite(Elaboratable):
     read from the stream and write data from the start to the end address,
     unless it is stopped earlier.
 
+    Optionally, the DMA can also run in circular mode. In this mode, the
+    region between the start and end addresses is used as a ring-buffer. The
+    DMA wraps around at the end address and keeps running until it is
+    stopped. The consumer of the data indicates how far it has read by
+    updating ``read_pointer``, and the DMA never writes to the bursts between
+    ``read_pointer`` and ``write_pointer``. If the ring-buffer is full, the
+    DMA stops accepting data from the stream and flags an overrun. When
+    ``overwrite`` is asserted, the read pointer is ignored and the oldest data
+    in the ring-buffer is overwritten instead.
+
     Parameters
     ----------
     start_address : int
@@ -206,11 +503,51 @@ class DmaStreamWrite(Elaboratable):
         Address width of the AXI3 port.
     name : Optional[str]
         Name for the AXI3 Manager interface.
+    circular : bool
+        Enables support for the circular mode.
+    burst_len_log2 : int
+        log2 of the number of beats of each AXI3 burst (at most 4). The start
+        and end addresses must be aligned to the burst size.
+    max_outstanding_bursts : int
+        Maximum number of bursts whose write address has been issued ahead of
+        their write data.
+    max_outstanding_b_log2 : int
+        The write data is paused when more than
+        ``2**max_outstanding_b_log2`` write responses are outstanding.
 
     Attributes
     ----------
     axi : AXI3 Manager interface
        The AXI3 port used for writing.
+    circular_mode : Signal(), in
+       Selects the circular mode. This is only present if ``circular`` is
+       enabled. It is latched when the DMA transfer starts.
+    overwrite : Signal(), in
+       In circular mode, ignore ``read_pointer`` and overwrite the oldest
+       data when the ring-buffer is full. This is only present if
+       ``circular`` is enabled. It is latched when the DMA transfer starts.
+    read_pointer : Signal(axi_awidth), in
+       Address of the next byte that the consumer will read in circular mode.
+       It must be aligned to the burst size. It should be set to
+       the start address before the DMA transfer starts. This is only present
+       if ``circular`` is enabled.
+    write_pointer : Signal(axi_awidth), out
+       Address following the last burst whose write response has been
+       received. The data before this address can be read by the consumer.
+       This is only present if ``circular`` is enabled.
+    watermark_bursts : Signal(16), in
+       Number of bursts between ``watermark`` pulses. Each burst contains
+       ``2**burst_len_log2`` beats of 8 bytes. The value zero disables the
+       watermark. This is only present if ``circular`` is enabled.
+    watermark : Signal(), out
+       Pulsed for one cycle each time that ``watermark_bursts`` more
+       bursts have been written. This is only present if ``circular`` is
+       enabled.
+    overrun : Signal(), out
+       Indicates that the ring-buffer has been full at some point, so the
+       DMA had to stop accepting data from the stream. It is cleared when
+       the DMA transfer starts. This is only present if ``circular`` is
+       enabled.
     start : Signal(), in
        This signal should be pulsed for a clock cycle to start a DMA transfer.
        It is undefined behaviour to pulse this signal while the module is
@@ -224,7 +561,8 @@ class DmaStreamWrite(Elaboratable):
        This signal is pulsed for one cycle after the module has finished its
        operation, including all the outstanding write bursts. This happens
        either some time after the module has been commanded to stop by pulsing
-       the stop line or after the module has reached the end address.
+       the stop line or after the module has reached the end address (only
+       when not in circular mode).
     next_address : Signal(), out
        After the DMA is finished, this contains the next address that would
        have been written to.
@@ -236,15 +574,36 @@ class DmaStreamWrite(Elaboratable):
        Stream ready. Semantics are as in AXI4-Stream.
     """
     def __init__(self, start_address, end_address, width=64, axi_awidth=32,
-                 name=None):
+                 name=None, circular=False, burst_len_log2=4,
+                 max_outstanding_bursts=2, max_outstanding_b_log2=2):
         self.start_address = start_address
         self.end_address = end_address
         self.w = width
         self.axi_awidth = axi_awidth
+        self.circular = circular
+        if not 0 <= burst_len_log2 <= 4:
+            raise ValueError(f'invalid burst_len_log2 {burst_len_log2}')
+        self.burst_len_log2 = burst_len_log2
+        if max_outstanding_bursts < 1:
+            raise ValueError(
+                f'invalid max_outstanding_bursts {max_outstanding_bursts}')
+        self.max_outstanding_bursts = max_outstanding_bursts
+        if max_outstanding_b_log2 < 0:
+            raise ValueError(
+                f'invalid max_outstanding_b_log2 {max_outstanding_b_log2}')
+        self.max_outstanding_b_log2 = max_outstanding_b_log2
         self.axi = axi.AxiInterface(
             axi.AxiDevice.MANAGER,
             [axi.AxiChannel(axi.AxiDirection.WRITE, axi_awidth, width)],
             axi.AxiVersion.AXI3, name=name)
+        if circular:
+            self.circular_mode = Signal()
+            self.overwrite = Signal()
+            self.read_pointer = Signal(axi_awidth, init=start_address)
+            self.write_pointer = Signal(axi_awidth)
+            self.watermark_bursts = Signal(16)
+            self.watermark = Signal()
+            self.overrun = Signal()
         self.start = Signal()
         self.stop = Signal()
         self.finished = Signal()
@@ -257,15 +616,18 @@ class DmaStreamWrite(Elaboratable):
     def ports(self):
         return self.axi.ports() + [
             self.start, self.stop, self.finished,
-            self.stream_data, self.stream_valid, self.stream_ready]
+            self.stream_data, self.stream_valid, self.stream_ready] + (
+                [self.circular_mode, self.overwrite, self.read_pointer,
+                 self.write_pointer, self.watermark_bursts, self.watermark,
+                 self.overrun]
+                if self.circular else [])
 
     def elaborate(self, platform):
         m = Module()
 
         running = Signal()
 
-        # 16-word burst
-        burst_len_log2 = 4
+        burst_len_log2 = self.burst_len_log2
         bytes_per_word_log2 = int(log2(self.w // 8))
         addr_shift = burst_len_log2 + bytes_per_word_log2
         if (((self.start_address >> addr_shift)
@@ -273,8 +635,11 @@ class DmaStreamWrite(Elaboratable):
             or ((self.end_address >> addr_shift)
                 << addr_shift != self.end_address)):
             raise ValueError('address is not aligned correctly')
-        one_outstanding_burst = Signal()
-        two_outstanding_bursts = Signal()
+        # Number of bursts whose write address has been issued but whose
+        # write data has not been completely sent yet.
+        outstanding_bursts = Signal(range(self.max_outstanding_bursts + 1))
+        max_outstanding_bursts = (
+            outstanding_bursts == self.max_outstanding_bursts)
 
         axi_addr_counter_reset = self.start_address >> addr_shift
         axi_addr_counter = Signal(
@@ -290,17 +655,76 @@ class DmaStreamWrite(Elaboratable):
             addr_counter_end.eq(
                 axi_addr_counter[r:]
                 == (self.end_address >> (addr_shift + r))),
-            self.axi.awvalid.eq(
-                running & ~two_outstanding_bursts & ~addr_counter_end),
         ]
+
+        if self.circular:
+            circular_mode = Signal()
+            overwrite = Signal()
+            with m.If(self.start):
+                m.d.sync += [
+                    circular_mode.eq(self.circular_mode),
+                    overwrite.eq(self.overwrite),
+                ]
+            last_burst_counter = (self.end_address >> addr_shift) - 1
+
+            def counter_next(counter):
+                # Increment a burst counter, wrapping around at the end
+                # address in circular mode.
+                return Mux(circular_mode & (counter == last_burst_counter),
+                           axi_addr_counter_reset, counter + 1)
+
+            axi_addr_counter_next = Signal.like(axi_addr_counter)
+            m.d.comb += axi_addr_counter_next.eq(
+                counter_next(axi_addr_counter))
+            # The ring-buffer is full when the next burst would reach the
+            # read pointer. One burst is always left unused, so that a full
+            # ring-buffer can be told apart from an empty one.
+            ring_full = Signal()
+            m.d.comb += ring_full.eq(
+                circular_mode & ~overwrite
+                & (axi_addr_counter_next
+                   == self.read_pointer[addr_shift:]))
+            with m.If(running & ring_full):
+                m.d.sync += self.overrun.eq(1)
+
+            # Write pointer and watermark, which are updated with the write
+            # responses.
+            write_counter = Signal.like(axi_addr_counter)
+            watermark_counter = Signal.like(self.watermark_bursts)
+            watermark_counter_next = Signal(len(watermark_counter) + 1)
+            m.d.comb += [
+                self.write_pointer.eq(write_counter << addr_shift),
+                watermark_counter_next.eq(watermark_counter + 1),
+            ]
+            m.d.sync += self.watermark.eq(0)
+            with m.If(self.axi.bvalid):
+                m.d.sync += [
+                    write_counter.eq(counter_next(write_counter)),
+                    watermark_counter.eq(watermark_counter_next),
+                ]
+                with m.If(watermark_counter_next == self.watermark_bursts):
+                    m.d.sync += [
+                        watermark_counter.eq(0),
+                        self.watermark.eq(1),
+                    ]
+            with m.If(self.start):
+                m.d.sync += [
+                    write_counter.eq(axi_addr_counter_reset),
+                    watermark_counter.eq(0),
+                    self.overrun.eq(0),
+                ]
+        else:
+            axi_addr_counter_next = axi_addr_counter + 1
+            ring_full = C(0)
+
+        m.d.comb += self.axi.awvalid.eq(
+            running & ~max_outstanding_bursts & ~addr_counter_end
+            & ~ring_full)
         with m.If(self.axi.aw_handshake()):
-            m.d.sync += axi_addr_counter.eq(axi_addr_counter + 1)
+            m.d.sync += axi_addr_counter.eq(axi_addr_counter_next)
             with m.If(~(self.axi.w_handshake() & self.axi.wlast)):
                 # increase number of outstanding bursts
-                m.d.sync += [
-                    one_outstanding_burst.eq(~one_outstanding_burst),
-                    two_outstanding_bursts.eq(one_outstanding_burst),
-                ]
+                m.d.sync += outstanding_bursts.eq(outstanding_bursts + 1)
 
         # Beat counter to determine the end of bursts
         beat_counter = Signal(burst_len_log2)
@@ -323,7 +747,7 @@ class DmaStreamWrite(Elaboratable):
         m.d.sync += self.axi.bready.eq(1)
 
         # outstanding write response control
-        max_outstanding_b_log2 = 2
+        max_outstanding_b_log2 = self.max_outstanding_b_log2
         # outstanding_b contains the number of outstanding write responses - 1
         # in two's complement. This allows us to check 0 outstanding by looking
         # at a single bit and max outstanding by looking at two bits.
@@ -338,8 +762,7 @@ class DmaStreamWrite(Elaboratable):
 
         enable_w = Signal()
         m.d.comb += [
-            enable_w.eq((one_outstanding_burst | two_outstanding_bursts)
-                        & ~full_outstanding_b),
+            enable_w.eq((outstanding_bursts != 0) & ~full_outstanding_b),
             self.axi.wvalid.eq(enable_w & self.stream_valid),
             self.stream_ready.eq(enable_w & self.axi.wready),
         ]
@@ -347,10 +770,7 @@ class DmaStreamWrite(Elaboratable):
             m.d.sync += beat_counter.eq(beat_counter_next)
             with m.If(self.axi.wlast & ~self.axi.aw_handshake()):
                 # decrease number of outstanding bursts
-                m.d.sync += [
-                    one_outstanding_burst.eq(two_outstanding_bursts),
-                    two_outstanding_bursts.eq(0),
-                ]
+                m.d.sync += outstanding_bursts.eq(outstanding_bursts - 1)
 
         with m.If(self.stop | addr_counter_end):
             m.d.sync += running.eq(0)
@@ -359,19 +779,194 @@ class DmaStreamWrite(Elaboratable):
                 running.eq(1),
                 axi_addr_counter.eq(axi_addr_counter_reset),
             ]
-        one_outstanding_burst_q = Signal()
         no_outstanding_b_q = Signal(init=1)
         m.d.sync += [
             no_outstanding_b_q.eq(no_outstanding_b),
             self.finished.eq(
-                ~running
-                & ~one_outstanding_burst & ~two_outstanding_bursts
+                ~running & (outstanding_bursts == 0)
                 & ~no_outstanding_b_q & no_outstanding_b),
         ]
 
         return m
 
 
+class DmaStreamRead(Elaboratable):
+    """DMA AXI3 -> stream
+
+    This module contains an AXI3 Manager that reads a block of data from an
+    AXI3 port and presents it on an AXI4-Stream-like interface.
+
+    The start address and the length of the block are given at runtime. When
+    started, the DMA issues read bursts for the whole block, keeping at most
+    ``max_outstanding_bursts`` bursts whose data has not been received. The
+    last burst is shortened if the length is not a multiple of the burst
+    length. The read data channel is stalled whenever the stream is not
+    ready.
+
+    Parameters
+    ----------
+    width : int
+        Data width of the AXI3 and stream ports.
+    axi_awidth : int
+        Address width of the AXI3 port.
+    name : Optional[str]
+        Name for the AXI3 Manager interface.
+    burst_len_log2 : int
+        log2 of the maximum number of beats of each AXI3 burst (at most 4).
+    max_length_log2 : int
+        log2 of the maximum number of words in a block.
+    max_outstanding_bursts : int
+        Maximum number of bursts whose read address has been issued and whose
+        read data has not been completely received.
+
+    Attributes
+    ----------
+    axi : AXI3 Manager interface
+       The AXI3 port used for reading.
+    start : Signal(), in
+       This signal should be pulsed for a clock cycle to start a DMA transfer.
+       It is undefined behaviour to pulse this signal while the module is
+       busy.
+    address : Signal(axi_awidth), in
+       Address of the block. It is latched when the DMA transfer starts. It
+       must be aligned to the burst size, so that bursts do not cross 4 KiB
+       boundaries. The LSBs below the burst size are ignored.
+    length : Signal(range(2**max_length_log2 + 1)), in
+       Number of words in the block. It is latched when the DMA transfer
+       starts.
+    busy : Signal(), out
+       Indicates that a DMA transfer is in progress.
+    finished : Signal(), out
+       This signal is pulsed for one cycle after the last word of the block
+       has been presented in the stream.
+    error : Signal(), out
+       Indicates that some read response of the last DMA transfer was not
+       OKAY. It is cleared when the DMA transfer starts.
+    stream_data : Signal(width), out
+       Stream data output.
+    stream_valid : Signal(), out
+       Stream valid. Semantics are as in AXI4-Stream.
+    stream_ready : Signal(), in
+       Stream ready. Semantics are as in AXI4-Stream.
+    stream_last : Signal(), out
+       Asserted together with the last word of the block.
+    """
+    def __init__(self, width=64, axi_awidth=32, name=None, burst_len_log2=4,
+                 max_length_log2=16, max_outstanding_bursts=2):
+        self.w = width
+        self.axi_awidth = axi_awidth
+        if not 0 <= burst_len_log2 <= 4:
+            raise ValueError(f'invalid burst_len_log2 {burst_len_log2}')
+        self.burst_len_log2 = burst_len_log2
+        self.max_length_log2 = max_length_log2
+        if max_outstanding_bursts < 1:
+            raise ValueError(
+                f'invalid max_outstanding_bursts {max_outstanding_bursts}')
+        self.max_outstanding_bursts = max_outstanding_bursts
+        self.axi = axi.AxiInterface(
+            axi.AxiDevice.MANAGER,
+            [axi.AxiChannel(axi.AxiDirection.READ, axi_awidth, width)],
+            axi.AxiVersion.AXI3, name=name)
+        self.start = Signal()
+        self.address = Signal(axi_awidth)
+        self.length = Signal(range(2**max_length_log2 + 1))
+        self.busy = Signal()
+        self.finished = Signal()
+        self.error = Signal()
+        # Stream ports
+        self.stream_data = Signal(width)
+        self.stream_valid = Signal()
+        self.stream_ready = Signal()
+        self.stream_last = Signal()
+
+    def ports(self):
+        return self.axi.ports() + [
+            self.start, self.address, self.length, self.busy, self.finished,
+            self.error, self.stream_data, self.stream_valid,
+            self.stream_ready, self.stream_last]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bytes_per_word_log2 = int(log2(self.w // 8))
+        burst_len = 2**self.burst_len_log2
+        burst_bytes_log2 = self.burst_len_log2 + bytes_per_word_log2
+
+        # Read address channel
+        ar_address = Signal(self.axi_awidth - burst_bytes_log2)
+        ar_remaining = Signal.like(self.length)
+        outstanding_bursts = Signal(range(self.max_outstanding_bursts + 1))
+        issue_burst = Signal()
+        burst_done = Signal()
+        m.d.comb += [
+            issue_burst.eq(
+                (~self.axi.arvalid | self.axi.arready)
+                & (ar_remaining != 0)
+                & ((outstanding_bursts < self.max_outstanding_bursts)
+                   | burst_done)),
+            burst_done.eq(self.axi.r_handshake() & self.axi.rlast),
+        ]
+        with m.If(self.axi.ar_handshake()):
+            m.d.sync += self.axi.arvalid.eq(0)
+        with m.If(issue_burst):
+            m.d.sync += [
+                self.axi.arvalid.eq(1),
+                self.axi.araddr.eq(
+                    Cat(Const(0, burst_bytes_log2), ar_address)),
+                self.axi.arlen.eq(
+                    Mux(ar_remaining >= burst_len, burst_len - 1,
+                        ar_remaining - 1)),
+                ar_address.eq(ar_address + 1),
+                ar_remaining.eq(
+                    Mux(ar_remaining >= burst_len, ar_remaining - burst_len,
+                        0)),
+            ]
+        with m.If(issue_burst & ~burst_done):
+            m.d.sync += outstanding_bursts.eq(outstanding_bursts + 1)
+        with m.Elif(~issue_burst & burst_done):
+            m.d.sync += outstanding_bursts.eq(outstanding_bursts - 1)
+
+        m.d.comb += [
+            self.axi.arburst.eq(axi.AxiBurst.INCR),
+            # Normal non-cacheable buffereable memory
+            self.axi.arcache.eq(0b0011),
+            self.axi.arprot.eq(0b0000),
+            self.axi.arlock.eq(0),
+            self.axi.arsize.eq(bytes_per_word_log2),
+        ]
+
+        # Read data channel
+        r_remaining = Signal.like(self.length)
+        m.d.comb += [
+            self.stream_data.eq(self.axi.rdata),
+            self.stream_valid.eq(self.axi.rvalid & self.busy),
+            self.stream_last.eq(r_remaining == 1),
+            self.axi.rready.eq(self.stream_ready & self.busy),
+        ]
+        m.d.sync += self.finished.eq(0)
+        with m.If(self.axi.r_handshake()):
+            m.d.sync += r_remaining.eq(r_remaining - 1)
+            with m.If(self.axi.rresp != axi.AxiResp.OKAY.value):
+                m.d.sync += self.error.eq(1)
+            with m.If(r_remaining == 1):
+                m.d.sync += [
+                    self.busy.eq(0),
+                    self.finished.eq(1),
+                ]
+
+        with m.If(self.start):
+            m.d.sync += [
+                ar_address.eq(self.address[burst_bytes_log2:]),
+                ar_remaining.eq(self.length),
+                r_remaining.eq(self.length),
+                self.busy.eq(self.length != 0),
+                self.finished.eq(self.length == 0),
+                self.error.eq(0),
+            ]
+
+        return m
+
+
 def gen_verilog():
     with open('dma.v', 'w') as f:
         m = DmaBRAMWrite(0x08000000, 6, 12)
@@ -389,6 +984,14 @@ def gen_verilog():
                 name='dma_stream_write',
                 ports=m.ports(),
                 emit_src=False))
+    with open('dma_stream_read.v', 'w') as f:
+        m = DmaStreamRead()
+        f.write(
+            amaranth.back.verilog.convert(
+                m,
+                name='dma_stream_read',
+                ports=m.ports(),
+                emit_src=False))
 
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@ import amaranth.back.verilog
 import numpy as np
 import scipy.signal
 
+import functools
 import operator
 
 from .cmult import Cmult, Cmult3x
@@ -754,6 +755,27 @@ class TwiddleI(Elaboratable):
         return m
 
 
+@functools.lru_cache(maxsize=64)
+def _twiddle_table(order, radix_log2, r22_mode, twiddle_width):
+    # Twiddle factors for Twiddle. The tables are cached and shared by all the
+    # Twiddle instances, so they are returned as read-only arrays.
+    j_iter = (
+        range(2**radix_log2)
+        if not r22_mode
+        else [0, 2, 1, 3])
+    j = np.array(j_iter)[:, np.newaxis]
+    k = np.arange(2**(radix_log2*(order-1)))
+    twiddle_complex = np.exp(
+        -1j*np.pi*j*k/2**(radix_log2*order-1)).ravel()
+    # Twiddle.twiddle_scale_clog2()
+    twiddle_scale = 1 << (twiddle_width - 2)
+    tables = tuple(np.round(twiddle_scale * x).astype('int')
+                   for x in [twiddle_complex.real, twiddle_complex.imag])
+    for table in tables:
+        table.flags.writeable = False
+    return tables
+
+
 class Twiddle(Elaboratable):
     """Twiddle factor multiplication
 
@@ -891,8 +913,7 @@ class Twiddle(Elaboratable):
         v = self.model_vlen
         re_in, im_in = (np.array(x, 'int').reshape(-1, v)
                         for x in [re_in, im_in])
-        tw_re, tw_im = (np.array(x, 'int')
-                        for x in self.twiddles_full())
+        tw_re, tw_im = self.twiddles_full()
         trunc = self.twiddle_scale_clog2()
         re_out = clamp_nbits(
             (re_in * tw_re - im_in * tw_im).ravel() >> trunc,
@@ -906,20 +927,8 @@ class Twiddle(Elaboratable):
         return self.tw - 2
 
     def twiddles_full(self):
-        j_iter = (
-            range(2**self.radix_log2)
-            if not self.r22_mode
-            else [0, 2, 1, 3])
-        twiddle_complex = np.array([
-            np.exp(-1j*np.pi*j*k/2**(self.radix_log2*self.order-1))
-            for j in j_iter
-            for k in range(2**(self.radix_log2*(self.order-1)))])
-        twiddle_scale = 1 << self.twiddle_scale_clog2()
-        twiddle_int_re = [int(a) for a in
-                          np.round(twiddle_scale * twiddle_complex.real)]
-        twiddle_int_im = [int(a) for a in
-                          np.round(twiddle_scale * twiddle_complex.imag)]
-        return twiddle_int_re, twiddle_int_im
+        return _twiddle_table(
+            self.order, self.radix_log2, self.r22_mode, self.tw)
 
     def twiddles_elaborate(self):
         twiddles_re, twiddles_im = self.twiddles_full()
@@ -952,7 +961,8 @@ class Twiddle(Elaboratable):
         # Pack re and im together in the same Memory
         mask = 2**self.tw - 1
         twiddles_packed = [((re & mask) << self.tw) | (im & mask)
-                           for re, im in zip(twiddles_re, twiddles_im)]
+                           for re, im in zip(twiddles_re.tolist(),
+                                             twiddles_im.tolist())]
         mem_attrs = {
             'ram_style': (
                 'distributed' if self.storage == 'lut'
@@ -1005,6 +1015,24 @@ class Twiddle(Elaboratable):
         return m
 
 
+@functools.lru_cache(maxsize=64)
+def _window_table(window, order_log2, coeff_width):
+    # Window coefficients for Window. The tables are cached and shared by all
+    # the Window instances, so they are returned as read-only arrays.
+    #
+    # We use fftbins=False to get a symmetric window. Even though we want the
+    # window for an FFT, we prefer a symmetric window because this allows us
+    # to store only the left half of the window.
+    w = scipy.signal.get_window(window, 2**order_log2, fftbins=False)
+    if np.any(w < 0):
+        raise ValueError(
+            'windows with negative coefficients not supported')
+    scale = 2**coeff_width - 1
+    table = np.round(scale * w).astype('int')
+    table.flags.writeable = False
+    return table
+
+
 class Window(Elaboratable):
     """Window multiplication
 
@@ -1079,26 +1107,25 @@ class Window(Elaboratable):
     def model_vlen(self):
         return 2**self.order_log2
 
-    def model(self, re_in, im_in):
-        v = self.model_vlen
-        re_in, im_in = (np.array(x, 'int').reshape(-1, v)
+    def model(self, re_in, im_in, order_log2=None):
+        w = self.window(order_log2)
+        re_in, im_in = (np.array(x, 'int').reshape(-1, w.size)
                         for x in [re_in, im_in])
-        w = self.window()
         re_out = (re_in * w).ravel() >> self.truncate
         im_out = (im_in * w).ravel() >> self.truncate
         return re_out, im_out
 
-    def window(self):
-        # We use fftbins=False to get a symmetric window. Even though we want
-        # the window for an FFT, we prefer a symmetric window because this
-        # allows us to store only the left half of the window.
-        w = scipy.signal.get_window(self.window_name, 2**self.order_log2,
-                                    fftbins=False)
-        if np.any(w < 0):
-            raise ValueError(
-                'windows with negative coefficients not supported')
-        scale = 2**self.cw - 1
-        return [int(a) for a in np.round(scale * w)]
+    def window(self, order_log2=None):
+        """Window coefficients.
+
+        If ``order_log2`` is given, this returns the window used for a runtime
+        FFT size of ``2**order_log2``, which is obtained by decimating the
+        full-size window (see ``FFTControl``).
+        """
+        table = _window_table(self.window_name, self.order_log2, self.cw)
+        if order_log2 is None:
+            return table
+        return table[::2**(self.order_log2 - order_log2)]
 
     def elaborate(self, platform):
         m = Module()
@@ -1108,7 +1135,7 @@ class Window(Elaboratable):
             Memory(
                 shape=self.cw,
                 depth=2**(self.order_log2-1),
-                init=self.window()[:2**(self.order_log2-1)],
+                init=self.window()[:2**(self.order_log2-1)].tolist(),
                 attrs={'ram_style': 'block'},
             ))
         rdport = window_mem.read_port(domain='sync')
@@ -1155,6 +1182,9 @@ class FFTControl(Elaboratable):
         List of twiddle factor modules, ordered from input to output.
     window : Optional[Elaboratable]
         Window module (if present).
+    nbypass : int
+        Maximum number of stages that can be bypassed at runtime in order to
+        compute a smaller FFT.
 
     Attributes
     ----------
@@ -1162,6 +1192,14 @@ class FFTControl(Elaboratable):
         Delay (in samples) from input to output of the FFT.
     clken : Signal(), in
         Clock enable.
+    bypass : Signal(range(nbypass + 1)), in
+        Number of stages that are bypassed. This is only present if
+        ``nbypass`` is non-zero. When ``n`` stages are bypassed, the input of
+        the FFT (or the output of the window) should be connected to butterfly
+        ``n`` (see ``FFT``), and the last stages compute an FFT of size
+        ``2**order_stage(n)``. The window coefficients are decimated
+        accordingly, and the twiddle counters and ``out_last`` account for
+        the shorter pipeline.
     mux_control : list[Optional[Signal()]], out
         List of ``mux_control`` output signals for each of the butterflies
         (and None in the positions corresponding to R22SDF butterflies).
@@ -1183,14 +1221,18 @@ class FFTControl(Elaboratable):
         presented at the output.
     """
     # butterflies and twiddles are passed ordered from input to output
-    def __init__(self, butterflies, twiddles, window):
+    def __init__(self, butterflies, twiddles, window, nbypass=0):
         assert len(butterflies) == len(twiddles) + 1
+        assert 0 <= nbypass < len(butterflies)
         self.butterflies = butterflies
         self.twiddles = twiddles
         self.window = window
         self.stages = len(butterflies)
+        self.nbypass = nbypass
 
         self.clken = Signal()
+        if nbypass:
+            self.bypass = Signal(range(nbypass + 1))
         self._clken_out = Signal()  # used to connect clken of stages
         if self.window is not None:
             self.window_index = Signal(self.window.coeff_index.shape())
@@ -1245,6 +1287,17 @@ class FFTControl(Elaboratable):
     def order_stage(self, n):
         return sum([bfly.radix_log2 for bfly in self.butterflies[n:]])
 
+    def bypass_delay(self, n):
+        """Gives the reduction of the FFT delay when ``n`` stages are
+        bypassed"""
+        return self.delay_butterflies_input()[n] - self.delay_window
+
+    def _bypass_select(self, values):
+        # Selects values[n] when n stages are bypassed
+        if not self.nbypass:
+            return values[0]
+        return Array(values)[self.bypass]
+
     def elaborate(self, platform):
         m = Module()
         m.d.comb += self._clken_out.eq(self.clken)
@@ -1285,7 +1338,12 @@ class FFTControl(Elaboratable):
                     for j in range(1, len(mux_bfly0_delay))]
             m.d.comb += [
                 counter_window_next.eq(counter_window + 1),
-                self.window_index.eq(counter_window),
+                # When stages are bypassed, the window is decimated by
+                # reading every 2**k-th coefficient.
+                self.window_index.eq(self._bypass_select([
+                    counter_window << (self.order_stage(0)
+                                       - self.order_stage(n))
+                    for n in range(self.nbypass + 1)])),
                 self.control_output(0).eq(mux_bfly0_delay[-1]),
             ]
 
@@ -1321,22 +1379,59 @@ class FFTControl(Elaboratable):
                             + self.twiddles[j-1].twiddle_index_advance)]
             for j in range(1, self.stages)]
 
+        # counter_bfly0_next and counter_bfly0 (or counter_bfly0_q, depending
+        # on whether use_bram_reg is enabled) are used to provide the read and
+        # write addresses of the butterflies that use BRAMs. If the counter for
+        # butterfly0 is replaced by the counter for the window, the counter for
+        # the window is used here instead.
+        if self.window is not None:
+            counter0 = counter_window
+            counter0_next = counter_window_next
+            if any_bfly_bram:
+                counter0_q = counter_window_q
+        else:
+            counter0 = counter_bfly0
+            counter0_next = counter_bfly0_next
+            if any_bfly_bram:
+                counter0_q = counter_bfly0_q
+        counter0_init = counter0.init
+
         # Counters to control the twiddle indexes.
+        #
+        # These, and the out_last counter, are obtained by adding a constant
+        # offset to counter0_next, rather than by incrementing them. This
+        # allows the offset to depend on the number of bypassed stages, since
+        # bypassing stages reduces the delay from the FFT input to the input
+        # of each twiddle.
         counters_twiddles = [
             Signal(w := self.order_stage(j), name=f'counter_twiddle{j}',
                    init=(self.twiddles[j].twiddle_index_advance
                          - delay_twiddles_input[j]) % 2**w)
             for j in range(self.stages - 1)]
+        counters_twiddles_offset = [
+            self._bypass_select([
+                (counter.init - counter0_init + self.bypass_delay(n))
+                % 2**len(counter)
+                for n in range(self.nbypass + 1)])
+            for counter in counters_twiddles]
 
         # Counter to generate the out_last signal
         out_last_counter = Signal(
             w := self.order_stage(0), init=(-self.fft_delay + 1) % 2**w)
-        out_last_counter_next = Signal(self.order_stage(0) + 1)
-        out_last_counter_carry = out_last_counter_next[-1]
+        out_last_counter_offset = self._bypass_select([
+            (out_last_counter.init - counter0_init + self.bypass_delay(n))
+            % 2**w
+            for n in range(self.nbypass + 1)])
+        # out_last is asserted after the LSBs of the out_last_counter
+        # corresponding to the FFT size are all ones.
+        out_last_mask = self._bypass_select([
+            2**self.order_stage(n) - 1 for n in range(self.nbypass + 1)])
 
         with m.If(self.clken):
             m.d.sync += [
-                counter.eq(counter + 1) for counter in counters_twiddles]
+                counter.eq(counter0_next + offset)
+                for counter, offset in zip(counters_twiddles,
+                                           counters_twiddles_offset)]
             for j in range(self.stages - 1):
                 m.d.sync += mux_bfly_delay[j][0].eq(
                     self.butterfly_delay_in(counters_twiddles[j], j + 1))
@@ -1344,8 +1439,9 @@ class FFTControl(Elaboratable):
                     mux_bfly_delay[j][k].eq(mux_bfly_delay[j][k - 1])
                     for k in range(1, len(mux_bfly_delay[j]))]
             m.d.sync += [
-                out_last_counter.eq(out_last_counter_next),
-                self.out_last.eq(out_last_counter_carry)]
+                out_last_counter.eq(counter0_next + out_last_counter_offset),
+                self.out_last.eq(
+                    (out_last_counter & out_last_mask) == out_last_mask)]
         m.d.comb += [
             self.control_output(j).eq(
                 mux_bfly_delay[j - 1][-1])
@@ -1353,23 +1449,7 @@ class FFTControl(Elaboratable):
         m.d.comb += [
             self.twiddle_index[j].eq(counters_twiddles[j])
             for j in range(self.stages-1)]
-        m.d.comb += out_last_counter_next.eq(out_last_counter + 1)
 
-        # counter_bfly0_next and counter_bfly0 (or counter_bfly0_q, depending
-        # on whether use_bram_reg is enabled) are used to provide the read and
-        # write addresses of the butterflies that use BRAMs. If the counter for
-        # butterfly0 is replaced by the counter for the window, the counter for
-        # the window is used here instead.
-        if self.window is not None:
-            counter0 = counter_window
-            counter0_next = counter_window_next
-            if any_bfly_bram:
-                counter0_q = counter_window_q
-        else:
-            counter0 = counter_bfly0
-            counter0_next = counter_bfly0_next
-            if any_bfly_bram:
-                counter0_q = counter_bfly0_q
         for j in range(self.stages):
             if (bfly := self.butterflies[j]).storage == 'bram':
                 w = len(bfly.bram_raddr)
@@ -1496,11 +1576,26 @@ class FFT(Elaboratable):
     domain_3x : Optional[str]
         Name of the clock domain of the 3x clock. This is only used when
         cmult3x is enabled.
+    min_order_log2 : Optional[int]
+        log2 of the minimum FFT size that can be selected at runtime. The
+        runtime size is selected by bypassing the first stages of the FFT, so
+        ``order_log2 - min_order_log2`` must be a multiple of the log2 of the
+        radix. By default, the FFT size is fixed.
 
     Attributes
     ----------
     clken : Signal(), in
         Clock enable.
+    size_log2 : Signal(range(order_log2 + 1)), in
+        log2 of the FFT size used at runtime. This is only present if
+        ``min_order_log2`` is smaller than ``order_log2``. The supported
+        values are ``order_log2 - k * radix_log2``, with ``k`` a non-negative
+        integer, that are greater or equal than ``min_order_log2``. Other
+        values select the maximum FFT size. The FFT outputs are not valid
+        until the pipeline has been flushed after a change in this signal.
+        When a smaller FFT size is used, the input is shifted left to use
+        the datapath width of the first stage that is not bypassed, and the
+        window is decimated.
     common_edge_2x : Signal(), in
         A signal that toggles with the 2x clock and is high immediately
         after the rising edge of the 1x clock. This is only present when
@@ -1525,11 +1620,13 @@ class FFT(Elaboratable):
                  width_twiddle=None, truncates=None,
                  butterfly_storage='auto', twiddle_storage='auto',
                  use_bram_reg=True, window=None, cmult3x=False,
-                 domain_2x=None, domain_3x=None):
+                 domain_2x=None, domain_3x=None, min_order_log2=None):
         if radix not in [2, 4, 'R22']:
             raise ValueError(
                 f"invalid radix {radix} (radix can only be 2, 4 or 'R22')")
         self.order_log2 = order_log2
+        if min_order_log2 is None:
+            min_order_log2 = order_log2
 
         if width_twiddle is None:
             width_twiddle = width_in
@@ -1539,6 +1636,14 @@ class FFT(Elaboratable):
         bfly_trunc = {2: 1, 4: 2, 'R22': [1, 1]}[radix]
         r22_mode = radix == 'R22'
         self.nstages = nstages = self.order_log2 // radix_log2
+        self.radix_log2 = radix_log2
+        if (min_order_log2 < radix_log2 or min_order_log2 > order_log2
+                or (order_log2 - min_order_log2) % radix_log2 != 0):
+            raise ValueError(
+                f'invalid min_order_log2 {min_order_log2} for '
+                f'order_log2 {order_log2} and radix {radix}')
+        self.min_order_log2 = min_order_log2
+        nbypass = (order_log2 - min_order_log2) // radix_log2
 
         if truncates is None:
             truncates = [bfly_trunc] * nstages
@@ -1559,6 +1664,8 @@ class FFT(Elaboratable):
         self.cmult3x = cmult3x
 
         self.clken = Signal()
+        if nbypass:
+            self.size_log2 = Signal(range(order_log2 + 1), init=order_log2)
         self.re_in = Signal(signed(width_in))
         self.im_in = Signal(signed(width_in))
         width_out = widths[-1]
@@ -1590,23 +1697,40 @@ class FFT(Elaboratable):
             else TwiddleI(widths[j + 1])  # use TwiddleI for last radix 2 stage
             for j in range(nstages - 1)]
         self._control = FFTControl(
-            self._butterflies, self._twiddles, self._window)
+            self._butterflies, self._twiddles, self._window, nbypass)
 
     @property
     def delay(self):
         return self._control.fft_delay
 
+    def size_delay(self, size_log2):
+        """Delay of the FFT for a runtime size of ``2**size_log2``"""
+        return self.delay - self._control.bypass_delay(
+            self._bypass(size_log2))
+
+    def _bypass(self, size_log2):
+        # Number of stages that are bypassed for a runtime FFT size
+        if size_log2 is None:
+            return 0
+        if (size_log2 < self.min_order_log2 or size_log2 > self.order_log2
+                or (self.order_log2 - size_log2) % self.radix_log2 != 0):
+            raise ValueError(f'unsupported FFT size_log2 {size_log2}')
+        return (self.order_log2 - size_log2) // self.radix_log2
+
     @property
     def model_vlen(self):
         return 2**self.order_log2
 
-    def model(self, re_in, im_in):
-        v = self.model_vlen
+    def model(self, re_in, im_in, size_log2=None):
+        bypass = self._bypass(size_log2)
         re = re_in
         im = im_in
         if self._window is not None:
-            re, im = self._window.model(re, im)
-        for j in range(self.nstages):
+            re, im = self._window.model(re, im, size_log2)
+        if bypass:
+            shift = len(self._butterflies[bypass].re_in) - len(self.re_in)
+            re, im = (np.asarray(x, 'int') << shift for x in [re, im])
+        for j in range(bypass, self.nstages):
             re, im = self._butterflies[j].model(re, im)
             if j != self.nstages - 1:
                 re, im = self._twiddles[j].model(re, im)
@@ -1630,6 +1754,26 @@ class FFT(Elaboratable):
                          if not isinstance(twiddle, TwiddleI)]
         m.submodules.control = ctrl = self._control
         ctrl.connect_stages(m)
+        if ctrl.nbypass:
+            with m.Switch(self.size_log2):
+                for n in range(1, ctrl.nbypass + 1):
+                    with m.Case(self.order_log2 - n * self.radix_log2):
+                        m.d.comb += ctrl.bypass.eq(n)
+            # The input of the first stage that is not bypassed is taken from
+            # the window or the FFT input. This overrides the connections
+            # made by connect_stages.
+            if self._window is not None:
+                re_first, im_first = self._window.re_out, self._window.im_out
+            else:
+                re_first, im_first = self.re_in, self.im_in
+            for n in range(1, ctrl.nbypass + 1):
+                bfly = self._butterflies[n]
+                shift = len(bfly.re_in) - len(re_first)
+                with m.If(ctrl.bypass == n):
+                    m.d.comb += [
+                        bfly.re_in.eq(re_first << shift),
+                        bfly.im_in.eq(im_first << shift),
+                    ]
         last_bfly = self._butterflies[-1]
         m.d.comb += [
             ctrl.clken.eq(self.clken),
@@ -8,6 +8,8 @@
 
 from amaranth import *
 import amaranth.cli
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.fifo import AsyncFIFO
 
 
 class AsyncFifo18_36(Elaboratable):
@@ -81,6 +83,119 @@ class AsyncFifo18_36(Elaboratable):
         return m
 
 
+class AsyncFifoBRAM(Elaboratable):
+    """Asynchronous FIFO using BRAM.
+
+    This FIFO has the same interface as ``AsyncFifo18_36``, but its depth is
+    configurable, so that it can be made much deeper by using several
+    BRAMs. The storage is inferred as BRAM. Additionally, it reports its
+    fill level and its high-water mark in the read domain.
+
+    Parameters
+    ----------
+    width : int
+        Data width.
+    depth_log2 : int
+        log2 of the FIFO depth.
+    r_domain : str
+        Read clock domain.
+    w_domain : str
+        Write clock domain.
+
+    Attributes
+    ----------
+    reset : Signal(), in
+        Reset for the FIFO. It is synchronized to the write domain, so it
+        should be held for a few cycles of the write domain.
+    data_in : Signal(width), in
+        Data input.
+    wren : Signal(), in
+        Write enable.
+    full : Signal(), out
+        FIFO full flag.
+    wrerr : Signal(), out
+        FIFO write error.
+    data_out : Signal(width), out
+        Data output. It has one cycle of latency with respect to ``rden``.
+    rden : Signal(), in
+        Read enable.
+    empty : Signal(), out
+        FIFO empty flag.
+    rderr : Signal(), out
+        FIFO read error.
+    level : Signal(range(2**depth_log2 + 1)), out
+        Number of words in the FIFO, as seen from the read domain.
+    high_water_mark : Signal(range(2**depth_log2 + 1)), out
+        Maximum of ``level`` since the FIFO was reset.
+    """
+    def __init__(self, width=36, depth_log2=10, r_domain='read',
+                 w_domain='write'):
+        self._r_domain = r_domain
+        self._w_domain = w_domain
+        self.w = width
+        self.depth_log2 = depth_log2
+        self.reset = Signal()
+
+        self.data_in = Signal(width)
+        self.wren = Signal()
+        self.full = Signal()
+        self.wrerr = Signal()
+
+        self.data_out = Signal(width)
+        self.rden = Signal()
+        self.empty = Signal()
+        self.rderr = Signal()
+        self.level = Signal(range(2**depth_log2 + 1))
+        self.high_water_mark = Signal.like(self.level)
+
+    def ports(self):
+        return [
+            self.reset, self.data_in, self.wren, self.full, self.wrerr,
+            self.data_out, self.rden, self.empty, self.rderr, self.level,
+            self.high_water_mark,
+        ]
+
+    def elaborate(self, platform):
+        m = Module()
+        w_reset = Signal(init=1)
+        m.submodules.sync_reset = FFSynchronizer(
+            self.reset, w_reset, o_domain=self._w_domain, init=1)
+        # The AsyncFIFO is reset with the reset of its write domain, so a
+        # local write domain with our reset is used.
+        m.domains.fifo_write = fifo_write = ClockDomain(local=True)
+        m.d.comb += [
+            fifo_write.clk.eq(ClockSignal(self._w_domain)),
+            fifo_write.rst.eq(w_reset),
+        ]
+        m.submodules.fifo = fifo = AsyncFIFO(
+            width=self.w, depth=2**self.depth_log2,
+            r_domain=self._r_domain, w_domain='fifo_write')
+
+        # write domain
+        m.d.comb += [
+            fifo.w_data.eq(self.data_in),
+            fifo.w_en.eq(self.wren),
+            self.full.eq(~fifo.w_rdy),
+        ]
+        m.d[self._w_domain] += self.wrerr.eq(self.wren & ~fifo.w_rdy)
+
+        # read domain
+        m.d.comb += [
+            fifo.r_en.eq(self.rden),
+            self.empty.eq(~fifo.r_rdy),
+            self.level.eq(fifo.r_level),
+        ]
+        with m.If(self.rden):
+            m.d[self._r_domain] += self.data_out.eq(fifo.r_data)
+        m.d[self._r_domain] += self.rderr.eq(self.rden & ~fifo.r_rdy)
+        with m.If(fifo.r_level > self.high_water_mark):
+            m.d[self._r_domain] += self.high_water_mark.eq(fifo.r_level)
+        with m.If(fifo.r_rst):
+            m.d[self._r_domain] += self.high_water_mark.eq(0)
+
+        return m
+
+
 if __name__ == '__main__':
     fifo = AsyncFifo18_36()
     amaranth.cli.main(
@@ -197,6 +197,10 @@ class Coefficients(Elaboratable):
     awidth : int
         Address width of the RAM. The number of coefficients stored is
         ``2**awidth``.
+    double_buffer : bool
+        Store two banks of ``2**awidth`` coefficients. The bank used for
+        reading and the bank used for writing are selected independently, so
+        that one bank can be rewritten while the other is in use.
 
     Attributes
     ----------
@@ -210,36 +214,200 @@ class Coefficients(Elaboratable):
         Write enable.
     wdata : Signal(width), in
         Write data.
+    rbank : Signal(), in
+        Bank used for reading (only present if ``double_buffer == True``).
+    wbank : Signal(), in
+        Bank used for writing (only present if ``double_buffer == True``).
     """
-    def __init__(self, *, width=18, awidth=7):
+    def __init__(self, *, width=18, awidth=7, double_buffer=False):
         self.w = width
         self.aw = awidth
+        self.double_buffer = double_buffer
 
         self.raddr = Signal(awidth)
         self.rdata = Signal(signed(width), reset_less=True)
         self.waddr = Signal(awidth)
         self.wren = Signal()
         self.wdata = Signal(signed(width))
+        if double_buffer:
+            self.rbank = Signal()
+            self.wbank = Signal()
 
     def elaborate(self, platform):
         m = Module()
 
         m.submodules.mem = mem = Memory(
-            shape=self.w, depth=2**self.aw, init=[])
+            shape=self.w, depth=2**(self.aw + int(self.double_buffer)),
+            init=[])
         rdport = mem.read_port()
         wrport = mem.write_port()
+        if self.double_buffer:
+            raddr = Cat(self.raddr, self.rbank)
+            waddr = Cat(self.waddr, self.wbank)
+        else:
+            raddr = self.raddr
+            waddr = self.waddr
         m.d.sync += self.rdata.eq(rdport.data)
         m.d.comb += [
             rdport.en.eq(1),
-            rdport.addr.eq(self.raddr),
+            rdport.addr.eq(raddr),
             wrport.en.eq(self.wren),
-            wrport.addr.eq(self.waddr),
+            wrport.addr.eq(waddr),
             wrport.data.eq(self.wdata),
         ]
 
         return m
 
 
+def _polyphase_macc(taps, x, start, nout, nmacc, macc_trunc, out_width):
+    """Vectorized model of the polyphase MACCs of a FIR decimator.
+
+    Polyphase branch ``k`` is accumulated in MACC ``k % nmacc``. Each MACC
+    output is rounded, truncated by ``macc_trunc`` bits and wrapped to
+    ``out_width`` bits, and then the MACC outputs are added and wrapped.
+
+    Parameters
+    ----------
+    taps : numpy.ndarray
+        FIR taps, arranged as an array of shape ``(branches, decimation)``.
+    x : numpy.ndarray
+        Input samples, preceded by ``taps.size - 1`` history samples.
+    start : int
+        Index (not counting the history samples) of the input sample at
+        which the first output is computed.
+    nout : int
+        Number of output samples to compute.
+    nmacc : int
+        Number of MACCs among which the polyphase branches are distributed.
+    macc_trunc : int
+        Truncation length for the output of each MACC.
+    out_width : int
+        Output width.
+    """
+    branches, decimation = taps.shape
+    # initial values for rounding
+    acc_init = 2**(macc_trunc - 1) if macc_trunc >= 1 else 0
+    accs = [np.full(nout, acc_init, 'int') for _ in range(nmacc)]
+    if nout > 0:
+        # windows[n] = x[n:n+decimation]; the output j of branch k uses the
+        # window that starts at (j + branches - k - 1) * decimation
+        windows = np.lib.stride_tricks.sliding_window_view(x, decimation)
+        for k in range(branches):
+            w = windows[start + (branches - k - 1) * decimation::decimation]
+            accs[k % nmacc] += w[:nout] @ taps[k, ::-1]
+    out = sum(clamp_nbits(acc >> macc_trunc, out_width) for acc in accs)
+    return clamp_nbits(out, out_width)
+
+
+def _polyphase_model(taps, decimation, re_in, im_in, **kwargs):
+    assert len(taps) % decimation == 0
+    taps = np.array(taps, 'int').reshape(-1, decimation)
+    history = np.zeros(taps.size - 1, 'int')
+    nout = len(re_in) // decimation
+    return tuple(
+        _polyphase_macc(taps, np.concatenate((history, x)), 0, nout,
+                        **kwargs)
+        for x in [np.asarray(re_in, 'int'), np.asarray(im_in, 'int')])
+
+
+def _polyphase_model_stream(taps, decimation, chunks, **kwargs):
+    assert len(taps) % decimation == 0
+    taps = np.array(taps, 'int').reshape(-1, decimation)
+    nhist = taps.size - 1
+    history = [np.zeros(nhist, 'int')] * 2
+    # index in the next chunk of the input sample at which the next output is
+    # computed
+    start = 0
+    for re_in, im_in in chunks:
+        assert len(re_in) == len(im_in)
+        n = len(re_in)
+        nout = max(0, -(-(n - start) // decimation))
+        out = []
+        for j, x in enumerate([re_in, im_in]):
+            x = np.concatenate((history[j], np.asarray(x, 'int')))
+            out.append(_polyphase_macc(taps, x, start, nout, **kwargs))
+            history[j] = x[x.size - nhist:]
+        start = (start - n) % decimation
+        yield tuple(out)
+
+
+def _fit_taps(taps, num_taps):
+    # Zero-pads or truncates the taps to the length used by the hardware
+    fit = np.zeros(num_taps, 'int')
+    taps = np.asarray(taps, 'int')[:num_taps]
+    fit[:taps.size] = taps
+    return fit
+
+
+def _shadow_config(m, fir, boundary, coeffs):
+    """Elaborates the shadow configuration of a FIR stage.
+
+    This is used by ``FIR4DSP`` and ``FIR2DSP``. The ``boundary`` argument is
+    asserted in the cycles in which the last operation of an output sample is
+    performed, which are the cycles in which a pending ``apply`` can be
+    committed. The ``coeffs`` argument is the list of the ``Coefficients`` of
+    the stage.
+
+    Returns a dictionary with the values of the configuration inputs
+    (``decimation``, ``operations_minus_one`` and, if present,
+    ``odd_operations``) that the control logic of the stage must use.
+    """
+    names = ['decimation', 'operations_minus_one']
+    if hasattr(fir, 'odd_operations'):
+        names.append('odd_operations')
+    if not fir.shadow:
+        return {name: getattr(fir, name) for name in names}
+
+    active = {name: Signal.like(getattr(fir, name), name=f'{name}_active')
+              for name in names}
+    config = {name: Signal.like(getattr(fir, name), name=f'{name}_config')
+              for name in names}
+    # Bank of the coefficients that is in use, and flag that indicates that
+    # the other bank has been written since the last commit
+    bank = Signal()
+    dirty = Signal()
+    commit = Signal()
+    m.d.comb += commit.eq(fir.apply_pending & boundary)
+
+    with m.If(fir.shadow_mode):
+        with m.If(commit):
+            m.d.sync += [
+                fir.apply_pending.eq(0),
+                bank.eq(bank ^ dirty),
+                dirty.eq(0),
+            ]
+            m.d.sync += [active[name].eq(getattr(fir, name))
+                         for name in names]
+        with m.If(fir.coeff_wren):
+            m.d.sync += dirty.eq(1)
+        with m.If(fir.apply):
+            m.d.sync += fir.apply_pending.eq(1)
+    with m.Else():
+        m.d.sync += [
+            fir.apply_pending.eq(0),
+            dirty.eq(0),
+        ]
+        m.d.sync += [active[name].eq(getattr(fir, name)) for name in names]
+
+    for c in coeffs:
+        m.d.comb += [
+            c.rbank.eq(bank),
+            c.wbank.eq(bank ^ fir.shadow_mode),
+        ]
+
+    # The operation performed in the commit cycle still belongs to the old
+    # output sample, but the counters that are loaded in that cycle already
+    # refer to the new output sample, so they take the new configuration.
+    for name in ['decimation', 'operations_minus_one']:
+        m.d.comb += config[name].eq(
+            Mux(fir.shadow_mode & ~commit, active[name], getattr(fir, name)))
+    if 'odd_operations' in names:
+        m.d.comb += config['odd_operations'].eq(
+            Mux(fir.shadow_mode, active['odd_operations'],
+                fir.odd_operations))
+    return config
+
+
 class FIR4DSP(Elaboratable):
     """Polyphase FIR decimator with 4 DSP48.
 
@@ -272,6 +440,9 @@ class FIR4DSP(Elaboratable):
     len_log2 : int
         Maximum FIR length given as a log2 (by default, the maximum FIR length
         is 256).
+    shadow : bool
+        Add a shadow copy of the runtime configuration and of the
+        coefficients, which is committed atomically by ``apply``.
 
     Attributes
     ----------
@@ -293,6 +464,24 @@ class FIR4DSP(Elaboratable):
     odd_operations : Signal(), in
         Disable the MACC1 in the last operation in order to achieve an odd
         number of multiplies.
+    shadow_mode : Signal(), in
+        Enables the shadow configuration (only present if ``shadow ==
+        True``). When this is deasserted, changes to the configuration and
+        coefficient writes take effect immediately. When this is asserted,
+        they only take effect when ``apply`` is pulsed. Coefficient writes go
+        to a shadow coefficient bank. If any coefficient has been written
+        before ``apply``, the banks are swapped, so all the coefficients of
+        the stage must have been written to the shadow bank.
+    apply : Signal(), in
+        Commit the shadow configuration (only present if ``shadow ==
+        True``). The commit happens at the boundary between two output
+        samples, so that each output sample is computed either entirely with
+        the old configuration or entirely with the new configuration.
+    apply_pending : Signal(), out
+        Indicates that ``apply`` has been pulsed but the commit has not
+        happened yet (only present if ``shadow == True``). The commit only
+        happens while the FIR is processing input samples. The configuration
+        and the coefficients should not be modified while this is asserted.
     re_in : Signal(signed(in_width)), in
         Input real part.
     im_in : Signal(signed(in_width)), in
@@ -312,7 +501,8 @@ class FIR4DSP(Elaboratable):
     """
     def __init__(self, *, in_width=16, out_width=16,
                  coeff_width=18, decim_width=7, oper_width=7,
-                 macc_trunc=19, len_log2=8):
+                 macc_trunc=19, len_log2=8,
+                 shadow=False):
         self.iw = in_width
         self.ow = out_width
         self.coeff_width = coeff_width
@@ -320,6 +510,7 @@ class FIR4DSP(Elaboratable):
         self.oper_width = oper_width
         self.macc_trunc = macc_trunc
         self.len_log2 = len_log2
+        self.shadow = shadow
 
         self.coeff_waddr = Signal(len_log2)
         self.coeff_wren = Signal()
@@ -327,6 +518,10 @@ class FIR4DSP(Elaboratable):
         self.decimation = Signal(decim_width)
         self.operations_minus_one = Signal(oper_width)
         self.odd_operations = Signal()
+        if shadow:
+            self.shadow_mode = Signal()
+            self.apply = Signal()
+            self.apply_pending = Signal()
 
         self.re_in = Signal(signed(self.iw))
         self.im_in = Signal(signed(self.iw))
@@ -338,39 +533,30 @@ class FIR4DSP(Elaboratable):
         self.strobe_out = Signal()
 
     def model(self, taps, decimation, re_in, im_in):
-        assert len(taps) % decimation == 0
-        taps = np.array(taps).reshape(-1, decimation)
-        history = np.zeros(taps.size - 1, 'int')
-        re_out = np.zeros(len(re_in) // decimation, 'int')
-        im_out = np.zeros(len(re_in) // decimation, 'int')
-        re_in = np.concatenate((history, re_in))
-        im_in = np.concatenate((history, im_in))
-        for j in range(re_out.size):
-            # initial values for rounding
-            acc_init = (2**(self.macc_trunc - 1)
-                        if self.macc_trunc >= 1
-                        else 0)
-            re0, im0, re1, im1 = [acc_init] * 4
-            for k in range(taps.shape[0]):
-                wr = re_in[(j + taps.shape[0] - k - 1)
-                           * decimation:][:decimation]
-                wi = im_in[(j + taps.shape[0] - k - 1)
-                           * decimation:][:decimation]
-                sr = np.sum(wr[::-1] * taps[k])
-                si = np.sum(wi[::-1] * taps[k])
-                if k % 2 == 0:
-                    re0 += sr
-                    im0 += si
-                else:
-                    re1 += sr
-                    im1 += si
-            re0 = clamp_nbits(re0 >> self.macc_trunc, self.ow)
-            im0 = clamp_nbits(im0 >> self.macc_trunc, self.ow)
-            re1 = clamp_nbits(re1 >> self.macc_trunc, self.ow)
-            im1 = clamp_nbits(im1 >> self.macc_trunc, self.ow)
-            re_out[j] = clamp_nbits(re0 + re1, self.ow)
-            im_out[j] = clamp_nbits(im0 + im1, self.ow)
-        return re_out, im_out
+        return _polyphase_model(
+            taps, decimation, re_in, im_in, nmacc=2,
+            macc_trunc=self.macc_trunc, out_width=self.ow)
+
+    def model_stream(self, taps, decimation, chunks):
+        """Streaming model.
+
+        This is a generator version of ``model`` that takes an iterable of
+        ``(re_in, im_in)`` chunks and yields an ``(re_out, im_out)`` chunk
+        for each input chunk. The FIR history and polyphase phase are kept
+        across chunks, so that the concatenation of the output chunks is
+        independent of how the input is split (the output samples are
+        computed at input samples whose index is a multiple of
+        ``decimation``).
+        """
+        return _polyphase_model_stream(
+            taps, decimation, chunks, nmacc=2,
+            macc_trunc=self.macc_trunc, out_width=self.ow)
+
+    @staticmethod
+    def num_taps(decimation, operations_minus_one, odd_operations):
+        """Returns the FIR length for a given hardware configuration."""
+        return decimation * (2 * (operations_minus_one + 1)
+                             - int(bool(odd_operations)))
 
     def elaborate(self, platform):
         m = Module()
@@ -389,9 +575,11 @@ class FIR4DSP(Elaboratable):
         m.submodules.samples = samples = SampleBuffer(
             2*self.iw, awidth=self.len_log2)
         m.submodules.coeffs0 = coeffs0 = Coefficients(
-            width=self.coeff_width, awidth=self.len_log2-1)
+            width=self.coeff_width, awidth=self.len_log2-1,
+            double_buffer=self.shadow)
         m.submodules.coeffs1 = coeffs1 = Coefficients(
-            width=self.coeff_width, awidth=self.len_log2-1)
+            width=self.coeff_width, awidth=self.len_log2-1,
+            double_buffer=self.shadow)
 
         m.d.comb += [
             macc0_re.a.eq(samples.rdata0[:self.iw]),
@@ -422,7 +610,11 @@ class FIR4DSP(Elaboratable):
         last_operation = Signal(reset_less=True)
         last_acc = Signal(reset_less=True)
         m.d.comb += last_acc.eq(decimation_end_of_count & last_operation)
-        two_decim = Cat(Const(0, 1), self.decimation)
+        config = _shadow_config(m, self, work & last_acc, [coeffs0, coeffs1])
+        decimation = config['decimation']
+        operations_minus_one = config['operations_minus_one']
+        odd_operations = config['odd_operations']
+        two_decim = Cat(Const(0, 1), decimation)
         first_acc = Signal()
         first_acc_q = Signal(2, reset_less=True)
         enable_macc0_q = Signal(2, reset_less=True)
@@ -431,7 +623,7 @@ class FIR4DSP(Elaboratable):
         enable_macc1 = Signal(reset_less=True)
         m.d.comb += [
             enable_macc0.eq(work),
-            enable_macc1.eq(work & (~last_operation | ~self.odd_operations)),
+            enable_macc1.eq(work & (~last_operation | ~odd_operations)),
         ]
         m.d.sync += [
             first_acc_q.eq(Cat(first_acc, first_acc_q[:-1])),
@@ -445,20 +637,20 @@ class FIR4DSP(Elaboratable):
                     Mux(last_operation, write_pointer,
                         sample_addr0 - two_decim)),
                 sample_addr1.eq(
-                    Mux(last_operation, write_pointer - self.decimation,
+                    Mux(last_operation, write_pointer - decimation,
                         sample_addr1 - two_decim)),
                 first_acc.eq(last_acc),
                 coeff_counter.eq(Mux(last_acc, 0, coeff_counter + 1)),
                 operation_counter.eq(Mux(last_operation,
-                                         self.operations_minus_one,
+                                         operations_minus_one,
                                          operation_counter - 1)),
                 last_operation.eq((operation_counter == 1)
-                                  | (self.operations_minus_one == 0)),
+                                  | (operations_minus_one == 0)),
             ]
             with m.If(last_operation):
                 m.d.sync += [
                     decimation_counter.eq(Mux(
-                        last_acc, self.decimation, decimation_counter - 1)),
+                        last_acc, decimation, decimation_counter - 1)),
                     # decimation_counter should never reach 0 during normal
                     # operation, but it can when coming from reset. Using
                     # ~decimation_end_of_count here prevents
@@ -559,6 +751,9 @@ class FIR2DSP(Elaboratable):
     len_log2 : int
         Maximum FIR length given as a log2 (by default, the maximum FIR length
         is 128).
+    shadow : bool
+        Add a shadow copy of the runtime configuration and of the
+        coefficients, which is committed atomically by ``apply``.
 
     Attributes
     ----------
@@ -574,6 +769,24 @@ class FIR2DSP(Elaboratable):
         Number of operations to perform minus one. This determines the length
         of the polyphase branches. The length is equal to the number of
         operations.
+    shadow_mode : Signal(), in
+        Enables the shadow configuration (only present if ``shadow ==
+        True``). When this is deasserted, changes to the configuration and
+        coefficient writes take effect immediately. When this is asserted,
+        they only take effect when ``apply`` is pulsed. Coefficient writes go
+        to a shadow coefficient bank. If any coefficient has been written
+        before ``apply``, the banks are swapped, so all the coefficients of
+        the stage must have been written to the shadow bank.
+    apply : Signal(), in
+        Commit the shadow configuration (only present if ``shadow ==
+        True``). The commit happens at the boundary between two output
+        samples, so that each output sample is computed either entirely with
+        the old configuration or entirely with the new configuration.
+    apply_pending : Signal(), out
+        Indicates that ``apply`` has been pulsed but the commit has not
+        happened yet (only present if ``shadow == True``). The commit only
+        happens while the FIR is processing input samples. The configuration
+        and the coefficients should not be modified while this is asserted.
     re_in : Signal(signed(in_width)), in
         Input real part.
     im_in : Signal(signed(in_width)), in
@@ -593,7 +806,8 @@ class FIR2DSP(Elaboratable):
     """
     def __init__(self, *, in_width=16, out_width=16,
                  coeff_width=18, decim_width=6, oper_width=6,
-                 macc_trunc=19, len_log2=7):
+                 macc_trunc=19, len_log2=7,
+                 shadow=False):
         self.iw = in_width
         self.ow = out_width
         self.coeff_width = coeff_width
@@ -601,12 +815,17 @@ class FIR2DSP(Elaboratable):
         self.oper_width = oper_width
         self.macc_trunc = macc_trunc
         self.len_log2 = len_log2
+        self.shadow = shadow
 
         self.coeff_waddr = Signal(len_log2)
         self.coeff_wren = Signal()
         self.coeff_wdata = Signal(coeff_width)
         self.decimation = Signal(decim_width)
         self.operations_minus_one = Signal(oper_width)
+        if shadow:
+            self.shadow_mode = Signal()
+            self.apply = Signal()
+            self.apply_pending = Signal()
 
         self.re_in = Signal(signed(self.iw))
         self.im_in = Signal(signed(self.iw))
@@ -618,29 +837,23 @@ class FIR2DSP(Elaboratable):
         self.strobe_out = Signal()
 
     def model(self, taps, decimation, re_in, im_in):
-        assert len(taps) % decimation == 0
-        taps = np.array(taps).reshape(-1, decimation)
-        history = np.zeros(taps.size - 1, 'int')
-        re_out = np.zeros(len(re_in) // decimation, 'int')
-        im_out = np.zeros(len(re_in) // decimation, 'int')
-        re_in = np.concatenate((history, re_in))
-        im_in = np.concatenate((history, im_in))
-        for j in range(re_out.size):
-            # initial values for rounding
-            acc_init = (2**(self.macc_trunc - 1)
-                        if self.macc_trunc >= 1
-                        else 0)
-            re, im = [acc_init] * 2
-            for k in range(taps.shape[0]):
-                wr = re_in[(j + taps.shape[0] - k - 1)
-                           * decimation:][:decimation]
-                wi = im_in[(j + taps.shape[0] - k - 1)
-                           * decimation:][:decimation]
-                re += np.sum(wr[::-1] * taps[k])
-                im += np.sum(wi[::-1] * taps[k])
-            re_out[j] = clamp_nbits(re >> self.macc_trunc, self.ow)
-            im_out[j] = clamp_nbits(im >> self.macc_trunc, self.ow)
-        return re_out, im_out
+        return _polyphase_model(
+            taps, decimation, re_in, im_in, nmacc=1,
+            macc_trunc=self.macc_trunc, out_width=self.ow)
+
+    def model_stream(self, taps, decimation, chunks):
+        """Streaming model.
+
+        See ``FIR4DSP.model_stream``.
+        """
+        return _polyphase_model_stream(
+            taps, decimation, chunks, nmacc=1,
+            macc_trunc=self.macc_trunc, out_width=self.ow)
+
+    @staticmethod
+    def num_taps(decimation, operations_minus_one):
+        """Returns the FIR length for a given hardware configuration."""
+        return decimation * (operations_minus_one + 1)
 
     def elaborate(self, platform):
         m = Module()
@@ -655,7 +868,8 @@ class FIR2DSP(Elaboratable):
         m.submodules.samples = samples = SampleBuffer(
             2*self.iw, awidth=self.len_log2, two_read_ports=False)
         m.submodules.coeffs = coeffs = Coefficients(
-            width=self.coeff_width, awidth=self.len_log2)
+            width=self.coeff_width, awidth=self.len_log2,
+            double_buffer=self.shadow)
 
         m.d.comb += [
             macc_re.a.eq(samples.rdata0[:self.iw]),
@@ -678,6 +892,9 @@ class FIR2DSP(Elaboratable):
         last_operation = Signal(reset_less=True)
         last_acc = Signal(reset_less=True)
         m.d.comb += last_acc.eq(decimation_end_of_count & last_operation)
+        config = _shadow_config(m, self, work & last_acc, [coeffs])
+        decimation = config['decimation']
+        operations_minus_one = config['operations_minus_one']
         first_acc = Signal()
         first_acc_q = Signal(2, reset_less=True)
         m.d.sync += first_acc_q.eq(Cat(first_acc, first_acc_q[:-1]))
@@ -693,20 +910,20 @@ class FIR2DSP(Elaboratable):
             m.d.sync += [
                 sample_addr.eq(
                     Mux(last_operation, write_pointer,
-                        sample_addr - self.decimation)),
+                        sample_addr - decimation)),
                 first_acc.eq(last_acc),
                 coeff_counter.eq(
                     Mux(last_acc, 0, coeff_counter + 1)),
                 operation_counter.eq(Mux(last_operation,
-                                         self.operations_minus_one,
+                                         operations_minus_one,
                                          operation_counter - 1)),
                 last_operation.eq((operation_counter == 1)
-                                  | (self.operations_minus_one == 0)),
+                                  | (operations_minus_one == 0)),
             ]
             with m.If(last_operation):
                 m.d.sync += [
                     decimation_counter.eq(Mux(
-                        last_acc, self.decimation, decimation_counter - 1)),
+                        last_acc, decimation, decimation_counter - 1)),
                     # decimation_counter should never reach 0 during normal
                     # operation, but it can when coming from reset. Using
                     # ~decimation_end_of_count here prevents
@@ -789,6 +1006,10 @@ class FIRDecimator3Stage(Elaboratable):
         Width of ``operations_minus_one`` input for each stage.
     macc_trunc : List[int]
         Truncation length for the output of each stage.
+    shadow : bool
+        Add a shadow copy of the runtime configuration and of the
+        coefficients of all the stages, which is committed atomically by
+        ``apply``.
 
     Attributes
     ----------
@@ -821,6 +1042,20 @@ class FIRDecimator3Stage(Elaboratable):
     odd_operations3 : Signal(), in
         Disable the MACC1 in the last operation of stage 1 in order to achieve
         an odd number of multiplies. See ``FIR4DSP``.
+    shadow_mode : Signal(), in
+        Enables the shadow configuration (only present if ``shadow ==
+        True``). See ``FIR4DSP``. The ``bypass2`` and ``bypass3`` inputs are
+        also shadowed. They are committed after stage 1 has committed its
+        configuration. Changing the bypass configuration unavoidably causes a
+        transient in the output, since the stages that are enabled by the
+        change start with old samples in their buffers.
+    apply : Signal(), in
+        Commit the shadow configuration of all the stages (only present if
+        ``shadow == True``). Each stage commits its configuration at the
+        boundary between two of its output samples.
+    apply_pending : Signal(), out
+        Indicates that the commit has not happened yet in some stage that is
+        not bypassed (only present if ``shadow == True``).
     re_in : Signal(signed(in_width)), in
         Input real part.
     im_in : Signal(signed(in_width)), in
@@ -840,13 +1075,15 @@ class FIRDecimator3Stage(Elaboratable):
     """
     def __init__(self, *, in_width=12, out_width=[16]*3,
                  coeff_width=18, decim_width=[7, 6, 7],
-                 oper_width=[7, 6, 7], macc_trunc=[17, 18, 18]):
+                 oper_width=[7, 6, 7], macc_trunc=[17, 18, 18],
+                 shadow=False):
         self.iw = in_width
         self.ow = out_width
         self.coeff_width = coeff_width
         self.decim_width = decim_width
         self.oper_width = oper_width
         self.macc_trunc = macc_trunc
+        self.shadow = shadow
 
         self.coeff_waddr = Signal(10)
         self.coeff_wren = Signal()
@@ -861,6 +1098,10 @@ class FIRDecimator3Stage(Elaboratable):
         self.operations_minus_one3 = Signal(oper_width[2])
         self.odd_operations1 = Signal()
         self.odd_operations3 = Signal()
+        if shadow:
+            self.shadow_mode = Signal()
+            self.apply = Signal()
+            self.apply_pending = Signal()
 
         self.re_in = Signal(signed(self.iw))
         self.im_in = Signal(signed(self.iw))
@@ -871,24 +1112,102 @@ class FIRDecimator3Stage(Elaboratable):
         self.im_out = Signal(signed(self.ow[-1]), reset_less=True)
         self.strobe_out = Signal()
 
-    def elaborate(self, platform):
-        m = Module()
-
-        m.submodules.stage1 = stage1 = FIR4DSP(
+        self.stage1 = FIR4DSP(
             in_width=self.iw, out_width=self.ow[0],
             coeff_width=self.coeff_width, decim_width=self.decim_width[0],
             oper_width=self.oper_width[0], macc_trunc=self.macc_trunc[0],
-            len_log2=8)
-        m.submodules.stage2 = stage2 = FIR2DSP(
+            len_log2=8, shadow=shadow)
+        self.stage2 = FIR2DSP(
             in_width=self.ow[0], out_width=self.ow[1],
             coeff_width=self.coeff_width, decim_width=self.decim_width[1],
             oper_width=self.oper_width[1], macc_trunc=self.macc_trunc[1],
-            len_log2=7)
-        m.submodules.stage3 = stage3 = FIR4DSP(
+            len_log2=7, shadow=shadow)
+        self.stage3 = FIR4DSP(
             in_width=self.ow[1], out_width=self.ow[2],
             coeff_width=self.coeff_width, decim_width=self.decim_width[2],
             oper_width=self.oper_width[2], macc_trunc=self.macc_trunc[2],
-            len_log2=8)
+            len_log2=8, shadow=shadow)
+
+    def model(self, taps, decimation, chunks, *, bypass2=False,
+              bypass3=False, operations_minus_one=None,
+              odd_operations=None):
+        """Streaming model.
+
+        This is a generator that takes an iterable of ``(re_in, im_in)``
+        chunks and yields an ``(re_out, im_out)`` chunk for each input chunk
+        (some output chunks can be empty). The state of the FIR stages is
+        kept across chunks, so arbitrarily long inputs can be processed with
+        constant memory.
+
+        Parameters
+        ----------
+        taps : List[numpy.ndarray]
+            FIR taps of each stage.
+        decimation : List[int]
+            Decimation factor of each stage.
+        chunks : Iterable[Tuple[numpy.ndarray, numpy.ndarray]]
+            Input IQ chunks.
+        bypass2 : bool
+            Bypass stage 2.
+        bypass3 : bool
+            Bypass stage 3.
+        operations_minus_one : Optional[List[int]]
+            Value of ``operations_minus_one`` for each stage. If this is
+            given, the taps of each stage are zero-padded or truncated to the
+            FIR length used by the hardware. Otherwise the taps are used as
+            given.
+        odd_operations : Optional[List[bool]]
+            Value of ``odd_operations`` for stages 1 and 3. Only used
+            together with ``operations_minus_one``.
+        """
+        taps = self._model_taps(taps, decimation, operations_minus_one,
+                                odd_operations)
+        out = self.stage1.model_stream(taps[0], decimation[0], chunks)
+        if not bypass2:
+            out = self.stage2.model_stream(taps[1], decimation[1], out)
+        if not bypass3:
+            out = self.stage3.model_stream(taps[2], decimation[2], out)
+        return out
+
+    def model_span(self, taps, decimation, *, bypass2=False, bypass3=False,
+                   operations_minus_one=None, odd_operations=None):
+        """Total decimation and span of the streaming model.
+
+        Returns a tuple ``(total_decimation, span)``, where ``span`` is the
+        number of consecutive input samples on which each output sample
+        depends. The arguments are the same as for ``model``.
+        """
+        taps = self._model_taps(taps, decimation, operations_minus_one,
+                                odd_operations)
+        enabled = [True, not bypass2, not bypass3]
+        total_decimation = 1
+        span = 1
+        for t, d, en in zip(taps, decimation, enabled):
+            if en:
+                span += (len(t) - 1) * total_decimation
+                total_decimation *= d
+        return total_decimation, span
+
+    @staticmethod
+    def _model_taps(taps, decimation, operations_minus_one, odd_operations):
+        taps = list(taps)
+        if operations_minus_one is not None:
+            if odd_operations is None:
+                odd_operations = [False, False]
+            taps[0] = _fit_taps(taps[0], FIR4DSP.num_taps(
+                decimation[0], operations_minus_one[0], odd_operations[0]))
+            taps[1] = _fit_taps(taps[1], FIR2DSP.num_taps(
+                decimation[1], operations_minus_one[1]))
+            taps[2] = _fit_taps(taps[2], FIR4DSP.num_taps(
+                decimation[2], operations_minus_one[2], odd_operations[1]))
+        return taps
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.stage1 = stage1 = self.stage1
+        m.submodules.stage2 = stage2 = self.stage2
+        m.submodules.stage3 = stage3 = self.stage3
         stages = [stage1, stage2, stage3]
 
         for j, stage in enumerate(stages):
@@ -913,6 +1232,48 @@ class FIRDecimator3Stage(Elaboratable):
             self.in_ready.eq(stage1.in_ready),
         ]
 
+        if self.shadow:
+            bypass2 = Signal()
+            bypass3 = Signal()
+            bypass_active = Signal(2)
+            bypass_pending = Signal()
+            apply_q = Signal()
+            m.d.sync += apply_q.eq(self.apply)
+            for stage in stages:
+                m.d.comb += [
+                    stage.shadow_mode.eq(self.shadow_mode),
+                    stage.apply.eq(self.apply),
+                ]
+            # The bypass configuration is committed once stage 1 has
+            # committed. apply_q is used because stage1.apply_pending is
+            # asserted one cycle after apply.
+            commit_bypass = bypass_pending & ~apply_q & ~stage1.apply_pending
+            with m.If(self.shadow_mode):
+                with m.If(commit_bypass):
+                    m.d.sync += [
+                        bypass_pending.eq(0),
+                        bypass_active.eq(Cat(self.bypass2, self.bypass3)),
+                    ]
+                with m.If(self.apply):
+                    m.d.sync += bypass_pending.eq(1)
+            with m.Else():
+                m.d.sync += [
+                    bypass_pending.eq(0),
+                    bypass_active.eq(Cat(self.bypass2, self.bypass3)),
+                ]
+            m.d.comb += [
+                Cat(bypass2, bypass3).eq(
+                    Mux(self.shadow_mode, bypass_active,
+                        Cat(self.bypass2, self.bypass3))),
+                self.apply_pending.eq(
+                    bypass_pending | stage1.apply_pending
+                    | (stage2.apply_pending & ~bypass2)
+                    | (stage3.apply_pending & ~bypass3)),
+            ]
+        else:
+            bypass2 = self.bypass2
+            bypass3 = self.bypass3
+
         stage2_re_in = Signal(signed(self.ow[0]), reset_less=True)
         stage2_im_in = Signal(signed(self.ow[0]), reset_less=True)
         stage2_in_valid = Signal(reset_less=True)
@@ -925,7 +1286,7 @@ class FIRDecimator3Stage(Elaboratable):
             m.d.sync += stage2_in_valid.eq(0)
         with m.If(stage1.strobe_out):
             m.d.sync += [
-                stage2_in_valid.eq(~self.bypass2),
+                stage2_in_valid.eq(~bypass2),
                 stage2_re_in.eq(stage1.re_out),
                 stage2_im_in.eq(stage1.im_out),
             ]
@@ -940,23 +1301,23 @@ class FIRDecimator3Stage(Elaboratable):
         ]
         with m.If(stage3.in_ready):
             m.d.sync += stage3_in_valid.eq(0)
-        with m.If(self.bypass2):
+        with m.If(bypass2):
             with m.If(stage1.strobe_out):
                 m.d.sync += [
                     stage3_re_in.eq(stage1.re_out),
                     stage3_im_in.eq(stage1.im_out),
-                    stage3_in_valid.eq(~self.bypass3),
+                    stage3_in_valid.eq(~bypass3),
                 ]
         with m.Else():
             with m.If(stage2.strobe_out):
                 m.d.sync += [
                     stage3_re_in.eq(stage2.re_out),
                     stage3_im_in.eq(stage2.im_out),
-                    stage3_in_valid.eq(~self.bypass3),
+                    stage3_in_valid.eq(~bypass3),
                 ]
 
-        with m.If(self.bypass3):
-            with m.If(self.bypass2):
+        with m.If(bypass3):
+            with m.If(bypass2):
                 m.d.sync += [
                     self.re_out.eq(stage1.re_out),
                     self.im_out.eq(stage1.im_out),
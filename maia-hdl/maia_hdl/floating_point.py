@@ -20,6 +20,8 @@ from amaranth import *
 import amaranth.cli
 import numpy as np
 
+from .util import signed_bit_length
+
 
 class ShiftRight(Elaboratable):
     """Shift right with a maximum shift
@@ -132,15 +134,9 @@ class IQToFloatingPoint(Elaboratable):
         return 2
 
     def model(self, re_in, im_in):
-        def calc_len(a):
-            return (int(a).bit_length() + 1 if a >= 0
-                    else (-(int(a)+1)).bit_length() + 1)
-
-        cl = np.vectorize(calc_len)
-        re_lens = cl(re_in)
-        im_lens = cl(im_in)
-        re_exp, im_exp = (np.maximum(lens - self.ow, 0)
-                          for lens in (re_lens, im_lens))
+        re_in, im_in = (np.asarray(x, 'int') for x in [re_in, im_in])
+        re_exp, im_exp = (np.maximum(signed_bit_length(x) - self.ow, 0)
+                          for x in [re_in, im_in])
         exp = np.maximum(re_exp, im_exp)
         return re_in >> exp, im_in >> exp, exp
 
@@ -317,13 +313,13 @@ class MakeCommonExponent(Elaboratable):
         return 2
 
     def model(self, re_a, im_a, exponent_a, re_b, im_b, exponent_b):
+        re_a, im_a, exponent_a, re_b, im_b, exponent_b = (
+            np.asarray(x, 'int')
+            for x in [re_a, im_a, exponent_a, re_b, im_b, exponent_b])
         max_exponent = np.maximum(exponent_a, exponent_b)
-        diff_a = max_exponent - exponent_a
-        diff_b = max_exponent - exponent_b
-        if self.a_power:
-            diff_a *= 2
-        if self.b_power:
-            diff_b *= 2
+        # The shift for a power is twice the exponent difference
+        diff_a = (max_exponent - exponent_a) << int(self.a_power)
+        diff_b = (max_exponent - exponent_b) << int(self.b_power)
         return (re_a >> diff_a, im_a >> diff_a,
                 re_b >> diff_b, im_b >> diff_b,
                 max_exponent)
@@ -425,6 +421,100 @@ class MakeCommonExponent(Elaboratable):
         return m
 
 
+class ToFloat32(Elaboratable):
+    """Convert a floating point number to IEEE 754 single precision
+
+    This converts an unsigned number in the floating point representation used
+    in this module (a mantissa and an unsigned exponent) to an IEEE 754 single
+    precision float. The conversion truncates the mantissa (rounds towards
+    zero). The output is a 32-bit word with the binary representation of the
+    float.
+
+    Parameters
+    ----------
+    width : int
+        Width of the input mantissa.
+    exponent_width : int
+        Width of the input exponent.
+    is_power : bool
+        If this parameter is set to True, the input uses a power
+        representation, so each exponent unit represents a shift by 2 places
+        (see ``MakeCommonExponent``).
+
+    Attributes
+    ----------
+    delay : int
+        Delay (in samples) from input to output.
+    clken : Signal(), in
+        Clock enable
+    value_in : Signal(width), in
+        Input mantissa.
+    exponent_in : Signal(exponent_width), in
+        Input exponent.
+    out : Signal(32), out
+        Binary representation of the float.
+    """
+    def __init__(self, width, exponent_width, *, is_power=False):
+        self.w = width
+        self.ew = exponent_width
+        self.is_power = is_power
+        self.exponent_shift = 2 if is_power else 1
+        # The float exponent must not overflow
+        assert width + self.exponent_shift * (2**exponent_width - 1) <= 128
+
+        self.clken = Signal()
+        self.value_in = Signal(width)
+        self.exponent_in = Signal(exponent_width)
+        self.out = Signal(32, reset_less=True)
+
+    @property
+    def delay(self):
+        return 2
+
+    def model(self, value, exponent):
+        value, exponent = (np.asarray(x, 'int') for x in [value, exponent])
+        # frexp gives the bit length exactly, since the width is checked to
+        # be smaller than the float64 mantissa width.
+        assert self.w <= 53
+        msb = np.frexp(value)[1] - 1
+        float_exponent = 127 + msb + self.exponent_shift * exponent
+        mantissa = ((value << np.maximum(23 - msb, 0))
+                    >> np.maximum(msb - 23, 0)) & (2**23 - 1)
+        out = np.where(value == 0, 0, (float_exponent << 23) | mantissa)
+        return out.astype('uint32')
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Number of leading zeros
+        lz = Signal(range(self.w))
+        for j in range(self.w):
+            with m.If(self.value_in[j]):
+                m.d.comb += lz.eq(self.w - 1 - j)
+
+        value_q = Signal(self.w, reset_less=True)
+        exponent_q = Signal(self.ew, reset_less=True)
+        lz_q = Signal(range(self.w), reset_less=True)
+        # Normalize the mantissa so that the leading one is in the MSB, and
+        # take the 23 bits after the leading one, padding with zeros if
+        # needed.
+        normalized = Cat(Const(0, max(24 - self.w, 0)),
+                         (value_q << lz_q)[:self.w])
+        float_exponent = (127 + self.w - 1 - lz_q
+                          + self.exponent_shift * exponent_q)
+        with m.If(self.clken):
+            m.d.sync += [
+                value_q.eq(self.value_in),
+                exponent_q.eq(self.exponent_in),
+                lz_q.eq(lz),
+                self.out.eq(Mux(value_q == 0, 0,
+                                Cat(normalized[-24:-1], float_exponent[:8],
+                                    Const(0, 1)))),
+            ]
+
+        return m
+
+
 if __name__ == '__main__':
     dut = MakeCommonExponent(18, 47, 3, 4, a_complex=True, b_power=True)
     amaranth.cli.main(
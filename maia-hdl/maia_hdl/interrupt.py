@@ -0,0 +1,115 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+
+
+class InterruptModerator(Elaboratable):
+    """Interrupt moderator
+
+    This module coalesces the event pulses of an interrupt source, so that
+    the host can process several events (for instance, several filled
+    DMA buffers) for each interrupt. The events that have happened since the
+    last interrupt are counted as pending. An interrupt is generated when
+    ``interval`` ticks have passed since the first pending event, or when
+    the number of pending events reaches ``frames`` and at least
+    ``interval`` ticks have passed since the last interrupt. Therefore, a
+    non-zero ``interval`` limits the interrupt rate regardless of
+    ``frames``: consecutive interrupts are at least ``interval`` ticks
+    apart. If both ``frames`` and ``interval`` are zero, an interrupt is
+    generated for each event.
+
+    Parameters
+    ----------
+    width : int
+        Width of the event counters and of ``frames`` and ``interval``.
+    tick_cycles : int
+        Number of clock cycles in each tick of ``interval``. The ticks are
+        generated by a free-running prescaler, so the interval has a
+        resolution of one tick.
+
+    Attributes
+    ----------
+    event : Signal(), in
+        Event input. Each clock cycle in which this is asserted counts as
+        one event.
+    frames : Signal(width), in
+        Number of pending events that generate an interrupt. Zero disables
+        this condition.
+    interval : Signal(width), in
+        Maximum number of ticks that an event stays pending, and minimum
+        number of ticks between interrupts. Zero disables this condition.
+    interrupt : Signal(), out
+        Pulsed for a clock cycle to generate an interrupt.
+    pending : Signal(width), out
+        Number of events since the last interrupt. It saturates at its
+        maximum value.
+    coalesced : Signal(width), out
+        Number of events that were pending when the last interrupt was
+        generated.
+    """
+    def __init__(self, width=16, tick_cycles=100):
+        if tick_cycles < 1:
+            raise ValueError(f'invalid tick_cycles {tick_cycles}')
+        self.w = width
+        self.tick_cycles = tick_cycles
+
+        self.event = Signal()
+        self.frames = Signal(width)
+        self.interval = Signal(width)
+        self.interrupt = Signal()
+        self.pending = Signal(width)
+        self.coalesced = Signal(width)
+
+    def ports(self):
+        return [self.event, self.frames, self.interval, self.interrupt,
+                self.pending, self.coalesced]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        prescaler = Signal(range(self.tick_cycles))
+        tick = Signal()
+        m.d.comb += tick.eq(prescaler == self.tick_cycles - 1)
+        m.d.sync += prescaler.eq(Mux(tick, 0, prescaler + 1))
+
+        # Ticks since the first pending event
+        elapsed = Signal(self.w)
+        with m.If(self.pending == 0):
+            m.d.sync += elapsed.eq(0)
+        with m.Elif(tick & (elapsed != 2**self.w - 1)):
+            m.d.sync += elapsed.eq(elapsed + 1)
+
+        # Ticks since the last interrupt
+        since_interrupt = Signal(self.w, init=2**self.w - 1)
+        with m.If(tick & (since_interrupt != 2**self.w - 1)):
+            m.d.sync += since_interrupt.eq(since_interrupt + 1)
+
+        with m.If(self.event & (self.pending != 2**self.w - 1)):
+            m.d.sync += self.pending.eq(self.pending + 1)
+
+        frames_reached = (
+            (self.frames != 0) & (self.pending >= self.frames)
+            & (since_interrupt >= self.interval))
+        # The events become pending after the last interrupt, so elapsed is
+        # never larger than since_interrupt
+        interval_reached = (self.interval != 0) & (elapsed >= self.interval)
+        unmoderated = (self.frames == 0) & (self.interval == 0)
+        m.d.comb += self.interrupt.eq(
+            (self.pending != 0)
+            & (frames_reached | interval_reached | unmoderated))
+        with m.If(self.interrupt):
+            m.d.sync += [
+                self.coalesced.eq(self.pending),
+                # An event in this cycle is pending for the next interrupt
+                self.pending.eq(self.event),
+                elapsed.eq(0),
+                since_interrupt.eq(0),
+            ]
+
+        return m
@@ -7,20 +7,31 @@
 #
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import os
+import warnings
 
 from amaranth import *
+from amaranth.hdl import UnusedElaboratable
 from amaranth.lib.cdc import FFSynchronizer, PulseSynchronizer
 import amaranth.back.verilog
+import numpy as np
 
 from .axi4_lite import Axi4LiteRegisterBridge
-from .cdc import RegisterCDC, RxIQCDC
+from .cdc import RxIQCDC
 from .clknx import ClkNxCommonEdge
+from .coeff_loader import CoeffLoader
 from .config import MaiaSDRConfig
+from .counter import EventCounter
 from . import configs
 from .ddc import DDC
+from .interrupt import InterruptModerator
 from .pulse import PulseStretcher
 from .pluto_platform import PlutoPlatform
-from .register import Access, Field, Registers, Register, RegisterMap
+from .register import (
+    Access, Field, Registers, Register, RegisterCrossbar, RegisterMap)
 from .recorder import Recorder16IQ, RecorderMode
 from .spectrometer import Spectrometer
 
@@ -33,10 +44,14 @@ class MaiaSDR(Elaboratable):
 
     This elaboratable is the top-level Maia SDR IP core.
     """
+    # The spectrometer DMA base address register only holds the address bits
+    # above this shift.
+    _spectrometer_address_shift = 16
+
     def __init__(self, config=MaiaSDRConfig()):
         config.validate()
         self.config = config
-        self.axi4_awidth = 4
+        self.axi4_awidth = 6
         self.s_axi_lite = ClockDomain()
         self.sampling = ClockDomain()
         # A clock domain called 'sync' is added to override the default
@@ -48,7 +63,7 @@ class MaiaSDR(Elaboratable):
         self.clk3x = ClockDomain()
 
         self.axi4lite = Axi4LiteRegisterBridge(
-            self.axi4_awidth, name='s_axi_lite')
+            self.axi4_awidth, name='s_axi_lite', max_outstanding=4)
         self.control_registers = Registers(
             'control',
             {
@@ -71,34 +86,168 @@ class MaiaSDR(Elaboratable):
                 0b11: Register('interrupts', [
                     Field('spectrometer', Access.Rsticky, 1, 0),
                     Field('recorder', Access.Rsticky, 1, 0),
+                    Field('recorder_watermark', Access.Rsticky, 1, 0),
+                    Field('ddc_coeff_dma', Access.Rsticky, 1, 0),
                 ], interrupt=True),
             },
             2)
         self.recorder_registers = Registers(
             'recorder',
             {
-                0b0: Register('recorder_control', [
+                0b00: Register('recorder_control', [
                     Field('start', Access.Wpulse, 1, 0),
                     Field('stop', Access.Wpulse, 1, 0),
                     Field('mode', Access.RW,
                           Shape.cast(RecorderMode).width, 0),
                     Field('dropped_samples', Access.R, 1, 0),
+                    Field('circular', Access.RW, 1, 0),
+                    Field('overrun', Access.R, 1, 0),
+                    # Number of DMA bursts between watermark interrupts
+                    # (zero disables them). Each burst contains
+                    # 2**recorder_dma_burst_len_log2 beats of 8 bytes.
+                    Field('watermark_bursts', Access.RW, 16, 0),
                 ]),
-                0b1: Register('recorder_next_address', [
+                0b01: Register('recorder_next_address', [
                     Field('next_address', Access.R, 32, 0),
                 ]),
+                0b10: Register('recorder_read_pointer', [
+                    Field('read_pointer', Access.RW, 32,
+                          config.recorder_address_range[0]),
+                ]),
+                0b11: Register('recorder_write_pointer', [
+                    Field('write_pointer', Access.R, 32, 0),
+                ]),
+            },
+            2)
+        self.recorder_trigger_registers = Registers(
+            'recorder_trigger',
+            {
+                0b00: Register('recorder_trigger', [
+                    Field('enable', Access.RW, 1, 0),
+                    Field('trigger', Access.Wpulse, 1, 0),
+                    Field('power_enable', Access.RW, 1, 0),
+                    Field('triggered', Access.R, 1, 0),
+                ]),
+                0b01: Register('recorder_post_trigger', [
+                    Field('post_trigger_samples', Access.RW, 32, 0),
+                ]),
+                0b10: Register('recorder_power_threshold', [
+                    Field('power_threshold', Access.RW, 32, 0),
+                ]),
+                0b11: Register('recorder_trigger_sample', [
+                    Field('trigger_sample', Access.R, 32, 0),
+                ]),
+            },
+            2)
+        self.recorder_fifo_registers = Registers(
+            'recorder_fifo',
+            {
+                0b00: Register('recorder_fifo', [
+                    Field('high_water_mark', Access.R,
+                          config.recorder_fifo_depth_log2 + 1, 0),
+                ]),
+            },
+            2)
+        self.perf_registers = Registers(
+            'perf',
+            {
+                0b000: Register('perf_recorder_dropped', [
+                    Field('dropped_words', Access.R, 32, 0),
+                ]),
+                0b001: Register('perf_recorder_aw_stall', [
+                    Field('aw_stall_cycles', Access.R, 32, 0),
+                ]),
+                0b010: Register('perf_recorder_w_stall', [
+                    Field('w_stall_cycles', Access.R, 32, 0),
+                ]),
+                0b011: Register('perf_spectrometer_aw_stall', [
+                    Field('aw_stall_cycles', Access.R, 32, 0),
+                ]),
+                0b100: Register('perf_spectrometer_w_stall', [
+                    Field('w_stall_cycles', Access.R, 32, 0),
+                ]),
+                0b101: Register('perf_spectra', [
+                    Field('spectra', Access.R, 32, 0),
+                ]),
+                0b110: Register('perf_aborted_integrations', [
+                    Field('aborted_integrations', Access.R, 32, 0),
+                ]),
+                0b111: Register('perf_interrupts', [
+                    Field('interrupts', Access.R, 32, 0),
+                ]),
+            },
+            3)
+        self.ddc_coeff_dma_registers = Registers(
+            'ddc_coeff_dma',
+            {
+                0b00: Register('ddc_coeff_dma_control', [
+                    Field('start', Access.Wpulse, 1, 0),
+                    Field('busy', Access.R, 1, 0),
+                    Field('error', Access.R, 1, 0),
+                    Field('waddr_start', Access.RW, 10, 0),
+                    Field('num_coeffs', Access.RW, 11, 0),
+                ]),
+                0b01: Register('ddc_coeff_dma_address', [
+                    Field('address', Access.RW, 32, 0),
+                ]),
             },
-            1)
+            2)
+        # An interrupt is generated when the number of pending events reaches
+        # frames, or when interval_us have passed since the first pending
+        # event. A non-zero interval_us is also the minimum time between
+        # interrupts, regardless of frames. The reset values give an
+        # interrupt for each event.
+        self.interrupt_moderation_registers = Registers(
+            'interrupt_moderation',
+            {
+                0b00: Register('spectrometer_moderation', [
+                    Field('frames', Access.RW, 16, 1),
+                    Field('interval_us', Access.RW, 16, 0),
+                ]),
+                0b01: Register('spectrometer_pending', [
+                    Field('pending', Access.R, 16, 0),
+                    Field('coalesced', Access.R, 16, 0),
+                ]),
+                0b10: Register('recorder_watermark_moderation', [
+                    Field('frames', Access.RW, 16, 1),
+                    Field('interval_us', Access.RW, 16, 0),
+                ]),
+                0b11: Register('recorder_watermark_pending', [
+                    Field('pending', Access.R, 16, 0),
+                    Field('coalesced', Access.R, 16, 0),
+                ]),
+            },
+            2)
         self.spectrometer = Spectrometer(
             config.spectrometer_address,
             config.spectrometer_buffers.bit_length() - 1,
-            dma_name='m_axi_spectrometer')
+            dma_max_buffers_log2=(
+                config.spectrometer_max_buffers.bit_length() - 1),
+            dma_name='m_axi_spectrometer',
+            fft_order_log2=config.spectrometer_fft_order_log2,
+            fft_min_order_log2=config.spectrometer_fft_min_order_log2,
+            fft_max_overlap_log2=config.spectrometer_fft_max_overlap_log2,
+            max_bin_decimation_log2=(
+                config.spectrometer_max_bin_decimation_log2),
+            zoom=config.spectrometer_zoom,
+            header=config.spectrometer_header)
         self.recorder = Recorder16IQ(
             config.recorder_address_range[0],
             config.recorder_address_range[1],
             dma_name='m_axi_recorder', domain_in='sync',
-            domain_dma='s_axi_lite')
-        self.ddc = DDC('clk3x')
+            domain_dma='s_axi_lite', circular=True,
+            fifo_depth_log2=config.recorder_fifo_depth_log2,
+            dma_burst_len_log2=config.recorder_dma_burst_len_log2,
+            dma_max_outstanding_bursts=(
+                config.recorder_dma_max_outstanding_bursts),
+            dma_max_outstanding_b_log2=(
+                config.recorder_dma_max_outstanding_b_log2),
+            trigger=True)
+        self.ddc = DDC('clk3x', shadow=True)
+        self.ddc_coeff_loader = CoeffLoader(
+            self.ddc.coeff_width, len(self.ddc.coeff_waddr),
+            dma_name='m_axi_ddc_coeff', domain_dma='s_axi_lite',
+            domain_out='sync')
         self.sdr_registers = Registers(
             'sdr', {
                 0b000: Register(
@@ -113,14 +262,30 @@ class MaiaSDR(Elaboratable):
                               self.spectrometer.nint_width,
                               -1),
                         Field('abort', Access.Wpulse, 1, 0),
+                        # This field keeps the width given by the default
+                        # number of buffers, so that the fields above it do
+                        # not move. The full buffer index is in the
+                        # spectrometer_dma register.
                         Field('last_buffer',
                               Access.R,
-                              len(self.spectrometer.last_buffer),
+                              config.spectrometer_buffers.bit_length() - 1,
                               0),
                         Field('peak_detect',
                               Access.RW,
                               1,
                               0),
+                        Field('fft_size_log2',
+                              Access.RW,
+                              4,
+                              self.spectrometer.fft_order_log2),
+                        Field('output_float32',
+                              Access.RW,
+                              1,
+                              0),
+                        Field('fft_overlap_log2',
+                              Access.RW,
+                              len(self.spectrometer.fft_overlap_log2),
+                              0),
                     ]),
                 0b001: Register(
                     'ddc_coeff_addr',
@@ -201,6 +366,61 @@ class MaiaSDR(Elaboratable):
                               Access.RW,
                               1,
                               0),
+                        Field('shadow',
+                              Access.RW,
+                              1,
+                              0),
+                        Field('apply',
+                              Access.Wpulse,
+                              1,
+                              0),
+                        Field('apply_pending',
+                              Access.R,
+                              1,
+                              0),
+                    ]),
+                0b110: Register(
+                    'spectrometer_zoom',
+                    [
+                        Field('bin_decimation_log2',
+                              Access.RW,
+                              len(self.spectrometer.bin_decimation_log2),
+                              0),
+                        Field('zoom_log2',
+                              Access.RW,
+                              len(self.spectrometer.zoom_log2),
+                              0),
+                        Field('zoom_start',
+                              Access.RW,
+                              len(self.spectrometer.zoom_start),
+                              0),
+                        # 0: sum of the decimated bins, 1: maximum
+                        Field('bin_decimation_max',
+                              Access.RW,
+                              1,
+                              0),
+                    ]),
+                0b111: Register(
+                    'spectrometer_dma',
+                    [
+                        # bits 31:16 of the DMA base address
+                        Field('base_address',
+                              Access.RW,
+                              32 - self._spectrometer_address_shift,
+                              config.spectrometer_address
+                              >> self._spectrometer_address_shift),
+                        Field('buffers_log2',
+                              Access.RW,
+                              len(self.spectrometer.ring_buffers_log2),
+                              config.spectrometer_buffers.bit_length() - 1),
+                        Field('address_error',
+                              Access.R,
+                              1,
+                              0),
+                        Field('last_buffer',
+                              Access.R,
+                              len(self.spectrometer.last_buffer),
+                              0),
                     ]),
             }, 3)
         metadata = {
@@ -217,7 +437,15 @@ class MaiaSDR(Elaboratable):
             0x0: self.control_registers,
             0x10: self.recorder_registers,
             0x20: self.sdr_registers,
+            0x40: self.recorder_trigger_registers,
+            0x50: self.recorder_fifo_registers,
+            0x60: self.perf_registers,
+            0x80: self.ddc_coeff_dma_registers,
+            0x90: self.interrupt_moderation_registers,
         }, metadata)
+        self.register_crossbar = RegisterCrossbar(
+            self.register_map, self.axi4_awidth, domain='s_axi_lite',
+            domains={0x20: 'sync'})
 
         self.iq_in_width = 12
         self.re_in = Signal(self.iq_in_width)
@@ -229,6 +457,7 @@ class MaiaSDR(Elaboratable):
             self.axi4lite.axi.ports()
             + self.spectrometer.dma.axi.ports()
             + self.recorder.dma.axi.ports()
+            + self.ddc_coeff_loader.dma.axi.ports()
             + [
                 self.re_in,
                 self.im_in,
@@ -246,6 +475,200 @@ class MaiaSDR(Elaboratable):
     def svd(self):
         return self.register_map.svd()
 
+    def model(self, re_in, im_in, *, use_ddc_out=False,
+              num_integrations=None, peak_detect=False, ddc=None,
+              fft_size_log2=None, output_float32=False, fft_overlap_log2=0,
+              bin_decimation_log2=0, zoom_log2=0, zoom_start=0,
+              bin_decimation_max=False):
+        """Model of the spectrometer data.
+
+        This model computes the words that the spectrometer writes to
+        its DMA buffers for a given IQ input and register configuration. It is
+        bit-exact assuming that the first input sample is aligned with the
+        start of the first FFT and that the DDC state is zero at the first
+        input sample.
+
+        Parameters
+        ----------
+        re_in : numpy.ndarray
+            Real part of the input (12-bit) IQ samples.
+        im_in : numpy.ndarray
+            Imaginary part of the input (12-bit) IQ samples.
+        use_ddc_out : bool
+            Value of the ``use_ddc_out`` register field.
+        num_integrations : Optional[int]
+            Value of the ``num_integrations`` register field. By default the
+            reset value of the register is used.
+        peak_detect : bool
+            Value of the ``peak_detect`` register field.
+        ddc : Optional[dict]
+            DDC settings. These are keyword arguments for ``DDC.model``
+            (``frequency``, ``taps``, ``decimation``, and optionally
+            ``bypass2``, ``bypass3``, ``operations_minus_one`` and
+            ``odd_operations``). Only used when ``use_ddc_out`` is enabled.
+        fft_size_log2 : Optional[int]
+            Value of the ``fft_size_log2`` register field. By default the
+            reset value of the register is used.
+        output_float32 : bool
+            Value of the ``output_float32`` register field.
+        fft_overlap_log2 : int
+            Value of the ``fft_overlap_log2`` register field.
+        bin_decimation_log2, zoom_log2, zoom_start : int
+            Values of the fields of the ``spectrometer_zoom`` register.
+        bin_decimation_max : bool
+            Value of the ``bin_decimation_max`` field of the
+            ``spectrometer_zoom`` register.
+
+        Returns
+        -------
+        numpy.ndarray
+            An array of shape ``(num_spectra, num_bins)`` with the data
+            written to each DMA buffer. The type is ``uint64``, or ``uint32``
+            if ``output_float32`` is enabled.
+        """
+        return self._model(
+            re_in, im_in, 0, 0, use_ddc_out=use_ddc_out,
+            num_integrations=num_integrations, peak_detect=peak_detect,
+            ddc=ddc, fft_size_log2=fft_size_log2,
+            output_float32=output_float32,
+            fft_overlap_log2=fft_overlap_log2,
+            bin_decimation_log2=bin_decimation_log2, zoom_log2=zoom_log2,
+            zoom_start=zoom_start, bin_decimation_max=bin_decimation_max)
+
+    def _model(self, re_in, im_in, first_sample, warmup, *, use_ddc_out,
+               num_integrations, peak_detect, ddc, fft_size_log2,
+               output_float32, fft_overlap_log2, bin_decimation_log2,
+               zoom_log2, zoom_start, bin_decimation_max):
+        # first_sample is the index of the first input sample in the whole
+        # input stream, and warmup is the number of input samples that are
+        # only used to fill the DDC history
+        if num_integrations is None:
+            num_integrations = 2**self.spectrometer.nint_width - 1
+        if use_ddc_out:
+            decimation, _ = self._model_ddc_span(ddc)
+            kwargs = dict(ddc)
+            frequency = kwargs.pop('frequency')
+            phase = (first_sample * frequency) % 2**self.ddc.nco_width
+            out = list(self.ddc.model(
+                frequency, kwargs.pop('taps'), kwargs.pop('decimation'),
+                [(re_in, im_in)], phase=phase, **kwargs))[0]
+            re, im = (x[warmup // decimation:] for x in out)
+        else:
+            # The RX IQ samples are pushed to the MSBs of the spectrometer
+            # input
+            shift = self.spectrometer.width_in - self.iq_in_width
+            re, im = (np.asarray(x[warmup:], 'int') << shift
+                      for x in [re_in, im_in])
+        return self.spectrometer.model(re, im, num_integrations, peak_detect,
+                                       fft_size_log2, output_float32,
+                                       fft_overlap_log2, bin_decimation_log2,
+                                       zoom_log2, zoom_start,
+                                       bin_decimation_max)
+
+    def _model_ddc_span(self, ddc):
+        kwargs = {k: v for k, v in ddc.items()
+                  if k not in ['frequency', 'taps', 'decimation']}
+        return self.ddc.decimator.model_span(
+            ddc['taps'], ddc['decimation'], **kwargs)
+
+    def model_file(self, path, output=None, *, dtype='int16',
+                   use_ddc_out=False, num_integrations=None,
+                   peak_detect=False, ddc=None, fft_size_log2=None,
+                   output_float32=False, fft_overlap_log2=0,
+                   bin_decimation_log2=0, zoom_log2=0, zoom_start=0,
+                   bin_decimation_max=False, block_spectra=None,
+                   processes=None):
+        """Model of the spectrometer data for an IQ file.
+
+        This computes the same as ``model``, but the input is read from a file
+        and processed in blocks that contain an integer number of
+        integrations. The blocks are independent (when the DDC is used, each
+        block includes enough previous samples to fill the DDC history), so
+        they are processed in parallel by a pool of processes.
+
+        Parameters
+        ----------
+        path : str
+            Path of the input file. The file contains interleaved IQ samples
+            with the values that are presented in the ``re_in`` and ``im_in``
+            inputs.
+        output : Optional[str]
+            Path of the output file. The words written by the DMA are stored
+            in this file using the machine's byte order. If this is
+            ``None``, the output is returned as an array.
+        dtype : str
+            Data type of the samples in the input file.
+        use_ddc_out, num_integrations, peak_detect, ddc
+            Register configuration. See ``model``.
+        fft_size_log2, output_float32, fft_overlap_log2
+            Register configuration. See ``model``.
+        bin_decimation_log2, zoom_log2, zoom_start, bin_decimation_max
+            Register configuration. See ``model``.
+        block_spectra : Optional[int]
+            Number of spectra in each block. By default, this is chosen so
+            that each block has about 4 million input samples.
+        processes : Optional[int]
+            Number of worker processes. By default, the number of CPUs is
+            used. If this is 1, the model runs in the current process.
+
+        Returns
+        -------
+        numpy.ndarray or int
+            The model output (see ``model``) if ``output`` is ``None``.
+            Otherwise, the number of spectra written to the output file.
+        """
+        nint = (2**self.spectrometer.nint_width - 1
+                if num_integrations is None else num_integrations)
+        fft_size = 2**(self.spectrometer.fft_order_log2
+                       if fft_size_log2 is None else fft_size_log2)
+        # With overlap, consecutive spectra start nint * hop samples apart, and
+        # each block needs fft_size - hop samples after its last spectrum
+        # start to complete the last FFT frame.
+        hop = fft_size >> fft_overlap_log2
+        spectrum_len = max(nint, 1) * hop
+        if use_ddc_out:
+            decimation, span = self._model_ddc_span(ddc)
+            # warmup is rounded up to a multiple of the decimation to keep the
+            # FIR polyphase alignment
+            warmup = -(-(span - 1) // decimation) * decimation
+        else:
+            decimation, warmup = 1, 0
+        spectrum_len *= decimation
+        tail = (fft_size - hop) * decimation
+        if block_spectra is None:
+            block_spectra = max(1, 2**22 // spectrum_len)
+        block_len = block_spectra * spectrum_len
+        nsamples = np.memmap(path, dtype, mode='r').size // 2
+        settings = {'use_ddc_out': use_ddc_out,
+                    'num_integrations': num_integrations,
+                    'peak_detect': peak_detect, 'ddc': ddc,
+                    'fft_size_log2': fft_size_log2,
+                    'output_float32': output_float32,
+                    'fft_overlap_log2': fft_overlap_log2,
+                    'bin_decimation_log2': bin_decimation_log2,
+                    'zoom_log2': zoom_log2, 'zoom_start': zoom_start,
+                    'bin_decimation_max': bin_decimation_max}
+        jobs = ((path, dtype, start, min(start, warmup),
+                 min(start + block_len + tail, nsamples), settings)
+                for start in range(0, nsamples, block_len))
+
+        results = []
+        num_spectra = 0
+        with (open(output, 'wb') if output is not None
+              else contextlib.nullcontext()) as f:
+            for words in _model_map(self, jobs, processes):
+                num_spectra += words.shape[0]
+                if f is None:
+                    results.append(words)
+                else:
+                    words.tofile(f)
+        if output is not None:
+            return num_spectra
+        if not results:
+            return np.zeros((0, fft_size >> (zoom_log2 + bin_decimation_log2)),
+                            'uint32' if output_float32 else 'uint64')
+        return np.concatenate(results)
+
     def elaborate(self, platform):
         m = Module()
         m.domains += [
@@ -257,19 +680,14 @@ class MaiaSDR(Elaboratable):
         ]
         s_axi_lite_renamer = DomainRenamer({'sync': 's_axi_lite'})
         m.submodules.axi4lite = s_axi_lite_renamer(self.axi4lite)
-        m.submodules.control_registers = s_axi_lite_renamer(
-            self.control_registers)
-        m.submodules.recorder_registers = s_axi_lite_renamer(
-            self.recorder_registers)
+        m.submodules.register_crossbar = self.register_crossbar
         m.submodules.spectrometer = self.spectrometer
         m.submodules.sync_spectrometer_interrupt = \
             sync_spectrometer_interrupt = PulseSynchronizer(
                 i_domain='sync', o_domain='s_axi_lite')
         m.submodules.recorder = self.recorder
         m.submodules.ddc = self.ddc
-        m.submodules.sdr_registers = self.sdr_registers
-        m.submodules.sdr_registers_cdc = sdr_registers_cdc = RegisterCDC(
-            's_axi_lite', 'sync', self.sdr_registers.aw)
+        m.submodules.ddc_coeff_loader = self.ddc_coeff_loader
 
         m.submodules.common_edge_2x = common_edge_2x = ClkNxCommonEdge(
             'sync', 'clk2x', 2)
@@ -318,9 +736,35 @@ class MaiaSDR(Elaboratable):
                 self.sdr_registers['spectrometer']['abort']),
             self.spectrometer.peak_detect.eq(
                 self.sdr_registers['spectrometer']['peak_detect']),
+            self.spectrometer.fft_size_log2.eq(
+                self.sdr_registers['spectrometer']['fft_size_log2']),
+            self.spectrometer.output_float32.eq(
+                self.sdr_registers['spectrometer']['output_float32']),
+            self.spectrometer.fft_overlap_log2.eq(
+                self.sdr_registers['spectrometer']['fft_overlap_log2']),
+        ]
+        zoom_registers = self.sdr_registers['spectrometer_zoom']
+        m.d.comb += [
+            self.spectrometer.bin_decimation_log2.eq(
+                zoom_registers['bin_decimation_log2']),
+            self.spectrometer.zoom_log2.eq(zoom_registers['zoom_log2']),
+            self.spectrometer.zoom_start.eq(zoom_registers['zoom_start']),
+            self.spectrometer.bin_decimation_max.eq(
+                zoom_registers['bin_decimation_max']),
             self.sdr_registers['spectrometer']['last_buffer'].eq(
                 self.spectrometer.last_buffer),
         ]
+        dma_registers = self.sdr_registers['spectrometer_dma']
+        m.d.comb += [
+            self.spectrometer.ring_base_address.eq(
+                Cat(Const(0, self._spectrometer_address_shift),
+                    dma_registers['base_address'])),
+            self.spectrometer.ring_buffers_log2.eq(
+                dma_registers['buffers_log2']),
+            dma_registers['address_error'].eq(
+                self.spectrometer.ring_address_error),
+            dma_registers['last_buffer'].eq(self.spectrometer.last_buffer),
+        ]
 
         # Recorder
         m.d.comb += [
@@ -339,6 +783,39 @@ class MaiaSDR(Elaboratable):
                 self.recorder.dropped_samples),
             (self.recorder_registers['recorder_next_address']
              ['next_address'].eq(self.recorder.next_address)),
+            self.recorder.circular_mode.eq(
+                self.recorder_registers['recorder_control']['circular']),
+            self.recorder.watermark_bursts.eq(
+                self.recorder_registers['recorder_control']
+                ['watermark_bursts']),
+            self.recorder_registers['recorder_control']['overrun'].eq(
+                self.recorder.overrun),
+            self.recorder.read_pointer.eq(
+                self.recorder_registers['recorder_read_pointer']
+                ['read_pointer']),
+            (self.recorder_registers['recorder_write_pointer']
+             ['write_pointer'].eq(self.recorder.write_pointer)),
+        ]
+        trigger_registers = self.recorder_trigger_registers
+        m.d.comb += [
+            self.recorder.trigger_enable.eq(
+                trigger_registers['recorder_trigger']['enable']),
+            self.recorder.trigger_now.eq(
+                trigger_registers['recorder_trigger']['trigger']),
+            self.recorder.power_trigger.eq(
+                trigger_registers['recorder_trigger']['power_enable']),
+            trigger_registers['recorder_trigger']['triggered'].eq(
+                self.recorder.triggered),
+            self.recorder.post_trigger_samples.eq(
+                trigger_registers['recorder_post_trigger']
+                ['post_trigger_samples']),
+            self.recorder.power_threshold.eq(
+                trigger_registers['recorder_power_threshold']
+                ['power_threshold']),
+            (trigger_registers['recorder_trigger_sample']['trigger_sample']
+             .eq(self.recorder.trigger_sample)),
+            (self.recorder_fifo_registers['recorder_fifo']['high_water_mark']
+             .eq(self.recorder.fifo_high_water_mark)),
         ]
 
         # DDC
@@ -348,12 +825,6 @@ class MaiaSDR(Elaboratable):
                 self.sdr_registers['ddc_control']['enable_input']),
             self.ddc.frequency.eq(
                 self.sdr_registers['ddc_frequency']['frequency']),
-            self.ddc.coeff_waddr.eq(
-                self.sdr_registers['ddc_coeff_addr']['coeff_waddr']),
-            self.ddc.coeff_wren.eq(
-                self.sdr_registers['ddc_coeff']['coeff_wren']),
-            self.ddc.coeff_wdata.eq(
-                self.sdr_registers['ddc_coeff']['coeff_wdata']),
             self.ddc.decimation1.eq(
                 self.sdr_registers['ddc_decimation']['decimation1']),
             self.ddc.decimation2.eq(
@@ -374,64 +845,64 @@ class MaiaSDR(Elaboratable):
                 self.sdr_registers['ddc_control']['odd_operations1']),
             self.ddc.odd_operations3.eq(
                 self.sdr_registers['ddc_control']['odd_operations3']),
+            self.ddc.shadow_mode.eq(
+                self.sdr_registers['ddc_control']['shadow']),
+            self.ddc.apply.eq(
+                self.sdr_registers['ddc_control']['apply']),
+            self.sdr_registers['ddc_control']['apply_pending'].eq(
+                self.ddc.apply_pending),
             self.ddc.strobe_in.eq(rxiq_cdc.strobe_out),
             self.ddc.re_in.eq(rxiq_cdc.re_out),
             self.ddc.im_in.eq(rxiq_cdc.im_out),
         ]
-
-        # Registers s_axi_lite domain
-        # TODO: convert all of this into a RegisterCrossbar module
-        address = Signal(self.axi4_awidth, reset_less=True)
-        wdata = Signal(32, reset_less=True)
-        sdr_regs_select = self.axi4lite.address[3] == 1
-        recorder_regs_select = (
-            ~sdr_regs_select & (self.axi4lite.address[2] == 1))
-        control_regs_select = (
-            ~sdr_regs_select & (self.axi4lite.address[2] == 0))
-        m.d.s_axi_lite += [
-            self.axi4lite.rdata.eq(self.control_registers.rdata
-                                   | self.recorder_registers.rdata
-                                   | sdr_registers_cdc.i_rdata),
-            self.axi4lite.rdone.eq(self.control_registers.rdone
-                                   | self.recorder_registers.rdone
-                                   | sdr_registers_cdc.i_rdone),
-            self.axi4lite.wdone.eq(self.control_registers.wdone
-                                   | self.recorder_registers.wdone
-                                   | sdr_registers_cdc.i_wdone),
-            self.control_registers.ren.eq(
-                self.axi4lite.ren & control_regs_select),
-            self.control_registers.wstrobe.eq(
-                Mux(control_regs_select, self.axi4lite.wstrobe, 0)),
-            self.recorder_registers.ren.eq(
-                self.axi4lite.ren & recorder_regs_select),
-            self.recorder_registers.wstrobe.eq(
-                Mux(recorder_regs_select, self.axi4lite.wstrobe, 0)),
-            sdr_registers_cdc.i_ren.eq(
-                self.axi4lite.ren & sdr_regs_select),
-            sdr_registers_cdc.i_wstrobe.eq(
-                Mux(sdr_regs_select, self.axi4lite.wstrobe, 0)),
-            address.eq(self.axi4lite.address),
-            wdata.eq(self.axi4lite.wdata),
-        ]
+        # The coefficients can be written either with the ddc_coeff
+        # register or with the coefficient loader DMA
+        coeff_loader = self.ddc_coeff_loader
+        with m.If(coeff_loader.coeff_wren):
+            m.d.comb += [
+                self.ddc.coeff_waddr.eq(coeff_loader.coeff_waddr),
+                self.ddc.coeff_wdata.eq(coeff_loader.coeff_wdata),
+            ]
+        with m.Else():
+            m.d.comb += [
+                self.ddc.coeff_waddr.eq(
+                    self.sdr_registers['ddc_coeff_addr']['coeff_waddr']),
+                self.ddc.coeff_wdata.eq(
+                    self.sdr_registers['ddc_coeff']['coeff_wdata']),
+            ]
+        coeff_dma_registers = self.ddc_coeff_dma_registers
         m.d.comb += [
-            self.control_registers.address.eq(address),
-            self.control_registers.wdata.eq(wdata),
-            self.recorder_registers.address.eq(address),
-            self.recorder_registers.wdata.eq(wdata),
-            sdr_registers_cdc.i_address.eq(address),
-            sdr_registers_cdc.i_wdata.eq(wdata),
+            self.ddc.coeff_wren.eq(
+                self.sdr_registers['ddc_coeff']['coeff_wren']
+                | coeff_loader.coeff_wren),
+            # s_axi_lite domain
+            coeff_loader.start.eq(
+                coeff_dma_registers['ddc_coeff_dma_control']['start']),
+            coeff_loader.waddr_start.eq(
+                coeff_dma_registers['ddc_coeff_dma_control']['waddr_start']),
+            coeff_loader.num_coeffs.eq(
+                coeff_dma_registers['ddc_coeff_dma_control']['num_coeffs']),
+            coeff_loader.address.eq(
+                coeff_dma_registers['ddc_coeff_dma_address']['address']),
+            coeff_dma_registers['ddc_coeff_dma_control']['busy'].eq(
+                coeff_loader.busy),
+            coeff_dma_registers['ddc_coeff_dma_control']['error'].eq(
+                coeff_loader.error),
         ]
 
-        # Registers sync domain
+        # Registers (s_axi_lite domain)
+        crossbar = self.register_crossbar
         m.d.comb += [
-            self.sdr_registers.ren.eq(sdr_registers_cdc.o_ren),
-            self.sdr_registers.wstrobe.eq(sdr_registers_cdc.o_wstrobe),
-            self.sdr_registers.address.eq(sdr_registers_cdc.o_address),
-            self.sdr_registers.wdata.eq(sdr_registers_cdc.o_wdata),
-            sdr_registers_cdc.o_rdone.eq(self.sdr_registers.rdone),
-            sdr_registers_cdc.o_wdone.eq(self.sdr_registers.wdone),
-            sdr_registers_cdc.o_rdata.eq(self.sdr_registers.rdata),
+            crossbar.ren.eq(self.axi4lite.ren),
+            crossbar.wstrobe.eq(self.axi4lite.wstrobe),
+            crossbar.address.eq(self.axi4lite.address),
+            crossbar.wdata.eq(self.axi4lite.wdata),
+            self.axi4lite.rdone.eq(crossbar.rdone),
+            self.axi4lite.wdone.eq(crossbar.wdone),
+            self.axi4lite.rdata.eq(crossbar.rdata),
+            self.axi4lite.ready.eq(crossbar.ready),
         ]
+
         # internal resets
         # We use FFSynchronizer rather than ResetSynchronizer because of
         # https://github.com/amaranth-lang/amaranth/issues/721
@@ -447,13 +918,113 @@ class MaiaSDR(Elaboratable):
         interrupts_reg = self.control_registers['interrupts']
         m.d.comb += [
             self.interrupt_out.eq(interrupts_reg.interrupt),
-            interrupts_reg['spectrometer'].eq(sync_spectrometer_interrupt.o),
             interrupts_reg['recorder'].eq(self.recorder.finished),
+            interrupts_reg['ddc_coeff_dma'].eq(self.ddc_coeff_loader.done),
+        ]
+        # The spectrometer and recorder watermark interrupts, which can be
+        # very frequent, go through an interrupt moderator.
+        tick_cycles = self.config.s_axi_lite_frequency // 1_000_000
+        moderated_interrupts = [
+            ('spectrometer', sync_spectrometer_interrupt.o),
+            ('recorder_watermark', self.recorder.watermark),
         ]
+        for name, event in moderated_interrupts:
+            moderator = s_axi_lite_renamer(
+                InterruptModerator(tick_cycles=tick_cycles))
+            m.submodules[f'{name}_interrupt_moderator'] = moderator
+            moderation_reg = (
+                self.interrupt_moderation_registers[f'{name}_moderation'])
+            pending_reg = (
+                self.interrupt_moderation_registers[f'{name}_pending'])
+            m.d.comb += [
+                moderator.event.eq(event),
+                moderator.frames.eq(moderation_reg['frames']),
+                moderator.interval.eq(moderation_reg['interval_us']),
+                interrupts_reg[name].eq(moderator.interrupt),
+                pending_reg['pending'].eq(moderator.pending),
+                pending_reg['coalesced'].eq(moderator.coalesced),
+            ]
+
+        # Performance counters (read in the s_axi_lite domain)
+        interrupt_q = Signal()
+        m.d.s_axi_lite += interrupt_q.eq(interrupts_reg.interrupt)
+        recorder_axi = self.recorder.dma.axi
+        spectrometer_axi = self.spectrometer.dma.axi
+        perf_counters = [
+            # (register, field, event, event domain)
+            ('perf_recorder_aw_stall', 'aw_stall_cycles',
+             recorder_axi.awvalid & ~recorder_axi.awready, 's_axi_lite'),
+            ('perf_recorder_w_stall', 'w_stall_cycles',
+             recorder_axi.wvalid & ~recorder_axi.wready, 's_axi_lite'),
+            ('perf_spectrometer_aw_stall', 'aw_stall_cycles',
+             spectrometer_axi.awvalid & ~spectrometer_axi.awready, 'sync'),
+            ('perf_spectrometer_w_stall', 'w_stall_cycles',
+             spectrometer_axi.wvalid & ~spectrometer_axi.wready, 'sync'),
+            ('perf_spectra', 'spectra',
+             self.spectrometer.interrupt_out, 'sync'),
+            ('perf_aborted_integrations', 'aborted_integrations',
+             self.spectrometer.aborted, 'sync'),
+            ('perf_interrupts', 'interrupts',
+             interrupts_reg.interrupt & ~interrupt_q, 's_axi_lite'),
+        ]
+        for register, field, event, domain in perf_counters:
+            m.submodules[f'{register}_counter'] = counter = EventCounter(
+                len(self.perf_registers[register][field]),
+                domain=domain, o_domain='s_axi_lite')
+            m.d.comb += [
+                counter.event.eq(event),
+                self.perf_registers[register][field].eq(counter.count),
+            ]
+        m.d.comb += (
+            self.perf_registers['perf_recorder_dropped']['dropped_words']
+            .eq(self.recorder.dropped_words))
 
         return m
 
 
+# MaiaSDR instance used by the model worker processes
+_model_top = None
+
+
+def _model_worker_init(config):
+    global _model_top
+    # The worker processes only use the models, so the MaiaSDR is never
+    # elaborated
+    warnings.simplefilter('ignore', UnusedElaboratable)
+    _model_top = MaiaSDR(config)
+
+
+def _model_worker(job):
+    return _model_block(_model_top, job)
+
+
+def _model_block(top, job):
+    path, dtype, start, warmup, end, settings = job
+    iq = np.asarray(
+        np.memmap(path, dtype, mode='r')[2*(start - warmup):2*end], 'int')
+    return top._model(
+        iq[::2], iq[1::2], start - warmup, warmup, **settings)
+
+
+def _model_map(top, jobs, processes):
+    # Equivalent to map(_model_block, jobs), but using a process pool. The
+    # number of pending jobs is limited to bound memory usage.
+    if processes == 1:
+        yield from (_model_block(top, job) for job in jobs)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_model_worker_init,
+            initargs=(top.config,)) as executor:
+        max_pending = 2 * (processes or os.cpu_count())
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(executor.submit(_model_worker, job))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 def write_svd(path):
     top = MaiaSDR()
     with open(path, 'wb') as f:
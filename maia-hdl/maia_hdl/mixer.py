@@ -91,9 +91,16 @@ class Mixer(Elaboratable):
     def delay(self):
         return self.cmult.delay + 1
 
-    def model(self, freq, re_in, im_in):
+    def model(self, freq, re_in, im_in, phase=0):
+        """Model of the mixer.
+
+        The ``phase`` argument gives the NCO value for the first input
+        sample. This can be used to process a long input in chunks. The NCO
+        value for the first sample of the next chunk is ``(phase +
+        len(re_in) * freq) % 2**nco_width``.
+        """
         assert len(re_in) == len(im_in)
-        phase = (np.arange(len(re_in)) * freq) % 2**self.nco_width
+        phase = (phase + np.arange(len(re_in)) * freq) % 2**self.nco_width
         phase = phase // 2**(self.nco_width-self.phase_bits)
         cexp_re, cexp_im = [np.array(a, 'int')[phase] for a in self.cexp()]
         re_in, im_in = [np.array(a, 'int') for a in [re_in, im_in]]
@@ -0,0 +1,249 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import amaranth.cli
+from amaranth.lib.memory import Memory
+import numpy as np
+
+
+class OverlapBuffer(Elaboratable):
+    """Overlapped FFT frames buffer.
+
+    This module is placed before an FFT to feed it with overlapping frames of
+    input samples. The input samples are written to a BRAM ring-buffer, and
+    each time that a new frame is complete, it is read out at one sample per
+    clock cycle. Consecutive frames start ``2**(size_log2 - overlap_log2)``
+    samples apart, so each input sample is used in ``2**overlap_log2``
+    frames.
+
+    Reading a frame takes as many clock cycles as the frame size, so the
+    input strobe duty cycle should be at most ``2**-overlap_log2``. If the
+    input is faster than this, some frames are dropped, which reduces the
+    effective overlap. Frames are never corrupted by this.
+
+    When the overlap is zero, the input is passed directly to the output.
+
+    The output frames are aligned so that the number of output samples is a
+    multiple of the frame size at the start of each frame, as the FFT
+    expects. After the frame size is changed, the first frame can be
+    truncated to achieve this.
+
+    Parameters
+    ----------
+    width : int
+        Width of the real and imaginary parts of the samples.
+    order_log2 : int
+        log2 of the maximum frame size.
+    min_order_log2 : Optional[int]
+        log2 of the minimum frame size that can be selected at runtime with
+        ``size_log2``. By default, the frame size is fixed.
+    max_overlap_log2 : int
+        Maximum value of ``overlap_log2``.
+
+    Attributes
+    ----------
+    strobe_in : Signal(), in
+        Input strobe.
+    re_in : Signal(signed(width)), in
+        Input real part.
+    im_in : Signal(signed(width)), in
+        Input imaginary part.
+    overlap_log2 : Signal(range(max_overlap_log2 + 1)), in
+        log2 of the number of frames that use each sample.
+    size_log2 : Signal(range(order_log2 + 1)), in
+        log2 of the frame size. This is only present if ``min_order_log2`` is
+        smaller than ``order_log2``. Values outside the supported range select
+        the maximum frame size.
+    strobe_out : Signal(), out
+        Output strobe.
+    re_out : Signal(signed(width)), out
+        Output real part.
+    im_out : Signal(signed(width)), out
+        Output imaginary part.
+    start_out : Signal(order_log2 + 2), out
+        Index of the input sample (modulo ``2**(order_log2 + 2)``) that is
+        the first sample of the output frame. It is valid together with
+        ``strobe_out``. The input samples are counted with ``strobe_in``
+        since the reset. When ``overlap_log2`` is zero, the frames are not
+        tracked, and this gives the index of each output sample instead.
+    """
+    def __init__(self, width, order_log2, min_order_log2=None,
+                 max_overlap_log2=2):
+        self.w = width
+        self.order_log2 = order_log2
+        self.min_order_log2 = (
+            order_log2 if min_order_log2 is None else min_order_log2)
+        if not 0 < self.min_order_log2 <= order_log2:
+            raise ValueError(f'invalid min_order_log2 {min_order_log2}')
+        if not 0 <= max_overlap_log2 <= self.min_order_log2:
+            raise ValueError(f'invalid max_overlap_log2 {max_overlap_log2}')
+        self.max_overlap_log2 = max_overlap_log2
+
+        self.strobe_in = Signal()
+        self.re_in = Signal(signed(width))
+        self.im_in = Signal(signed(width))
+        self.overlap_log2 = Signal(range(max_overlap_log2 + 1))
+        if self.min_order_log2 < order_log2:
+            self.size_log2 = Signal(range(order_log2 + 1), init=order_log2)
+        self.strobe_out = Signal()
+        self.re_out = Signal(signed(width))
+        self.im_out = Signal(signed(width))
+        self.start_out = Signal(order_log2 + 2)
+
+    def ports(self):
+        return [
+            self.strobe_in, self.re_in, self.im_in, self.overlap_log2,
+            self.strobe_out, self.re_out, self.im_out, self.start_out,
+        ] + ([self.size_log2] if self.min_order_log2 < self.order_log2
+             else [])
+
+    def model(self, re_in, im_in, overlap_log2, size_log2=None):
+        """Model of the output samples.
+
+        The model assumes that the input is slow enough so that no frames
+        are dropped. Input samples that do not form a complete frame are
+        dropped.
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            Real and imaginary parts of the output samples. These are the
+            concatenation of all the output frames.
+        """
+        if size_log2 is None:
+            size_log2 = self.order_log2
+        re_in, im_in = (np.asarray(x) for x in [re_in, im_in])
+        if overlap_log2 == 0:
+            n = (re_in.size >> size_log2) << size_log2
+            return re_in[:n], im_in[:n]
+        size = 2**size_log2
+        hop = size >> overlap_log2
+        num_frames = max((re_in.size - size) // hop + 1, 0)
+        idx = (hop * np.arange(num_frames)[:, np.newaxis]
+               + np.arange(size)).ravel()
+        return re_in[idx], im_in[idx]
+
+    def model_num_frames(self, num_samples, overlap_log2, size_log2=None):
+        """Number of output frames given by the model"""
+        if size_log2 is None:
+            size_log2 = self.order_log2
+        size = 2**size_log2
+        hop = size >> overlap_log2
+        return max((num_samples - size) // hop + 1, 0)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # The ring-buffer has twice the maximum frame size. When a frame read
+        # starts, the writer is at most twice the frame size ahead of the
+        # frame start, so it cannot overwrite samples that have not been read
+        # yet.
+        buffer_awidth = self.order_log2 + 1
+        m.submodules.mem = mem = Memory(
+            shape=2 * self.w, depth=2**buffer_awidth, init=[])
+        wrport = mem.write_port()
+        rdport = mem.read_port(transparent_for=())
+
+        # Frame size mask
+        size_mask = Signal(self.order_log2)
+        if self.min_order_log2 < self.order_log2:
+            with m.Switch(self.size_log2):
+                for n in range(self.min_order_log2, self.order_log2):
+                    with m.Case(n):
+                        m.d.comb += size_mask.eq(2**n - 1)
+                with m.Default():
+                    m.d.comb += size_mask.eq(-1)
+        else:
+            m.d.comb += size_mask.eq(-1)
+        size = size_mask + 1
+        hop = Signal(self.order_log2 + 1)
+        m.d.comb += hop.eq(size >> self.overlap_log2)
+
+        # Write side. The counters have an extra bit to be able to tell how
+        # far ahead the writer is from the next frame start.
+        write_count = Signal(buffer_awidth + 1)
+        m.d.comb += [
+            wrport.en.eq(self.strobe_in),
+            wrport.addr.eq(write_count[:buffer_awidth]),
+            wrport.data.eq(Cat(self.re_in, self.im_in)),
+        ]
+        with m.If(self.strobe_in):
+            m.d.sync += write_count.eq(write_count + 1)
+
+        frame_start = Signal(buffer_awidth + 1)
+        excess = Signal(buffer_awidth + 1)
+        m.d.comb += excess.eq(write_count - frame_start)
+
+        # Read side
+        reading = Signal()
+        reading_q = Signal()
+        # This has the width of the write counter, so that it gives the
+        # input sample index of the frame start.
+        read_start = Signal(buffer_awidth + 1)
+        read_start_q = Signal.like(read_start)
+        read_index = Signal(self.order_log2)
+        read_mask = Signal(self.order_log2)
+        # Number of output samples (modulo the maximum frame size). This is
+        # used to keep the frames aligned with the FFT.
+        phase = Signal(self.order_log2)
+        direct = Signal()
+        m.d.comb += [
+            direct.eq((self.overlap_log2 == 0) & ~reading & ~reading_q),
+            rdport.addr.eq(read_start + read_index),
+        ]
+        m.d.sync += [
+            reading_q.eq(reading),
+            read_start_q.eq(read_start),
+        ]
+
+        # A new frame can start in the last cycle of the current frame, so
+        # that frames are read back-to-back.
+        last_read = reading & (phase | ~read_mask).all()
+        with m.If(direct):
+            # The next frame starts with the next input sample
+            m.d.sync += frame_start.eq(write_count)
+            with m.If(self.strobe_in):
+                m.d.sync += phase.eq(phase + 1)
+        with m.Else():
+            with m.If(reading):
+                m.d.sync += [
+                    read_index.eq(read_index + 1),
+                    phase.eq(phase + 1),
+                ]
+                with m.If(last_read):
+                    m.d.sync += reading.eq(0)
+            with m.If((~reading | last_read) & (self.overlap_log2 != 0)):
+                with m.If(excess >= 2 * size):
+                    # The reader is falling behind. Drop a frame.
+                    m.d.sync += frame_start.eq(frame_start + hop)
+                with m.Elif(excess >= size):
+                    m.d.sync += [
+                        reading.eq(1),
+                        read_start.eq(frame_start),
+                        read_index.eq(0),
+                        read_mask.eq(size_mask),
+                        frame_start.eq(frame_start + hop),
+                    ]
+
+        re_mem, im_mem = rdport.data[:self.w], rdport.data[self.w:]
+        m.d.comb += [
+            self.strobe_out.eq(Mux(direct, self.strobe_in, reading_q)),
+            self.re_out.eq(Mux(direct, self.re_in, re_mem)),
+            self.im_out.eq(Mux(direct, self.im_in, im_mem)),
+            # In direct mode, the index of the current input sample is given.
+            self.start_out.eq(Mux(direct, write_count, read_start_q)),
+        ]
+
+        return m
+
+
+if __name__ == '__main__':
+    overlap = OverlapBuffer(16, 12, 8)
+    amaranth.cli.main(
+        overlap, ports=overlap.ports())
@@ -11,8 +11,10 @@ from amaranth.lib.cdc import FFSynchronizer, PulseSynchronizer
 from amaranth.lib import enum
 import amaranth.cli
 
+from .cdc import BusSynchronizer
+from .counter import EventCounter
 from .dma import DmaStreamWrite
-from .fifo import AsyncFifo18_36
+from .fifo import AsyncFifo18_36, AsyncFifoBRAM
 from .packer import Pack16IQto32, Pack12IQto32, Pack8IQto32, PackFifoTwice
 
 
@@ -22,6 +24,125 @@ class RecorderMode(enum.Enum, shape=2):
     MODE_8BIT = 2
 
 
+class RecorderTrigger(Elaboratable):
+    """Recorder trigger.
+
+    This module implements the trigger of the pre-trigger capture mode of the
+    recorder. The trigger fires either when ``trigger`` is pulsed or, if
+    ``power_enable`` is asserted, when the power of an input sample is above
+    ``power_threshold``. After the trigger, ``post_trigger_samples`` more
+    samples are counted and then ``done`` is asserted.
+
+    The samples are counted since ``run`` is asserted, so the position of the
+    trigger is given as a sample index in ``trigger_sample``.
+
+    Attributes
+    ----------
+    run : Signal(), in
+        Asserted while the recording runs. The module is reset when this is
+        deasserted.
+    enable : Signal(), in
+        Enables the trigger.
+    strobe_in : Signal(), in
+        Asserted to indicate that a valid sample is presented at the input.
+    re_in : Signal(16), in
+        Input real part.
+    im_in : Signal(16), in
+        Input imaginary part.
+    trigger : Signal(), in
+        Pulsed to trigger manually.
+    power_enable : Signal(), in
+        Enables the power threshold detector.
+    power_threshold : Signal(32), in
+        Power threshold. The power of a sample is ``re_in**2 + im_in**2``.
+    post_trigger_samples : Signal(32), in
+        Number of samples to record after the trigger sample.
+    triggered : Signal(), out
+        Asserted once the trigger has fired. It is asserted one cycle after
+        ``trigger_sample`` is updated.
+    trigger_sample : Signal(32), out
+        Index of the sample that fired the trigger. For a manual trigger,
+        this is the index of the next sample, and the post-trigger samples
+        start with it.
+    done : Signal(), out
+        Asserted once ``post_trigger_samples`` have been counted after the
+        trigger.
+    """
+    def __init__(self):
+        self.run = Signal()
+        self.enable = Signal()
+        self.strobe_in = Signal()
+        self.re_in = Signal(16)
+        self.im_in = Signal(16)
+        self.trigger = Signal()
+        self.power_enable = Signal()
+        self.power_threshold = Signal(32)
+        self.post_trigger_samples = Signal(32)
+        self.triggered = Signal()
+        self.trigger_sample = Signal(32)
+        self.done = Signal()
+
+    def ports(self):
+        return [
+            self.run, self.enable, self.strobe_in, self.re_in, self.im_in,
+            self.trigger, self.power_enable, self.power_threshold,
+            self.post_trigger_samples, self.triggered, self.trigger_sample,
+            self.done,
+        ]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Power detector
+        re = self.re_in.as_signed()
+        im = self.im_in.as_signed()
+        power = Signal(32)
+        power_valid = Signal()
+        m.d.sync += [
+            power.eq(re * re + im * im),
+            power_valid.eq(self.strobe_in),
+        ]
+        power_detected = (self.power_enable & power_valid
+                          & (power > self.power_threshold))
+
+        sample_counter = Signal(32)
+        with m.If(self.strobe_in):
+            m.d.sync += sample_counter.eq(sample_counter + 1)
+
+        fired = Signal()
+        post_counter = Signal(32)
+        with m.If(self.enable & ~fired):
+            # The power detector refers to the previous sample, which has
+            # already been counted.
+            with m.If(power_detected):
+                m.d.sync += [
+                    fired.eq(1),
+                    self.trigger_sample.eq(sample_counter - 1),
+                ]
+            with m.Elif(self.trigger):
+                m.d.sync += [
+                    fired.eq(1),
+                    self.trigger_sample.eq(sample_counter),
+                ]
+        m.d.sync += self.triggered.eq(fired)
+        with m.If(fired & ~self.done):
+            with m.If(post_counter == self.post_trigger_samples):
+                m.d.sync += self.done.eq(1)
+            with m.Elif(self.strobe_in):
+                m.d.sync += post_counter.eq(post_counter + 1)
+
+        with m.If(~self.run):
+            m.d.sync += [
+                sample_counter.eq(0),
+                fired.eq(0),
+                post_counter.eq(0),
+                self.triggered.eq(0),
+                self.done.eq(0),
+            ]
+
+        return m
+
+
 class Recorder16IQ(Elaboratable):
     """IQ recorder (16-bit input).
 
@@ -50,6 +171,29 @@ class Recorder16IQ(Elaboratable):
         Clock domain for the IQ samples.
     domain_dma : str
         Clock domain for the DMA and control interface.
+    circular : bool
+        Enables support for the circular mode of the DMA. In this mode, the
+        memory between the start and end addresses is used as a ring-buffer
+        and the recording runs until it is stopped (see ``DmaStreamWrite``).
+    fifo_depth_log2 : Optional[int]
+        log2 of the depth of the FIFO between ``domain_in`` and
+        ``domain_dma``, in 32-bit words. If this is given, an
+        ``AsyncFifoBRAM`` of this depth is used. Otherwise, a single
+        ``AsyncFifo18_36`` (512 words) is used.
+    dma_burst_len_log2 : int
+        log2 of the DMA burst length (see ``DmaStreamWrite``).
+    dma_max_outstanding_bursts : int
+        Maximum number of DMA bursts issued ahead of their write data (see
+        ``DmaStreamWrite``).
+    dma_max_outstanding_b_log2 : int
+        log2 of the maximum number of outstanding DMA write responses (see
+        ``DmaStreamWrite``).
+    trigger : bool
+        Enables support for pre-trigger capture (see ``RecorderTrigger``).
+        This requires ``circular``. In this mode, the recording runs
+        continuously, overwriting the oldest data in the ring-buffer, until
+        the trigger fires and the post-trigger samples have been recorded.
+        Then the recording stops by itself.
 
     Attributes
     ----------
@@ -75,14 +219,72 @@ class Recorder16IQ(Elaboratable):
        recording. This happens either some time after the module has been
        commanded to stop by pulsing the stop line or after the module has
        reached the end address.
+    dropped_samples : Signal(), out
+       Indicates that samples have been dropped because the FIFO was full
+       during the recording.
+    dropped_words : Signal(32), out
+       Number of 32-bit words that have been dropped because the FIFO was
+       full. This counter is not cleared when a recording starts, and it
+       wraps around when it overflows.
     next_address : Signal(), out
        After the DMA is finished, this contains the next address that would
        have been written to. This can be used to obtain the length of the
        recording when ``stop`` was used.
+    fifo_high_water_mark : Signal(fifo_depth_log2 + 1), out
+       Maximum number of words that have been stored in the FIFO during the
+       recording. This is only present if ``fifo_depth_log2`` is given.
+    circular_mode : Signal(), in
+       Selects the circular mode. This is only present if ``circular`` is
+       enabled.
+    read_pointer : Signal(axi_awidth), in
+       Ring-buffer read pointer. This is only present if ``circular`` is
+       enabled.
+    write_pointer : Signal(axi_awidth), out
+       Ring-buffer write pointer. This is only present if ``circular`` is
+       enabled.
+    watermark_bursts : Signal(16), in
+       Number of DMA bursts between ``watermark`` pulses. Each burst contains
+       ``2**dma_burst_len_log2`` beats of 8 bytes. This is only present if
+       ``circular`` is enabled.
+    watermark : Signal(), out
+       Pulsed each time that ``watermark_bursts`` bursts have been written.
+       This is only present if ``circular`` is enabled.
+    overrun : Signal(), out
+       Indicates that the ring-buffer has been full during the recording.
+       This is only present if ``circular`` is enabled.
+    trigger_enable : Signal(), in
+       Selects the pre-trigger capture mode. This is only present if
+       ``trigger`` is enabled.
+    trigger_now : Signal(), in
+       Pulsed to trigger manually. This is only present if ``trigger`` is
+       enabled.
+    power_trigger : Signal(), in
+       Enables the power threshold trigger. This is only present if
+       ``trigger`` is enabled.
+    power_threshold : Signal(32), in
+       Power threshold for the trigger. This is only present if ``trigger``
+       is enabled.
+    post_trigger_samples : Signal(32), in
+       Number of samples to record after the trigger. This is only present if
+       ``trigger`` is enabled.
+    triggered : Signal(), out
+       Asserted once the trigger has fired. This is only present if
+       ``trigger`` is enabled.
+    trigger_sample : Signal(32), out
+       Index of the trigger sample, counting from the start of the recording.
+       The byte offset of this sample in the ring-buffer is its index times
+       the number of bytes per sample modulo the ring-buffer size. It is
+       updated together with ``triggered``. This is only present if
+       ``trigger`` is enabled.
     """
     def __init__(self, start_address, end_address, dma_name=None,
                  axi_awidth=32,
-                 domain_in='sync', domain_dma='sync'):
+                 domain_in='sync', domain_dma='sync', circular=False,
+                 fifo_depth_log2=None, dma_burst_len_log2=4,
+                 dma_max_outstanding_bursts=2, dma_max_outstanding_b_log2=2,
+                 trigger=False):
+        if trigger and not circular:
+            raise ValueError('trigger requires circular')
         self.domain_in = domain_in
         self.domain_dma = domain_dma
 
@@ -97,19 +299,52 @@ class Recorder16IQ(Elaboratable):
         self.stop = Signal()
         self.finished = Signal()
         self.dropped_samples = Signal()
+        self.dropped_words = Signal(32)
         self.next_address = Signal(axi_awidth)
 
         self.dma_renamer = DomainRenamer({'sync': self.domain_dma})
         self.dma = self.dma_renamer(
             DmaStreamWrite(start_address, end_address, name=dma_name,
-                           axi_awidth=axi_awidth))
+                           axi_awidth=axi_awidth, circular=circular,
+                           burst_len_log2=dma_burst_len_log2,
+                           max_outstanding_bursts=dma_max_outstanding_bursts,
+                           max_outstanding_b_log2=dma_max_outstanding_b_log2))
+        self.fifo_depth_log2 = fifo_depth_log2
+        if fifo_depth_log2 is not None:
+            self.fifo_high_water_mark = Signal(range(2**fifo_depth_log2 + 1))
+        self.circular = circular
+        if circular:
+            self.circular_mode = Signal()
+            self.read_pointer = Signal(axi_awidth, init=start_address)
+            self.write_pointer = Signal(axi_awidth)
+            self.watermark_bursts = Signal(16)
+            self.watermark = Signal()
+            self.overrun = Signal()
+        self.trigger = trigger
+        if trigger:
+            self.trigger_enable = Signal()
+            self.trigger_now = Signal()
+            self.power_trigger = Signal()
+            self.power_threshold = Signal(32)
+            self.post_trigger_samples = Signal(32)
+            self.triggered = Signal()
+            self.trigger_sample = Signal(32)
 
     def ports(self):
         return [
             self.strobe_in, self.re_in, self.im_in,
             self.mode.as_value(), self.start, self.stop, self.finished,
-            self.dropped_samples, self.next_address,
-        ] + self.dma.axi.ports()
+            self.dropped_samples, self.dropped_words, self.next_address,
+        ] + self.dma.axi.ports() + (
+            [self.circular_mode, self.read_pointer, self.write_pointer,
+             self.watermark_bursts, self.watermark, self.overrun]
+            if self.circular else []) + (
+            [self.fifo_high_water_mark]
+            if self.fifo_depth_log2 is not None else []) + (
+            [self.trigger_enable, self.trigger_now, self.power_trigger,
+             self.power_threshold, self.post_trigger_samples, self.triggered,
+             self.trigger_sample]
+            if self.trigger else [])
 
     def elaborate(self, platform):
         m = Module()
@@ -119,8 +354,14 @@ class Recorder16IQ(Elaboratable):
         m.submodules.pack16 = pack16 = in_renamer(Pack16IQto32())
         m.submodules.pack12 = pack12 = in_renamer(Pack12IQto32())
         m.submodules.pack8 = pack8 = in_renamer(Pack8IQto32())
-        m.submodules.fifo = fifo = AsyncFifo18_36(
-            w_domain=self.domain_in, r_domain=self.domain_dma)
+        if self.fifo_depth_log2 is None:
+            m.submodules.fifo = fifo = AsyncFifo18_36(
+                w_domain=self.domain_in, r_domain=self.domain_dma)
+        else:
+            m.submodules.fifo = fifo = AsyncFifoBRAM(
+                32, self.fifo_depth_log2,
+                w_domain=self.domain_in, r_domain=self.domain_dma)
+            m.d.comb += self.fifo_high_water_mark.eq(fifo.high_water_mark)
         m.submodules.pack64 = pack64 = dma_renamer(PackFifoTwice(width_in=32))
         m.submodules.dma = dma = self.dma
 
@@ -188,6 +429,14 @@ class Recorder16IQ(Elaboratable):
         with m.If(run_in & ~run_in_q):
             m.d[self.domain_in] += dropped.eq(0)
 
+        m.submodules.dropped_counter = dropped_counter = EventCounter(
+            len(self.dropped_words), domain=self.domain_in,
+            o_domain=self.domain_dma)
+        m.d.comb += [
+            dropped_counter.event.eq(fifo.wrerr),
+            self.dropped_words.eq(dropped_counter.count),
+        ]
+
         # dropped, run_in synchronizer: domain_in -> domain_dma
         if self.domain_in == self.domain_dma:
             m.d.comb += self.dropped_samples.eq(dropped)
@@ -219,13 +468,112 @@ class Recorder16IQ(Elaboratable):
             dma.stream_valid.eq(pack64.out_valid),
             pack64.out_ready.eq(dma.stream_ready),
             dma.start.eq(self.start),
-            dma.stop.eq(self.stop),
             self.finished.eq(dma.finished),
             self.next_address.eq(dma.next_address),
         ]
+        if self.trigger:
+            self._elaborate_trigger(m, run_in, fifo.empty)
+        else:
+            m.d.comb += dma.stop.eq(self.stop)
+        if self.circular:
+            m.d.comb += [
+                dma.circular_mode.eq(
+                    self.circular_mode
+                    | (self.trigger_enable if self.trigger else 0)),
+                dma.read_pointer.eq(self.read_pointer),
+                dma.watermark_bursts.eq(self.watermark_bursts),
+                self.write_pointer.eq(dma.write_pointer),
+                self.watermark.eq(dma.watermark),
+                self.overrun.eq(dma.overrun),
+            ]
 
         return m
 
+    def _elaborate_trigger(self, m, run_in, fifo_empty):
+        m.submodules.trigger = trigger = DomainRenamer(
+            {'sync': self.domain_in})(RecorderTrigger())
+        dma = self.dma
+
+        # domain_dma -> domain_in
+        if self.domain_in == self.domain_dma:
+            m.d.comb += [
+                trigger.enable.eq(self.trigger_enable),
+                trigger.trigger.eq(self.trigger_now),
+                trigger.power_enable.eq(self.power_trigger),
+                trigger.power_threshold.eq(self.power_threshold),
+                trigger.post_trigger_samples.eq(self.post_trigger_samples),
+            ]
+        else:
+            for name, i, o in [
+                    ('enable', self.trigger_enable, trigger.enable),
+                    ('power_enable', self.power_trigger,
+                     trigger.power_enable)]:
+                setattr(m.submodules, f'sync_trigger_{name}', FFSynchronizer(
+                    i, o, o_domain=self.domain_in))
+            for name, i, o in [
+                    ('power_threshold', self.power_threshold,
+                     trigger.power_threshold),
+                    ('post_trigger_samples', self.post_trigger_samples,
+                     trigger.post_trigger_samples)]:
+                bus_sync = BusSynchronizer(
+                    self.domain_dma, self.domain_in, len(i))
+                setattr(m.submodules, f'sync_trigger_{name}', bus_sync)
+                m.d.comb += [bus_sync.i.eq(i), o.eq(bus_sync.o)]
+            m.submodules.sync_trigger_now = sync_trigger_now = \
+                PulseSynchronizer(i_domain=self.domain_dma,
+                                  o_domain=self.domain_in)
+            m.d.comb += [
+                sync_trigger_now.i.eq(self.trigger_now),
+                trigger.trigger.eq(sync_trigger_now.o),
+            ]
+
+        m.d.comb += [
+            trigger.run.eq(run_in),
+            trigger.strobe_in.eq(self.strobe_in),
+            trigger.re_in.eq(self.re_in),
+            trigger.im_in.eq(self.im_in),
+        ]
+
+        # domain_in -> domain_dma
+        if self.domain_in == self.domain_dma:
+            done = trigger.done
+            m.d.comb += [
+                self.triggered.eq(trigger.triggered),
+                self.trigger_sample.eq(trigger.trigger_sample),
+            ]
+        else:
+            done = Signal()
+            m.submodules.sync_trigger_done = FFSynchronizer(
+                trigger.done, done, o_domain=self.domain_dma)
+            # triggered and trigger_sample are transferred together, so that
+            # trigger_sample is valid when triggered is asserted.
+            m.submodules.sync_trigger_sample = sync_trigger_sample = \
+                BusSynchronizer(self.domain_in, self.domain_dma,
+                                len(trigger.trigger_sample) + 1)
+            m.d.comb += [
+                sync_trigger_sample.i.eq(
+                    Cat(trigger.trigger_sample, trigger.triggered)),
+                Cat(self.trigger_sample, self.triggered).eq(
+                    sync_trigger_sample.o),
+            ]
+
+        # Stop the DMA once the post-trigger samples have been written to the
+        # FIFO and the FIFO has been drained. The input keeps running until
+        # the DMA finishes its outstanding bursts, so the recording can
+        # contain some samples after the post-trigger samples.
+        trigger_stop = Signal()
+        trigger_stopped = Signal()
+        m.d.comb += trigger_stop.eq(
+            self.trigger_enable & done & fifo_empty & ~trigger_stopped)
+        with m.If(trigger_stop):
+            m.d[self.domain_dma] += trigger_stopped.eq(1)
+        with m.If(self.start):
+            m.d[self.domain_dma] += trigger_stopped.eq(0)
+        m.d.comb += [
+            dma.stop.eq(self.stop | trigger_stop),
+            dma.overwrite.eq(self.trigger_enable),
+        ]
+
 
 if __name__ == '__main__':
     recorder = Recorder16IQ(
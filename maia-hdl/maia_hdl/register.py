@@ -11,9 +11,11 @@ import amaranth.back.verilog
 
 import collections
 import enum
-from typing import Dict, List
+from typing import Dict, List, Optional
 import xml.etree.ElementTree as ET
 
+from .cdc import RegisterCDC
+
 
 Field = collections.namedtuple('RegisterField',
                                ['name', 'access', 'width', 'reset'])
@@ -356,3 +358,176 @@ class RegisterMap:
         ET.indent(device, space=' '*2, level=0)
         xml = b'<?xml version="1.0" encoding="utf-8"?>\n' + ET.tostring(device)
         return xml
+
+
+class RegisterCrossbar(Elaboratable):
+    """Register crossbar
+
+    This module connects a register bus to all the register banks of a
+    ``RegisterMap``. The address decoding is generated from the base
+    addresses of the register banks, which are added as submodules of the
+    crossbar.
+
+    The crossbar is pipelined. A new transaction can be initiated in each
+    cycle in which ``ready`` was asserted in the previous cycle, without
+    waiting for the previous transactions to finish. The responses are given
+    in the same order as the transactions. Transactions to register banks in
+    the same clock domain as the crossbar finish with a fixed latency of 2
+    cycles. Transactions to register banks in other clock domains go through
+    a ``RegisterCDC``. ``ready`` is deasserted while one of these transactions
+    is in progress. Transactions to addresses that do not belong to any
+    register bank finish normally, and reads return zero.
+
+    Parameters
+    ----------
+    register_map : RegisterMap
+        Register map. Its keys are byte addresses, which must be aligned to
+        the address space of each register bank.
+    address_width : int
+        Address width of the register bus. The register bus uses 32-bit word
+        addressing.
+    domain : str
+        Clock domain of the register bus.
+    domains : Optional[Dict[int, str]]
+        Clock domain of the register banks, indexed by their base address.
+        The register banks which are not included are in ``domain``.
+    width : int
+        Data width.
+
+    Attributes
+    ----------
+    ren : Signal(), in
+        Read enable.
+    rdone : Signal(), out
+        Read done.
+    wstrobe : Signal(width // 8), in
+        Write strobe.
+    wdone : Signal(), out
+        Write done.
+    address : Signal(address_width), in
+        Read and write address.
+    rdata : Signal(width), out
+        Read data.
+    wdata : Signal(width), in
+        Write data.
+    ready : Signal(), out
+        Indicates that a new transaction can be initiated in the next cycle.
+    """
+    def __init__(self, register_map: RegisterMap, address_width: int,
+                 domain: str = 'sync',
+                 domains: Optional[Dict[int, str]] = None,
+                 width: int = 32):
+        self.register_map = register_map
+        self.aw = address_width
+        self.w = width
+        self.nstrobes = width // 8
+        self._domain = domain
+        self._domains = {} if domains is None else domains
+
+        self.banks = []
+        for base, bank in sorted(register_map.registers.items()):
+            if base % self.nstrobes != 0:
+                raise ValueError(f'{bank.name} base address is not aligned')
+            word_base = base // self.nstrobes
+            if word_base % 2**bank.aw != 0:
+                raise ValueError(f'{bank.name} base address is not aligned')
+            if word_base + 2**bank.aw > 2**self.aw:
+                raise ValueError(
+                    f'{bank.name} does not fit in the address space')
+            if self.banks:
+                prev_base, prev_bank = self.banks[-1]
+                if prev_base + 2**prev_bank.aw > word_base:
+                    raise ValueError(f'{bank.name} overlaps {prev_bank.name}')
+            self.banks.append((word_base, bank))
+
+        self.ren = Signal()
+        self.rdone = Signal()
+        self.wstrobe = Signal(self.nstrobes)
+        self.wdone = Signal()
+        self.address = Signal(self.aw)
+        self.rdata = Signal(self.w, reset_less=True)
+        self.wdata = Signal(self.w)
+        self.ready = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+        request = self.ren | self.wstrobe.any()
+        # Read and write done, and read data for each bank, plus an extra
+        # entry for the addresses that do not belong to any bank
+        rdone = []
+        wdone = []
+        rdata = []
+        selects = []
+        cdc_select = Const(0)
+        cdc_done = Const(0)
+        for word_base, bank in self.banks:
+            select = Signal(name=f'{bank.name}_select')
+            m.d.comb += select.eq(
+                self.address[bank.aw:] == word_base >> bank.aw)
+            selects.append(select)
+            bank_domain = self._domains.get(
+                word_base * self.nstrobes, self._domain)
+            m.submodules[bank.name] = DomainRenamer(
+                {'sync': bank_domain})(bank)
+            if bank_domain == self._domain:
+                bus = bank
+                bus_prefix = ''
+            else:
+                m.submodules[f'{bank.name}_cdc'] = bus = RegisterCDC(
+                    self._domain, bank_domain, bank.aw, self.w)
+                bus_prefix = 'i_'
+                m.d.comb += [
+                    bank.ren.eq(bus.o_ren),
+                    bank.wstrobe.eq(bus.o_wstrobe),
+                    bank.address.eq(bus.o_address),
+                    bank.wdata.eq(bus.o_wdata),
+                    bus.o_rdone.eq(bank.rdone),
+                    bus.o_wdone.eq(bank.wdone),
+                    bus.o_rdata.eq(bank.rdata),
+                ]
+                cdc_select = cdc_select | select
+                cdc_done = cdc_done | bus.i_rdone | bus.i_wdone
+
+            def port(name):
+                return getattr(bus, f'{bus_prefix}{name}')
+
+            m.d.comb += [
+                port('ren').eq(self.ren & select),
+                port('wstrobe').eq(Mux(select, self.wstrobe, 0)),
+                port('address').eq(self.address[:bank.aw]),
+                port('wdata').eq(self.wdata),
+            ]
+            rdone.append(port('rdone'))
+            wdone.append(port('wdone'))
+            rdata.append(port('rdata'))
+
+        unmapped = ~Cat(*selects).any()
+        unmapped_rdone = Signal()
+        unmapped_wdone = Signal()
+        m.d[self._domain] += [
+            unmapped_rdone.eq(self.ren & unmapped),
+            unmapped_wdone.eq(self.wstrobe.any() & unmapped),
+        ]
+        rdone.append(unmapped_rdone)
+        wdone.append(unmapped_wdone)
+
+        rdata_or = 0
+        for r in rdata:
+            rdata_or |= r
+        m.d[self._domain] += [
+            self.rdone.eq(Cat(*rdone).any()),
+            self.wdone.eq(Cat(*wdone).any()),
+            self.rdata.eq(rdata_or),
+        ]
+
+        # Only one transaction to a bank in another clock domain can be in
+        # progress, and no other transactions can be initiated while it is
+        # in progress, so that responses are given in order.
+        cdc_busy = Signal()
+        with m.If(cdc_done):
+            m.d[self._domain] += cdc_busy.eq(0)
+        with m.If(request & cdc_select):
+            m.d[self._domain] += cdc_busy.eq(1)
+        m.d.comb += self.ready.eq(~cdc_busy & ~(request & cdc_select))
+
+        return m
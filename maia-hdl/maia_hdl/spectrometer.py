@@ -12,6 +12,8 @@ import numpy as np
 
 from .dma import DmaBRAMWrite
 from .fft import FFT
+from .floating_point import ToFloat32
+from .overlap import OverlapBuffer
 from .spectrum_integrator import SpectrumIntegrator
 
 
@@ -35,6 +37,33 @@ class Spectrometer(Elaboratable):
         Name of the clock domain of the 2x clock.
     domain_3x : str
         Name of the clock domain of the 2x clock.
+    fft_order_log2 : int
+        log2 of the maximum FFT size. This must be even, since a radix-2^2
+        FFT is used.
+    fft_min_order_log2 : Optional[int]
+        log2 of the minimum FFT size that can be selected at runtime with
+        ``fft_size_log2``. By default, the FFT size is fixed.
+    fft_max_overlap_log2 : int
+        Maximum value of ``fft_overlap_log2``. If this is zero, overlapped
+        FFT frames are not supported.
+    max_bin_decimation_log2 : int
+        Maximum value of ``bin_decimation_log2``. If this is zero, bin
+        decimation is not supported.
+    zoom : bool
+        Enables the zoom window (``zoom_log2`` and ``zoom_start``).
+    dma_max_buffers_log2 : Optional[int]
+        Maximum value of ``ring_buffers_log2``. By default, the DMA base
+        address and number of buffers are fixed.
+    header : bool
+        Enables a header that the DMA writes for each spectrum, in a header
+        ring placed after the DMA ring-buffer (see ``DmaBRAMWrite``). The
+        header contains four 64-bit words: the index of the first input
+        sample of the integration (counting the samples in ``strobe_in``
+        since the reset), a sequence number that counts the spectra, the
+        number of FFT vectors actually integrated (which is smaller than
+        ``number_integrations`` if the integration was aborted), and flags
+        (bit 0 is ``peak_detect`` and bit 1 indicates that the integration
+        was aborted).
 
     Attributes
     ----------
@@ -58,23 +87,122 @@ class Spectrometer(Elaboratable):
         integration prematurely.
     peak_detect : Signal(), in
         Enables peak detect mode (instead of average power mode).
+    fft_size_log2 : Signal(range(fft_order_log2 + 1)), in
+        log2 of the FFT size used at runtime. The supported values are the
+        even values between ``fft_min_order_log2`` and ``fft_order_log2``.
+        Other values select the maximum FFT size. The spectrum is written to
+        the first ``2**fft_size_log2`` words of each DMA buffer (or fewer
+        words when zoom or bin decimation are used), and the buffer size does
+        not depend on the FFT size. The spectra that are
+        being computed when this signal changes are not valid.
+    fft_overlap_log2 : Signal(range(fft_max_overlap_log2 + 1)), in
+        log2 of the number of overlapping FFT frames that use each input
+        sample (0 means no overlap, 1 means 50% overlap and 2 means 75%
+        overlap). The input strobe duty cycle should be at most
+        ``2**-fft_overlap_log2``. Otherwise some FFT frames are dropped (see
+        ``OverlapBuffer``). The spectra that are being computed when this
+        signal changes are not valid.
+    bin_decimation_log2 : Signal(range(max_bin_decimation_log2 + 1)), in
+        log2 of the bin decimation factor. Groups of adjacent bins are
+        combined into a single output bin, according to
+        ``bin_decimation_max``.
+    bin_decimation_max : Signal(), in
+        Selects the maximum of the bins of each decimation group instead of
+        their sum. This is independent of the peak detect mode. When it does
+        not match the peak detect mode, the bins are combined after each
+        integration, which delays the DMA by ``2**(fft_size_log2 -
+        zoom_log2)`` clock cycles.
+    zoom_log2 : Signal(range(fft_order_log2 + 1)), in
+        Only a window of ``2**(fft_size_log2 - zoom_log2)`` bins (before
+        decimation), starting at ``zoom_start``, is output.
+    zoom_start : Signal(fft_order_log2), in
+        First bin of the zoom window, counting from the most negative
+        frequency. The window wraps around the end of the spectrum. The
+        ``bin_decimation_log2`` LSBs are ignored.
+    output_float32 : Signal(), in
+        Selects the compact output format, in which each spectrum bin is
+        written as a 32-bit IEEE 754 single precision float instead of a
+        64-bit word. The floats are packed at the beginning of each DMA
+        buffer, two in each 64-bit AXI beat, so the DMA writes half as many
+        beats. This signal is latched when each DMA transfer starts.
+    ring_base_address : Signal(32), in
+        Base address of the DMA ring-buffer. This is only present if
+        ``dma_max_buffers_log2`` is given. It must be aligned to the
+        ring-buffer size. Together with ``ring_buffers_log2``, it is latched
+        when each DMA transfer starts.
+    ring_buffers_log2 : Signal(range(dma_max_buffers_log2 + 1)), in
+        log2 of the number of DMA buffers. This is only present if
+        ``dma_max_buffers_log2`` is given.
+    ring_address_error : Signal(), out
+        Indicates that ``ring_base_address`` is not aligned to the
+        ring-buffer size. In this case, the previous DMA settings are kept.
+        This is only present if ``dma_max_buffers_log2`` is given.
     last_buffer : Signal(dma_buffers_log2), out
-        Indicates the last buffer to which the DMA has written to.
+        Indicates the last buffer to which the DMA has written to. Its
+        width is ``dma_max_buffers_log2`` if this is given.
     interrupt_out : Signal(), out
         Pulsed each time that a DMA transfer finishes.
+    aborted : Signal(), out
+        Pulsed each time that an integration is finished early because of
+        ``abort``.
     """
     def __init__(self, dma_base_address, dma_buffers_log2, dma_name=None,
-                 domain_2x='clk2x', domain_3x='clk3x'):
+                 domain_2x='clk2x', domain_3x='clk3x', fft_order_log2=12,
+                 fft_min_order_log2=None, fft_max_overlap_log2=0,
+                 max_bin_decimation_log2=0, zoom=False,
+                 dma_max_buffers_log2=None, header=False):
         self._domain_2x = domain_2x
         self._domain_3x = domain_3x
-        self.fft_order_log2 = 12
+        if fft_order_log2 % 2 != 0:
+            raise ValueError('fft_order_log2 must be even')
+        self.fft_order_log2 = fft_order_log2
+        self.fft_min_order_log2 = (
+            fft_order_log2 if fft_min_order_log2 is None
+            else fft_min_order_log2)
         self.width_in = 16
+        self.fft_max_overlap_log2 = fft_max_overlap_log2
+        if fft_max_overlap_log2:
+            self.overlap = OverlapBuffer(
+                self.width_in, self.fft_order_log2, self.fft_min_order_log2,
+                fft_max_overlap_log2)
 
         self.nint_width = 10
 
+        truncates = [[0, 1]] * (self.fft_order_log2 // 2)
+        self.fft = FFT(
+            self.width_in, self.fft_order_log2, 'R22',
+            width_twiddle=16, truncates=truncates,
+            use_bram_reg=True, window='blackmanharris',
+            cmult3x=True,
+            domain_2x=self._domain_2x, domain_3x=self._domain_3x,
+            min_order_log2=self.fft_min_order_log2)
+        width_fft_out = len(self.fft.re_out)
+        assert width_fft_out == self.width_in + self.fft_order_log2 // 2
+
+        spectrum_fp_width = 18
+        self.integrator = SpectrumIntegrator(
+            self._domain_3x, width_fft_out, spectrum_fp_width,
+            self.nint_width, self.fft_order_log2,
+            fft_min_order_log2=self.fft_min_order_log2,
+            max_decimation_log2=max_bin_decimation_log2, zoom=zoom)
+        self.max_bin_decimation_log2 = max_bin_decimation_log2
+        self.zoom = zoom
+
+        self.to_float32 = ToFloat32(
+            len(self.integrator.rdata_value),
+            len(self.integrator.rdata_exponent), is_power=True)
+
         self.dma = DmaBRAMWrite(
             dma_base_address, dma_buffers_log2,
-            self.fft_order_log2, name=dma_name)
+            self.fft_order_log2,
+            bram_latency=2 + self.to_float32.delay,
+            name=dma_name,
+            min_length_log2=(
+                self._min_output_log2 if max_bin_decimation_log2 or zoom
+                else self.fft_min_order_log2),
+            narrow_width=32, max_buffers_log2=dma_max_buffers_log2,
+            header_words=self._header_words if header else 0)
+        self.header = header
 
         self.strobe_in = Signal()
         self.common_edge_2x = Signal()
@@ -85,9 +213,24 @@ class Spectrometer(Elaboratable):
         self.number_integrations = Signal(self.nint_width)
         self.abort = Signal()
         self.peak_detect = Signal()
-        self.last_buffer = Signal(dma_buffers_log2)
+        self.fft_size_log2 = Signal(range(self.fft_order_log2 + 1),
+                                    init=self.fft_order_log2)
+        self.fft_overlap_log2 = Signal(range(fft_max_overlap_log2 + 1))
+        self.bin_decimation_log2 = Signal(
+            range(max_bin_decimation_log2 + 1))
+        self.bin_decimation_max = Signal()
+        self.zoom_log2 = Signal(range(self.fft_order_log2 + 1))
+        self.zoom_start = Signal(self.fft_order_log2)
+        self.output_float32 = Signal()
+        if self.dma.runtime_address:
+            self.ring_base_address = Signal.like(self.dma.base_address_in)
+            self.ring_buffers_log2 = Signal.like(
+                self.dma.num_buffers_log2_in)
+            self.ring_address_error = Signal()
+        self.last_buffer = Signal.like(self.dma.last_buffer)
 
         self.interrupt_out = Signal()
+        self.aborted = Signal()
 
     def ports(self):
         return self.dma.axi.ports() + [
@@ -97,27 +240,124 @@ class Spectrometer(Elaboratable):
             self.im_in,
             self.number_integrations,
             self.abort,
+            self.fft_size_log2,
+            self.fft_overlap_log2,
+            self.bin_decimation_log2,
+            self.bin_decimation_max,
+            self.zoom_log2,
+            self.zoom_start,
+            self.output_float32,
             self.last_buffer,
             self.interrupt_out,
-        ]
+            self.aborted,
+        ] + ([self.ring_base_address, self.ring_buffers_log2,
+              self.ring_address_error] if self.dma.runtime_address else [])
+
+    # Minimum number of output words (log2) when zoom or bin decimation are
+    # used. The DMA transfers at least two bursts.
+    _min_output_log2 = DmaBRAMWrite._burst_len_log2 + 1
+
+    # Number of 64-bit words in the spectrum header
+    _header_words = 4
+
+    @property
+    def model_vlen(self):
+        return 2**self.fft_order_log2
+
+    def model(self, re_in, im_in, number_integrations, peak_detect,
+              fft_size_log2=None, output_float32=False, fft_overlap_log2=0,
+              bin_decimation_log2=0, zoom_log2=0, zoom_start=0,
+              bin_decimation_max=False):
+        """Model of the data written by the DMA.
+
+        The input is split into FFT vectors, and groups of
+        ``number_integrations`` vectors are integrated to form each spectrum.
+        Input samples that do not form a complete integration are dropped.
+        When overlap is used, the model assumes that the input is slow enough
+        so that no FFT frames are dropped.
+
+        Parameters
+        ----------
+        fft_size_log2 : Optional[int]
+            Runtime FFT size (see the ``fft_size_log2`` attribute). By
+            default, the maximum FFT size is used.
+        output_float32 : bool
+            Use the compact output format (see the ``output_float32``
+            attribute).
+        fft_overlap_log2 : int
+            FFT frames overlap (see the ``fft_overlap_log2`` attribute).
+        bin_decimation_log2, zoom_log2, zoom_start : int
+            Bin decimation and zoom window (see the corresponding
+            attributes).
+        bin_decimation_max : bool
+            Take the maximum of the decimated bins instead of their sum (see
+            the ``bin_decimation_max`` attribute).
+
+        Returns
+        -------
+        numpy.ndarray
+            An array of shape ``(num_spectra, num_bins)`` containing
+            the words that the DMA writes to each buffer. The type is
+            ``uint64`` by default, and ``uint32`` if ``output_float32`` is
+            True. The ``uint32`` words can be viewed as ``float32``.
+        """
+        if fft_size_log2 is None:
+            fft_size_log2 = self.fft_order_log2
+        if fft_size_log2 not in range(self.fft_min_order_log2,
+                                      self.fft_order_log2 + 1, 2):
+            raise ValueError(f'unsupported fft_size_log2 {fft_size_log2}')
+        if fft_overlap_log2 not in range(self.fft_max_overlap_log2 + 1):
+            raise ValueError(
+                f'unsupported fft_overlap_log2 {fft_overlap_log2}')
+        out_log2 = fft_size_log2 - zoom_log2 - bin_decimation_log2
+        if ((bin_decimation_log2 or zoom_log2 or zoom_start)
+                and (bin_decimation_log2 > self.max_bin_decimation_log2
+                     or ((zoom_log2 or zoom_start) and not self.zoom)
+                     or out_log2 < self._min_output_log2)):
+            raise ValueError(
+                f'unsupported bin_decimation_log2 {bin_decimation_log2}, '
+                f'zoom_log2 {zoom_log2}')
+        # The integrator treats 0 as 1 integration
+        nint = max(number_integrations, 1)
+        vlen = 2**fft_size_log2
+        hop = vlen >> fft_overlap_log2
+        num_frames = max((len(re_in) - vlen) // hop + 1, 0)
+        num_spectra = num_frames // nint
+        n = num_spectra * nint
+        # The FFT is computed in chunks of vectors that are streamed into the
+        # integrator to bound the memory usage for large nint.
+        chunk = 64
+
+        def fft_chunks():
+            for j in range(0, n, chunk):
+                # Input samples for the FFT frames j to j + chunk - 1
+                k = min(j + chunk, n)
+                re, im = (x[j*hop:(k-1)*hop + vlen] for x in [re_in, im_in])
+                if fft_overlap_log2:
+                    re, im = self.overlap.model(
+                        re, im, fft_overlap_log2, fft_size_log2)
+                yield self.fft.model(re, im, fft_size_log2)
+
+        words = np.zeros((num_spectra, 2**out_log2),
+                         'uint32' if output_float32 else 'uint64')
+        for j, (value, exponent) in enumerate(self.integrator.model_stream(
+                nint, fft_chunks(), peak_detect, fft_size_log2,
+                bin_decimation_log2, zoom_log2, zoom_start,
+                bin_decimation_max)):
+            if output_float32:
+                words[j] = self.to_float32.model(value, exponent)
+            else:
+                words[j] = (value.astype('uint64')
+                            | (exponent.astype('uint64') << np.uint64(64 - 8)))
+        return words
 
     def elaborate(self, platform):
         m = Module()
 
-        truncates = [[0, 1]] * (self.fft_order_log2 // 2)
-        m.submodules.fft = fft = FFT(
-            self.width_in, self.fft_order_log2, 'R22',
-            width_twiddle=16, truncates=truncates,
-            use_bram_reg=True, window='blackmanharris',
-            cmult3x=True,
-            domain_2x=self._domain_2x, domain_3x=self._domain_3x)
-        width_fft_out = len(fft.re_out)
-        assert width_fft_out == 22
-
-        spectrum_fp_width = 18
-        m.submodules.integrator = integrator = SpectrumIntegrator(
-            self._domain_3x, width_fft_out, spectrum_fp_width,
-            self.nint_width, self.fft_order_log2)
+        m.submodules.fft = fft = self.fft
+        if self.fft_max_overlap_log2:
+            m.submodules.overlap = overlap = self.overlap
+        m.submodules.integrator = integrator = self.integrator
         # Form 64-bit rdata for the DMA. The exponent is placed in the 8 MSBs
         # and the value is placed in the LSBs, leaving a gap with zeros between
         # them
@@ -125,26 +365,101 @@ class Spectrometer(Elaboratable):
                         Const(0, 64 - 8 - len(integrator.rdata_value)),
                         integrator.rdata_exponent,
                         Const(0, 8 - len(integrator.rdata_exponent)))
-        assert len(integrator.rdata_value) == 47
-        assert len(integrator.rdata_exponent) == 3
+        assert len(integrator.rdata_value) <= 64 - 8
+        assert len(integrator.rdata_exponent) <= 8
         assert len(dma_rdata) == 64
 
         m.submodules.dma = dma = self.dma
 
+        # The 64-bit words are delayed to match the latency of the float32
+        # conversion. Both pipelines advance with the BRAM read enable, as
+        # the DMA expects.
+        m.submodules.to_float32 = to_float32 = self.to_float32
+        m.d.comb += [
+            to_float32.clken.eq(dma.ren),
+            to_float32.value_in.eq(integrator.rdata_value),
+            to_float32.exponent_in.eq(integrator.rdata_exponent),
+        ]
+        dma_rdata_q = [Signal(64, name=f'dma_rdata_q{j}', reset_less=True)
+                       for j in range(to_float32.delay)]
+        with m.If(dma.ren):
+            m.d.sync += [a.eq(b) for a, b in zip(
+                dma_rdata_q, [dma_rdata] + dma_rdata_q[:-1])]
+        output_float32 = Signal()
+        with m.If(dma.start):
+            m.d.sync += output_float32.eq(self.output_float32)
+
         dma_busy_q = Signal()
         m.d.sync += dma_busy_q.eq(dma.busy)
 
+        # Unsupported FFT sizes select the maximum FFT size, so that the FFT,
+        # integrator and DMA always agree on the FFT size.
+        fft_size_log2 = Signal.like(self.fft_size_log2)
+        m.d.comb += fft_size_log2.eq(self.fft_order_log2)
+        if self.fft_min_order_log2 < self.fft_order_log2:
+            with m.Switch(self.fft_size_log2):
+                for order_log2 in range(self.fft_min_order_log2,
+                                        self.fft_order_log2, 2):
+                    with m.Case(order_log2):
+                        m.d.comb += fft_size_log2.eq(order_log2)
+            if self.fft_max_overlap_log2:
+                m.d.comb += overlap.size_log2.eq(fft_size_log2)
+            m.d.comb += [
+                fft.size_log2.eq(fft_size_log2),
+                integrator.size_log2.eq(fft_size_log2),
+            ]
+
+        # Zoom and bin decimation settings that give too few output words
+        # disable zoom and bin decimation.
+        zoom_log2 = Signal.like(self.zoom_log2)
+        bin_decimation_log2 = Signal.like(self.bin_decimation_log2)
+        if self.zoom:
+            with m.If(self.zoom_log2 + self.bin_decimation_log2
+                      + self._min_output_log2 <= fft_size_log2):
+                m.d.comb += [
+                    zoom_log2.eq(self.zoom_log2),
+                    bin_decimation_log2.eq(self.bin_decimation_log2),
+                ]
+            m.d.comb += [
+                integrator.zoom_log2.eq(zoom_log2),
+                integrator.zoom_start.eq(self.zoom_start),
+            ]
+        else:
+            with m.If(self.bin_decimation_log2 + self._min_output_log2
+                      <= fft_size_log2):
+                m.d.comb += bin_decimation_log2.eq(self.bin_decimation_log2)
+        if self.max_bin_decimation_log2:
+            m.d.comb += [
+                integrator.decimation_log2.eq(bin_decimation_log2),
+                integrator.decimation_max.eq(self.bin_decimation_max),
+            ]
+        if dma.runtime_length:
+            m.d.comb += dma.length_log2.eq(
+                fft_size_log2 - zoom_log2 - bin_decimation_log2)
+
+        if self.fft_max_overlap_log2:
+            m.d.comb += [
+                overlap.strobe_in.eq(self.strobe_in),
+                overlap.re_in.eq(self.re_in),
+                overlap.im_in.eq(self.im_in),
+                overlap.overlap_log2.eq(self.fft_overlap_log2),
+            ]
+            fft_strobe, fft_re, fft_im = (
+                overlap.strobe_out, overlap.re_out, overlap.im_out)
+        else:
+            fft_strobe, fft_re, fft_im = self.strobe_in, self.re_in, self.im_in
+
         m.d.comb += [
-            fft.clken.eq(self.strobe_in),
+            fft.clken.eq(fft_strobe),
             fft.common_edge_2x.eq(self.common_edge_2x),
             fft.common_edge_3x.eq(self.common_edge_3x),
-            fft.re_in.eq(self.re_in),
-            fft.im_in.eq(self.im_in),
+            fft.re_in.eq(fft_re),
+            fft.im_in.eq(fft_im),
 
             integrator.nint.eq(self.number_integrations),
             integrator.abort.eq(self.abort),
             integrator.peak_detect.eq(self.peak_detect),
-            integrator.clken.eq(self.strobe_in),
+            integrator.clken.eq(fft_strobe),
             integrator.common_edge.eq(self.common_edge_3x),
             integrator.input_last.eq(fft.out_last),
             integrator.re_in.eq(fft.re_out),
@@ -152,12 +467,95 @@ class Spectrometer(Elaboratable):
             integrator.rdaddr.eq(dma.raddr),
             integrator.rden.eq(dma.ren),
 
-            dma.rdata.eq(dma_rdata),
+            dma.rdata.eq(Mux(output_float32, to_float32.out,
+                             dma_rdata_q[-1])),
+            dma.narrow.eq(self.output_float32),
             dma.start.eq(integrator.done),
             self.last_buffer.eq(dma.last_buffer),
 
             self.interrupt_out.eq(~dma.busy & dma_busy_q),
+            self.aborted.eq(integrator.aborted),
         ]
+        if dma.runtime_address:
+            m.d.comb += [
+                dma.base_address_in.eq(self.ring_base_address),
+                dma.num_buffers_log2_in.eq(self.ring_buffers_log2),
+                self.ring_address_error.eq(dma.address_error),
+            ]
+
+        if self.header:
+            sample_counter = Signal(64)
+            with m.If(self.strobe_in):
+                m.d.sync += sample_counter.eq(sample_counter + 1)
+            # Index of the input sample that is the first sample of the
+            # current FFT input frame.
+            frame_index = Signal(64)
+            if self.fft_max_overlap_log2:
+                frame_age = Signal.like(overlap.start_out)
+                m.d.comb += [
+                    frame_age.eq(sample_counter - overlap.start_out),
+                    frame_index.eq(sample_counter - frame_age),
+                ]
+            else:
+                m.d.comb += frame_index.eq(sample_counter)
+            # The FFT input frames are aligned to multiples of the FFT size
+            # in the count of FFT input samples.
+            fft_in_count = Signal(self.fft_order_log2)
+            fft_in_mask = Signal(self.fft_order_log2)
+            with m.If(fft_strobe):
+                m.d.sync += fft_in_count.eq(fft_in_count + 1)
+            with m.Switch(fft_size_log2):
+                for order_log2 in range(self.fft_min_order_log2,
+                                        self.fft_order_log2 + 1, 2):
+                    with m.Case(order_log2):
+                        m.d.comb += fft_in_mask.eq(2**order_log2 - 1)
+            # Indices of the first samples of the current and the previous
+            # FFT input frames.
+            frame_start = fft_strobe & ((fft_in_count & fft_in_mask) == 0)
+            frame_indices = [Signal(64, name=f'frame_index{j}')
+                             for j in range(2)]
+            with m.If(frame_start):
+                m.d.sync += [
+                    frame_indices[0].eq(frame_index),
+                    frame_indices[1].eq(frame_indices[0]),
+                ]
+            # The FFT delay is between one and two frames, so when an FFT
+            # vector ends at the FFT output, the frame of the next vector is
+            # the previous FFT input frame.
+            for order_log2 in range(self.fft_min_order_log2,
+                                    self.fft_order_log2 + 1, 2):
+                excess_delay = fft.size_delay(order_log2) - 2**order_log2
+                assert 0 < excess_delay < 2**order_log2
+            vector_end = fft_strobe & fft.out_last
+            vector_index = Signal(64)
+            with m.If(vector_end):
+                m.d.sync += vector_index.eq(frame_indices[1])
+            # The integrator finishes an integration (done) a few samples
+            # after the end of its last FFT vector, and before the end of
+            # the first vector of the next integration.
+            start_counter = Signal(64)
+            sequence = Signal(32)
+            num_vectors = Signal(self.nint_width + 1)
+            aborted = Signal()
+            with m.If(vector_end):
+                m.d.sync += num_vectors.eq(num_vectors + 1)
+            with m.If(integrator.aborted):
+                m.d.sync += aborted.eq(1)
+            with m.If(integrator.done):
+                m.d.sync += [
+                    start_counter.eq(vector_index),
+                    sequence.eq(sequence + 1),
+                    num_vectors.eq(vector_end),
+                    aborted.eq(0),
+                ]
+            m.d.comb += dma.header.eq(Cat(
+                start_counter,
+                sequence, Const(0, 32),
+                num_vectors, Const(0, 64 - len(num_vectors)),
+                self.peak_detect, aborted | integrator.aborted,
+                Const(0, 62)))
+            assert len(dma.header) == 64 * self._header_words
+
         return m
 
 
@@ -15,7 +15,7 @@ import numpy as np
 from .cpwr import CpwrPeak
 from .floating_point import IQToFloatingPoint, MakeCommonExponent
 from .pluto_platform import PlutoPlatform
-from .util import bit_invert
+from .util import bit_invert_table
 
 
 class SpectrumIntegrator(Elaboratable):
@@ -50,9 +50,53 @@ class SpectrumIntegrator(Elaboratable):
         Width of the input that indicates the number of integrations.
     fft_order_log2 : int
         Determines the FFT size, as ``2**fft_order_log2``.
+    fft_min_order_log2 : Optional[int]
+        log2 of the minimum FFT size that can be selected at runtime. By
+        default, the FFT size is fixed.
+    max_decimation_log2 : int
+        Maximum value of ``decimation_log2``. The accumulator width is
+        increased by this number of bits to accommodate the sum of the
+        decimated bins.
+    zoom : bool
+        Enables the zoom window inputs ``zoom_log2`` and ``zoom_start``.
 
     Attributes
     ----------
+    size_log2 : Signal(range(fft_order_log2 + 1)), in
+        log2 of the FFT size used at runtime. This is only present if
+        ``fft_min_order_log2`` is smaller than ``fft_order_log2``. Values
+        outside the supported range select the maximum FFT size. The
+        integration results are stored in the first ``2**size_log2``
+        addresses of the BRAM.
+    decimation_log2 : Signal(range(max_decimation_log2 + 1)), in
+        log2 of the bin decimation factor. Each group of
+        ``2**decimation_log2`` adjacent bins (after fftshift) is combined
+        into a single output, either by summing the bins or by taking their
+        maximum, according to ``decimation_max``. The FFT size divided by the
+        decimation factor must be larger than the processing delay of the
+        integrator (which is less than 16). This signal is only present if
+        ``max_decimation_log2`` is not zero.
+    decimation_max : Signal(), in
+        Selects the maximum (instead of the sum) of the bins of each
+        decimation group. When this matches the peak detect mode, the bins of
+        a group are accumulated in the same BRAM address. Otherwise, the bins
+        are integrated separately, and the groups are combined by a pass over
+        the BRAM, which takes ``2**(size_log2 - zoom_log2)`` clock cycles,
+        before ``done`` is asserted. In this case, the integration must last
+        longer than this pass plus the time that the reader needs to read
+        the BRAM. This signal is only present if ``max_decimation_log2`` is
+        not zero.
+    zoom_log2 : Signal(range(fft_order_log2 + 1)), in
+        Only the ``2**(size_log2 - zoom_log2)`` bins (after fftshift)
+        starting at ``zoom_start`` are stored, in the first
+        ``2**(size_log2 - zoom_log2 - decimation_log2)`` addresses of the
+        BRAM. The window wraps around the end of the spectrum. This signal is
+        only present if ``zoom`` is enabled.
+    zoom_start : Signal(fft_order_log2), in
+        First bin of the zoom window, counting from the most negative
+        frequency. The ``decimation_log2`` LSBs are ignored, so that the
+        decimated bins are aligned. This signal is only present if ``zoom``
+        is enabled.
     nint : Signal(nint_width), in
         Number of integrations to perform. This signal is only latched
         after the current integration has finished.
@@ -81,6 +125,9 @@ class SpectrumIntegrator(Elaboratable):
     done : Signal(), out
         This signal is pulsed for one clock cycle whenever an integration
         is finished.
+    aborted : Signal(), out
+        This signal is pulsed for one clock cycle whenever an integration
+        is finished early because of an abort.
     rdaddr : Signal(fft_order_log2), in
         Read address for the BRAM that contains the previous integration.
     rdata_value : Signal(sum_width), out
@@ -93,13 +140,25 @@ class SpectrumIntegrator(Elaboratable):
         Read enable for the BRAM that contains the previous integration.
     """
     def __init__(self, domain_3x, input_width, input_fp_width,
-                 nint_width, fft_order_log2):
+                 nint_width, fft_order_log2, fft_min_order_log2=None,
+                 max_decimation_log2=0, zoom=False):
         self.w = input_width
         self.fw = input_fp_width
         self.nw = nint_width
         # Here + 1 accounts for the addition of the real and imaginary parts.
-        self.sumw = 2*self.fw + 1 + nint_width
+        self.sumw = 2*self.fw + 1 + nint_width + max_decimation_log2
         self.order_log2 = fft_order_log2
+        self.min_order_log2 = (
+            fft_order_log2 if fft_min_order_log2 is None
+            else fft_min_order_log2)
+        if not 1 <= self.min_order_log2 <= fft_order_log2:
+            raise ValueError(
+                f'invalid fft_min_order_log2 {fft_min_order_log2}')
+        if not 0 <= max_decimation_log2 < self.min_order_log2:
+            raise ValueError(
+                f'invalid max_decimation_log2 {max_decimation_log2}')
+        self.max_decimation_log2 = max_decimation_log2
+        self.zoom = zoom
 
         self.to_fp = IQToFloatingPoint(self.w, self.fw)
         self.ew = len(self.to_fp.exponent_out)
@@ -108,6 +167,15 @@ class SpectrumIntegrator(Elaboratable):
             a_complex=True, b_power=True, b_signed=False)
         self.cpwr = CpwrPeak(domain_3x, self.fw, self.sumw)
 
+        if self.min_order_log2 < self.order_log2:
+            self.size_log2 = Signal(range(fft_order_log2 + 1),
+                                    init=fft_order_log2)
+        if max_decimation_log2:
+            self.decimation_log2 = Signal(range(max_decimation_log2 + 1))
+            self.decimation_max = Signal()
+        if zoom:
+            self.zoom_log2 = Signal(range(fft_order_log2 + 1))
+            self.zoom_start = Signal(fft_order_log2)
         self.nint = Signal(nint_width)
         self.abort = Signal()
         self.peak_detect = Signal()
@@ -117,45 +185,233 @@ class SpectrumIntegrator(Elaboratable):
         self.re_in = Signal(signed(input_width))
         self.im_in = Signal(signed(input_width))
         self.done = Signal()
+        self.aborted = Signal()
         self.rdaddr = Signal(fft_order_log2)
         self.rdata_value = Signal(self.sumw)
         self.rdata_exponent = Signal(self.ew)
         self.rden = Signal()
 
+    # BRAM read latency, using the output register
+    _mem_delay = 2
+
+    def _delay(self):
+        # Delay between the BRAM read and write of an accumulator
+        return self._mem_delay + self.common_exp.delay + self.cpwr.delay
+
     @property
     def model_vlen(self, nint):
         return 2**self.order_log2 * nint
 
-    def model(self, nint, re_in, im_in, peak_detect):
+    def model(self, nint, re_in, im_in, peak_detect, size_log2=None,
+              decimation_log2=0, zoom_log2=0, zoom_start=0,
+              decimation_max=False):
+        order_log2 = self._model_order(size_log2)
+        self._model_check_zoom(order_log2, decimation_log2, zoom_log2,
+                               zoom_start)
+        acc_decimation_log2 = self._model_acc_decimation(
+            peak_detect, decimation_log2, decimation_max)
         re_in, im_in = (
-            np.array(x, 'int').reshape(-1, nint, 2**self.order_log2)
+            self._model_groups(
+                np.array(x, 'int').reshape(-1, nint, 2**order_log2),
+                acc_decimation_log2)
             for x in [re_in, im_in])
+        acc, acc_exp = (
+            np.zeros((re_in.shape[0], 2**(order_log2 - acc_decimation_log2)),
+                     'int')
+            for _ in range(2))
+        # The integration is done in blocks of vectors to keep the arrays
+        # small enough for cache efficiency.
+        block = max(1, 2**18 // max(acc.size, 1))
+        for j in range(0, nint, block):
+            acc, acc_exp = self._model_integrate(
+                acc, acc_exp, re_in[:, j:j+block], im_in[:, j:j+block],
+                peak_detect)
+        return self._model_output(acc, acc_exp, order_log2, decimation_log2,
+                                  zoom_log2, zoom_start, decimation_max,
+                                  acc_decimation_log2)
+
+    def model_stream(self, nint, chunks, peak_detect, size_log2=None,
+                     decimation_log2=0, zoom_log2=0, zoom_start=0,
+                     decimation_max=False):
+        """Streaming model.
+
+        This is a generator that takes an iterable of ``(re_in, im_in)``
+        chunks, each containing an integer number of FFT vectors (for
+        instance, a single FFT vector), and yields a ``(value, exponent)``
+        tuple each time that an integration is completed. The accumulator
+        state is kept across chunks, so only one chunk needs to be kept in
+        memory. The output is the same as the output of ``model`` for each
+        integration.
+        """
+        assert nint >= 1
+        order_log2 = self._model_order(size_log2)
+        self._model_check_zoom(order_log2, decimation_log2, zoom_log2,
+                               zoom_start)
+        acc_decimation_log2 = self._model_acc_decimation(
+            peak_detect, decimation_log2, decimation_max)
+        nfft = 2**order_log2
+        nacc = nfft >> acc_decimation_log2
+        acc, acc_exp = (np.zeros((1, nacc), 'int') for _ in range(2))
+        count = 0
+        for re_in, im_in in chunks:
+            re_in, im_in = (np.array(x, 'int').reshape(1, -1, nfft)
+                            for x in [re_in, im_in])
+            pos = 0
+            while pos < re_in.shape[1]:
+                sel = slice(pos, pos + nint - count)
+                acc, acc_exp = self._model_integrate(
+                    acc, acc_exp,
+                    self._model_groups(re_in[:, sel], acc_decimation_log2),
+                    self._model_groups(im_in[:, sel], acc_decimation_log2),
+                    peak_detect)
+                num_vectors = re_in[:, sel].shape[1]
+                pos += num_vectors
+                count += num_vectors
+                if count == nint:
+                    yield self._model_output(
+                        acc, acc_exp, order_log2, decimation_log2,
+                        zoom_log2, zoom_start, decimation_max,
+                        acc_decimation_log2)
+                    acc, acc_exp = (np.zeros((1, nacc), 'int')
+                                    for _ in range(2))
+                    count = 0
+
+    def _model_order(self, size_log2):
+        if size_log2 is None:
+            return self.order_log2
+        if not self.min_order_log2 <= size_log2 <= self.order_log2:
+            raise ValueError(f'unsupported FFT size_log2 {size_log2}')
+        return size_log2
+
+    def _model_check_zoom(self, order_log2, decimation_log2, zoom_log2,
+                          zoom_start):
+        if decimation_log2 and not (
+                decimation_log2 <= self.max_decimation_log2
+                and 2**(order_log2 - decimation_log2) > self._delay()):
+            raise ValueError(f'unsupported decimation_log2 {decimation_log2}')
+        if (zoom_log2 or zoom_start) and not (
+                self.zoom and zoom_log2 <= order_log2 - decimation_log2
+                and zoom_start in range(2**order_log2)):
+            raise ValueError(
+                f'unsupported zoom_log2 {zoom_log2}, zoom_start {zoom_start}')
+
+    @staticmethod
+    def _model_acc_decimation(peak_detect, decimation_log2, decimation_max):
+        # The bins of a decimation group are only accumulated in the same
+        # address if the combination mode matches the peak detect mode.
+        # Otherwise they are integrated separately and combined afterwards.
+        if bool(decimation_max) == bool(peak_detect):
+            return decimation_log2
+        return 0
+
+    @staticmethod
+    def _model_groups(x, decimation_log2):
+        # The bins that are accumulated in the same address appear at the FFT
+        # output every 2**(order_log2 - decimation_log2) samples, because of
+        # the bit reversed order. This rearranges the FFT vectors x[:, j] so
+        # that they are integrated as 2**decimation_log2 vectors that have
+        # one bin of each group, in the order in which the bins appear.
+        return x.reshape(x.shape[0], -1, x.shape[-1] >> decimation_log2)
+
+    def _model_integrate(self, acc, acc_exp, re_in, im_in, peak_detect):
+        # Integrates the FFT vectors re_in[:, j], im_in[:, j] on the
+        # accumulators acc, acc_exp.
         re_in, im_in, exp_in = self.to_fp.model(re_in, im_in)
-        acc, acc_exp = (np.zeros((re_in.shape[0], 2**self.order_log2), 'int')
-                        for _ in range(2))
-        for j in range(nint):
-            re_in_c, im_in_c, acc_c, _, exp_c = self.common_exp.model(
-                re_in[:, j], im_in[:, j], exp_in[:, j],
-                acc, np.zeros_like(acc), acc_exp)
-            cpwr_result = self.cpwr.model(
-                re_in_c, im_in_c, acc_c, peak_detect)
-            if peak_detect:
-                pwr, is_greater = cpwr_result
-                acc[is_greater] = pwr[is_greater]
-                acc_exp[is_greater] = exp_c[is_greater]
-            else:
-                acc[:] = cpwr_result
-                acc_exp[:] = exp_c
+        if peak_detect:
+            # In peak detect mode the accumulator is only updated when the
+            # power is greater, so the recurrence is done sequentially.
+            for j in range(re_in.shape[1]):
+                re_in_c, im_in_c, acc_c, _, exp_c = self.common_exp.model(
+                    re_in[:, j], im_in[:, j], exp_in[:, j],
+                    acc, np.zeros_like(acc), acc_exp)
+                pwr, is_greater = self.cpwr.model(
+                    re_in_c, im_in_c, acc_c, peak_detect)
+                acc = np.where(is_greater, pwr, acc)
+                acc_exp = np.where(is_greater, exp_c, acc_exp)
+            return acc, acc_exp
+
+        # In average mode the accumulator exponent is the running maximum of
+        # the input exponents, so it can be computed for all the vectors at
+        # once. The accumulator is added the power of each input (converted
+        # to the accumulator exponent), and it is shifted right each time
+        # that its exponent increases. Since the exponent is non-decreasing,
+        # this can be done by iterating over the possible exponent values
+        # rather than over the input vectors: the power of the inputs with
+        # the same common exponent is summed in a single step, and the
+        # accumulator is shifted when moving to the next exponent value
+        # (successive shifts of a non-negative value can be combined).
+        #
+        # This requires cpwr to compute the sum without shifts or
+        # truncations.
+        assert self.cpwr.real_shift == 0 and self.cpwr.truncate == 0
+        exp_c = np.maximum.accumulate(exp_in, axis=1)
+        np.maximum(exp_c, acc_exp[:, np.newaxis], out=exp_c)
+        # common_exp.model for the input, which is not a power
+        assert not self.common_exp.a_power
+        diff = exp_c - exp_in
+        pwr = self.cpwr.model(re_in >> diff, im_in >> diff, 0, peak_detect)
+        # Group the power by the common exponent, using the fact that exp_c
+        # is non-decreasing along the integration axis.
+        pwr_cumsum = np.cumsum(pwr, axis=1)
+        exp_last = exp_c[:, -1]
+        shift = 2 if self.common_exp.b_power else 1
+        pwr_sum_prev = 0
+        for exponent in range(self.w - self.fw + 1):
+            if exponent > 0:
+                do_shift = (acc_exp < exponent) & (exponent <= exp_last)
+                acc = np.where(do_shift, acc >> shift, acc)
+            # number of inputs with common exponent <= exponent
+            n = np.sum(exp_c <= exponent, axis=1)
+            pwr_sum = np.where(
+                n > 0,
+                np.take_along_axis(
+                    pwr_cumsum, np.maximum(n - 1, 0)[:, np.newaxis],
+                    axis=1)[:, 0],
+                0)
+            acc = acc + pwr_sum - pwr_sum_prev
+            pwr_sum_prev = pwr_sum
+        return acc, exp_last
+
+    def _model_output(self, acc, acc_exp, order_log2, decimation_log2=0,
+                      zoom_log2=0, zoom_start=0, decimation_max=False,
+                      acc_decimation_log2=None):
+        if acc_decimation_log2 is None:
+            acc_decimation_log2 = decimation_log2
         # Bit reverse accumulator order
-        acc = acc[:, [bit_invert(n, self.order_log2, 1)
-                      for n in range(2**self.order_log2)]]
-        acc_exp = acc_exp[:, [bit_invert(n, self.order_log2, 1)
-                              for n in range(2**self.order_log2)]]
+        invert = bit_invert_table(order_log2 - acc_decimation_log2, 1)
+        acc = acc[:, invert]
+        acc_exp = acc_exp[:, invert]
         # Perform fftshift
         acc = np.fft.fftshift(acc, axes=-1)
         acc_exp = np.fft.fftshift(acc_exp, axes=-1)
+        # Select zoom window
+        window = (((zoom_start >> decimation_log2) << (
+            decimation_log2 - acc_decimation_log2))
+                  + np.arange(acc.shape[-1] >> zoom_log2)) % acc.shape[-1]
+        acc, acc_exp = acc[:, window], acc_exp[:, window]
+        if acc_decimation_log2 != decimation_log2:
+            acc, acc_exp = self._model_combine(
+                acc, acc_exp, decimation_log2, decimation_max)
         return acc.ravel(), acc_exp.ravel()
 
+    def _model_combine(self, acc, acc_exp, decimation_log2, decimation_max):
+        # Combines the groups of 2**decimation_log2 adjacent bins of acc by
+        # taking the sum or the maximum in the order in which they are stored
+        # in the BRAM. Each step converts the running value and the next bin
+        # to a common exponent.
+        acc, acc_exp = (
+            x.reshape(x.shape[0], -1, 2**decimation_log2)
+            for x in [acc, acc_exp])
+        shift = 2 if self.common_exp.b_power else 1
+        value, exponent = acc[..., 0], acc_exp[..., 0]
+        for k in range(1, 2**decimation_log2):
+            common = np.maximum(exponent, acc_exp[..., k])
+            a = value >> (shift * (common - exponent))
+            b = acc[..., k] >> (shift * (common - acc_exp[..., k]))
+            value = np.maximum(a, b) if decimation_max else a + b
+            exponent = common
+        return value, exponent
+
     def elaborate(self, platform):
         m = Module()
         m.submodules.to_fp = to_fp = self.to_fp
@@ -178,12 +434,12 @@ class SpectrumIntegrator(Elaboratable):
         wrports = [mem.write_port() for mem in mems]
 
         # We use the output register on the BRAM.
-        mem_delay = 2
+        mem_delay = self._mem_delay
         # Accumulator data is subject to the BRAM delay. Input data is subject
         # to floating-point conversion. Since these operations have the same
         # delay, we do not need to delay any of them to align them.
         assert mem_delay == to_fp.delay
-        processing_delay = mem_delay + common_exp.delay + cpwr.delay
+        processing_delay = self._delay()
 
         read_counter_rst = 0
         read_counter = Signal(self.order_log2, init=read_counter_rst)
@@ -193,18 +449,21 @@ class SpectrumIntegrator(Elaboratable):
         sum_counter = Signal(self.nw)
         not_first_sum = Signal()
         not_first_sum_delay = Signal(mem_delay)
+        # Indicates that the accumulator is read (instead of using zero)
+        accumulate = Signal()
         pingpong = Signal()
         pingpong_delay = Signal(processing_delay, reset_less=False)
         pingpong_q = Signal(reset_less=False)
         do_abort = Signal()
 
+        m.d.sync += self.aborted.eq(0)
         with m.If(self.clken):
             m.d.sync += [
                 read_counter.eq(read_counter + 1),
                 write_counter.eq(write_counter + 1),
                 pingpong_delay.eq(Cat(pingpong, pingpong_delay[:-1])),
                 not_first_sum_delay.eq(
-                    Cat(not_first_sum, not_first_sum_delay[:-1])),
+                    Cat(accumulate, not_first_sum_delay[:-1])),
             ]
 
             with m.If(self.input_last):
@@ -215,13 +474,15 @@ class SpectrumIntegrator(Elaboratable):
                     not_first_sum.eq(1),
                     sum_counter.eq(sum_counter - 1),
                 ]
-                with m.If((sum_counter == 1) | (sum_counter == 0) | do_abort):
+                sum_finished = (sum_counter == 1) | (sum_counter == 0)
+                with m.If(sum_finished | do_abort):
                     # A new sum starts
                     m.d.sync += [
                         sum_counter.eq(self.nint),
                         not_first_sum.eq(0),
                         pingpong.eq(~pingpong),
                         do_abort.eq(0),
+                        self.aborted.eq(~sum_finished),
                     ]
 
         with m.If(self.abort):
@@ -231,13 +492,77 @@ class SpectrumIntegrator(Elaboratable):
 
         # The read and write counters are reversed to perform bit order
         # inversion in the FFT indices. Moreover, the MSB is negated to perform
-        # fftshift.
-        read_counter_rev = read_counter[::-1]
-        write_counter_rev = write_counter[::-1]
-        read_counter_shift = Cat(read_counter_rev[:-1],
-                                 ~read_counter_rev[-1])
-        write_counter_shift = Cat(write_counter_rev[:-1],
-                                  ~write_counter_rev[-1])
+        # fftshift. When the FFT size is selected at runtime, only the LSBs of
+        # the counters corresponding to the FFT size are used.
+        def counter_shift(counter, order_log2):
+            counter_rev = counter[:order_log2][::-1]
+            return Cat(counter_rev[:-1], ~counter_rev[-1])
+
+        size_mask = Signal(self.order_log2)
+        if self.min_order_log2 == self.order_log2:
+            read_counter_shift = counter_shift(read_counter, self.order_log2)
+            write_counter_shift = counter_shift(write_counter, self.order_log2)
+            m.d.comb += size_mask.eq(-1)
+        else:
+            read_counter_shift = Signal(self.order_log2)
+            write_counter_shift = Signal(self.order_log2)
+            m.d.comb += size_mask.eq(-1)
+            with m.Switch(self.size_log2):
+                for order_log2 in range(self.min_order_log2, self.order_log2):
+                    with m.Case(order_log2):
+                        m.d.comb += [
+                            read_counter_shift.eq(
+                                counter_shift(read_counter, order_log2)),
+                            write_counter_shift.eq(
+                                counter_shift(write_counter, order_log2)),
+                            size_mask.eq(2**order_log2 - 1),
+                        ]
+                with m.Default():
+                    m.d.comb += [
+                        read_counter_shift.eq(
+                            counter_shift(read_counter, self.order_log2)),
+                        write_counter_shift.eq(
+                            counter_shift(write_counter, self.order_log2)),
+                    ]
+
+        # Bin decimation and zoom. The bins of a decimation group are
+        # accumulated in the same address. Because of the bit reversed order,
+        # they appear at the input 2**(size_log2 - decimation_log2) samples
+        # apart, with the group index in the MSBs of the counter. In the first
+        # sum, the accumulator is only read for the bins after the first.
+        #
+        # If the combination of the bins of a group (sum or maximum) does not
+        # match the peak detect mode, each bin is accumulated in its own
+        # address, and the groups are combined after the integration.
+        combine = Signal()
+        if self.max_decimation_log2:
+            decimation_log2 = self.decimation_log2
+            m.d.comb += combine.eq(
+                (self.decimation_max ^ self.peak_detect)
+                & (self.decimation_log2 != 0))
+            acc_decimation_log2 = Mux(combine, 0, decimation_log2)
+        else:
+            decimation_log2 = C(0, 1)
+            acc_decimation_log2 = decimation_log2
+        if self.zoom:
+            zoom_log2 = self.zoom_log2
+            zoom_start = (self.zoom_start >> decimation_log2) \
+                << decimation_log2
+        else:
+            zoom_log2 = C(0, 1)
+            zoom_start = C(0, self.order_log2)
+        group_mask = size_mask & ~(size_mask >> acc_decimation_log2)
+        m.d.comb += accumulate.eq(
+            not_first_sum | (read_counter & group_mask).any())
+
+        def zoom_address(counter_shift):
+            bin_index = Signal(self.order_log2)
+            m.d.comb += bin_index.eq((counter_shift - zoom_start) & size_mask)
+            in_window = (bin_index & ~(size_mask >> zoom_log2)) == 0
+            return bin_index >> acc_decimation_log2, in_window
+
+        read_address, _ = zoom_address(read_counter_shift)
+        write_address, write_in_window = zoom_address(write_counter_shift)
 
         exp_delay = [Signal(self.ew, name=f'exp_q_{j}', reset_less=True)
                      for j in range(cpwr.delay)]
@@ -249,6 +574,92 @@ class SpectrumIntegrator(Elaboratable):
         writeback = Signal()
         read_data = Signal(self.sumw + self.ew)
         rdata = Mux(pingpong, rdports_reg[0], rdports_reg[1])
+        integration_done = pingpong_delay[-1] ^ pingpong_q
+
+        # Combination of the decimation groups. When an integration finishes,
+        # the bins in the zoom window are read in order from the BRAM that
+        # contains the integration, using the reader port. The bins of each
+        # group are adjacent, so they are combined with a running value that
+        # is written back to the address of the group once the last bin of
+        # the group has been read. This address is never larger than the
+        # addresses of the bins, so the combination can be done in place.
+        combine_done = Signal()
+        combine_write = Signal()
+        combine_write_addr = Signal(self.order_log2)
+        combine_value = Signal(self.sumw)
+        combine_exp = Signal(self.ew)
+        if self.max_decimation_log2:
+            combine_run = Signal()
+            combine_addr = Signal(self.order_log2)
+            combine_valid = Signal(mem_delay)
+            combine_addr_q = [
+                Signal(self.order_log2, name=f'combine_addr_q{j}')
+                for j in range(mem_delay)]
+            window_mask = size_mask >> zoom_log2
+            member_mask = size_mask & ~(size_mask << decimation_log2)
+            with m.If(integration_done & combine):
+                m.d.sync += [
+                    combine_run.eq(1),
+                    combine_addr.eq(0),
+                ]
+            with m.If(combine_run):
+                m.d.sync += combine_addr.eq(combine_addr + 1)
+                with m.If(combine_addr == window_mask):
+                    m.d.sync += combine_run.eq(0)
+            m.d.sync += [
+                combine_valid.eq(Cat(combine_run, combine_valid[:-1])),
+                combine_addr_q[0].eq(combine_addr),
+            ]
+            m.d.sync += [combine_addr_q[j].eq(combine_addr_q[j - 1])
+                         for j in range(1, mem_delay)]
+            bin_addr = combine_addr_q[-1]
+            bin_value = rdata[:self.sumw]
+            bin_exp = rdata[-self.ew:]
+            exp_max = Signal(self.ew)
+            value_shift = Signal(self.ew + 1)
+            bin_shift = Signal(self.ew + 1)
+            # The power representation uses two bits per exponent unit.
+            assert self.common_exp.b_power
+            m.d.comb += [
+                exp_max.eq(Mux(combine_exp > bin_exp, combine_exp, bin_exp)),
+                value_shift.eq((exp_max - combine_exp) << 1),
+                bin_shift.eq((exp_max - bin_exp) << 1),
+            ]
+            value_aligned = combine_value >> value_shift
+            bin_aligned = bin_value >> bin_shift
+            m.d.sync += [
+                combine_write.eq(0),
+                combine_done.eq(0),
+            ]
+            with m.If(combine_valid[-1]):
+                with m.If((bin_addr & member_mask) == 0):
+                    m.d.sync += [
+                        combine_value.eq(bin_value),
+                        combine_exp.eq(bin_exp),
+                    ]
+                with m.Else():
+                    m.d.sync += [
+                        combine_value.eq(
+                            Mux(self.decimation_max,
+                                Mux(value_aligned > bin_aligned,
+                                    value_aligned, bin_aligned),
+                                value_aligned + bin_aligned)),
+                        combine_exp.eq(exp_max),
+                    ]
+                with m.If((bin_addr & member_mask) == member_mask):
+                    m.d.sync += [
+                        combine_write.eq(1),
+                        combine_write_addr.eq(bin_addr >> decimation_log2),
+                    ]
+                m.d.sync += combine_done.eq(bin_addr == window_mask)
+            # The reader port is used by the combination while it runs. The
+            # read enable is kept during the BRAM latency to update the output
+            # register.
+            reader_addr = Mux(combine_run, combine_addr, self.rdaddr)
+            reader_en = self.rden | combine_run | combine_valid[:-1].any()
+        else:
+            reader_addr = self.rdaddr
+            reader_en = self.rden
         m.d.comb += [
             to_fp.clken.eq(self.clken),
             to_fp.re_in.eq(self.re_in),
@@ -273,29 +684,37 @@ class SpectrumIntegrator(Elaboratable):
             cpwr.im_in.eq(common_exp.im_a_out),
             cpwr.real_in.eq(common_exp.b_out),
 
-            self.done.eq(pingpong_delay[-1] ^ pingpong_q),
+            self.done.eq((integration_done & ~combine) | combine_done),
             # We need to include pingpong_delay[1] here because otherwise the
             # rden would be active immediately after toggling pingpong, and we
             # would lose the contents of the ram output register.
             rdports[0].en.eq(Mux(pingpong & pingpong_delay[mem_delay - 1],
-                                 self.rden, self.clken)),
+                                 reader_en, self.clken)),
             rdports[1].en.eq(Mux(pingpong | pingpong_delay[mem_delay - 1],
-                                 self.clken, self.rden)),
-            rdports[0].addr.eq(Mux(pingpong, self.rdaddr, read_counter_shift)),
-            rdports[1].addr.eq(Mux(pingpong, read_counter_shift, self.rdaddr)),
+                                 self.clken, reader_en)),
+            rdports[0].addr.eq(Mux(pingpong, reader_addr, read_address)),
+            rdports[1].addr.eq(Mux(pingpong, read_address, reader_addr)),
             # In average mode, always write back to the BRAM. In peak detect
             # mode, only write back when the cpwr says that the new power is
             # greater than the one in the BRAM.
-            writeback.eq(~self.peak_detect | cpwr.is_greater),
-            wrports[0].en.eq((~pingpong_delay[-1]) & self.clken & writeback),
-            wrports[1].en.eq(pingpong_delay[-1] & self.clken & writeback),
+            # Bins outside the zoom window are never written back.
+            writeback.eq((~self.peak_detect | cpwr.is_greater)
+                         & write_in_window),
             self.rdata_value.eq(rdata[:self.sumw]),
             self.rdata_exponent.eq(rdata[-self.ew:]),
         ]
-        for wr in wrports:
+        # The combination writes to the BRAM that is not being integrated.
+        for wr, integrating in zip(wrports, [~pingpong_delay[-1],
+                                             pingpong_delay[-1]]):
+            wr_combine = combine_write & ~integrating
             m.d.comb += [
-                wr.addr.eq(write_counter_shift),
-                wr.data.eq(Cat(cpwr.out[:self.sumw], exp_delay[-1])),
+                wr.en.eq((integrating & self.clken & writeback)
+                         | wr_combine),
+                wr.addr.eq(Mux(wr_combine, combine_write_addr,
+                               write_address)),
+                wr.data.eq(Mux(wr_combine,
+                               Cat(combine_value, combine_exp),
+                               Cat(cpwr.out[:self.sumw], exp_delay[-1]))),
                 ]
         return m
 
@@ -6,6 +6,8 @@
 # SPDX-License-Identifier: MIT
 #
 
+import functools
+
 import numpy as np
 
 
@@ -14,9 +16,48 @@ def clamp_nbits(x, nbits):
     return ((x + offset) % 2**nbits) - offset
 
 
+def signed_bit_length(x):
+    """Number of bits required to represent a signed integer.
+
+    This is equal to ``int(x).bit_length() + 1`` for ``x >= 0`` and to
+    ``int(~x).bit_length() + 1`` for ``x < 0``. It works element-wise on
+    numpy integer arrays of up to 64 bits.
+    """
+    x = np.asarray(x, 'int64')
+    # Reduce to the non-negative case by replacing x by ~x when x < 0
+    x = x ^ (x >> 63)
+    # Leading zero count by binary search
+    length = np.zeros(x.shape, 'int')
+    for shift in [32, 16, 8, 4, 2, 1]:
+        s = (x >= (1 << shift)) * shift
+        length += s
+        x = x >> s
+    return length + (x > 0) + 1
+
+
+def _bit_invert(n, nbits, radix_log2):
+    # Reverses the order of the radix_log2-bit digits of n. Works both with
+    # ints and with numpy integer arrays.
+    assert nbits % radix_log2 == 0
+    mask = 2**radix_log2 - 1
+    inverted = 0
+    for j in range(0, nbits, radix_log2):
+        inverted = (inverted << radix_log2) | ((n >> j) & mask)
+    return inverted
+
+
 def bit_invert(n, nbits, radix_log2):
-    bits = ('0'*nbits + bin(n)[2:])[-nbits:]
-    bits_arr = np.array([a for a in bits])
-    inverted = bits_arr.reshape(-1, radix_log2)[::-1].ravel()
-    inverted_str = ''.join(list(inverted))
-    return int(inverted_str, 2)
+    return int(_bit_invert(int(n), nbits, radix_log2))
+
+
+@functools.lru_cache(maxsize=32)
+def bit_invert_table(nbits, radix_log2):
+    """Bit inversion permutation table.
+
+    Returns a read-only array ``t`` of length ``2**nbits`` such that ``t[n]``
+    is equal to ``bit_invert(n, nbits, radix_log2)``. The tables are cached,
+    so this is inexpensive to call repeatedly.
+    """
+    table = _bit_invert(np.arange(2**nbits), nbits, radix_log2)
+    table.flags.writeable = False
+    return table
@@ -354,6 +354,14 @@ create_bd_addr_seg -range 0x20000000 -offset 0x00000000 \
                     [get_bd_addr_segs sys_ps7/S_AXI_HP1/HP1_DDR_LOWOCM] \
                     SEG_sys_ps7_HP1_DDR_LOWOCM
 
+ad_ip_parameter sys_ps7 CONFIG.PCW_USE_S_AXI_HP3 {1}
+ad_connect sys_cpu_clk sys_ps7/S_AXI_HP3_ACLK
+ad_connect maia_sdr/m_axi_ddc_coeff sys_ps7/S_AXI_HP3
+create_bd_addr_seg -range 0x20000000 -offset 0x00000000 \
+                    [get_bd_addr_spaces maia_sdr/m_axi_ddc_coeff] \
+                    [get_bd_addr_segs sys_ps7/S_AXI_HP3/HP3_DDR_LOWOCM] \
+                    SEG_sys_ps7_HP3_DDR_LOWOCM
+
 
 # interrupts
 if {[info exists maia_iio]} {
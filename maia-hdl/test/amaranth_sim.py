@@ -8,12 +8,75 @@
 
 from amaranth.sim import Simulator
 
+import os
 import unittest
+import warnings
+
+from . import cxxrtl_sim
+
+
+class ShardSkip(unittest.SkipTest):
+    """Subtest skipped because it belongs to another shard.
+
+    See :attr:`AmaranthSim.shard`.
+    """
+    reason_prefix = 'not in shard'
 
 
 class AmaranthSim(unittest.TestCase):
-    def simulate(self, benches, *, vcd=None, named_clocks={}):
-        sim = Simulator(self.dut)
+    # Optional (index, count) tuple. When it is set, the outermost subtests
+    # are numbered in order, and only the subtests whose number modulo count
+    # equals index are run. The other subtests are skipped by raising
+    # ShardSkip when they set the DUT, so that the model and the simulation
+    # are not computed, or when they call simulate(). Subtests that do
+    # neither run in every shard. This is used by test.run_parallel to split
+    # parameterized tests into independent jobs.
+    shard = None
+
+    # When this is set to True, the test runs in shard discovery mode, which
+    # is used by test.run_parallel to find which tests can be sharded. Every
+    # outermost subtest is skipped by raising ShardSkip as if it belonged to
+    # another shard, and the numbers of the skipped subtests are added to
+    # shard_subtests. A simulation outside subtests also raises ShardSkip, so
+    # that the tests that cannot be sharded are not run.
+    shard_discovery = False
+    shard_subtests = set()
+
+    # Simulation backend: 'pysim' (the Amaranth Python simulator) or 'cxxrtl'
+    # (compiled simulation, see cxxrtl_sim). Test cases with long simulations
+    # can set this class attribute to 'cxxrtl'. The MAIA_HDL_SIM_BACKEND
+    # environment variable overrides it for all the test cases.
+    backend = 'pysim'
+
+    @property
+    def dut(self):
+        return self._dut
+
+    @dut.setter
+    def dut(self, dut):
+        self._check_shard()
+        self._dut = dut
+
+    def subTest(self, *args, **kwargs):
+        if ((self.shard is not None or self.shard_discovery)
+                and self._subtest is None):
+            self._shard_subtest = getattr(self, '_shard_subtest', -1) + 1
+        return super().subTest(*args, **kwargs)
+
+    def dummy_simulation(self, *, named_clocks={}):
+        # Dummy simulation, to keep amaranth happy (otherwise amaranth
+        # complains that we didn't use the DUT if we only use it to run
+        # the model).
+        async def dummy(ctx):
+            pass
+
+        self.simulate(dummy, named_clocks=named_clocks)
+
+    def simulate(self, benches, *, vcd=None, named_clocks={}, backend=None):
+        if self.shard_discovery and self._subtest is None:
+            raise ShardSkip(f'{ShardSkip.reason_prefix} (discovery)')
+        self._check_shard()
+        sim = self._simulator(backend, vcd)
         sim.add_clock(12e-9)
         for domain, period in named_clocks.items():
             sim.add_clock(period, domain=domain, phase=6e-9)
@@ -27,3 +90,33 @@ class AmaranthSim(unittest.TestCase):
         else:
             with sim.write_vcd(vcd):
                 sim.run()
+
+    def _simulator(self, backend, vcd):
+        if backend is None:
+            backend = os.environ.get('MAIA_HDL_SIM_BACKEND', self.backend)
+        if backend == 'cxxrtl':
+            if vcd is not None:
+                warnings.warn('the cxxrtl backend cannot write VCD files; '
+                              'falling back to pysim')
+            elif not cxxrtl_sim.available():
+                raise RuntimeError('yosys or a C++ compiler are not '
+                                   'available for the cxxrtl backend')
+            else:
+                return cxxrtl_sim.CxxrtlSimulator(self.dut)
+        elif backend != 'pysim':
+            raise ValueError(f'unknown simulation backend {backend}')
+        return Simulator(self.dut)
+
+    def _check_shard(self):
+        if self._subtest is None:
+            return
+        if self.shard_discovery:
+            self.shard_subtests.add(self._shard_subtest)
+            raise ShardSkip(f'{ShardSkip.reason_prefix} (discovery, '
+                            f'subtest {self._shard_subtest})')
+        if self.shard is None:
+            return
+        index, count = self.shard
+        if self._shard_subtest % count != index:
+            raise ShardSkip(f'{ShardSkip.reason_prefix} {index}/{count} '
+                            f'(subtest {self._shard_subtest})')
@@ -0,0 +1,392 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+"""Simulation throughput benchmarks
+
+This simulates a fixed number of clock cycles of the main elaboratables with
+the Amaranth Python simulator and reports, for each of them, the elaboration
+time, the simulator construction time, the number of simulated cycles per
+wall-clock second and the peak memory usage (maximum resident set size). Each
+benchmark runs in a fresh process, so that the peak memory usage and the
+timings of one benchmark do not depend on the others. The results are printed
+as JSON, so that they can be stored and compared between commits.
+
+Usage (from the maia-hdl directory)::
+
+    python3 -m test.benchmark [-n CYCLES] [-o FILE] [--compare FILE] [names]
+"""
+
+import amaranth
+from amaranth.hdl import Fragment
+from amaranth.sim import Simulator
+import numpy as np
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+from maia_hdl.config import MaiaSDRConfig
+from maia_hdl.ddc import DDC
+from maia_hdl.fft import FFT, R2SDF, R4SDF, R22SDF
+from maia_hdl.fir import FIR2DSP, FIR4DSP
+from maia_hdl.recorder import Recorder16IQ, RecorderMode
+from maia_hdl.spectrum_integrator import SpectrumIntegrator
+from .common_edge import CommonEdgeTb
+
+
+class Benchmark:
+    """Benchmark definition.
+
+    Parameters
+    ----------
+    top : Elaboratable
+        Top level to simulate.
+    step : Callable
+        Function ``step(ctx, j)`` called in each cycle ``j`` of the ``sync``
+        domain to drive the inputs.
+    setup : Optional[Callable]
+        Function ``setup(ctx)`` called once before the first cycle to set
+        constant inputs.
+    named_clocks : dict
+        Periods of the clock domains other than ``sync``, as in
+        ``AmaranthSim.simulate``.
+    note : Optional[str]
+        Note to include in the results.
+    """
+    def __init__(self, top, step, setup=None, named_clocks={}, note=None):
+        self.top = top
+        self.step = step
+        self.setup = setup
+        self.named_clocks = named_clocks
+        self.note = note
+
+
+def _random_iq(width, size):
+    rng = np.random.default_rng(0)
+    return [int(a) for a in rng.integers(-2**(width-1), 2**(width-1),
+                                         size=2 * size)]
+
+
+def _sdf(dut, depth, mux):
+    # Drives an R2SDF, R4SDF or R22SDF with BRAM storage. depth is the depth
+    # of the delay line and mux(ctx, j) sets the mux control input in cycle j.
+    size = dut.model_vlen
+    iq = _random_iq(len(dut.re_in), size)
+    offset = 2 if dut.use_bram_reg else 1
+
+    def step(ctx, j):
+        ctx.set(dut.clken, 1)
+        ctx.set(dut.re_in, iq[2 * (j % size)])
+        ctx.set(dut.im_in, iq[2 * (j % size) + 1])
+        mux(ctx, j)
+        waddr = j % depth
+        ctx.set(dut.bram_raddr, waddr + offset)
+        ctx.set(dut.bram_waddr, waddr)
+
+    return Benchmark(dut, step)
+
+
+def r2sdf():
+    order = 8
+    dut = R2SDF(order, 16, truncate=1, storage='bram', use_bram_reg=True)
+    return _sdf(dut, 2**(order - 1), lambda ctx, j: ctx.set(
+        dut.mux_control, (j // 2**(order - 1)) % 2))
+
+
+def r4sdf():
+    order = 4
+    dut = R4SDF(order, 16, truncate=2, storage='bram', use_bram_reg=True)
+    return _sdf(dut, 4**(order - 1), lambda ctx, j: ctx.set(
+        dut.mux_control, (j // 4**(order - 1)) % 4 == 3))
+
+
+def r22sdf():
+    order = 4
+    dut = R22SDF(order, 16, truncate=[1, 1], storage='bram',
+                 use_bram_reg=True)
+    return _sdf(dut, 2**(2 * order - 1), lambda ctx, j: ctx.set(
+        dut.mux_count, (j // 4**(order - 1)) % 4))
+
+
+def fft_window_cmult3x():
+    # Same configuration as the FFT in the Spectrometer
+    order_log2 = 12
+    fft = FFT(16, order_log2, 'R22', width_twiddle=16,
+              truncates=[[0, 1]] * (order_log2 // 2),
+              use_bram_reg=True, window='blackmanharris', cmult3x=True,
+              domain_2x='clk2x', domain_3x='clk3x')
+    top = CommonEdgeTb(fft, [('clk2x', 2, 'common_edge_2x'),
+                             ('clk3x', 3, 'common_edge_3x')])
+    size = 2**order_log2
+    iq = _random_iq(16, size)
+
+    def step(ctx, j):
+        ctx.set(fft.clken, 1)
+        ctx.set(fft.re_in, iq[2 * (j % size)])
+        ctx.set(fft.im_in, iq[2 * (j % size) + 1])
+
+    return Benchmark(top, step,
+                     named_clocks={'clk2x': 6e-9, 'clk3x': 4e-9})
+
+
+def _fir(dut, decimation, operations, odd_operations=None):
+    size = 4096
+    iq = _random_iq(16, size)
+
+    def setup(ctx):
+        ctx.set(dut.decimation, decimation)
+        ctx.set(dut.operations_minus_one, operations - 1)
+        if odd_operations is not None:
+            ctx.set(dut.odd_operations, odd_operations)
+        ctx.set(dut.in_valid, 1)
+
+    def step(ctx, j):
+        ctx.set(dut.re_in, iq[2 * (j % size)])
+        ctx.set(dut.im_in, iq[2 * (j % size) + 1])
+
+    return Benchmark(dut, step, setup)
+
+
+def fir4dsp():
+    return _fir(FIR4DSP(), 5, 3, odd_operations=False)
+
+
+def fir2dsp():
+    return _fir(FIR2DSP(), 6, 3)
+
+
+def ddc():
+    dut = DDC('clk3x')
+    top = CommonEdgeTb(dut, [('clk3x', 3, 'common_edge')])
+    size = 4096
+    iq = _random_iq(12, size)
+
+    def setup(ctx):
+        ctx.set(dut.enable_input, 1)
+        ctx.set(dut.frequency, 12345678)
+        ctx.set(dut.decimation1, 5)
+        ctx.set(dut.decimation2, 3)
+        ctx.set(dut.decimation3, 2)
+        ctx.set(dut.operations_minus_one1, 2)
+        ctx.set(dut.operations_minus_one2, 7)
+        ctx.set(dut.operations_minus_one3, 5)
+        ctx.set(dut.strobe_in, 1)
+
+    def step(ctx, j):
+        ctx.set(dut.re_in, iq[2 * (j % size)])
+        ctx.set(dut.im_in, iq[2 * (j % size) + 1])
+
+    return Benchmark(top, step, setup, named_clocks={'clk3x': 4e-9})
+
+
+def spectrum_integrator():
+    # Same configuration as the SpectrumIntegrator in the Spectrometer
+    order_log2 = 12
+    dut = SpectrumIntegrator('clk3x', 22, 18, 10, order_log2)
+    top = CommonEdgeTb(dut, [('clk3x', 3, 'common_edge')])
+    size = 2**order_log2
+    iq = _random_iq(22, size)
+
+    def setup(ctx):
+        ctx.set(dut.nint, 4)
+
+    def step(ctx, j):
+        # one sample every other cycle, as in the Spectrometer
+        k = (j // 2) % size
+        ctx.set(dut.clken, j % 2)
+        ctx.set(dut.re_in, iq[2 * k])
+        ctx.set(dut.im_in, iq[2 * k + 1])
+        ctx.set(dut.input_last, k == size - 1)
+
+    return Benchmark(top, step, setup, named_clocks={'clk3x': 4e-9})
+
+
+def recorder16iq():
+    # The FIFO and DMA configuration of the MaiaSDR top level. The
+    # AsyncFifoBRAM is used because the FIFO18E1 primitive of the default
+    # FIFO is a black box in the Amaranth simulator.
+    config = MaiaSDRConfig()
+    dut = Recorder16IQ(
+        0, 2**30, fifo_depth_log2=config.recorder_fifo_depth_log2,
+        dma_burst_len_log2=config.recorder_dma_burst_len_log2,
+        dma_max_outstanding_bursts=config.recorder_dma_max_outstanding_bursts,
+        dma_max_outstanding_b_log2=config.recorder_dma_max_outstanding_b_log2)
+    size = 4096
+    iq = _random_iq(16, size)
+
+    def setup(ctx):
+        ctx.set(dut.mode, RecorderMode.MODE_12BIT)
+        ctx.set(dut.strobe_in, 1)
+
+    def step(ctx, j):
+        ctx.set(dut.start, j == 0)
+        ctx.set(dut.re_in, iq[2 * (j % size)] & 0xffff)
+        ctx.set(dut.im_in, iq[2 * (j % size) + 1] & 0xffff)
+        ctx.set(dut.dma.axi.awready, 1)
+        ctx.set(dut.dma.axi.wready, 1)
+        ctx.set(dut.dma.axi.bvalid, j % 16 == 0)
+
+    return Benchmark(dut, step, setup)
+
+
+BENCHMARKS = {
+    'R2SDF': r2sdf,
+    'R4SDF': r4sdf,
+    'R22SDF': r22sdf,
+    'FFT_window_cmult3x': fft_window_cmult3x,
+    'FIR4DSP': fir4dsp,
+    'FIR2DSP': fir2dsp,
+    'DDC': ddc,
+    'SpectrumIntegrator': spectrum_integrator,
+    'Recorder16IQ': recorder16iq,
+}
+
+
+def run_benchmark(name, cycles):
+    """Run a benchmark in the current process.
+
+    Parameters
+    ----------
+    name : str
+        Benchmark name (a key of ``BENCHMARKS``).
+    cycles : int
+        Number of cycles of the ``sync`` domain to simulate.
+
+    Returns
+    -------
+    dict
+        Benchmark results.
+    """
+    bench = BENCHMARKS[name]()
+    t0 = time.perf_counter()
+    fragment = Fragment.get(bench.top, None)
+    t1 = time.perf_counter()
+    sim = Simulator(fragment)
+    sim.add_clock(12e-9)
+    for domain, period in bench.named_clocks.items():
+        sim.add_clock(period, domain=domain, phase=6e-9)
+
+    async def testbench(ctx):
+        if bench.setup is not None:
+            bench.setup(ctx)
+        for j in range(cycles):
+            bench.step(ctx, j)
+            await ctx.tick()
+
+    sim.add_testbench(testbench)
+    t2 = time.perf_counter()
+    sim.run()
+    t3 = time.perf_counter()
+    results = {
+        'elaborate_s': t1 - t0,
+        'simulator_s': t2 - t1,
+        'run_s': t3 - t2,
+        'cycles': cycles,
+        'cycles_per_s': cycles / (t3 - t2),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if bench.note is not None:
+        results['note'] = bench.note
+    return results
+
+
+def run_benchmarks(names, cycles):
+    """Run benchmarks, each of them in a fresh process.
+
+    Parameters
+    ----------
+    names : list[str]
+        Names of the benchmarks to run.
+    cycles : int
+        Number of cycles of the ``sync`` domain to simulate.
+
+    Returns
+    -------
+    dict
+        JSON-serializable results.
+    """
+    results = {}
+    for name in names:
+        print(f'running {name}...', file=sys.stderr, flush=True)
+        # A new single-process pool for each benchmark gives it a fresh
+        # process. The benchmarks are run one at a time so that they do not
+        # compete for CPU and memory bandwidth.
+        with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[name] = pool.submit(run_benchmark, name, cycles).result()
+    return {
+        'versions': {
+            'python': platform.python_version(),
+            'amaranth': amaranth.__version__,
+            'numpy': np.__version__,
+        },
+        'machine': platform.machine(),
+        'benchmarks': results,
+    }
+
+
+def compare(old, new, stream=sys.stdout):
+    """Print a comparison between two benchmark results."""
+    print(f'{"benchmark":<20} {"cycles/s":>10} {"old":>10} {"ratio":>7} '
+          f'{"elab s":>7} {"old":>7} {"rss MiB":>8} {"old":>8}',
+          file=stream)
+    for name, r in new['benchmarks'].items():
+        o = old['benchmarks'].get(name)
+        if o is None:
+            print(f'{name:<20} {r["cycles_per_s"]:10.1f}', file=stream)
+            continue
+        print(f'{name:<20} {r["cycles_per_s"]:10.1f} '
+              f'{o["cycles_per_s"]:10.1f} '
+              f'{r["cycles_per_s"] / o["cycles_per_s"]:7.3f} '
+              f'{r["elaborate_s"]:7.3f} {o["elaborate_s"]:7.3f} '
+              f'{r["peak_rss_kib"] / 1024:8.1f} '
+              f'{o["peak_rss_kib"] / 1024:8.1f}', file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the simulation throughput of maia-hdl modules')
+    parser.add_argument('names', nargs='*',
+                        help='benchmarks to run (default: all); available '
+                        f'benchmarks: {", ".join(BENCHMARKS)}')
+    parser.add_argument('-n', '--cycles', type=int, default=5000,
+                        help='number of cycles to simulate '
+                        '(default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the JSON results to this file '
+                        'instead of stdout')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a previous run to compare with')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+
+    results = run_benchmarks(args.names or list(BENCHMARKS), args.cycles)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        compare(old, results,
+                stream=sys.stderr if args.output is None else sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
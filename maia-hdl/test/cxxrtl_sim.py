@@ -0,0 +1,423 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+"""Compiled simulation backend using CXXRTL
+
+This module implements a simulator with the same interface as the subset of
+``amaranth.sim.Simulator`` used by the tests (``add_clock``,
+``add_testbench`` and ``run``, with testbenches that use ``ctx.get``,
+``ctx.set``, ``ctx.tick`` and ``ctx.tick().repeat``). The design is
+converted to C++ with ``amaranth.back.cxxrtl``, compiled to a shared library
+with the system C++ compiler and driven through the CXXRTL C API using
+ctypes. Compiled designs are cached, so that subtests that simulate the same
+design with different inputs only compile it once.
+
+The signals that the testbenches can access are the signals that can be
+reached through the public attributes of the toplevel, its submodules and
+their interfaces. These are made ports of the design. Undriven signals are
+inputs that the testbenches can set, and the remaining signals are outputs
+that can only be read. Memories and expressions other than signals cannot
+be accessed. The design is compiled and all the ports are checked when the
+simulator is constructed, so that unsupported designs fail before any
+simulation runs. Testbenches must be async functions, and they can only
+await ``ctx.tick()``.
+
+The Yosys version bundled with Amaranth (the amaranth-yosys package) or a
+system Yosys can be used, following the ``AMARANTH_USE_YOSYS`` environment
+variable in the same way as Amaranth. The C++ compiler is given by the
+``CXX`` environment variable (``c++`` by default), and extra compiler flags
+can be given in ``CXXFLAGS``. Designs containing instances of vendor
+primitives cannot be simulated with this backend.
+"""
+
+from amaranth.back import cxxrtl
+from amaranth.hdl import Const, Elaboratable, ShapeCastable, Signal
+
+import ctypes
+import hashlib
+import importlib.resources
+import inspect
+import os
+import shutil
+import subprocess
+import tempfile
+
+
+# CXXRTL C API debug item types and flags (see cxxrtl_capi.h)
+_CXXRTL_VALUE = 0
+_CXXRTL_WIRE = 1
+_CXXRTL_MEMORY = 2
+_CXXRTL_ALIAS = 3
+_CXXRTL_OUTLINE = 4
+_CXXRTL_INPUT = 1 << 0
+
+
+class _CxxrtlObject(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('width', ctypes.c_size_t),
+        ('lsb_at', ctypes.c_size_t),
+        ('depth', ctypes.c_size_t),
+        ('zero_at', ctypes.c_size_t),
+        ('curr', ctypes.POINTER(ctypes.c_uint32)),
+        ('next', ctypes.POINTER(ctypes.c_uint32)),
+        ('outline', ctypes.c_void_p),
+        ('attrs', ctypes.c_void_p),
+    ]
+
+
+def _yosys_data_dir():
+    # Returns the data directory of the Yosys used by amaranth.back.cxxrtl,
+    # or None if Yosys is not available. By default, Amaranth prefers the
+    # amaranth-yosys package over a system Yosys.
+    use_yosys = os.environ.get('AMARANTH_USE_YOSYS')
+    if use_yosys != 'system':
+        try:
+            return str(importlib.resources.files('amaranth_yosys') / 'share')
+        except ModuleNotFoundError:
+            if use_yosys == 'builtin':
+                return None
+    yosys_config = shutil.which('yosys-config')
+    if yosys_config is None:
+        return None
+    return subprocess.run([yosys_config, '--datdir'], check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def _compiler():
+    return os.environ.get('CXX', 'c++')
+
+
+def available():
+    """Check whether the CXXRTL backend can be used.
+
+    Returns
+    -------
+    bool
+        ``True`` if Yosys and a C++ compiler are available.
+    """
+    return (_yosys_data_dir() is not None
+            and shutil.which(_compiler()) is not None)
+
+
+def _runtime_paths():
+    # Returns the include directories and the C API sources of the CXXRTL
+    # runtime. Newer versions of Yosys ship the runtime in
+    # include/backends/cxxrtl/runtime, and the generated code includes
+    # <cxxrtl/cxxrtl.h>. Older versions ship it in include/backends/cxxrtl
+    # and the generated code includes <backends/cxxrtl/cxxrtl.h>.
+    include = os.path.join(_yosys_data_dir(), 'include')
+    runtime = os.path.join(include, 'backends', 'cxxrtl', 'runtime')
+    capi = [os.path.join(runtime, 'cxxrtl', 'capi', 'cxxrtl_capi.cc'),
+            os.path.join(include, 'backends', 'cxxrtl', 'cxxrtl_capi.cc')]
+    capi = [c for c in capi if os.path.exists(c)]
+    if not capi:
+        raise RuntimeError(f'CXXRTL C API not found in {include}')
+    return [runtime, include], capi[:1]
+
+
+def _cache_dir():
+    return os.environ.get(
+        'MAIA_HDL_CXXRTL_CACHE',
+        os.path.join(tempfile.gettempdir(), 'maia-hdl-cxxrtl'))
+
+
+def _build(cxx_source):
+    include_dirs, capi = _runtime_paths()
+    command = [_compiler(), '-std=c++14', '-O1', '-shared', '-fPIC',
+               *os.environ.get('CXXFLAGS', '').split(),
+               *[f'-I{d}' for d in include_dirs]]
+    digest = hashlib.sha256(
+        '\0'.join(command + [cxx_source]).encode()).hexdigest()
+    cache = _cache_dir()
+    library = os.path.join(cache, f'{digest}.so')
+    if not os.path.exists(library):
+        os.makedirs(cache, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=cache) as tmp:
+            source = os.path.join(tmp, 'design.cc')
+            with open(source, 'w') as f:
+                f.write(cxx_source)
+            output = os.path.join(tmp, 'design.so')
+            subprocess.run(command + ['-o', output, source, *capi],
+                           check=True)
+            # Atomic rename, in case several processes build the same design
+            # concurrently.
+            os.replace(output, library)
+    return ctypes.CDLL(library)
+
+
+def _design_signals(toplevel):
+    # Returns a dict that maps port names to the signals that can be reached
+    # through the public attributes of the toplevel. The names are formed
+    # from the attribute paths, in the same way as Amaranth names the ports
+    # of a component.
+    signals = {}
+    visited = set()
+
+    def visit(obj, path):
+        if id(obj) in visited:
+            return
+        if isinstance(obj, Signal):
+            visited.add(id(obj))
+            signals['__'.join(path)] = obj
+        elif isinstance(obj, (list, tuple)):
+            visited.add(id(obj))
+            for j, item in enumerate(obj):
+                visit(item, path + [str(j)])
+        elif (isinstance(obj, Elaboratable)
+              or type(obj).__module__.startswith('maia_hdl.')):
+            visited.add(id(obj))
+            for name, attr in vars(obj).items():
+                if not name.startswith('_'):
+                    visit(attr, path + [name])
+
+    visit(toplevel, [])
+    return signals
+
+
+class _Tick:
+    def __init__(self, domain, count=1):
+        self.domain = domain
+        self.count = count
+
+    def repeat(self, count):
+        return _Tick(self.domain, self.count * count)
+
+    def __await__(self):
+        yield self
+
+
+class _Context:
+    # Testbench context. Implements the subset of
+    # amaranth.sim.TestbenchContext used by the tests.
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, expr):
+        raw = self._sim._read(expr)
+        shape = expr.shape()
+        if isinstance(shape, ShapeCastable):
+            return shape.from_bits(raw)
+        if shape.signed and raw >> (shape.width - 1):
+            raw -= 1 << shape.width
+        return raw
+
+    def set(self, expr, value):
+        shape = expr.shape()
+        if isinstance(shape, ShapeCastable):
+            value = Const.cast(shape.const(value)).value
+        self._sim._write(expr, int(value))
+
+    def tick(self, domain='sync'):
+        if domain not in self._sim._clocks:
+            raise ValueError(f'domain {domain} does not have a clock')
+        return _Tick(domain)
+
+
+class _Testbench:
+    def __init__(self, constructor, background):
+        self.constructor = constructor
+        self.background = background
+        self.coroutine = None
+        self.waiting = None
+        self.remaining = 0
+
+    def resume(self):
+        try:
+            trigger = self.coroutine.send(None)
+        except StopIteration:
+            self.coroutine = None
+            return
+        if not isinstance(trigger, _Tick):
+            raise TypeError(
+                f'the CXXRTL backend does not support awaiting {trigger!r}')
+        self.waiting = trigger.domain
+        self.remaining = trigger.count
+
+
+class CxxrtlSimulator:
+    """Compiled simulator using CXXRTL.
+
+    The design is compiled when the simulator is constructed.
+
+    Parameters
+    ----------
+    toplevel : Elaboratable
+        Design to simulate.
+    """
+    def __init__(self, toplevel):
+        # domain -> (period, phase) in femtoseconds
+        self._clocks = {}
+        # domain -> clock signal parts, for the domains used by the design
+        self._clk = {}
+        self._testbenches = []
+        signals = _design_signals(toplevel)
+        cxx_source = cxxrtl.convert(
+            toplevel,
+            ports={name: (signal, None) for name, signal in signals.items()})
+        self._lib = _build(cxx_source)
+        self._lib.cxxrtl_design_create.restype = ctypes.c_void_p
+        self._lib.cxxrtl_create.restype = ctypes.c_void_p
+        self._lib.cxxrtl_create.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_destroy.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_step.restype = ctypes.c_size_t
+        self._lib.cxxrtl_step.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_get_parts.restype = ctypes.POINTER(_CxxrtlObject)
+        self._lib.cxxrtl_get_parts.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p,
+            ctypes.POINTER(ctypes.c_size_t)]
+        self._lib.cxxrtl_outline_eval.argtypes = [ctypes.c_void_p]
+        self._handle = self._lib.cxxrtl_create(
+            self._lib.cxxrtl_design_create())
+        self._dirty = True
+        # id(signal) -> (signal, parts, is_input)
+        self._ports = {}
+        for name, signal in signals.items():
+            parts = self._parts(name)
+            if parts is None:
+                raise ValueError(
+                    f'{signal!r} is not present in the compiled design')
+            if any(part.type not in (_CXXRTL_VALUE, _CXXRTL_WIRE,
+                                     _CXXRTL_ALIAS, _CXXRTL_OUTLINE)
+                   for part in parts):
+                raise ValueError(
+                    f'{signal!r} cannot be accessed by the CXXRTL backend')
+            is_input = all(part.flags & _CXXRTL_INPUT for part in parts)
+            self._ports[id(signal)] = (signal, parts, is_input)
+            if is_input:
+                # Undriven signals keep their initial value, as in pysim
+                self._write_parts(parts, signal.init)
+
+    def _parts(self, name):
+        nparts = ctypes.c_size_t()
+        parts = self._lib.cxxrtl_get_parts(
+            self._handle, name.encode(), ctypes.byref(nparts))
+        if not parts:
+            return None
+        return [parts[j] for j in range(nparts.value)]
+
+    def add_clock(self, period, *, phase=None, domain='sync'):
+        """Add a clock.
+
+        This has the same meaning as in ``amaranth.sim.Simulator``.
+        """
+        if domain in self._clocks:
+            raise ValueError(f'domain {domain} already has a clock')
+        if phase is None:
+            phase = period / 2
+        self._clocks[domain] = (round(period * 1e15), round(phase * 1e15))
+        # Amaranth adds the clocks of the domains used by the design as
+        # ports named after the clock signal of each domain. The clocks of
+        # the domains that are not used are not driven, but their ticks can
+        # still be awaited by the testbenches.
+        clk = self._parts('clk' if domain == 'sync' else f'{domain}_clk')
+        if clk is not None:
+            self._clk[domain] = clk
+
+    def add_testbench(self, constructor, *, background=False):
+        """Add a testbench.
+
+        This has the same meaning as in ``amaranth.sim.Simulator``, but only
+        async functions are supported.
+        """
+        if not inspect.iscoroutinefunction(constructor):
+            raise TypeError('the CXXRTL backend only supports async '
+                            f'testbenches, not {constructor!r}')
+        self._testbenches.append(_Testbench(constructor, background))
+
+    def _port(self, expr):
+        if not isinstance(expr, Signal):
+            raise TypeError('the CXXRTL backend can only access signals, '
+                            f'not {expr!r}')
+        try:
+            return self._ports[id(expr)]
+        except KeyError:
+            raise ValueError(
+                f'{expr!r} cannot be reached through the attributes of the '
+                'toplevel, so it is not a port of the design') from None
+
+    def _step(self):
+        if self._dirty:
+            self._lib.cxxrtl_step(self._handle)
+            self._dirty = False
+
+    @staticmethod
+    def _chunks(width):
+        return 4 * ((width + 31) // 32)
+
+    def _read(self, expr):
+        signal, parts, _ = self._port(expr)
+        self._step()
+        raw = 0
+        for part in parts:
+            if part.type == _CXXRTL_OUTLINE:
+                self._lib.cxxrtl_outline_eval(part.outline)
+            value = int.from_bytes(
+                ctypes.string_at(part.curr, self._chunks(part.width)),
+                'little')
+            raw |= value << part.lsb_at
+        return raw & ((1 << len(signal)) - 1)
+
+    def _write(self, expr, value):
+        signal, parts, is_input = self._port(expr)
+        if not is_input:
+            raise ValueError(f'{signal!r} is driven by the design, so it '
+                             'cannot be set by the testbenches')
+        self._write_parts(parts, value)
+
+    def _write_parts(self, parts, value):
+        for part in parts:
+            data = ((value >> part.lsb_at) & ((1 << part.width) - 1)).to_bytes(
+                self._chunks(part.width), 'little')
+            ctypes.memmove(part.next if part.next else part.curr,
+                           data, len(data))
+        self._dirty = True
+
+    def _edge(self, domains):
+        # Rising edge in the clocks of the given domains. The clocks are set
+        # back to zero after the edge, which is committed by the next step.
+        clocks = [self._clk[d] for d in domains if d in self._clk]
+        self._step()
+        for clk in clocks:
+            self._write_parts(clk, 1)
+        self._step()
+        for clk in clocks:
+            self._write_parts(clk, 0)
+
+    def run(self):
+        """Run the simulation until all the testbenches have finished."""
+        try:
+            ctx = _Context(self)
+            for tb in self._testbenches:
+                tb.coroutine = tb.constructor(ctx)
+                tb.resume()
+            next_edge = {domain: phase
+                         for domain, (_, phase) in self._clocks.items()}
+            while any(tb.coroutine is not None and not tb.background
+                      for tb in self._testbenches):
+                if not next_edge:
+                    raise RuntimeError('testbenches are waiting for a clock '
+                                       'edge, but there are no clocks')
+                now = min(next_edge.values())
+                domains = [d for d, t in next_edge.items() if t == now]
+                for d in domains:
+                    next_edge[d] += self._clocks[d][0]
+                self._edge(domains)
+                for tb in self._testbenches:
+                    if tb.coroutine is None or tb.waiting not in domains:
+                        continue
+                    tb.remaining -= 1
+                    if tb.remaining == 0:
+                        tb.resume()
+        finally:
+            for tb in self._testbenches:
+                if tb.coroutine is not None:
+                    tb.coroutine.close()
+            self._lib.cxxrtl_destroy(self._handle)
+            self._handle = None
@@ -0,0 +1,327 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+"""Process-parallel test runner
+
+This runs the unittest suite in a pool of worker processes. Each test method
+is an independent job. Test methods that have several subtests that set a DUT
+or run a simulation are additionally split into several shards (see
+AmaranthSim.shard), so that the parameterized cases of a test run in
+parallel. These tests are found by running each AmaranthSim test once in
+shard discovery mode (see AmaranthSim.shard_discovery), in which such
+subtests are counted and skipped. Subtests that neither set a DUT nor run a
+simulation are not sharded, so they run in every shard of their test.
+
+Each job seeds the Python and NumPy random number generators with a value
+derived from its job name, so that a failing job can be reproduced by running
+it alone (``-k`` can be used to select it).
+
+Usage (from the maia-hdl directory)::
+
+    python3 -m test.run_parallel [-j JOBS] [--split N] [--report FILE] [names]
+"""
+
+from amaranth.hdl import UnusedElaboratable
+import numpy as np
+
+import argparse
+import concurrent.futures
+import fnmatch
+import io
+import json
+import os
+import random
+import sys
+import time
+import traceback
+import unittest
+import warnings
+import zlib
+
+from .amaranth_sim import AmaranthSim, ShardSkip
+
+
+class _Result(unittest.TestResult):
+    def __init__(self):
+        super().__init__()
+        self.successes = 0
+        self.subtests = 0
+        self.shard_skips = 0
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self.successes += 1
+
+    def addSkip(self, test, reason):
+        if reason.startswith(ShardSkip.reason_prefix):
+            self.shard_skips += 1
+            return
+        super().addSkip(test, reason)
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        self.subtests += 1
+
+
+class Job:
+    """A test method, or one shard of a test method.
+
+    Parameters
+    ----------
+    test_id : str
+        Test id, as given by ``unittest.TestCase.id()``.
+    shard : tuple[int, int] or None
+        Shard ``(index, count)``, or ``None`` to run the whole test.
+    """
+    def __init__(self, test_id, shard=None):
+        self.test_id = test_id
+        self.shard = shard
+
+    @property
+    def name(self):
+        if self.shard is None:
+            return self.test_id
+        return f'{self.test_id}[{self.shard[0]}/{self.shard[1]}]'
+
+    @property
+    def seed(self):
+        return zlib.crc32(self.name.encode())
+
+
+def _run_job(job):
+    # Python and NumPy RNGs are process-wide, so they are seeded for every
+    # job rather than in the worker initializer.
+    random.seed(job.seed)
+    np.random.seed(job.seed)
+    AmaranthSim.shard = job.shard
+    result = _Result()
+    start = time.perf_counter()
+    try:
+        suite = unittest.defaultTestLoader.loadTestsFromName(job.test_id)
+        suite.run(result)
+    except Exception:
+        result.errors.append((job.test_id, traceback.format_exc()))
+    elapsed = time.perf_counter() - start
+    AmaranthSim.shard = None
+    return {
+        'name': job.name,
+        'seed': job.seed,
+        'time': elapsed,
+        'tests': result.testsRun,
+        'subtests': result.subtests,
+        'shard_skips': result.shard_skips,
+        'failures': [(str(t), tb) for t, tb in result.failures],
+        'errors': [(str(t), tb) for t, tb in result.errors],
+        'skipped': [(str(t), r) for t, r in result.skipped],
+    }
+
+
+def _worker_init():
+    # Sharded subtests construct DUTs that are never elaborated.
+    warnings.simplefilter('ignore', UnusedElaboratable)
+    # Keep the output of the workers from interleaving with the report.
+    sys.stdout = io.StringIO()
+
+
+def _iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iter_tests(test)
+        else:
+            yield test
+
+
+def _count_shard_subtests(test_id):
+    # Runs a test in shard discovery mode and returns the number of subtests
+    # that can be sharded. Tests that fail in this mode are not sharded.
+    AmaranthSim.shard_discovery = True
+    AmaranthSim.shard_subtests = set()
+    result = _Result()
+    try:
+        suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+        suite.run(result)
+        ok = not result.failures and not result.errors
+    except Exception:
+        ok = False
+    finally:
+        AmaranthSim.shard_discovery = False
+    return len(AmaranthSim.shard_subtests) if ok else 0
+
+
+def make_jobs(names=None, patterns=None, split=4, processes=None):
+    """Discover the tests and split them into jobs.
+
+    Parameters
+    ----------
+    names : list[str] or None
+        Test names to load, as accepted by ``unittest.TestLoader``. If
+        ``None``, the tests are discovered from the current directory.
+    patterns : list[str] or None
+        Shell-style patterns. Only tests whose id matches one of them are
+        kept.
+    split : int
+        Maximum number of shards for each parameterized test.
+    processes : int or None
+        Number of worker processes used to find the parameterized tests. If
+        ``None``, ``os.cpu_count()`` is used.
+
+    Returns
+    -------
+    list[Job]
+        Jobs to run.
+    """
+    loader = unittest.defaultTestLoader
+    if names:
+        suite = loader.loadTestsFromNames(names)
+    else:
+        suite = loader.discover('.')
+    tests = [test for test in _iter_tests(suite)
+             if not patterns or any(fnmatch.fnmatchcase(test.id(), f'*{p}*')
+                                    for p in patterns)]
+    candidates = [test.id() for test in tests
+                  if split > 1 and isinstance(test, AmaranthSim)]
+    with concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_worker_init) as executor:
+        subtests = dict(zip(
+            candidates, executor.map(_count_shard_subtests, candidates)))
+    jobs = []
+    for test in tests:
+        count = min(split, subtests.get(test.id(), 0))
+        if count > 1:
+            jobs.extend(Job(test.id(), (j, count)) for j in range(count))
+        else:
+            jobs.append(Job(test.id()))
+    return jobs
+
+
+def run(jobs, processes=None, durations=None, verbose=False):
+    """Run jobs in a process pool.
+
+    Parameters
+    ----------
+    jobs : list[Job]
+        Jobs to run.
+    processes : int or None
+        Number of worker processes. If ``None``, ``os.cpu_count()`` is used.
+    durations : dict[str, float] or None
+        Job durations from a previous run. If given, the jobs are submitted
+        longest first, which shortens the total run time.
+    verbose : bool
+        Print a line for each job as it finishes.
+
+    Returns
+    -------
+    list[dict]
+        Job results, in the order in which the jobs were given.
+    """
+    if durations:
+        order = sorted(range(len(jobs)),
+                       key=lambda j: -durations.get(jobs[j].name, np.inf))
+    else:
+        order = range(len(jobs))
+    results = [None] * len(jobs)
+    with concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_worker_init) as executor:
+        futures = {executor.submit(_run_job, jobs[j]): j for j in order}
+        for future in concurrent.futures.as_completed(futures):
+            r = future.result()
+            results[futures[future]] = r
+            ok = not r['failures'] and not r['errors']
+            if verbose or not ok:
+                print(f'{r["name"]} ... {"ok" if ok else "FAIL"} '
+                      f'({r["time"]:.2f}s)', file=sys.stderr, flush=True)
+    return results
+
+
+def report(results, elapsed, slowest=10, stream=sys.stderr):
+    """Print an aggregated report of the job results.
+
+    Returns
+    -------
+    bool
+        ``True`` if all the jobs passed.
+    """
+    sep1 = '=' * 70
+    sep2 = '-' * 70
+    failed = False
+    for r in results:
+        for kind, items in [('FAIL', r['failures']), ('ERROR', r['errors'])]:
+            for test, tb in items:
+                failed = True
+                print(sep1, file=stream)
+                print(f'{kind}: {test} (job {r["name"]}, seed {r["seed"]})',
+                      file=stream)
+                print(sep2, file=stream)
+                print(tb, file=stream)
+    if slowest:
+        print('Slowest jobs:', file=stream)
+        for r in sorted(results, key=lambda r: -r['time'])[:slowest]:
+            print(f'{r["time"]:8.2f}s  {r["name"]}', file=stream)
+    cpu_time = sum(r['time'] for r in results)
+    tests = len({r['name'].split('[')[0] for r in results})
+    skipped = sum(len(r['skipped']) for r in results)
+    print(sep2, file=stream)
+    print(f'Ran {tests} tests in {len(results)} jobs in {elapsed:.3f}s '
+          f'({cpu_time:.3f}s of job time)', file=stream)
+    if failed:
+        nfail = sum(len(r['failures']) for r in results)
+        nerr = sum(len(r['errors']) for r in results)
+        print(f'\nFAILED (failures={nfail}, errors={nerr}, '
+              f'skipped={skipped})', file=stream)
+    else:
+        print(f'\nOK (skipped={skipped})' if skipped else '\nOK', file=stream)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the maia-hdl unittest suite in parallel')
+    parser.add_argument('names', nargs='*',
+                        help='test modules, classes or methods to run '
+                        '(default: discover all the tests)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes '
+                        '(default: number of CPUs)')
+    parser.add_argument('-k', dest='patterns', action='append',
+                        help='only run tests whose id contains this pattern '
+                        '(shell-style wildcards allowed)')
+    parser.add_argument('--split', type=int, default=4,
+                        help='maximum number of shards for each '
+                        'parameterized test '
+                        '(default: %(default)s)')
+    parser.add_argument('--report', default=None,
+                        help='write per-job timings and results as JSON to '
+                        'this file; if it already exists, the timings it '
+                        'contains are used to schedule the longest jobs '
+                        'first')
+    parser.add_argument('--slowest', type=int, default=10,
+                        help='number of slowest jobs to list '
+                        '(default: %(default)s)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print each job as it finishes')
+    args = parser.parse_args()
+
+    durations = None
+    if args.report is not None and os.path.exists(args.report):
+        with open(args.report) as f:
+            durations = {r['name']: r['time'] for r in json.load(f)['jobs']}
+
+    start = time.perf_counter()
+    jobs = make_jobs(args.names, args.patterns, args.split, args.jobs)
+    results = run(jobs, args.jobs, durations, args.verbose)
+    elapsed = time.perf_counter() - start
+    ok = report(results, elapsed, args.slowest)
+
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump({'elapsed': elapsed, 'jobs': results}, f, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
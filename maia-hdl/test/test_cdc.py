@@ -0,0 +1,61 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.cdc import BusSynchronizer
+from .amaranth_sim import AmaranthSim
+
+
+class TestBusSynchronizer(AmaranthSim):
+    def setUp(self):
+        self.width = 32
+        self.o_domain = 'out'
+
+    def test_values(self):
+        for o_period in [5e-9, 31e-9]:
+            with self.subTest(o_period=o_period):
+                self.common_values(o_period)
+
+    def common_values(self, o_period):
+        self.dut = BusSynchronizer('sync', self.o_domain, self.width)
+        num_values = 100
+        values = np.random.randint(0, 2**self.width, size=num_values,
+                                   dtype='uint64')
+        hold_cycles = np.random.randint(1, 30, size=num_values)
+        outputs = set()
+        done = False
+
+        async def set_inputs(ctx):
+            nonlocal done
+            for value, hold in zip(values, hold_cycles):
+                ctx.set(self.dut.i, int(value))
+                await ctx.tick().repeat(int(hold))
+            # The last value eventually reaches the output
+            await ctx.tick().repeat(100)
+            assert ctx.get(self.dut.o) == values[-1]
+            done = True
+
+        async def check_outputs(ctx):
+            while not done:
+                outputs.add(ctx.get(self.dut.o))
+                await ctx.tick(self.o_domain)
+
+        self.simulate([set_inputs, check_outputs],
+                      named_clocks={self.o_domain: o_period})
+        # The output only takes values that were presented in the input, so
+        # its bits are never updated separately
+        assert outputs <= set(int(v) for v in values) | {0}
+        assert len(outputs) > 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.coeff_loader import CoeffLoader
+from .amaranth_sim import AmaranthSim
+
+
+class TestCoeffLoader(AmaranthSim):
+    def setUp(self):
+        self.coeff_width = 18
+        self.coeff_awidth = 10
+        self.table_address = 0x1000_0000
+
+    def test_load(self):
+        for num_coeffs, waddr_start in [(768, 0), (77, 300), (1, 1023)]:
+            with self.subTest(num_coeffs=num_coeffs,
+                              waddr_start=waddr_start):
+                self.common_load(num_coeffs, waddr_start)
+
+    def common_load(self, num_coeffs, waddr_start):
+        self.dut = CoeffLoader(
+            self.coeff_width, self.coeff_awidth, domain_dma='sync',
+            domain_out='out')
+        axi = self.dut.dma.axi
+        coeffs = np.random.randint(
+            -2**(self.coeff_width - 1), 2**(self.coeff_width - 1),
+            size=num_coeffs)
+        table = np.zeros(2 * ((num_coeffs + 1) // 2), 'uint32')
+        table[:num_coeffs] = coeffs.astype('int32').view('uint32')
+        table = table.view('uint64')
+        written = {}
+        done = False
+
+        async def dma_bench(ctx):
+            nonlocal done
+            ctx.set(self.dut.address, self.table_address)
+            ctx.set(self.dut.num_coeffs, num_coeffs)
+            ctx.set(self.dut.waddr_start, waddr_start)
+            ctx.set(self.dut.start, 1)
+            await ctx.tick()
+            ctx.set(self.dut.start, 0)
+            assert ctx.get(self.dut.busy)
+            # Read bursts whose address has been accepted
+            bursts = []
+            beat = 0
+            for cycle in range(5000):
+                if ctx.get(self.dut.done):
+                    break
+                arready = bool(np.random.randint(2))
+                ctx.set(axi.arready, arready)
+                if arready and ctx.get(axi.arvalid):
+                    bursts.append((ctx.get(axi.araddr), ctx.get(axi.arlen)))
+                assert len(bursts) <= 2
+                rvalid = bool(bursts) and bool(np.random.randint(4))
+                ctx.set(axi.rvalid, rvalid)
+                if rvalid:
+                    address, arlen = bursts[0]
+                    assert address % 128 == 0
+                    index = (address - self.table_address) // 8 + beat
+                    ctx.set(axi.rdata, int(table[index]))
+                    ctx.set(axi.rlast, beat == arlen)
+                    if ctx.get(axi.rready):
+                        beat += 1
+                        if beat == arlen + 1:
+                            bursts.pop(0)
+                            beat = 0
+                await ctx.tick()
+            else:
+                raise AssertionError('coefficient load did not finish')
+            await ctx.tick()
+            assert not ctx.get(self.dut.busy)
+            assert not ctx.get(self.dut.error)
+            assert not bursts
+            done = True
+
+        async def out_bench(ctx):
+            while not done:
+                if ctx.get(self.dut.coeff_wren):
+                    waddr = ctx.get(self.dut.coeff_waddr)
+                    assert waddr not in written
+                    written[waddr] = ctx.get(self.dut.coeff_wdata)
+                await ctx.tick('out')
+
+        self.simulate([dma_bench, out_bench], named_clocks={'out': 10e-9})
+
+        expected = {
+            (waddr_start + j) % 2**self.coeff_awidth:
+            int(c) % 2**self.coeff_width
+            for j, c in enumerate(coeffs)}
+        assert written == expected
+
+
+if __name__ == '__main__':
+    unittest.main()
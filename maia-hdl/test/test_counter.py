@@ -0,0 +1,68 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.counter import EventCounter
+from .amaranth_sim import AmaranthSim
+
+
+class TestEventCounter(AmaranthSim):
+    def setUp(self):
+        self.width = 8
+        self.num_cycles = 1000
+        self.events = [int(x) for x in np.random.randint(
+            0, 2, size=self.num_cycles)]
+
+    def test_same_domain(self):
+        self.dut = EventCounter(self.width)
+
+        async def bench(ctx):
+            count = 0
+            for event in self.events:
+                assert ctx.get(self.dut.count) == count
+                ctx.set(self.dut.event, event)
+                await ctx.tick()
+                count = (count + event) % 2**self.width
+
+        self.simulate(bench)
+
+    def test_cdc(self):
+        self.dut = EventCounter(self.width, o_domain='read')
+        readings = []
+        done = False
+
+        async def event_bench(ctx):
+            nonlocal done
+            for event in self.events:
+                ctx.set(self.dut.event, event)
+                await ctx.tick()
+            ctx.set(self.dut.event, 0)
+            await ctx.tick().repeat(10)
+            done = True
+
+        async def read_bench(ctx):
+            while not done:
+                readings.append(ctx.get(self.dut.count))
+                await ctx.tick('read')
+
+        self.simulate([event_bench, read_bench],
+                      named_clocks={'read': 7e-9})
+
+        # The readings wrap around several times. Each increment must be
+        # small, since the read clock is faster.
+        increments = np.diff(readings) % 2**self.width
+        assert np.all(increments <= 1)
+        assert readings[-1] == sum(self.events) % 2**self.width
+
+
+if __name__ == '__main__':
+    unittest.main()
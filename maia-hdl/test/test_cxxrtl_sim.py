@@ -0,0 +1,64 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+import os
+import unittest
+
+from .amaranth_sim import AmaranthSim
+from . import cxxrtl_sim, test_fir, test_spectrum_integrator
+
+# The test cases in this module run long simulations with the cxxrtl
+# backend, reusing the test code of other test cases. They are skipped if
+# Yosys or a C++ compiler are not available, unless MAIA_HDL_REQUIRE_CXXRTL
+# is set in the environment (this is used in CI to make sure that the
+# backend runs).
+requires_cxxrtl = unittest.skipUnless(
+    cxxrtl_sim.available() or os.environ.get('MAIA_HDL_REQUIRE_CXXRTL'),
+    'cxxrtl backend not available')
+
+
+@requires_cxxrtl
+class TestFIRCxxrtl(AmaranthSim):
+    backend = 'cxxrtl'
+
+    FIR4DSP_common = test_fir.TestFIR.FIR4DSP_common
+    fir_common_test = test_fir.TestFIR.fir_common_test
+
+    def test_FIR4DSP_long(self):
+        # Same configuration as TestFIR.test_FIR4DSP_odd_operations, with
+        # 16 times more input samples
+        self.decimation = 4
+        self.operations = 8
+        self.odd_operations = True
+        self.macc_trunc = 0
+        self.min_wait = 4
+        self.max_wait = 16
+        self.num_samples = 2**15
+        self.FIR4DSP_common()
+
+
+@requires_cxxrtl
+class TestSpectrumIntegratorCxxrtl(AmaranthSim):
+    backend = 'cxxrtl'
+
+    setUp = test_spectrum_integrator.TestSpectrumIntegrator.setUp
+    common_model = test_spectrum_integrator.TestSpectrumIntegrator.common_model
+
+    def test_model_long(self):
+        # Long simulation with the same FFT size and number of integrations
+        # as a typical spectrometer configuration. This is too slow for the
+        # pysim backend.
+        self.fft_order_log2 = 12
+        self.nfft = 2**self.fft_order_log2
+        for peak_detect in [False, True]:
+            with self.subTest(peak_detect=peak_detect):
+                self.common_model(64, peak_detect)
+
+
+if __name__ == '__main__':
+    unittest.main()
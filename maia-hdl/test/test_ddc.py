@@ -0,0 +1,232 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.ddc import DDC
+from .amaranth_sim import AmaranthSim
+from .common_edge import CommonEdgeTb
+
+
+def coeff_writes(taps, decimation, operations_minus_one, odd_operations):
+    """Coefficient writes that load the taps of the three DDC stages.
+
+    Returns a list of ``(coeff_waddr, coeff_wdata)`` tuples. The 2 MSBs of
+    the address select the stage.
+    """
+    writes = []
+    for stage, (t, dec, op) in enumerate(
+            zip(taps, decimation, np.array(operations_minus_one) + 1)):
+        if stage == 1:
+            # FIR2DSP
+            coeffs = np.zeros(128, 'int')
+            for j in range(op):
+                coeffs[j::op][:dec] = t[j*dec:][:dec][::-1]
+        else:
+            # FIR4DSP
+            odd = odd_operations[stage // 2]
+            num_coeffs = 256
+            coeffs = np.zeros(num_coeffs, 'int')
+            for j in range(op):
+                coeffs[j::op][:dec] = t[2*j*dec:][:dec][::-1]
+                if not odd or j != op - 1:
+                    coeffs[num_coeffs//2+j::op][:dec] = (
+                            t[(2*j+1)*dec:][:dec][::-1])
+        writes.extend((256 * stage + addr, int(c))
+                      for addr, c in enumerate(coeffs))
+    return writes
+
+
+def hdl_delay(ddc, decimation, *, bypass2=False, bypass3=False):
+    """Number of zeros that align the input of ``DDC.model`` with the hardware.
+
+    The mixer output is delayed by ``ddc.mixer.delay`` samples, and each FIR
+    stage computes its output samples one input sample later than the
+    model. This is the same as preceding the input of the model with zeros.
+    With this input, the NCO phase for the first sample is ``-(delay + 2) *
+    frequency``, and the first output sample of the model is not produced by
+    the hardware.
+    """
+    delay = ddc.mixer.delay
+    total_decimation = 1
+    for d, enabled in zip(decimation, [True, not bypass2, not bypass3]):
+        if enabled:
+            delay += total_decimation
+            total_decimation *= d
+    return delay
+
+
+def hdl_model(ddc, frequency, taps, decimation, re_in, im_in, *,
+              bypass2=False, bypass3=False, **kwargs):
+    """Output of the DDC hardware after reset, computed with ``DDC.model``.
+
+    The first input samples must be zero, since the FIR stages do not
+    compute correctly the outputs that depend on their first inputs.
+    """
+    delay = hdl_delay(ddc, decimation, bypass2=bypass2, bypass3=bypass3)
+    re, im = (np.concatenate((np.zeros(delay, 'int'), x))
+              for x in [re_in, im_in])
+    # The NCO phase is zero at the third input sample after reset
+    phase = -(delay + 2) * frequency % 2**ddc.nco_width
+    re_out, im_out = list(ddc.model(
+        frequency, taps, decimation, [(re, im)], phase=phase,
+        bypass2=bypass2, bypass3=bypass3, **kwargs))[0]
+    # The first output sample of the model is not produced by the hardware
+    return re_out[1:], im_out[1:]
+
+
+class TestDDC(AmaranthSim):
+    def setUp(self):
+        self.domain_3x = 'clk3x'
+        self.dut = DDC(self.domain_3x)
+        self.frequency = 12345678
+        self.decimation = [5, 3, 2]
+        self.taps = [np.random.randint(-2**15, 2**15, size=4 * d)
+                     for d in self.decimation]
+        nsamples = 6000
+        self.re_in, self.im_in = np.random.randint(
+            -2**11, 2**11, size=(2, nsamples))
+
+    def model(self, chunks, **kwargs):
+        out = list(self.dut.model(
+            self.frequency, self.taps, self.decimation, chunks, **kwargs))
+        return tuple(np.concatenate([c[j] for c in out]) for j in range(2))
+
+    def test_model_chunks(self):
+        for kwargs in [{}, {'bypass2': True}, {'bypass3': True},
+                       {'bypass2': True, 'bypass3': True}]:
+            with self.subTest(**kwargs):
+                single = self.model([(self.re_in, self.im_in)], **kwargs)
+                # split input in random chunks, including some empty chunks
+                # and some chunks shorter than the decimation
+                splits = np.sort(np.random.randint(
+                    0, self.re_in.size, size=200))
+                chunks = zip(np.split(self.re_in, splits),
+                             np.split(self.im_in, splits))
+                chunked = self.model(chunks, **kwargs)
+                for a, b in zip(single, chunked):
+                    np.testing.assert_equal(a, b)
+        self.dummy_simulation(named_clocks={self.domain_3x: 4e-9})
+
+    def test_model_vs_stages(self):
+        re, im = self.dut.mixer.model(self.frequency, self.re_in, self.im_in)
+        stages = [self.dut.decimator.stage1, self.dut.decimator.stage2,
+                  self.dut.decimator.stage3]
+        for stage, taps, decimation in zip(
+                stages, self.taps, self.decimation):
+            re, im = stage.model(taps, decimation, re, im)
+        out_re, out_im = self.model([(self.re_in, self.im_in)])
+        np.testing.assert_equal(out_re, re)
+        np.testing.assert_equal(out_im, im)
+        self.dummy_simulation(named_clocks={self.domain_3x: 4e-9})
+
+    def test_model_operations(self):
+        # with operations_minus_one, the taps are padded or truncated to the
+        # FIR length implied by the hardware configuration
+        kwargs = {'operations_minus_one': [1, 4, 2],
+                  'odd_operations': [True, False]}
+        d1, d2, d3 = self.decimation
+        padded_taps = [
+            self.taps[0][:3 * d1],
+            np.concatenate((self.taps[1], np.zeros(d2, 'int'))),
+            np.concatenate((self.taps[2], np.zeros(2 * d3, 'int'))),
+        ]
+        expected = list(self.dut.model(
+            self.frequency, padded_taps, self.decimation,
+            [(self.re_in, self.im_in)]))[0]
+        out = self.model([(self.re_in, self.im_in)], **kwargs)
+        for a, b in zip(expected, out):
+            np.testing.assert_equal(a, b)
+        self.dummy_simulation(named_clocks={self.domain_3x: 4e-9})
+
+    def test_model_vs_hdl(self):
+        ddc = self.dut
+        for frequency, kwargs in [
+                (self.frequency, {}),
+                (-self.frequency // 3, {}),
+                (self.frequency, {'bypass2': True}),
+                (self.frequency, {'bypass3': True}),
+                (self.frequency, {'bypass2': True, 'bypass3': True})]:
+            with self.subTest(frequency=frequency, **kwargs):
+                self.common_model_vs_hdl(ddc, frequency, **kwargs)
+
+    def common_model_vs_hdl(self, ddc, frequency, bypass2=False,
+                            bypass3=False):
+        self.dut = CommonEdgeTb(ddc, [(self.domain_3x, 3, 'common_edge')])
+        # The taps of setUp give 2 operations in stages 1 and 3 and 4
+        # operations in stage 2
+        operations_minus_one = [1, 3, 1]
+        odd_operations = [False, False]
+        nsamples = 2000
+        re_in, im_in = self.re_in[:nsamples], self.im_in[:nsamples]
+        # see hdl_model
+        keep_out = 20
+        re_in[:keep_out] = 0
+        im_in[:keep_out] = 0
+        expected_re, expected_im = hdl_model(
+            ddc, frequency, self.taps, self.decimation, re_in, im_in,
+            bypass2=bypass2, bypass3=bypass3,
+            operations_minus_one=operations_minus_one,
+            odd_operations=odd_operations)
+        re_out = []
+        im_out = []
+
+        def read_output(ctx):
+            if ctx.get(ddc.strobe_out):
+                re_out.append(ctx.get(ddc.re_out))
+                im_out.append(ctx.get(ddc.im_out))
+
+        async def bench(ctx):
+            ctx.set(ddc.frequency, frequency % 2**ddc.nco_width)
+            for j in range(3):
+                ctx.set(getattr(ddc, f'decimation{j + 1}'),
+                        self.decimation[j])
+                ctx.set(getattr(ddc, f'operations_minus_one{j + 1}'),
+                        operations_minus_one[j])
+            ctx.set(ddc.odd_operations1, odd_operations[0])
+            ctx.set(ddc.odd_operations3, odd_operations[1])
+            ctx.set(ddc.bypass2, bypass2)
+            ctx.set(ddc.bypass3, bypass3)
+            for addr, coeff in coeff_writes(
+                    self.taps, self.decimation, operations_minus_one,
+                    odd_operations):
+                ctx.set(ddc.coeff_wren, 1)
+                ctx.set(ddc.coeff_waddr, addr)
+                ctx.set(ddc.coeff_wdata, coeff)
+                await ctx.tick()
+            ctx.set(ddc.coeff_wren, 0)
+            ctx.set(ddc.enable_input, 1)
+            # input samples in every other clock cycle
+            for re, im in zip(re_in, im_in):
+                ctx.set(ddc.re_in, int(re))
+                ctx.set(ddc.im_in, int(im))
+                ctx.set(ddc.strobe_in, 1)
+                await ctx.tick()
+                read_output(ctx)
+                ctx.set(ddc.strobe_in, 0)
+                await ctx.tick()
+                read_output(ctx)
+            # flush the output
+            for _ in range(100):
+                await ctx.tick()
+                read_output(ctx)
+
+        self.simulate(bench, named_clocks={self.domain_3x: 4e-9})
+        # The number of output samples can differ by one, because the
+        # hardware computes them one input sample later than the model
+        num_out = min(len(re_out), expected_re.size)
+        assert num_out >= expected_re.size - 1
+        np.testing.assert_equal(re_out[:num_out], expected_re[:num_out])
+        np.testing.assert_equal(im_out[:num_out], expected_im[:num_out])
+
+
+if __name__ == '__main__':
+    unittest.main()
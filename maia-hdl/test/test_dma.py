@@ -0,0 +1,329 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+from amaranth.lib.memory import Memory
+import numpy as np
+
+import unittest
+
+from maia_hdl.dma import DmaBRAMWrite, DmaStreamWrite
+from .amaranth_sim import AmaranthSim
+
+
+class DmaBRAMWriteTb(Elaboratable):
+    def __init__(self, dma, bram_data):
+        self.dma = dma
+        self.bram_data = bram_data
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.dma = dma = self.dma
+        m.submodules.mem = mem = Memory(
+            shape=len(dma.rdata), depth=len(self.bram_data),
+            init=self.bram_data)
+        rdport = mem.read_port()
+        # BRAM output register, as in the SpectrumIntegrator
+        with m.If(dma.ren):
+            m.d.sync += dma.rdata.eq(rdport.data)
+        m.d.comb += [
+            rdport.en.eq(dma.ren),
+            rdport.addr.eq(dma.raddr),
+        ]
+        return m
+
+
+class TestDmaBRAMWrite(AmaranthSim):
+    def setUp(self):
+        self.base_address = 0x1000_0000
+        self.num_buffers_log2 = 2
+        self.bram_awidth = 7
+        self.bram_data = [int(x) for x in np.random.randint(
+            0, 2**63, size=2**self.bram_awidth, dtype='uint64')]
+
+    def test_fixed_length(self):
+        self.common_transfers([None] * 5)
+
+    def test_runtime_length(self):
+        self.common_transfers([7, 5, 6, 5, 7, 6], min_length_log2=5)
+
+    def test_narrow(self):
+        self.common_transfers([None] * 5, narrow=[True, False, True, True,
+                                                  False])
+
+    def test_narrow_runtime_length(self):
+        self.common_transfers([7, 5, 6, 5], min_length_log2=5,
+                              narrow=[False, True, True, False])
+
+    def test_narrow_backpressure(self):
+        self.common_transfers([7, 5, 6, 5, 7], min_length_log2=5,
+                              narrow=[True, True, False, True, False],
+                              backpressure=True)
+
+    def test_runtime_address(self):
+        buffer_size = 8 * 2**self.bram_awidth
+        ring_buffers = (
+            [(self.base_address, self.num_buffers_log2)] * 3
+            # Misaligned base address, which is ignored
+            + [(self.base_address + buffer_size, 1)] * 2
+            + [(0x2000_0000, 3)] * 9
+            + [(0x2000_0000 + 2 * buffer_size, 1)] * 3
+            + [(0x2000_0000, 0)] * 2)
+        self.common_transfers([None] * len(ring_buffers),
+                              ring_buffers=ring_buffers, max_buffers_log2=3)
+
+    def test_header(self):
+        self.common_transfers([None] * 5, header_words=4)
+
+    def test_header_runtime(self):
+        buffer_size = 8 * 2**self.bram_awidth
+        ring_buffers = (
+            [(self.base_address, self.num_buffers_log2)] * 5
+            + [(0x2000_0000 + 2 * buffer_size, 1)] * 3)
+        self.common_transfers([7, 5, 6, 5, 7, 6, 5, 7], min_length_log2=5,
+                              narrow=[False, True, False, True, True, False,
+                                      True, False],
+                              ring_buffers=ring_buffers, max_buffers_log2=3,
+                              header_words=2)
+
+    def common_transfers(self, lengths_log2, min_length_log2=None,
+                         narrow=None, ring_buffers=None,
+                         max_buffers_log2=None, header_words=0,
+                         backpressure=False):
+        narrow_width = None if narrow is None else 32
+        self.dma = DmaBRAMWrite(
+            self.base_address, self.num_buffers_log2, self.bram_awidth,
+            min_length_log2=min_length_log2, narrow_width=narrow_width,
+            max_buffers_log2=max_buffers_log2, header_words=header_words)
+        self.dut = DmaBRAMWriteTb(self.dma, self.bram_data)
+        axi = self.dma.axi
+        buffer_size = 8 * 2**self.bram_awidth
+
+        async def bench(ctx):
+            ctx.set(axi.awready, 1)
+            ctx.set(axi.wready, 1)
+            addresses = []
+            expected_addresses = []
+            base_address = self.base_address
+            num_buffers_log2 = self.num_buffers_log2
+            buffer = -1
+            for n, length_log2 in enumerate(lengths_log2):
+                if ring_buffers is not None:
+                    new_base, new_buffers_log2 = ring_buffers[n]
+                    ctx.set(self.dma.base_address_in, new_base)
+                    ctx.set(self.dma.num_buffers_log2_in, new_buffers_log2)
+                    error = new_base % (buffer_size
+                                        * 2**new_buffers_log2) != 0
+                    assert ctx.get(self.dma.address_error) == error
+                    if not error and (
+                            (new_base, new_buffers_log2)
+                            != (base_address, num_buffers_log2)):
+                        base_address = new_base
+                        num_buffers_log2 = new_buffers_log2
+                        buffer = -1
+
+                if length_log2 is None:
+                    length_log2 = self.bram_awidth
+                else:
+                    ctx.set(self.dma.length_log2, length_log2)
+                is_narrow = narrow is not None and narrow[n]
+                if narrow is not None:
+                    ctx.set(self.dma.narrow, is_narrow)
+                header = [int(x) for x in np.random.randint(
+                    0, 2**63, size=header_words, dtype='uint64')]
+                if header_words:
+                    ctx.set(self.dma.header,
+                            sum(x << (64 * j) for j, x in enumerate(header)))
+                ctx.set(self.dma.start, 1)
+                await ctx.tick()
+                ctx.set(self.dma.start, 0)
+                data = []
+                wstrb = []
+                sizes = []
+                wlast = []
+                bvalid = False
+                while True:
+                    if ctx.get(axi.awvalid):
+                        addresses.append(ctx.get(axi.awaddr))
+                        sizes.append(ctx.get(axi.awsize))
+                    if backpressure:
+                        ctx.set(axi.wready, np.random.randint(2))
+                    w_handshake = bool(ctx.get(axi.wvalid)
+                                       and ctx.get(axi.wready))
+                    if w_handshake:
+                        data.append(ctx.get(axi.wdata))
+                        wstrb.append(ctx.get(axi.wstrb))
+                        wlast.append(ctx.get(axi.wlast))
+                    # Write response in the cycle after the last beat of
+                    # each burst
+                    bvalid = w_handshake and bool(ctx.get(axi.wlast))
+                    if not ctx.get(self.dma.busy) and not bvalid:
+                        break
+                    await ctx.tick()
+                    ctx.set(axi.bvalid, bvalid)
+                await ctx.tick()
+                ctx.set(axi.bvalid, 0)
+
+                buffer = (buffer + 1) % 2**num_buffers_log2
+                assert ctx.get(self.dma.last_buffer) == buffer
+                nwords = 2**length_log2
+                # Narrow transfers pack two words in each beat
+                nbeats = nwords // 2 if is_narrow else nwords
+                assert len(data) == nbeats + header_words
+                expected_addresses.extend(
+                    base_address + buffer * buffer_size + 128 * j
+                    for j in range(nbeats // 16))
+                if header_words:
+                    # The header ring follows the ring-buffer
+                    expected_addresses.append(
+                        base_address + buffer_size * 2**num_buffers_log2
+                        + 8 * header_words * buffer)
+                    assert data[nbeats:] == header
+                    assert wstrb[nbeats:] == [0xff] * header_words
+                    assert wlast[nbeats:] == (
+                        [False] * (header_words - 1) + [True])
+                    if sizes:
+                        assert sizes[-1] == 3
+                    data = data[:nbeats]
+                    wstrb = wstrb[:nbeats]
+                    wlast = wlast[:nbeats]
+                    sizes = sizes[:-1]
+                if is_narrow:
+                    lsbs = [x & (2**32 - 1) for x in self.bram_data[:nwords]]
+                    assert data == [x | (y << 32)
+                                    for x, y in zip(lsbs[::2], lsbs[1::2])]
+                else:
+                    assert data == self.bram_data[:nwords]
+                assert wstrb == [0xff] * nbeats
+                if min_length_log2 is not None or narrow is not None:
+                    assert sizes == [3] * (nbeats // 16)
+                assert wlast == [j % 16 == 15 for j in range(nbeats)]
+
+            if (min_length_log2 is None and narrow is None
+                    and ring_buffers is None):
+                # The addresses of the next buffers are issued before the
+                # corresponding transfers start.
+                addresses = addresses[:len(expected_addresses)]
+            assert addresses == expected_addresses, \
+                f'addresses = {addresses}, expected {expected_addresses}'
+
+        self.simulate(bench)
+
+
+class TestDmaStreamWrite(AmaranthSim):
+    def setUp(self):
+        self.start_address = 0x1000
+        self.end_address = 0x1800
+
+    def test_circular(self):
+        self.common_circular()
+
+    def test_circular_outstanding(self):
+        for burst_len_log2 in [4, 2]:
+            with self.subTest(burst_len_log2=burst_len_log2):
+                self.common_circular(
+                    burst_len_log2=burst_len_log2, max_outstanding_bursts=4,
+                    max_outstanding_b_log2=3, b_latency=20)
+
+    def common_circular(self, burst_len_log2=4, max_outstanding_bursts=2,
+                        max_outstanding_b_log2=2, b_latency=0):
+        self.dut = DmaStreamWrite(
+            self.start_address, self.end_address, circular=True,
+            burst_len_log2=burst_len_log2,
+            max_outstanding_bursts=max_outstanding_bursts,
+            max_outstanding_b_log2=max_outstanding_b_log2)
+        axi = self.dut.axi
+        burst_len = 2**burst_len_log2
+        ring_size = self.end_address - self.start_address
+        watermark_bursts = 3
+        # The consumer reads all the available data every consume_period
+        # cycles, except between stall_start and stall_end.
+        consume_period = 50
+        stall_start = 2000
+        stall_end = 3000
+        num_cycles = 4000
+
+        async def bench(ctx):
+            ctx.set(axi.awready, 1)
+            ctx.set(axi.wready, 1)
+            ctx.set(self.dut.stream_valid, 1)
+            ctx.set(self.dut.circular_mode, 1)
+            ctx.set(self.dut.watermark_bursts, watermark_bursts)
+            ctx.set(self.dut.read_pointer, self.start_address)
+            ctx.set(self.dut.start, 1)
+            await ctx.tick()
+            ctx.set(self.dut.start, 0)
+            memory = {}
+            bursts = []
+            # Cycles at which the pending write responses are sent
+            responses = []
+            beat = 0
+            num_bursts = 0
+            num_watermarks = 0
+            stream_count = 0
+            read_pointer = self.start_address
+            consumed = 0
+            for cycle in range(num_cycles + 100):
+                if cycle == stall_start:
+                    assert not ctx.get(self.dut.overrun)
+                if cycle == stall_end:
+                    assert ctx.get(self.dut.overrun)
+                finished = ctx.get(self.dut.finished)
+                if finished or (cycle % consume_period == 0
+                                and not stall_start <= cycle < stall_end):
+                    write_pointer = ctx.get(self.dut.write_pointer)
+                    while read_pointer != write_pointer:
+                        # Data that has not been consumed yet is never
+                        # overwritten.
+                        assert memory[read_pointer] == consumed
+                        consumed += 1
+                        read_pointer += 8
+                        if read_pointer == self.end_address:
+                            read_pointer = self.start_address
+                    ctx.set(self.dut.read_pointer, read_pointer)
+                if finished:
+                    break
+                ctx.set(self.dut.stop, cycle == num_cycles)
+                num_watermarks += ctx.get(self.dut.watermark)
+                if ctx.get(axi.awvalid):
+                    address = ctx.get(axi.awaddr)
+                    assert (self.start_address <= address
+                            < self.end_address)
+                    bursts.append(address)
+                assert len(bursts) <= max_outstanding_bursts
+                if ctx.get(axi.wvalid):
+                    memory[bursts[0] + 8 * beat] = ctx.get(axi.wdata)
+                    beat += 1
+                    stream_count += 1
+                    if ctx.get(axi.wlast):
+                        assert beat == burst_len
+                        bursts.pop(0)
+                        beat = 0
+                        responses.append(cycle + b_latency)
+                        num_bursts += 1
+                # Write response in the cycle after the last beat of each
+                # burst, plus the latency
+                bvalid = bool(responses) and responses[0] <= cycle
+                if bvalid:
+                    responses.pop(0)
+                ctx.set(self.dut.stream_data, stream_count)
+                await ctx.tick()
+                ctx.set(axi.bvalid, bvalid)
+            else:
+                raise AssertionError('DMA did not finish')
+            assert not bursts and not responses
+            assert consumed == stream_count
+            # The data wraps around the ring-buffer several times.
+            assert consumed > 4 * ring_size // 8
+            assert num_watermarks == num_bursts // watermark_bursts
+
+        self.simulate(bench)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,7 @@ import numpy as np
 import unittest
 
 from maia_hdl.fft import R2SDF, R4SDF, R22SDF, TwiddleI, Twiddle, Window, FFT
-from maia_hdl.util import bit_invert
+from maia_hdl.util import bit_invert_table
 from .amaranth_sim import AmaranthSim
 from .common_edge import CommonEdgeTb
 
@@ -206,6 +206,25 @@ class TestTwiddle(AmaranthSim):
                            storage='bram')
         self.common_test_model()
 
+    def test_twiddles_shared(self):
+        twiddles = [Twiddle(3, 2, self.width, self.width, storage='lut',
+                            r22_mode=True)
+                    for _ in range(2)]
+        tw_re, tw_im = twiddles[0].twiddles_full()
+        # the tables are cached, shared by all the instances, and read-only
+        for a, b in zip(twiddles[1].twiddles_full(), [tw_re, tw_im]):
+            self.assertIs(a, b)
+            self.assertFalse(a.flags.writeable)
+        expected = np.round(
+            2**(self.width - 2)
+            * np.exp(-1j*np.pi*np.array([0, 2, 1, 3])[:, np.newaxis]
+                     * np.arange(16)/32)).ravel()
+        np.testing.assert_equal(tw_re, expected.real)
+        np.testing.assert_equal(tw_im, expected.imag)
+
+        for self.dut in twiddles:
+            self.dummy_simulation()
+
     def common_test_model(self):
         n_vec = 64
         adv = self.dut.twiddle_index_advance
@@ -345,9 +364,7 @@ class TestFFT(AmaranthSim):
             out_npy *= fft_size
         # Perform bit-order inversion at the output of the numpy FFT.
         bitinvert_radix = radix_log2 if radix != 'R22' else 1
-        invert = np.array([
-            bit_invert(n, self.order_log2, bitinvert_radix)
-            for n in range(fft_size)])
+        invert = bit_invert_table(self.order_log2, bitinvert_radix)
         out_npy = out_npy[:, invert].ravel()
         relative_error = np.sqrt(
             np.sum(np.abs(out_complex - out_npy)**2)
@@ -358,15 +375,6 @@ class TestFFT(AmaranthSim):
              f'model: {out_complex}\n'
              f'numpy: {out_npy}')
 
-    def dummy_simulation(self):
-        # Dummy simulation, to keep amaranth happy (otherwise amaranth
-        # complains that we didn't use the DUT if we only use it to run
-        # the model).
-        async def dummy(ctx):
-            pass
-
-        self.simulate(dummy)
-
     def test_deltas_and_exps_radix2(self):
         self.radix = 2
         self.fft = FFT(self.width, self.order_log2, self.radix,
@@ -472,7 +480,53 @@ class TestFFT(AmaranthSim):
                        truncates=truncates)
         self.common_deltas_and_exps()
 
-    def common_deltas_and_exps(self, vcd=None):
+    def test_deltas_and_exps_runtime_size_radix2(self):
+        self.radix = 2
+        for size_log2 in [3, 5]:
+            with self.subTest(size_log2=size_log2):
+                self.fft = FFT(self.width, self.order_log2, self.radix,
+                               butterfly_storage='bram', use_bram_reg=False,
+                               min_order_log2=3)
+                self.common_deltas_and_exps(size_log2=size_log2)
+
+    def test_deltas_and_exps_runtime_size_radix22_window_cmult3x(self):
+        self.radix = 'R22'
+        self.domain_2x = 'clk2x'
+        self.domain_3x = 'clk3x'
+        truncates = [[0, 1]] * (self.order_log2 // 2)
+        for size_log2 in [2, 4, 6]:
+            with self.subTest(size_log2=size_log2):
+                self.fft = FFT(self.width, self.order_log2, self.radix,
+                               truncates=truncates, use_bram_reg=True,
+                               window='blackmanharris', cmult3x=True,
+                               domain_2x=self.domain_2x,
+                               domain_3x=self.domain_3x,
+                               min_order_log2=2)
+                self.common_deltas_and_exps(size_log2=size_log2)
+
+    def test_model_runtime_size(self):
+        # The FFT with a bypassed stage is compared with an FFT of the
+        # smaller size that has the same truncates and datapath widths.
+        truncates = [[0, 1]] * (self.order_log2 // 2)
+        self.dut = FFT(self.width, self.order_log2, 'R22',
+                       truncates=truncates, min_order_log2=2)
+        size_log2 = self.order_log2 - 2
+        small = FFT(self.width + 1, size_log2, 'R22',
+                    truncates=truncates[1:])
+        Fragment.get(small, None)
+        self.dummy_simulation()  # keep amaranth happy
+        re_in, im_in = (
+            np.random.randint(-2**(self.width-2), 2**(self.width-2),
+                              size=64 * 2**size_log2)
+            for _ in range(2))
+        re_out, im_out = self.dut.model(re_in, im_in, size_log2)
+        re_small, im_small = small.model(2 * re_in, 2 * im_in)
+        np.testing.assert_equal(re_out, re_small)
+        np.testing.assert_equal(im_out, im_small)
+        with self.assertRaises(ValueError):
+            self.dut.model(re_in, im_in, size_log2 - 1)
+
+    def common_deltas_and_exps(self, vcd=None, size_log2=None):
         domains = []
         if hasattr(self, 'domain_2x'):
             domains.append((self.domain_2x, 2, 'common_edge_2x'))
@@ -481,7 +535,8 @@ class TestFFT(AmaranthSim):
         self.dut = CommonEdgeTb(self.fft, domains)
         self.radix_log2 = (2 if self.radix == 'R22'
                            else int(np.log2(self.radix)))
-        fft_size = self.fft_size
+        fft_size = (self.fft_size if size_log2 is None
+                    else 2**size_log2)
         # Required when the FFT uses a window, in order to fill
         # up the pipeline of the window BRAM.
         input_zeros = np.zeros(fft_size)
@@ -495,6 +550,8 @@ class TestFFT(AmaranthSim):
         im_in = [int(a) for a in np.round(input_all).imag]
 
         async def set_inputs(ctx):
+            if size_log2 is not None:
+                ctx.set(self.fft.size_log2, size_log2)
             for j in range(len(re_in)):
                 await ctx.tick()
                 ctx.set(self.fft.clken, 1)
@@ -505,7 +562,7 @@ class TestFFT(AmaranthSim):
             ctx.set(self.fft.im_in, 0)
 
         async def read_outputs(ctx):
-            await ctx.tick().repeat(self.fft.delay)
+            await ctx.tick().repeat(self.fft.size_delay(size_log2))
             re_out, im_out = (
                 np.empty(input_all.size, 'int') for _ in range(2))
             for j in range(input_all.size):
@@ -517,7 +574,7 @@ class TestFFT(AmaranthSim):
                     assert out_last
                 else:
                     assert not out_last
-            re_model, im_model = self.fft.model(re_in, im_in)
+            re_model, im_model = self.fft.model(re_in, im_in, size_log2)
             np.testing.assert_equal(re_out, re_model)
             np.testing.assert_equal(im_out, im_model)
 
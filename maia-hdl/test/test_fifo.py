@@ -0,0 +1,72 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.fifo import AsyncFifoBRAM
+from .amaranth_sim import AmaranthSim
+
+
+class TestAsyncFifoBRAM(AmaranthSim):
+    def setUp(self):
+        self.width = 32
+        self.depth_log2 = 6
+        self.dut = AsyncFifoBRAM(self.width, self.depth_log2,
+                                 r_domain='read', w_domain='sync')
+
+    def test_fifo(self):
+        depth = 2**self.depth_log2
+        # More words than the FIFO depth are written in a burst, so the FIFO
+        # becomes full.
+        num_words = depth + 16
+        data = [int(x) for x in np.random.randint(
+            0, 2**self.width, size=num_words, dtype='uint64')]
+        read = []
+        written = []
+
+        async def write_bench(ctx):
+            ctx.set(self.dut.reset, 1)
+            await ctx.tick().repeat(4)
+            ctx.set(self.dut.reset, 0)
+            await ctx.tick().repeat(4)
+            for x in data:
+                ctx.set(self.dut.data_in, x)
+                ctx.set(self.dut.wren, 1)
+                full = ctx.get(self.dut.full)
+                if not full:
+                    written.append(x)
+                await ctx.tick()
+                ctx.set(self.dut.wren, 0)
+                assert ctx.get(self.dut.wrerr) == full
+
+        async def read_bench(ctx):
+            # Wait until the FIFO is full before reading
+            await ctx.tick('read').repeat(3 * num_words)
+            assert ctx.get(self.dut.high_water_mark) == depth
+            valid = False
+            for _ in range(3 * num_words):
+                if valid:
+                    read.append(ctx.get(self.dut.data_out))
+                valid = not ctx.get(self.dut.empty)
+                ctx.set(self.dut.rden, valid)
+                await ctx.tick('read')
+            assert ctx.get(self.dut.level) == 0
+            assert ctx.get(self.dut.high_water_mark) == depth
+
+        self.simulate([write_bench, read_bench],
+                      named_clocks={'read': 7e-9})
+
+        assert len(written) == depth
+        assert read == written
+
+
+if __name__ == '__main__':
+    unittest.main()
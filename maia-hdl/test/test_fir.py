@@ -10,6 +10,8 @@ from amaranth import *
 import numpy as np
 import scipy.signal
 
+import os
+import tempfile
 import unittest
 
 from maia_hdl.fir import FIR4DSP, FIR2DSP, FIRDecimator3Stage
@@ -102,9 +104,163 @@ class TestFIR(AmaranthSim):
         self.max_wait = 16
         self.fir_common_test()
 
+    def test_FIR4DSP_shadow(self):
+        self.dut = FIR4DSP(macc_trunc=0, shadow=True)
+        self.decimation = 4
+        # (operations, odd_operations) before and after apply
+        self.shadow_config = [(3, False), (4, True)]
+        self.shadow_common_test()
+
+    def test_FIR2DSP_shadow(self):
+        self.dut = FIR2DSP(macc_trunc=0, shadow=True)
+        self.decimation = 3
+        self.shadow_config = [(5, False), (7, False)]
+        self.shadow_common_test()
+
+    def coeff_layout(self, taps, operations, odd_operations):
+        dec = self.decimation
+        op = operations
+        if isinstance(self.dut, FIR2DSP):
+            coeffs = np.zeros(128, 'int')
+            for j in range(op):
+                coeffs[j::op][:dec] = taps[j*dec:][:dec][::-1]
+            return coeffs
+        num_coeffs = 256
+        coeffs = np.zeros(num_coeffs, 'int')
+        for j in range(op):
+            coeffs[j::op][:dec] = taps[2*j*dec:][:dec][::-1]
+            if not odd_operations or j != op - 1:
+                coeffs[num_coeffs//2+j::op][:dec] = (
+                        taps[(2*j+1)*dec:][:dec][::-1])
+        return coeffs
+
+    def shadow_common_test(self):
+        is_fir4dsp = isinstance(self.dut, FIR4DSP)
+        taps = []
+        coeffs = []
+        for operations, odd in self.shadow_config:
+            if is_fir4dsp:
+                num_taps = self.dut.num_taps(
+                    self.decimation, operations - 1, odd)
+            else:
+                num_taps = self.dut.num_taps(self.decimation, operations - 1)
+            taps.append(np.random.randint(-2**10, 2**10, size=num_taps))
+            coeffs.append(self.coeff_layout(taps[-1], operations, odd))
+
+        re_in, im_in = np.random.randint(-2**10, 2**10, size=(2, 1200))
+        keep_out = 7
+        re_in[:keep_out] = 0
+        im_in[:keep_out] = 0
+        models = [self.dut.model(t, self.decimation, re_in, im_in)
+                  for t in taps]
+        # see fir_common_test
+        drop_samples = 1
+        nout = re_in.size // self.decimation - 1
+        re_out = np.empty(nout, 'int')
+        im_out = np.empty_like(re_out)
+        outputs = 0
+        outputs_at_apply = None
+        loaded = False
+
+        def set_config(ctx, config):
+            operations, odd = config
+            ctx.set(self.dut.operations_minus_one, operations - 1)
+            if is_fir4dsp:
+                ctx.set(self.dut.odd_operations, odd)
+
+        async def configure(ctx):
+            nonlocal loaded, outputs_at_apply
+            ctx.set(self.dut.decimation, self.decimation)
+            set_config(ctx, self.shadow_config[0])
+            # load the first coefficients directly
+            for addr, coeff in enumerate(coeffs[0]):
+                await ctx.tick()
+                ctx.set(self.dut.coeff_wren, 1)
+                ctx.set(self.dut.coeff_waddr, addr)
+                ctx.set(self.dut.coeff_wdata, int(coeff))
+            await ctx.tick()
+            ctx.set(self.dut.coeff_wren, 0)
+            ctx.set(self.dut.shadow_mode, 1)
+            await ctx.tick()
+            loaded = True
+
+            # write the second configuration to the shadow while the FIR
+            # is running
+            while outputs < 30:
+                await ctx.tick()
+            set_config(ctx, self.shadow_config[1])
+            for addr, coeff in enumerate(coeffs[1]):
+                ctx.set(self.dut.coeff_wren, 1)
+                ctx.set(self.dut.coeff_waddr, addr)
+                ctx.set(self.dut.coeff_wdata, int(coeff))
+                await ctx.tick()
+            ctx.set(self.dut.coeff_wren, 0)
+            ctx.set(self.dut.apply, 1)
+            outputs_at_apply = outputs
+            await ctx.tick()
+            ctx.set(self.dut.apply, 0)
+            await ctx.tick()
+            assert ctx.get(self.dut.apply_pending)
+            while ctx.get(self.dut.apply_pending):
+                await ctx.tick()
+
+        async def feed_samples(ctx):
+            while not loaded:
+                await ctx.tick()
+            for re, im in zip(re_in[drop_samples:], im_in[drop_samples:]):
+                ctx.set(self.dut.in_valid, 1)
+                ctx.set(self.dut.re_in, int(re))
+                ctx.set(self.dut.im_in, int(im))
+                while True:
+                    await ctx.tick()
+                    if ctx.get(self.dut.in_ready):
+                        break
+            ctx.set(self.dut.in_valid, 0)
+
+        async def check_outputs(ctx):
+            nonlocal outputs
+            while outputs < nout:
+                await ctx.tick()
+                if ctx.get(self.dut.strobe_out):
+                    re_out[outputs] = ctx.get(self.dut.re_out)
+                    im_out[outputs] = ctx.get(self.dut.im_out)
+                    outputs += 1
+
+        self.simulate([configure, feed_samples, check_outputs])
+
+        # The output must switch from the old configuration to the new
+        # configuration at a single output sample shortly after apply.
+        match = [(re_out == re[:nout]) & (im_out == im[:nout])
+                 for re, im in models]
+        switch = np.argmin(match[0])
+        assert not match[0][switch], 'configuration was not applied'
+        assert outputs_at_apply <= switch <= outputs_at_apply + 2
+        assert np.all(match[1][switch:]), 'outputs do not match new config'
+
+    def test_model_vs_numpy(self):
+        for fir in [FIR4DSP, FIR2DSP]:
+            for decimation in [1, 2, 5]:
+                with self.subTest(fir=fir.__name__, decimation=decimation):
+                    self.model_vs_numpy(fir, decimation)
+
+    def model_vs_numpy(self, fir, decimation):
+        # use a large output width and no truncation, so that the model
+        # output is an exact decimated convolution
+        self.dut = fir(macc_trunc=0, out_width=48)
+        taps = np.random.randint(-2**17, 2**17, size=7 * decimation)
+        re_in, im_in = np.random.randint(-2**15, 2**15, size=(2, 100003))
+        model_re, model_im = self.dut.model(taps, decimation, re_in, im_in)
+        nout = re_in.size // decimation
+        for x, y in [(re_in, model_re), (im_in, model_im)]:
+            expected = np.convolve(x, taps)[:nout * decimation:decimation]
+            np.testing.assert_equal(y, expected)
+        self.dummy_simulation()  # keep amaranth happy
+
     def fir_common_test(self):
         assert self.taps.size == self.num_taps
-        re_in = np.zeros(2048, 'int')
+        if not hasattr(self, 'num_samples'):
+            self.num_samples = 2048
+        re_in = np.zeros(self.num_samples, 'int')
         for j in range(self.decimation):
             re_in[4 * self.num_taps * j + j + 10] = 1
         im_in = np.random.randint(-2**15, 2**15, size=re_in.size)
@@ -318,7 +474,8 @@ class TestFIRDecimator(AmaranthSim):
                         out[2 * j] = ctx.get(self.dut.re_out)
                         out[2 * j + 1] = ctx.get(self.dut.im_out)
                         break
-            out.tofile('decimator_out.cs16')
+            with tempfile.TemporaryDirectory() as tmpdir:
+                out.tofile(os.path.join(tmpdir, 'decimator_out.cs16'))
 
         self.simulate([set_inputs, write_output])
 
@@ -11,7 +11,8 @@ import numpy as np
 
 import unittest
 
-from maia_hdl.floating_point import IQToFloatingPoint, MakeCommonExponent
+from maia_hdl.floating_point import (
+    IQToFloatingPoint, MakeCommonExponent, ToFloat32)
 from .amaranth_sim import AmaranthSim
 from .common_edge import CommonEdgeTb
 
@@ -108,5 +109,42 @@ class TestMakeCommonExponent(AmaranthSim):
         self.simulate(bench)
 
 
+class TestToFloat32(AmaranthSim):
+    def test_random_inputs(self):
+        width = 47
+        exponent_width = 3
+        max_exponent = 4
+        self.dut = ToFloat32(width, exponent_width, is_power=True)
+
+        num_inputs = 2048
+        # Random bit lengths, to exercise all the normalization shifts
+        bits = np.random.randint(0, width + 1, size=num_inputs)
+        value = np.array([np.random.randint(0, 2**b) if b else 0
+                          for b in bits], 'int')
+        exponent = np.random.randint(0, max_exponent + 1, size=num_inputs)
+
+        expected = self.dut.model(value, exponent)
+        # The model should agree with float32 conversion up to truncation
+        reference = value.astype('float64') * 4.0**exponent
+        converted = expected.view('float32').astype('float64')
+        assert np.all(converted <= reference)
+        assert np.all(reference - converted <= reference * 2**-23)
+
+        async def bench(ctx):
+            for j in range(num_inputs):
+                await ctx.tick()
+                ctx.set(self.dut.clken, 1)
+                ctx.set(self.dut.value_in, int(value[j]))
+                ctx.set(self.dut.exponent_in, int(exponent[j]))
+                if j >= self.dut.delay:
+                    out = ctx.get(self.dut.out)
+                    k = j - self.dut.delay
+                    assert out == expected[k], \
+                        (f'out = {out:#010x}, expected = {expected[k]:#010x} '
+                         f'@ cycle = {j}')
+
+        self.simulate(bench)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.interrupt import InterruptModerator
+from .amaranth_sim import AmaranthSim
+
+
+class TestInterruptModerator(AmaranthSim):
+    def setUp(self):
+        self.tick_cycles = 10
+        self.rng = np.random.default_rng(0)
+
+    def test_unmoderated(self):
+        interrupts = self.common_moderator(0, 0, event_probability=0.1)
+        assert all(coalesced == 1 for _, coalesced in interrupts)
+
+    def test_frames(self):
+        frames = 4
+        interrupts = self.common_moderator(frames, 0, event_probability=0.3)
+        assert all(coalesced == frames for _, coalesced in interrupts)
+
+    def test_interval(self):
+        interval = 3
+        for event_probability in [0.5, 0.02]:
+            with self.subTest(event_probability=event_probability):
+                interrupts, events = self.common_moderator(
+                    0, interval, event_probability, return_events=True)
+                # Measure each interrupt from the first event that is pending
+                # for it. An event in the cycle of an interrupt is pending
+                # for the next interrupt.
+                event_cycles = np.where(events)[0]
+                interrupt_cycles = np.array([c for c, _ in interrupts])
+                previous = np.concatenate(([0], interrupt_cycles[:-1]))
+                first_events = event_cycles[
+                    np.searchsorted(event_cycles, previous)]
+                latency = interrupt_cycles - first_events
+                # The first tick after the first pending event may be early
+                assert np.all(latency > (interval - 1) * self.tick_cycles)
+                assert np.all(latency <= interval * self.tick_cycles + 1)
+
+    def test_rate_limit(self):
+        # With a non-zero interval, frames does not bypass the rate limit
+        interval = 3
+        interrupts = self.common_moderator(1, interval, event_probability=0.5)
+        cycles = np.diff([cycle for cycle, _ in interrupts])
+        assert np.all(cycles > (interval - 1) * self.tick_cycles)
+        # Dense events are reported as soon as the interval allows
+        assert np.all(cycles <= interval * self.tick_cycles + 1)
+
+    def test_frames_interval(self):
+        # Sparse events, so that the interval elapses before the frames
+        # are reached
+        frames = 8
+        interval = 2
+        interrupts = self.common_moderator(
+            frames, interval, event_probability=0.02)
+        assert all(coalesced < frames for _, coalesced in interrupts)
+
+    def common_moderator(self, frames, interval, event_probability,
+                         num_cycles=2000, return_events=False):
+        self.dut = InterruptModerator(tick_cycles=self.tick_cycles)
+        events = self.rng.random(num_cycles) < event_probability
+        interrupts = []
+
+        async def bench(ctx):
+            ctx.set(self.dut.frames, frames)
+            ctx.set(self.dut.interval, interval)
+            for cycle, event in enumerate(events):
+                ctx.set(self.dut.event, int(event))
+                interrupt = ctx.get(self.dut.interrupt)
+                await ctx.tick()
+                if interrupt:
+                    interrupts.append((cycle, ctx.get(self.dut.coalesced)))
+            ctx.set(self.dut.event, 0)
+            pending = ctx.get(self.dut.pending)
+            # All the events are either coalesced or pending
+            assert sum(c for _, c in interrupts) + pending == events.sum()
+
+        self.simulate(bench)
+        assert interrupts
+        if return_events:
+            return interrupts, events
+        return interrupts
+
+
+if __name__ == '__main__':
+    unittest.main()
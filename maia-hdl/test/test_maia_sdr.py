@@ -0,0 +1,347 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+from amaranth.hdl import Fragment
+import numpy as np
+
+import os
+import tempfile
+import unittest
+
+from maia_hdl.maia_sdr import MaiaSDR
+from .amaranth_sim import AmaranthSim
+from .common_edge import CommonEdgeTb
+from .test_ddc import coeff_writes, hdl_delay
+
+
+class TestMaiaSDRModel(unittest.TestCase):
+    def setUp(self):
+        self.top = MaiaSDR()
+        self.nint = 2
+        self.ddc = {
+            'frequency': 1234567,
+            'taps': [np.random.randint(-2**15, 2**15, size=n)
+                     for n in [8, 6, 4]],
+            'decimation': [2, 2, 1],
+        }
+        vlen = self.top.spectrometer.model_vlen
+        # 3 complete spectra after the DDC, plus a partial one
+        nsamples = 3 * self.nint * vlen * 4 + 5000
+        self.iq = np.random.randint(
+            -2**11, 2**11, size=2 * nsamples).astype('int16')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'iq.cs16')
+        self.iq.tofile(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        # Elaborate the top level to keep amaranth happy (otherwise amaranth
+        # complains that we didn't use it if we only use it to run the model).
+        Fragment.get(self.top, None)
+
+    def test_model_file(self):
+        for use_ddc_out in [False, True]:
+            with self.subTest(use_ddc_out=use_ddc_out):
+                settings = {'use_ddc_out': use_ddc_out,
+                            'num_integrations': self.nint,
+                            'peak_detect': False, 'ddc': self.ddc}
+                expected = self.top.model(
+                    self.iq[::2], self.iq[1::2], **settings)
+                self.assertEqual(expected.shape[0],
+                                 12 if not use_ddc_out else 3)
+                # split in blocks of one spectrum processed in parallel
+                out = self.top.model_file(
+                    self.path, block_spectra=1, processes=2, **settings)
+                np.testing.assert_equal(out, expected)
+                # output to file
+                output = os.path.join(self.tmpdir.name, 'out.u64')
+                num_spectra = self.top.model_file(
+                    self.path, output, processes=1, **settings)
+                self.assertEqual(num_spectra, expected.shape[0])
+                np.testing.assert_equal(
+                    np.fromfile(output, 'uint64').reshape(expected.shape),
+                    expected)
+
+    def test_model_file_fft_size(self):
+        settings = {'num_integrations': self.nint, 'fft_size_log2': 8}
+        expected = self.top.model(self.iq[::2], self.iq[1::2], **settings)
+        self.assertEqual(expected.shape,
+                         (self.iq.size // 2 // (self.nint * 2**8), 2**8))
+        out = self.top.model_file(
+            self.path, block_spectra=16, processes=2, **settings)
+        np.testing.assert_equal(out, expected)
+        with self.assertRaises(ValueError):
+            self.top.model(self.iq[::2], self.iq[1::2], fft_size_log2=9)
+
+    def test_model_file_overlap(self):
+        for use_ddc_out in [False, True]:
+            with self.subTest(use_ddc_out=use_ddc_out):
+                settings = {'use_ddc_out': use_ddc_out,
+                            'num_integrations': self.nint,
+                            'ddc': self.ddc, 'fft_size_log2': 8,
+                            'fft_overlap_log2': 2}
+                expected = self.top.model(
+                    self.iq[::2], self.iq[1::2], **settings)
+                self.assertGreater(expected.shape[0], 1)
+                out = self.top.model_file(
+                    self.path, block_spectra=1, processes=2, **settings)
+                np.testing.assert_equal(out, expected)
+
+    def test_model_file_zoom(self):
+        for bin_decimation_max in [False, True]:
+            settings = {'num_integrations': self.nint,
+                        'bin_decimation_log2': 3, 'zoom_log2': 1,
+                        'zoom_start': 3000,
+                        'bin_decimation_max': bin_decimation_max}
+            with self.subTest(bin_decimation_max=bin_decimation_max):
+                expected = self.top.model(self.iq[::2], self.iq[1::2],
+                                          **settings)
+                self.assertEqual(expected.shape[1],
+                                 self.top.spectrometer.model_vlen // 16)
+                out = self.top.model_file(
+                    self.path, block_spectra=2, processes=2, **settings)
+                np.testing.assert_equal(out, expected)
+        with self.assertRaises(ValueError):
+            self.top.model(self.iq[::2], self.iq[1::2], fft_size_log2=8,
+                           bin_decimation_log2=4)
+
+    def test_model_file_float32(self):
+        settings = {'num_integrations': self.nint, 'output_float32': True}
+        expected = self.top.model(self.iq[::2], self.iq[1::2], **settings)
+        self.assertEqual(expected.dtype, np.uint32)
+        words = self.top.model(self.iq[::2], self.iq[1::2],
+                               num_integrations=self.nint)
+        # The floats are the 64-bit words truncated to 24 significant bits
+        value = (words & np.uint64(2**56 - 1)).astype('float64')
+        exponent = (words >> np.uint64(56)).astype('int')
+        reference = np.ldexp(value, 2 * exponent)
+        np.testing.assert_array_less(
+            reference - expected.view('float32'), reference * 2**-23 + 1e-30)
+        output = os.path.join(self.tmpdir.name, 'out.f32')
+        num_spectra = self.top.model_file(
+            self.path, output, processes=1, **settings)
+        self.assertEqual(num_spectra, expected.shape[0])
+        np.testing.assert_equal(
+            np.fromfile(output, 'uint32').reshape(expected.shape), expected)
+
+
+class _DDCSpectrometerTb(Elaboratable):
+    # Connects the DDC to the spectrometer of a MaiaSDR in the same way as
+    # MaiaSDR.elaborate when use_ddc_out is enabled
+    def __init__(self, top):
+        self.ddc = top.ddc
+        self.spectrometer = top.spectrometer
+        self.common_edge_2x = Signal()
+        self.common_edge_3x = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.ddc = self.ddc
+        m.submodules.spectrometer = self.spectrometer
+        m.d.comb += [
+            self.ddc.common_edge.eq(self.common_edge_3x),
+            self.spectrometer.common_edge_2x.eq(self.common_edge_2x),
+            self.spectrometer.common_edge_3x.eq(self.common_edge_3x),
+        ]
+        m.d.sync += [
+            self.spectrometer.re_in.eq(self.ddc.re_out),
+            self.spectrometer.im_in.eq(self.ddc.im_out),
+            self.spectrometer.strobe_in.eq(self.ddc.strobe_out),
+        ]
+        return m
+
+
+class TestMaiaSDRSpectrometer(AmaranthSim):
+    def setUp(self):
+        # A small runtime FFT size is used to keep the simulations short
+        self.fft_size_log2 = 8
+        self.integrations = 2
+        self.num_spectra = 3
+
+    def test_model_vs_hdl(self):
+        for peak_detect, output_float32 in [(False, False), (True, True)]:
+            with self.subTest(peak_detect=peak_detect,
+                              output_float32=output_float32):
+                self.common_model_vs_hdl(peak_detect, output_float32)
+
+    def test_model_vs_hdl_ddc(self):
+        # Compare the MaiaSDR model using the DDC output with a simulation of
+        # the DDC and the spectrometer of the MaiaSDR top level
+        top = MaiaSDR()
+        self.dut = CommonEdgeTb(
+            _DDCSpectrometerTb(top),
+            [('clk2x', 2, 'common_edge_2x'), ('clk3x', 3, 'common_edge_3x')])
+        ddc = top.ddc
+        nfft = 2**self.fft_size_log2
+        operations_minus_one = [1, 2, 1]
+        odd_operations = [True, False]
+        # Stage 3 is bypassed to keep the simulation short
+        decimation = [2, 2, 2]
+        settings = {
+            'frequency': -2345678,
+            'taps': [np.random.randint(-2**15, 2**15, size=n)
+                     for n in [6, 6, 8]],
+            'decimation': decimation,
+            'bypass3': True,
+            'operations_minus_one': operations_minus_one,
+            'odd_operations': odd_operations,
+        }
+        total_decimation = decimation[0] * decimation[1]
+        # The hardware does not produce the first output sample of the DDC
+        # model (see test_ddc.hdl_delay), but the DDC gives a zero output
+        # sample shortly after reset, which is the same as the first output
+        # sample of the model. The integrator starts the first integration
+        # after the end of the first FFT.
+        skip_ddc = nfft
+        nsamples = (skip_ddc + (self.num_spectra + 3) * self.integrations
+                    * nfft) * total_decimation
+        re_in, im_in = (
+            np.random.randint(-2**(top.iq_in_width - 1),
+                              2**(top.iq_in_width - 1), size=nsamples)
+            for _ in range(2))
+        # see test_ddc.hdl_model
+        keep_out = 20
+        re_in[:keep_out] = 0
+        im_in[:keep_out] = 0
+        # Model for the input preceded by the zeros that align it with the
+        # hardware, starting at the NCO phase of the hardware and discarding
+        # the DDC outputs that are not used by the spectrometer
+        delay = hdl_delay(ddc, decimation, bypass3=True)
+        re, im = (np.concatenate((np.zeros(delay, 'int'), x))
+                  for x in [re_in, im_in])
+        expected = top._model(
+            re, im, -(delay + 2), skip_ddc * total_decimation,
+            use_ddc_out=True, num_integrations=self.integrations,
+            peak_detect=False, ddc=settings,
+            fft_size_log2=self.fft_size_log2, output_float32=False,
+            fft_overlap_log2=0, bin_decimation_log2=0, zoom_log2=0,
+            zoom_start=0, bin_decimation_max=False)
+
+        async def set_inputs(ctx):
+            self.set_spectrometer(ctx, top.spectrometer, False, False)
+            ctx.set(ddc.frequency, settings['frequency'] % 2**ddc.nco_width)
+            for j in range(3):
+                ctx.set(getattr(ddc, f'decimation{j + 1}'), decimation[j])
+                ctx.set(getattr(ddc, f'operations_minus_one{j + 1}'),
+                        operations_minus_one[j])
+            ctx.set(ddc.odd_operations1, odd_operations[0])
+            ctx.set(ddc.odd_operations3, odd_operations[1])
+            ctx.set(ddc.bypass3, 1)
+            for addr, coeff in coeff_writes(
+                    settings['taps'], decimation, operations_minus_one,
+                    odd_operations):
+                ctx.set(ddc.coeff_wren, 1)
+                ctx.set(ddc.coeff_waddr, addr)
+                ctx.set(ddc.coeff_wdata, coeff)
+                await ctx.tick()
+            ctx.set(ddc.coeff_wren, 0)
+            ctx.set(ddc.enable_input, 1)
+            for re, im in zip(re_in, im_in):
+                ctx.set(ddc.re_in, int(re))
+                ctx.set(ddc.im_in, int(im))
+                ctx.set(ddc.strobe_in, 1)
+                await ctx.tick()
+                ctx.set(ddc.strobe_in, 0)
+                await ctx.tick()
+
+        self.simulate(
+            [set_inputs,
+             self.axi_subordinate(top.spectrometer, expected, False)],
+            named_clocks={'clk2x': 6e-9, 'clk3x': 4e-9})
+        # Elaborate the top level to keep amaranth happy, since only its DDC
+        # and spectrometer are simulated.
+        Fragment.get(top, None)
+
+    def common_model_vs_hdl(self, peak_detect, output_float32):
+        # Compare the MaiaSDR model with a simulation of the spectrometer of
+        # the MaiaSDR top level, fed with the RX IQ samples in the same way as
+        # in MaiaSDR.elaborate.
+        top = MaiaSDR()
+        spectrometer = top.spectrometer
+        self.dut = CommonEdgeTb(
+            spectrometer,
+            [('clk2x', 2, 'common_edge_2x'), ('clk3x', 3, 'common_edge_3x')])
+        nfft = 2**self.fft_size_log2
+        re_in, im_in = (
+            np.random.randint(-2**(top.iq_in_width - 1),
+                              2**(top.iq_in_width - 1),
+                              size=(self.num_spectra + 2) * self.integrations
+                              * nfft)
+            for _ in range(2))
+        shift = spectrometer.width_in - top.iq_in_width
+        # The integrator starts the first integration after the end of the
+        # first FFT.
+        expected = top.model(re_in[nfft:], im_in[nfft:],
+                             num_integrations=self.integrations,
+                             peak_detect=peak_detect,
+                             fft_size_log2=self.fft_size_log2,
+                             output_float32=output_float32)
+
+        async def set_inputs(ctx):
+            self.set_spectrometer(ctx, spectrometer, peak_detect,
+                                  output_float32)
+            for re, im in zip(re_in, im_in):
+                ctx.set(spectrometer.re_in, int(re) << shift)
+                ctx.set(spectrometer.im_in, int(im) << shift)
+                ctx.set(spectrometer.strobe_in, 1)
+                await ctx.tick()
+                ctx.set(spectrometer.strobe_in, 0)
+                await ctx.tick()
+
+        self.simulate(
+            [set_inputs,
+             self.axi_subordinate(spectrometer, expected, output_float32)],
+            named_clocks={'clk2x': 6e-9, 'clk3x': 4e-9})
+        # Elaborate the top level to keep amaranth happy, since only its
+        # spectrometer is simulated.
+        Fragment.get(top, None)
+
+    def set_spectrometer(self, ctx, spectrometer, peak_detect,
+                         output_float32):
+        ctx.set(spectrometer.fft_size_log2, self.fft_size_log2)
+        ctx.set(spectrometer.number_integrations, self.integrations)
+        ctx.set(spectrometer.peak_detect, peak_detect)
+        ctx.set(spectrometer.output_float32, output_float32)
+
+    def axi_subordinate(self, spectrometer, expected, output_float32):
+        # Returns a testbench that collects the spectra written by the DMA
+        # of the spectrometer and compares them with the model
+        axi = spectrometer.dma.axi
+        nfft = 2**self.fft_size_log2
+        # The first two DMA transfers do not contain valid spectra
+        skip = 2
+        header_words = 4 if spectrometer.header else 0
+        # In float32 mode, each beat contains two bins
+        data_beats = nfft // 2 if output_float32 else nfft
+        beats_per_spectrum = data_beats + header_words
+
+        async def bench(ctx):
+            ctx.set(axi.awready, 1)
+            ctx.set(axi.wready, 1)
+            beats = []
+            while len(beats) < (skip + self.num_spectra) * beats_per_spectrum:
+                # Write response in the cycle after the last beat of each
+                # burst
+                bvalid = bool(ctx.get(axi.wvalid) and ctx.get(axi.wlast))
+                if ctx.get(axi.wvalid):
+                    beats.append(ctx.get(axi.wdata))
+                await ctx.tick()
+                ctx.set(axi.bvalid, bvalid)
+            # The header of each spectrum is written after its data
+            spectra = np.array(beats, 'uint64').reshape(
+                -1, beats_per_spectrum)[skip:, :data_beats]
+            if output_float32:
+                spectra = spectra.view(expected.dtype)
+            np.testing.assert_equal(spectra, expected[:self.num_spectra])
+
+        return bench
+
+
+if __name__ == '__main__':
+    unittest.main()
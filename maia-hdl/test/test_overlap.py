@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.overlap import OverlapBuffer
+from .amaranth_sim import AmaranthSim
+
+
+class TestOverlapBuffer(AmaranthSim):
+    def setUp(self):
+        self.width = 16
+        self.order_log2 = 6
+        self.min_order_log2 = 4
+
+    def test_model(self):
+        for overlap_log2 in range(3):
+            for size_log2 in [6, 4]:
+                with self.subTest(overlap_log2=overlap_log2,
+                                  size_log2=size_log2):
+                    # The input strobe duty cycle is the maximum supported
+                    # for this overlap, so no frames should be dropped.
+                    self.common_model(overlap_log2, size_log2,
+                                      2**overlap_log2)
+
+    def test_fast_input(self):
+        for overlap_log2 in [1, 2]:
+            with self.subTest(overlap_log2=overlap_log2):
+                self.common_model(overlap_log2, self.order_log2, 1)
+
+    def common_model(self, overlap_log2, size_log2, strobe_period):
+        self.dut = OverlapBuffer(
+            self.width, self.order_log2, self.min_order_log2)
+        size = 2**size_log2
+        hop = size >> overlap_log2
+        num_inputs = 8 * 2**self.order_log2
+        re_in, im_in = (
+            np.random.randint(-2**(self.width-1), 2**(self.width-1),
+                              size=num_inputs)
+            for _ in range(2))
+        re_expected, im_expected = self.dut.model(
+            re_in, im_in, overlap_log2, size_log2)
+        out = []
+
+        async def bench(ctx):
+            ctx.set(self.dut.overlap_log2, overlap_log2)
+            ctx.set(self.dut.size_log2, size_log2)
+            for j in range(num_inputs):
+                ctx.set(self.dut.re_in, int(re_in[j]))
+                ctx.set(self.dut.im_in, int(im_in[j]))
+                for k in range(strobe_period):
+                    ctx.set(self.dut.strobe_in, k == 0)
+                    if ctx.get(self.dut.strobe_out):
+                        out.append((ctx.get(self.dut.re_out),
+                                    ctx.get(self.dut.im_out),
+                                    ctx.get(self.dut.start_out)))
+                    await ctx.tick()
+            # Wait for the last frame
+            ctx.set(self.dut.strobe_in, 0)
+            for _ in range(2 * size):
+                if ctx.get(self.dut.strobe_out):
+                    out.append((ctx.get(self.dut.re_out),
+                                ctx.get(self.dut.im_out),
+                                ctx.get(self.dut.start_out)))
+                await ctx.tick()
+
+        self.simulate(bench)
+
+        re_out, im_out, start_out = (np.array(x) for x in zip(*out))
+        start_modulus = 2**(self.order_log2 + 2)
+        if strobe_period >= 2**overlap_log2:
+            np.testing.assert_equal(re_out, re_expected)
+            np.testing.assert_equal(im_out, im_expected)
+            if overlap_log2 == 0:
+                expected_start = np.arange(re_out.size)
+            else:
+                expected_start = hop * (np.arange(re_out.size) // size)
+            np.testing.assert_equal(start_out,
+                                    expected_start % start_modulus)
+            return
+        # When the input is too fast, some frames are dropped, but all the
+        # output frames must be correct.
+        num_frames = re_out.size // size
+        assert num_frames == num_inputs // size
+        starts = []
+        for j in range(num_frames):
+            frame = re_out[j*size:(j+1)*size]
+            start = hop * np.argmax(
+                [np.array_equal(frame, re_in[k:k+size])
+                 for k in range(0, num_inputs - size + 1, hop)])
+            np.testing.assert_equal(frame, re_in[start:start+size])
+            np.testing.assert_equal(im_out[j*size:(j+1)*size],
+                                    im_in[start:start+size])
+            np.testing.assert_equal(start_out[j*size:(j+1)*size],
+                                    start % start_modulus)
+            starts.append(start)
+        assert np.all(np.diff(starts) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.recorder import RecorderTrigger
+from .amaranth_sim import AmaranthSim
+
+
+class TestRecorderTrigger(AmaranthSim):
+    def setUp(self):
+        self.dut = RecorderTrigger()
+        self.num_samples = 200
+        self.post_trigger_samples = 50
+        self.threshold = 2 * 1000**2
+        self.re_in, self.im_in = (
+            np.random.randint(-1000, 1000, size=self.num_samples)
+            for _ in range(2))
+
+    def test_power(self):
+        trigger_sample = 73
+        self.re_in[trigger_sample] = -2000
+        self.common_trigger(trigger_sample, power_enable=True)
+
+    def test_manual(self):
+        trigger_sample = 41
+        self.common_trigger(trigger_sample, power_enable=False,
+                            manual_trigger=trigger_sample)
+
+    def test_disabled(self):
+        self.re_in[10] = 2000
+        self.common_trigger(None, power_enable=True, enable=False)
+
+    def common_trigger(self, trigger_sample, power_enable, enable=True,
+                       manual_trigger=None):
+        async def bench(ctx):
+            ctx.set(self.dut.enable, enable)
+            ctx.set(self.dut.power_enable, power_enable)
+            ctx.set(self.dut.power_threshold, self.threshold)
+            ctx.set(self.dut.post_trigger_samples, self.post_trigger_samples)
+            ctx.set(self.dut.run, 1)
+            await ctx.tick()
+            done_sample = None
+            for j in range(self.num_samples):
+                # Manual triggers are given before the trigger sample
+                ctx.set(self.dut.trigger, j == manual_trigger)
+                await ctx.tick()
+                ctx.set(self.dut.trigger, 0)
+                # Strobe every other cycle
+                ctx.set(self.dut.re_in, int(self.re_in[j]) & 0xffff)
+                ctx.set(self.dut.im_in, int(self.im_in[j]) & 0xffff)
+                ctx.set(self.dut.strobe_in, 1)
+                await ctx.tick()
+                ctx.set(self.dut.strobe_in, 0)
+                if done_sample is None and ctx.get(self.dut.done):
+                    done_sample = j
+            await ctx.tick().repeat(3)
+            if trigger_sample is None:
+                assert not ctx.get(self.dut.triggered)
+                assert done_sample is None
+                return
+            assert ctx.get(self.dut.triggered)
+            assert ctx.get(self.dut.trigger_sample) == trigger_sample
+            # The manual trigger sample is one of the post-trigger samples
+            last_sample = (trigger_sample + self.post_trigger_samples
+                           - (manual_trigger is not None))
+            assert done_sample == last_sample + 1, \
+                f'done_sample = {done_sample}, last_sample = {last_sample}'
+
+            # The trigger is reset when the recording stops
+            ctx.set(self.dut.run, 0)
+            await ctx.tick()
+            assert not ctx.get(self.dut.triggered)
+            assert not ctx.get(self.dut.done)
+
+        self.simulate(bench)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,10 +7,13 @@
 #
 
 from amaranth import *
+import numpy as np
 
 import unittest
 
-from maia_hdl.register import Access, Field, Register, Registers
+from maia_hdl.axi4_lite import Axi4LiteRegisterBridge
+from maia_hdl.register import (
+    Access, Field, Register, RegisterCrossbar, Registers, RegisterMap)
 from .amaranth_sim import AmaranthSim
 
 
@@ -226,5 +229,157 @@ class TestRegisters(AmaranthSim):
         self.simulate(bench)
 
 
+class TestRegisterCrossbar(AmaranthSim):
+    def setUp(self):
+        self.address_width = 5
+        # initial value of the registers, indexed by word address
+        self.values = {0: 0x1111, 1: 0x2222, 4: 0x3333, 7: 0x4444,
+                       13: 0x5555}
+
+    def make_crossbar(self):
+        def bank(name, address_width, values):
+            return Registers(
+                name,
+                {address: Register(
+                    f'{name}{address}',
+                    [Field('field', Access.RW, 32, value)])
+                 for address, value in values.items()},
+                address_width)
+
+        register_map = RegisterMap({
+            0x0: bank('a', 2, {0: 0x1111, 1: 0x2222}),
+            0x10: bank('b', 2, {0: 0x3333, 3: 0x4444}),
+            0x20: bank('c', 3, {5: 0x5555}),
+        }, {})
+        return RegisterCrossbar(
+            register_map, self.address_width, domains={0x10: 'other'})
+
+    def expected(self, address):
+        return self.values.get(address, 0)
+
+    def test_pipelined_reads(self):
+        self.dut = self.make_crossbar()
+        # same-domain banks, other-domain bank and unmapped addresses
+        addresses = [0, 1, 13, 0, 4, 7, 1, 20, 31, 13, 13, 5, 0]
+        responses = []
+        done = False
+
+        async def requests(ctx):
+            nonlocal done
+            for address in addresses:
+                ctx.set(self.dut.ren, 1)
+                ctx.set(self.dut.address, address)
+                await ctx.tick()
+                ctx.set(self.dut.ren, 0)
+                while not ctx.get(self.dut.ready):
+                    await ctx.tick()
+            while len(responses) < len(addresses):
+                await ctx.tick()
+            done = True
+
+        async def read_responses(ctx):
+            while not done:
+                if ctx.get(self.dut.rdone):
+                    responses.append(ctx.get(self.dut.rdata))
+                await ctx.tick()
+
+        self.simulate([requests, read_responses],
+                      named_clocks={'other': 10e-9})
+        assert responses == [self.expected(a) for a in addresses]
+
+    def test_back_to_back(self):
+        self.dut = self.make_crossbar()
+        # reads to same-domain banks finish with a fixed latency, one per
+        # cycle
+        addresses = [0, 1, 13, 14, 0, 31]
+
+        async def bench(ctx):
+            for j in range(len(addresses) + 2):
+                if j < len(addresses):
+                    assert ctx.get(self.dut.ready)
+                    ctx.set(self.dut.ren, 1)
+                    ctx.set(self.dut.address, addresses[j])
+                else:
+                    ctx.set(self.dut.ren, 0)
+                await ctx.tick()
+                # the response to the read issued in the previous cycle
+                if 1 <= j <= len(addresses):
+                    assert ctx.get(self.dut.rdone)
+                    assert (ctx.get(self.dut.rdata)
+                            == self.expected(addresses[j - 1]))
+                else:
+                    assert not ctx.get(self.dut.rdone)
+
+        self.simulate(bench, named_clocks={'other': 10e-9})
+
+    def test_axi4lite(self):
+        self.dut = m = Module()
+        m.submodules.crossbar = crossbar = self.make_crossbar()
+        m.submodules.bridge = bridge = Axi4LiteRegisterBridge(
+            self.address_width, max_outstanding=4)
+        m.d.comb += [
+            crossbar.ren.eq(bridge.ren),
+            crossbar.wstrobe.eq(bridge.wstrobe),
+            crossbar.address.eq(bridge.address),
+            crossbar.wdata.eq(bridge.wdata),
+            bridge.rdone.eq(crossbar.rdone),
+            bridge.wdone.eq(crossbar.wdone),
+            bridge.rdata.eq(crossbar.rdata),
+            bridge.ready.eq(crossbar.ready),
+        ]
+        axi = bridge.axi
+        writes = [(1, 0xcafe), (7, 0xbeef), (13, 0x1234), (20, 0xffff)]
+        for address, value in writes:
+            if address in self.values:
+                self.values[address] = value
+        reads = [int(a) for a in np.random.randint(0, 32, size=40)]
+        responses = []
+        num_bresp = 0
+
+        async def write_address(ctx):
+            for address, value in writes:
+                ctx.set(axi.awvalid, 1)
+                ctx.set(axi.wvalid, 1)
+                ctx.set(axi.awaddr, 4 * address)
+                ctx.set(axi.wdata, value)
+                ctx.set(axi.wstrb, 0xf)
+                await ctx.tick().until(axi.awready)
+            ctx.set(axi.awvalid, 0)
+            ctx.set(axi.wvalid, 0)
+
+        async def write_response(ctx):
+            nonlocal num_bresp
+            while num_bresp < len(writes):
+                bready = bool(np.random.randint(2))
+                ctx.set(axi.bready, bready)
+                if bready and ctx.get(axi.bvalid):
+                    num_bresp += 1
+                await ctx.tick()
+            ctx.set(axi.bready, 0)
+
+        async def read_address(ctx):
+            while num_bresp < len(writes):
+                await ctx.tick()
+            for address in reads:
+                ctx.set(axi.arvalid, 1)
+                ctx.set(axi.araddr, 4 * address)
+                await ctx.tick().until(axi.arready)
+            ctx.set(axi.arvalid, 0)
+
+        async def read_data(ctx):
+            while len(responses) < len(reads):
+                rready = bool(np.random.randint(4))
+                ctx.set(axi.rready, rready)
+                if rready and ctx.get(axi.rvalid):
+                    responses.append(ctx.get(axi.rdata))
+                await ctx.tick()
+            ctx.set(axi.rready, 0)
+
+        self.simulate(
+            [write_address, write_response, read_address, read_data],
+            named_clocks={'other': 10e-9})
+        assert responses == [self.expected(a) for a in reads]
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,196 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+from amaranth.hdl import UnusedElaboratable
+
+import gc
+import io
+import os
+import subprocess
+import sys
+import unittest
+import warnings
+
+from . import run_parallel
+from .amaranth_sim import AmaranthSim
+
+
+class _Toggle(Elaboratable):
+    def __init__(self):
+        self.q = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.sync += self.q.eq(~self.q)
+        return m
+
+
+class _Samples:
+    # Test cases that are run by TestRunParallel. They are nested in a class
+    # so that they are not discovered as tests of this module.
+
+    class Subtests(AmaranthSim):
+        num_subtests = 7
+        # Numbers of the subtests that compute their model and that finish
+        models = []
+        runs = []
+        # Numbers of the subtests that do not simulate and that finish
+        plain_runs = []
+
+        def test_subtests(self):
+            for j in range(self.num_subtests):
+                with self.subTest(j=j):
+                    self.dut = _Toggle()
+                    self.models.append(j)
+
+                    async def bench(ctx):
+                        await ctx.tick()
+
+                    self.simulate(bench)
+                    self.runs.append(j)
+
+        def test_plain_subtests(self):
+            for j in range(3):
+                with self.subTest(j=j):
+                    self.plain_runs.append(j)
+
+        def test_helper_subtests(self):
+            for j in range(2):
+                self.common_helper(j)
+
+        def common_helper(self, j):
+            with self.subTest(j=j):
+                self.dut = _Toggle()
+                self.dummy_simulation()
+
+        def test_no_subtests(self):
+            # This mentions subTest, but it does not use it
+            self.dut = _Toggle()
+            self.dummy_simulation()
+
+    class Results(AmaranthSim):
+        def test_pass(self):
+            pass
+
+        def test_fail(self):
+            self.fail('expected failure')
+
+        def test_error(self):
+            raise RuntimeError('expected error')
+
+
+_samples = f'{__name__}._Samples'
+
+
+class TestRunParallel(unittest.TestCase):
+    def run_jobs(self, jobs):
+        # Runs the jobs in this process, so that the sample test cases can
+        # record which subtests have run.
+        _Samples.Subtests.models.clear()
+        _Samples.Subtests.runs.clear()
+        _Samples.Subtests.plain_runs.clear()
+        with warnings.catch_warnings():
+            # The DUTs of the subtests in other shards are not elaborated
+            warnings.simplefilter('ignore', UnusedElaboratable)
+            results = [run_parallel._run_job(job) for job in jobs]
+            gc.collect()
+        return results
+
+    def test_make_jobs(self):
+        jobs = run_parallel.make_jobs([f'{_samples}.Subtests'], split=3)
+        # Only the tests with several subtests that set a DUT or simulate
+        # are sharded, with at most one shard per subtest.
+        self.assertEqual(
+            sorted(job.name for job in jobs),
+            sorted([f'{_samples}.Subtests.test_subtests[{j}/3]'
+                    for j in range(3)]
+                   + [f'{_samples}.Subtests.test_helper_subtests[{j}/2]'
+                      for j in range(2)]
+                   + [f'{_samples}.Subtests.test_plain_subtests',
+                      f'{_samples}.Subtests.test_no_subtests']))
+        jobs = run_parallel.make_jobs([f'{_samples}.Results'], split=3)
+        self.assertTrue(all(job.shard is None for job in jobs))
+        self.assertEqual(len(jobs), 3)
+        jobs = run_parallel.make_jobs(
+            [f'{_samples}.Results'], patterns=['test_fail'])
+        self.assertEqual([job.name for job in jobs],
+                         [f'{_samples}.Results.test_fail'])
+
+    def test_shard_partition(self):
+        num_subtests = _Samples.Subtests.num_subtests
+        for split in range(1, num_subtests + 2):
+            with self.subTest(split=split):
+                jobs = run_parallel.make_jobs(
+                    [f'{_samples}.Subtests.test_subtests'], split=split)
+                self.assertEqual(len(jobs), min(split, num_subtests))
+                results = self.run_jobs(jobs)
+                # Each subtest runs exactly once across the shards, and the
+                # subtests in other shards are skipped before computing the
+                # model.
+                self.assertEqual(sorted(_Samples.Subtests.runs),
+                                 list(range(num_subtests)))
+                self.assertEqual(sorted(_Samples.Subtests.models),
+                                 list(range(num_subtests)))
+                self.assertEqual(sum(r['shard_skips'] for r in results),
+                                 num_subtests * (len(jobs) - 1))
+                for r in results:
+                    self.assertEqual(r['failures'], [])
+                    self.assertEqual(r['errors'], [])
+                    self.assertEqual(r['skipped'], [])
+
+    def test_plain_subtests(self):
+        jobs = run_parallel.make_jobs(
+            [f'{_samples}.Subtests.test_plain_subtests'], split=2)
+        # Subtests that do not set a DUT are not sharded
+        self.assertEqual([job.shard for job in jobs], [None])
+        results = self.run_jobs(jobs)
+        self.assertEqual(sorted(_Samples.Subtests.plain_runs),
+                         list(range(3)))
+        self.assertEqual(sum(r['shard_skips'] for r in results), 0)
+
+    def test_report(self):
+        jobs = run_parallel.make_jobs([f'{_samples}.Results'])
+        results = self.run_jobs(jobs)
+        by_name = {r['name'].split('.')[-1]: r for r in results}
+        self.assertEqual(len(by_name['test_fail']['failures']), 1)
+        self.assertEqual(len(by_name['test_error']['errors']), 1)
+        for r in results:
+            self.assertEqual(r['seed'],
+                             run_parallel.Job(r['name']).seed)
+
+        stream = io.StringIO()
+        self.assertFalse(run_parallel.report(results, 1.0, stream=stream))
+        output = stream.getvalue()
+        self.assertIn(f'FAIL: test_fail ({_samples}.Results.test_fail) '
+                      f'(job {_samples}.Results.test_fail, '
+                      f'seed {by_name["test_fail"]["seed"]})', output)
+        self.assertIn('expected error', output)
+        self.assertIn('Ran 3 tests in 3 jobs', output)
+        self.assertIn('FAILED (failures=1, errors=1, skipped=0)', output)
+
+        stream = io.StringIO()
+        self.assertTrue(run_parallel.report([by_name['test_pass']], 1.0,
+                                            stream=stream))
+        self.assertTrue(stream.getvalue().endswith('\nOK\n'))
+
+    def test_exit_code(self):
+        for name, returncode in [('test_pass', 0), ('test_fail', 1),
+                                 ('test_error', 1)]:
+            with self.subTest(name=name):
+                process = subprocess.run(
+                    [sys.executable, '-m', 'test.run_parallel', '-j', '1',
+                     f'{_samples}.Results.{name}'],
+                    cwd=os.path.dirname(os.path.dirname(__file__)),
+                    capture_output=True)
+                self.assertEqual(process.returncode, returncode,
+                                 process.stderr.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+import numpy as np
+
+import unittest
+
+from maia_hdl.spectrometer import Spectrometer
+from .amaranth_sim import AmaranthSim
+from .common_edge import CommonEdgeTb
+
+
+class TestSpectrometer(AmaranthSim):
+    def setUp(self):
+        self.domain_2x = 'clk2x'
+        self.domain_3x = 'clk3x'
+        self.fft_order_log2 = 8
+        self.fft_min_order_log2 = 6
+
+    def test_runtime_fft_size(self):
+        for fft_size_log2 in [8, 6]:
+            with self.subTest(fft_size_log2=fft_size_log2):
+                self.common_model(fft_size_log2)
+
+    def test_output_float32(self):
+        for fft_size_log2 in [8, 6]:
+            with self.subTest(fft_size_log2=fft_size_log2):
+                self.common_model(fft_size_log2, output_float32=True)
+
+    def test_fft_overlap(self):
+        for fft_overlap_log2 in [1, 2]:
+            for fft_size_log2 in [8, 6]:
+                with self.subTest(fft_overlap_log2=fft_overlap_log2,
+                                  fft_size_log2=fft_size_log2):
+                    self.common_model(fft_size_log2,
+                                      fft_overlap_log2=fft_overlap_log2)
+
+    def test_zoom_bin_decimation(self):
+        for bin_decimation_log2, zoom_log2, zoom_start, bin_max in [
+                (2, 0, 0, False), (1, 1, 77, False), (2, 0, 0, True)]:
+            with self.subTest(bin_decimation_log2=bin_decimation_log2,
+                              zoom_log2=zoom_log2, zoom_start=zoom_start,
+                              bin_decimation_max=bin_max):
+                self.common_model(8, bin_decimation_log2=bin_decimation_log2,
+                                  zoom_log2=zoom_log2, zoom_start=zoom_start,
+                                  bin_decimation_max=bin_max)
+
+    def test_header(self):
+        for fft_size_log2, output_float32, fft_overlap_log2 in [
+                (8, False, 0), (6, True, 0), (6, False, 1)]:
+            with self.subTest(fft_size_log2=fft_size_log2,
+                              output_float32=output_float32,
+                              fft_overlap_log2=fft_overlap_log2):
+                self.common_model(fft_size_log2, output_float32,
+                                  fft_overlap_log2, header=True)
+
+    def common_model(self, fft_size_log2, output_float32=False,
+                     fft_overlap_log2=0, bin_decimation_log2=0, zoom_log2=0,
+                     zoom_start=0, bin_decimation_max=False, header=False):
+        self.spectrometer = Spectrometer(
+            0x1000_0000, 2, domain_2x=self.domain_2x,
+            domain_3x=self.domain_3x, fft_order_log2=self.fft_order_log2,
+            fft_min_order_log2=self.fft_min_order_log2,
+            fft_max_overlap_log2=2, max_bin_decimation_log2=2, zoom=True,
+            header=header)
+        self.dut = CommonEdgeTb(
+            self.spectrometer,
+            [(self.domain_2x, 2, 'common_edge_2x'),
+             (self.domain_3x, 3, 'common_edge_3x')])
+        nfft = 2**fft_size_log2
+        hop = nfft >> fft_overlap_log2
+        integrations = 2
+        num_spectra = 3
+        re_in, im_in = (
+            np.random.randint(-2**13, 2**13,
+                              size=(num_spectra + 2) * integrations * nfft)
+            for _ in range(2))
+        # The integrator starts the first integration after the end of the
+        # first FFT.
+        expected = self.spectrometer.model(
+            re_in[hop:], im_in[hop:], integrations, False, fft_size_log2,
+            output_float32, fft_overlap_log2, bin_decimation_log2, zoom_log2,
+            zoom_start, bin_decimation_max)
+        nout = nfft >> (bin_decimation_log2 + zoom_log2)
+        assert expected.shape[1] == nout
+        # The input strobe duty cycle is the maximum supported by the overlap
+        strobe_period = max(2, 2**fft_overlap_log2)
+        axi = self.spectrometer.dma.axi
+        # The first two DMA transfers do not contain valid spectra
+        skip = 2
+        header_words = 4 if header else 0
+
+        async def set_inputs(ctx):
+            ctx.set(self.spectrometer.fft_size_log2, fft_size_log2)
+            ctx.set(self.spectrometer.number_integrations, integrations)
+            ctx.set(self.spectrometer.output_float32, output_float32)
+            ctx.set(self.spectrometer.fft_overlap_log2, fft_overlap_log2)
+            ctx.set(self.spectrometer.bin_decimation_log2,
+                    bin_decimation_log2)
+            ctx.set(self.spectrometer.bin_decimation_max, bin_decimation_max)
+            ctx.set(self.spectrometer.zoom_log2, zoom_log2)
+            ctx.set(self.spectrometer.zoom_start, zoom_start)
+            for re, im in zip(re_in, im_in):
+                ctx.set(self.spectrometer.re_in, int(re))
+                ctx.set(self.spectrometer.im_in, int(im))
+                ctx.set(self.spectrometer.strobe_in, 1)
+                await ctx.tick()
+                ctx.set(self.spectrometer.strobe_in, 0)
+                await ctx.tick().repeat(strobe_period - 1)
+
+        async def axi_subordinate(ctx):
+            ctx.set(axi.awready, 1)
+            ctx.set(axi.wready, 1)
+            words = []
+            headers = []
+            while (len(words) < (skip + num_spectra) * nout
+                   or len(headers) < (skip + num_spectra) * header_words):
+                # Write response in the cycle after the last beat of each
+                # burst
+                bvalid = bool(ctx.get(axi.wvalid) and ctx.get(axi.wlast))
+                if ctx.get(axi.wvalid) and header_words and (
+                        len(words)
+                        == (len(headers) // header_words + 1) * nout):
+                    # The header is written after the spectrum
+                    headers.append(ctx.get(axi.wdata))
+                elif ctx.get(axi.wvalid):
+                    wdata = ctx.get(axi.wdata)
+                    if output_float32:
+                        # Each beat contains two floats
+                        words.extend([wdata & (2**32 - 1), wdata >> 32])
+                    else:
+                        words.append(wdata)
+                await ctx.tick()
+                ctx.set(axi.bvalid, bvalid)
+            spectra = np.array(words, expected.dtype).reshape(-1, nout)[skip:]
+            np.testing.assert_equal(spectra, expected[:num_spectra])
+            if header:
+                headers = np.array(headers, 'uint64').reshape(-1, 4)
+                np.testing.assert_equal(headers[:, 1],
+                                        np.arange(skip + num_spectra))
+                valid = headers[skip:]
+                np.testing.assert_equal(valid[:, 2], integrations)
+                np.testing.assert_equal(valid[:, 3], 0)
+                # The first valid integration starts at the input sample
+                # hop, and consecutive integrations start nint hops apart
+                np.testing.assert_equal(
+                    valid[:, 0],
+                    hop + integrations * hop * np.arange(num_spectra))
+
+        self.simulate([set_inputs, axi_subordinate],
+                      named_clocks={self.domain_2x: 6e-9,
+                                    self.domain_3x: 4e-9})
+
+
+if __name__ == '__main__':
+    unittest.main()
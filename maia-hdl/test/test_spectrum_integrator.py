@@ -33,10 +33,52 @@ class TestSpectrumIntegrator(AmaranthSim):
                                   peak_detect=peak_detect):
                     self.common_model(integrations, peak_detect)
 
-    def common_model(self, integrations, peak_detect):
+    def test_model_runtime_size(self):
+        self.fft_order_log2 = 8
+        size_log2 = 5
+        self.nfft = 2**size_log2
+        for peak_detect in [False, True]:
+            with self.subTest(peak_detect=peak_detect):
+                self.common_model(3, peak_detect, size_log2=size_log2)
+
+    def test_model_decimation_zoom(self):
+        self.fft_order_log2 = 8
+        self.nfft = 2**self.fft_order_log2
+        for peak_detect in [False, True]:
+            for decimation_log2, zoom_log2, zoom_start in [
+                    (2, 0, 0), (0, 2, 37), (2, 1, 201)]:
+                with self.subTest(peak_detect=peak_detect,
+                                  decimation_log2=decimation_log2,
+                                  zoom_log2=zoom_log2,
+                                  zoom_start=zoom_start):
+                    self.common_model(
+                        3, peak_detect, decimation_log2=decimation_log2,
+                        zoom_log2=zoom_log2, zoom_start=zoom_start)
+
+    def test_model_decimation_max(self):
+        self.fft_order_log2 = 8
+        self.nfft = 2**self.fft_order_log2
+        for peak_detect in [False, True]:
+            for decimation_log2, zoom_log2, zoom_start in [
+                    (2, 0, 0), (2, 1, 201)]:
+                with self.subTest(peak_detect=peak_detect,
+                                  decimation_log2=decimation_log2,
+                                  zoom_log2=zoom_log2,
+                                  zoom_start=zoom_start):
+                    self.common_model(
+                        3, peak_detect, decimation_log2=decimation_log2,
+                        zoom_log2=zoom_log2, zoom_start=zoom_start,
+                        decimation_max=True)
+
+    def common_model(self, integrations, peak_detect, size_log2=None,
+                     decimation_log2=0, zoom_log2=0, zoom_start=0,
+                     decimation_max=False):
+        zoom = (decimation_log2, zoom_log2, zoom_start) != (0, 0, 0)
         self.dut0 = SpectrumIntegrator(
             self.domain_3x, self.width, self.fp_width, self.nint_width,
-            self.fft_order_log2)
+            self.fft_order_log2, fft_min_order_log2=size_log2,
+            max_decimation_log2=2 if zoom else 0, zoom=zoom)
+        nout = self.nfft >> (decimation_log2 + zoom_log2)
         self.dut = CommonEdgeTb(
             self.dut0, [(self.domain_3x, 3, 'common_edge')])
 
@@ -48,6 +90,13 @@ class TestSpectrumIntegrator(AmaranthSim):
         async def set_inputs(ctx):
             ctx.set(self.dut0.nint, integrations)
             ctx.set(self.dut0.peak_detect, peak_detect)
+            if size_log2 is not None:
+                ctx.set(self.dut0.size_log2, size_log2)
+            if zoom:
+                ctx.set(self.dut0.decimation_log2, decimation_log2)
+                ctx.set(self.dut0.decimation_max, decimation_max)
+                ctx.set(self.dut0.zoom_log2, zoom_log2)
+                ctx.set(self.dut0.zoom_start, zoom_start)
             for j, x in enumerate(zip(re_in, im_in)):
                 await ctx.tick()
                 re = x[0]
@@ -69,9 +118,9 @@ class TestSpectrumIntegrator(AmaranthSim):
 
             async def check_ram(expected, expected_exponent):
                 read = []
-                for j in range(self.nfft + self.read_delay):
+                for j in range(nout + self.read_delay):
                     ctx.set(self.dut0.rden, 1)
-                    if j < self.nfft:
+                    if j < nout:
                         ctx.set(self.dut0.rdaddr, j)
                     if j >= self.read_delay:
                         k = j - self.read_delay
@@ -95,12 +144,85 @@ class TestSpectrumIntegrator(AmaranthSim):
                     (n * integrations + 1) * self.nfft,
                     ((n + 1) * integrations + 1) * self.nfft)
                 expected = self.dut0.model(
-                    integrations, re_in[sel], im_in[sel], peak_detect)
+                    integrations, re_in[sel], im_in[sel], peak_detect,
+                    size_log2, decimation_log2, zoom_log2, zoom_start,
+                    decimation_max)
+                assert expected[0].size == nout
                 await check_ram(*expected)
 
         self.simulate([set_inputs, check_ram_contents],
                       named_clocks={self.domain_3x: 4e-9})
 
+    def test_model_stream(self):
+        self.fft_order_log2 = 6
+        self.nfft = 2**self.fft_order_log2
+        self.dut0 = SpectrumIntegrator(
+            self.domain_3x, self.width, self.fp_width, self.nint_width,
+            self.fft_order_log2, max_decimation_log2=2, zoom=True)
+        self.dut = CommonEdgeTb(
+            self.dut0, [(self.domain_3x, 3, 'common_edge')])
+        integrations = 37
+        num_spectra = 3
+        # use inputs with random bit lengths to exercise all the exponents
+        bits = np.random.randint(
+            1, self.width + 1, size=(2, num_spectra*integrations*self.nfft))
+        re_in, im_in = np.random.randint(-2**(bits-1), 2**(bits-1))
+        for peak_detect, zoom in [(False, (0, 0, 0, False)),
+                                  (True, (0, 0, 0, False)),
+                                  (False, (2, 1, 13, False)),
+                                  (False, (2, 1, 13, True))]:
+            with self.subTest(peak_detect=peak_detect, zoom=zoom):
+                expected = self.dut0.model(
+                    integrations, re_in, im_in, peak_detect, None, *zoom)
+                # feed chunks with a random number of vectors
+                splits = self.nfft * np.sort(np.random.randint(
+                    0, num_spectra * integrations, size=20))
+                chunks = zip(np.split(re_in, splits),
+                             np.split(im_in, splits))
+                out = list(self.dut0.model_stream(
+                    integrations, chunks, peak_detect, None, *zoom))
+                self.assertEqual(len(out), num_spectra)
+                for j in range(2):
+                    np.testing.assert_equal(
+                        np.concatenate([o[j] for o in out]), expected[j])
+
+        self.dummy_simulation(named_clocks={self.domain_3x: 4e-9})
+
+    def test_abort(self):
+        self.fft_order_log2 = 6
+        self.nfft = 2**self.fft_order_log2
+        self.dut0 = SpectrumIntegrator(
+            self.domain_3x, self.width, self.fp_width, self.nint_width,
+            self.fft_order_log2)
+        self.dut = CommonEdgeTb(
+            self.dut0, [(self.domain_3x, 3, 'common_edge')])
+        integrations = 20
+        # vectors during which abort is pulsed
+        abort_vectors = [5, 8]
+        num_vectors = 50
+
+        async def bench(ctx):
+            ctx.set(self.dut0.nint, integrations)
+            aborted = []
+            for n in range(num_vectors):
+                for j in range(self.nfft):
+                    ctx.set(self.dut0.abort, n in abort_vectors and j == 10)
+                    ctx.set(self.dut0.input_last, j == self.nfft - 1)
+                    ctx.set(self.dut0.clken, 1)
+                    await ctx.tick()
+                    ctx.set(self.dut0.abort, 0)
+                    ctx.set(self.dut0.clken, 0)
+                    if ctx.get(self.dut0.aborted):
+                        aborted.append(n)
+                    await ctx.tick()
+                    assert not ctx.get(self.dut0.aborted)
+            # The first integration starts after the first vector, and the
+            # integrations are finished early at the end of the vectors in
+            # which abort is pulsed.
+            assert aborted == abort_vectors
+
+        self.simulate(bench, named_clocks={self.domain_3x: 4e-9})
+
     def test_constant_input(self):
         for peak_detect in [False, True]:
             with self.subTest(peak_detect):
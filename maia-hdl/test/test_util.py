@@ -0,0 +1,53 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+import numpy as np
+
+import unittest
+
+from maia_hdl.util import bit_invert, bit_invert_table, signed_bit_length
+
+
+class TestBitInvert(unittest.TestCase):
+    def test_bit_invert(self):
+        self.assertEqual(bit_invert(0b000110, 6, 1), 0b011000)
+        self.assertEqual(bit_invert(0b000110, 6, 2), 0b100100)
+        self.assertEqual(bit_invert(0b000110, 6, 3), 0b110000)
+
+    def test_bit_invert_table(self):
+        for nbits, radix_log2 in [(4, 1), (6, 2), (6, 3), (12, 1), (12, 2)]:
+            with self.subTest(nbits=nbits, radix_log2=radix_log2):
+                table = bit_invert_table(nbits, radix_log2)
+                expected = [bit_invert(n, nbits, radix_log2)
+                            for n in range(2**nbits)]
+                np.testing.assert_equal(table, expected)
+                # the table is a permutation
+                np.testing.assert_equal(np.sort(table),
+                                        np.arange(2**nbits))
+                # the table is cached and read-only
+                self.assertIs(bit_invert_table(nbits, radix_log2), table)
+                self.assertFalse(table.flags.writeable)
+
+
+class TestSignedBitLength(unittest.TestCase):
+    def test_signed_bit_length(self):
+        # powers of two and their neighbours, covering the whole int64 range
+        x = [sign * 2**k + d
+             for k in range(64) for d in [-1, 0, 1] for sign in [-1, 1]]
+        x = [a for a in x if -2**63 <= a < 2**63]
+        x += list(np.random.randint(-2**63, 2**63 - 1, size=1000,
+                                    dtype='int64'))
+        expected = [int(a).bit_length() + 1 if a >= 0
+                    else int(~a).bit_length() + 1
+                    for a in x]
+        np.testing.assert_equal(
+            signed_bit_length(np.array(x, 'int64')), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
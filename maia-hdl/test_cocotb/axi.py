@@ -49,7 +49,7 @@ class AXI4Slave(BusDriver):
     ]
 
     def __init__(self, entity, name, clock, memory, callback=None, event=None,
-                 big_endian=False, **kwargs):
+                 big_endian=False, write_response_latency=None, **kwargs):
 
         BusDriver.__init__(self, entity, name, clock, **kwargs)
         self.clock = clock
@@ -68,9 +68,16 @@ class AXI4Slave(BusDriver):
         self.write_data_busy = Lock("%s_wbusy" % name)
 
         self._aw = []
+        # If write_response_latency is not None, the write responses are sent
+        # this number of cycles after the end of each burst, and the write
+        # data of the next bursts is accepted in the meantime.
+        self.write_response_latency = write_response_latency
+        self._b = []
         cocotb.start_soon(self._aw_data())
         cocotb.start_soon(self._read_data())
         cocotb.start_soon(self._write_data())
+        if write_response_latency is not None:
+            cocotb.start_soon(self._write_response())
 
     def _size_to_bytes_in_beat(self, AxSIZE):
         if AxSIZE < 7:
@@ -147,7 +154,9 @@ class AXI4Slave(BusDriver):
                         break
                 await clock_re
 
-            if hasattr(self.bus, "BREADY") and hasattr(self.bus, "BVALID"):
+            if self.write_response_latency is not None:
+                self._b.append(self.write_response_latency)
+            elif hasattr(self.bus, "BREADY") and hasattr(self.bus, "BVALID"):
                 self.bus.WREADY.value = 0
                 self.bus.BVALID.value = 1
                 await clock_re
@@ -159,6 +168,19 @@ class AXI4Slave(BusDriver):
 
             del self._aw[0]
 
+    async def _write_response(self):
+        clock_re = RisingEdge(self.clock)
+        bvalid = False
+        while True:
+            await clock_re
+            if bvalid and self.bus.BREADY.value:
+                bvalid = False
+            self._b = [latency - 1 for latency in self._b]
+            if not bvalid and self._b and self._b[0] <= 0:
+                del self._b[0]
+                bvalid = True
+            self.bus.BVALID.value = int(bvalid)
+
     async def _read_data(self):
         clock_re = RisingEdge(self.clock)
 
@@ -0,0 +1,92 @@
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+# Sustained throughput benchmark for the DmaStreamWrite. The stream input is
+# always valid, so the throughput is limited by the AXI backpressure and by
+# the latency of the write responses. The DmaStreamWrite configuration
+# (burst length and outstanding transactions) is set with the variables of
+# the Makefile.
+
+import array
+import struct
+
+import cocotb
+from cocotb_bus.drivers import BitDriver
+
+from axi import AXI4Slave
+from backpressure import RandomReady
+from memory import Memory
+
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge
+from cocotb.regression import TestFactory
+
+MEMORY_START = 0x0001_0000
+MEMORY_END = 0x0002_0000
+MEMORY_BYTES = MEMORY_END - MEMORY_START
+# Clock frequency used to convert the throughput to MB/s. This is the
+# frequency of the AXI4-Lite clock, which drives the recorder DMA.
+CLOCK_MHZ = 100
+
+
+async def stream_data(dut):
+    n = 0
+    rising = RisingEdge(dut.clk)
+    dut.stream_valid.value = 1
+    while True:
+        dut.stream_data.value = n
+        await rising
+        if dut.stream_valid.value and dut.stream_ready.value:
+            n += 1
+
+
+async def run_benchmark(dut, backpressure_inserter=None,
+                        write_response_latency=None):
+    cocotb.start_soon(Clock(dut.clk, 10, units='ns').start())
+    dut.rst.value = 1
+    dut.start.value = 0
+    dut.stop.value = 0
+    await ClockCycles(dut.clk, 2)
+    memory = Memory(MEMORY_BYTES)
+    AXI4Slave(dut, None, dut.clk, memory,
+              write_response_latency=write_response_latency)
+    if backpressure_inserter:
+        BitDriver(dut.WREADY, dut.clk).start(backpressure_inserter())
+    dut.rst.value = 0
+    cocotb.start_soon(stream_data(dut))
+
+    rising = RisingEdge(dut.clk)
+    await rising
+    dut.start.value = 1
+    await rising
+    dut.start.value = 0
+    cycles = 1
+    while not dut.finished.value:
+        await rising
+        cycles += 1
+
+    bytes_per_cycle = MEMORY_BYTES / cycles
+    dut._log.info(
+        f'{MEMORY_BYTES} bytes in {cycles} cycles: '
+        f'{bytes_per_cycle:.3f} bytes/cycle, '
+        f'{bytes_per_cycle * CLOCK_MHZ:.1f} MB/s at {CLOCK_MHZ} MHz')
+
+    bytes_per_word = 8
+    expected = array.array('B', [0] * MEMORY_BYTES)
+    for word in range(MEMORY_BYTES // bytes_per_word):
+        address = bytes_per_word * word
+        expected[address:address+bytes_per_word] = (
+            array.array('B', struct.pack('<Q', word)))
+    assert memory._data == expected, 'memory contents do not match'
+
+
+factory = TestFactory(run_benchmark)
+factory.add_option('backpressure_inserter',
+                   [None, RandomReady(), RandomReady(2, 2)])
+factory.add_option('write_response_latency', [None, 16, 64])
+factory.generate_tests()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2024 Daniel Estevez <daniel@destevez.net>
+#
+# This file is part of maia-sdr
+#
+# SPDX-License-Identifier: MIT
+#
+
+from amaranth import *
+from amaranth.back.verilog import convert
+
+import argparse
+
+from maia_hdl.dma import DmaStreamWrite
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Generate DmaStreamWrite Verilog for the benchmark')
+    parser.add_argument('--burst-len-log2', type=int, default=4)
+    parser.add_argument('--max-outstanding-bursts', type=int, default=2)
+    parser.add_argument('--max-outstanding-b-log2', type=int, default=2)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open('dut.v', 'w') as f:
+        m = DmaStreamWrite(
+            0x0001_0000, 0x0002_0000,
+            burst_len_log2=args.burst_len_log2,
+            max_outstanding_bursts=args.max_outstanding_bursts,
+            max_outstanding_b_log2=args.max_outstanding_b_log2)
+        f.write(convert(
+            m, name='dut', ports=m.ports(), emit_src=False))
+
+
+if __name__ == '__main__':
+    main()